@@ -688,7 +688,7 @@ class SBE37Driver(InstrumentDriver):
             content = {'type':DriverAnnouncement.STATE_CHANGE,
                        'transducer':SBE37Channel.INSTRUMENT,
                        'value':SBE37State.UNCONFIGURED}
-            yield self.send(self.proc_supid,'driver_event_occurred',content)
+            yield self.announce_to_agent(content)
             
             # Initialize driver configuration.
             self._initialize()
@@ -738,7 +738,7 @@ class SBE37Driver(InstrumentDriver):
             content = {'type':DriverAnnouncement.STATE_CHANGE,
                        'transducer':SBE37Channel.INSTRUMENT,
                        'value':SBE37State.DISCONNECTED}
-            yield self.send(self.proc_supid,'driver_event_occurred',content)
+            yield self.announce_to_agent(content)
             
         elif event == SBE37Event.EXIT:
             pass
@@ -788,7 +788,7 @@ class SBE37Driver(InstrumentDriver):
             content = {'type':DriverAnnouncement.STATE_CHANGE,
                        'transducer':SBE37Channel.INSTRUMENT,
                        'value':SBE37State.CONNECTING}
-            yield self.send(self.proc_supid,'driver_event_occurred',content)
+            yield self.announce_to_agent(content)
 
             # Attempt to set up a tcp connection to the serial server.
             cc = ClientCreator(reactor, InstrumentConnection, self)
@@ -847,7 +847,7 @@ class SBE37Driver(InstrumentDriver):
             content = {'type':DriverAnnouncement.STATE_CHANGE,
                        'transducer':SBE37Channel.INSTRUMENT,
                        'value':SBE37State.DISCONNECTED}
-            yield self.send(self.proc_supid,'driver_event_occurred',content)
+            yield self.announce_to_agent(content)
             
             # Drop the driver connection.
             # This blocks until the framework closes the connection,
@@ -901,7 +901,7 @@ class SBE37Driver(InstrumentDriver):
             content = {'type':DriverAnnouncement.STATE_CHANGE,
                        'transducer':SBE37Channel.INSTRUMENT,
                        'value':SBE37State.CONNECTED}
-            yield self.send(self.proc_supid,'driver_event_occurred',content)            
+            yield self.announce_to_agent(content)            
             
         elif event == SBE37Event.EXIT:
             pass
@@ -939,8 +939,7 @@ class SBE37Driver(InstrumentDriver):
                 content = {'type':DriverAnnouncement.CONFIG_CHANGE,
                            'transducer':SBE37Channel.INSTRUMENT,
                            'value':config}
-                yield self.send(self.proc_supid,'driver_event_occurred',
-                                content)
+                yield self.announce_to_agent(content)
                 
         elif event == SBE37Event.ACQUIRE_SAMPLE:
             
@@ -954,8 +953,7 @@ class SBE37Driver(InstrumentDriver):
                 self._debug_print('received samples',result)
                 content = {'type':DriverAnnouncement.DATA_RECEIVED,
                            'transducer':SBE37Channel.INSTRUMENT,'value':result}
-                yield self.send(self.proc_supid,'driver_event_occurred',
-                                content)                                                
+                yield self.announce_to_agent(content)                                                
             
         elif event == SBE37Event.START_AUTOSAMPLE:
             
@@ -1012,7 +1010,7 @@ class SBE37Driver(InstrumentDriver):
             content = {'type':DriverAnnouncement.STATE_CHANGE,
                        'transducer':SBE37Channel.INSTRUMENT,
                        'value':SBE37State.AUTOSAMPLE}
-            yield self.send(self.proc_supid,'driver_event_occurred',content)                                    
+            yield self.announce_to_agent(content)                                    
 
             # Clear data lines and sample buffer.
             self._data_lines = []
@@ -1052,7 +1050,7 @@ class SBE37Driver(InstrumentDriver):
                 self._debug_print('received samples',samples)
                 content = {'type':DriverAnnouncement.DATA_RECEIVED,
                            'transducer':SBE37Channel.INSTRUMENT,'value':samples}
-                yield self.send(self.proc_supid,'driver_event_occurred',content)                                                
+                yield self.announce_to_agent(content)                                                
             
         else:            
             success = InstErrorCode.INCORRECT_STATE
@@ -430,7 +430,7 @@ class NMEADeviceDriver(InstrumentDriver):
             content = {'type': DriverAnnouncement.STATE_CHANGE,
                        'transducer':    NMEADeviceChannel.GPS,
                        'value':         NMEADeviceState.UNCONFIGURED}
-            yield self.send(self.proc_supid, 'driver_event_occurred', content)
+            yield self.announce_to_agent(content)
 
             # Transition-in action(s)
             self._initialize()
@@ -474,7 +474,7 @@ class NMEADeviceDriver(InstrumentDriver):
                        'transducer': NMEADeviceChannel.GPS,
                        'value': NMEADeviceState.DISCONNECTED}
 
-            yield self.send(self.proc_supid, 'driver_event_occurred', content)
+            yield self.announce_to_agent(content)
 
         elif event == NMEADeviceEvent.EXIT:
             pass
@@ -516,7 +516,7 @@ class NMEADeviceDriver(InstrumentDriver):
             content = {'type': DriverAnnouncement.STATE_CHANGE,
                        'transducer': NMEADeviceChannel.GPS,
                        'value': NMEADeviceState.CONNECTING}
-            yield self.send(self.proc_supid, 'driver_event_occurred', content)
+            yield self.announce_to_agent(content)
 
             # Transition-in action(s)
             yield self._getConnected()
@@ -563,7 +563,7 @@ class NMEADeviceDriver(InstrumentDriver):
             content = {'type': DriverAnnouncement.STATE_CHANGE,
                        'transducer': NMEADeviceChannel.GPS,
                        'value': NMEADeviceState.DISCONNECTING}
-            yield self.send(self.proc_supid, 'driver_event_occurred', content)
+            yield self.announce_to_agent(content)
 
             # Transition into the state
             if NMEADeviceDriver.serConnection:
@@ -609,7 +609,7 @@ class NMEADeviceDriver(InstrumentDriver):
             content = {'type': DriverAnnouncement.STATE_CHANGE,
                        'transducer': NMEADeviceChannel.GPS,
                        'value': NMEADeviceState.CONNECTED}
-            yield self.send(self.proc_supid, 'driver_event_occurred', content)
+            yield self.announce_to_agent(content)
 
         elif event == NMEADeviceEvent.EXIT:
             pass
@@ -634,7 +634,7 @@ class NMEADeviceDriver(InstrumentDriver):
                 content = {'type': DriverAnnouncement.CONFIG_CHANGE,
                            'transducer': NMEADeviceChannel.GPS,
                            'value': config}
-                yield self.send(self.proc_supid,'driver_event_occurred', content)
+                yield self.announce_to_agent(content)
 
         elif event == NMEADeviceEvent.EXECUTE:
             # params is a single command list, already checked for channels
@@ -656,9 +656,7 @@ class NMEADeviceDriver(InstrumentDriver):
                         content = {'type': DriverAnnouncement.DATA_RECEIVED,
                                    'transducer': NMEADeviceChannel.GPS,
                                    'value': result}
-                        yield self.send(self.proc_supid,
-                                        'driver_event_occurred',
-                                        content)
+                        yield self.announce_to_agent(content)
 
                     else:
                         log.debug('Acquire Sample had no data to return')
@@ -682,9 +680,7 @@ class NMEADeviceDriver(InstrumentDriver):
                         content = {'type': DriverAnnouncement.DATA_RECEIVED,
                                    'transducer': NMEADeviceChannel.GPS,
                                    'value': nmeaLine}
-                        yield self.send(self.proc_supid,
-                                        'driver_event_occurred',
-                                        content)
+                        yield self.announce_to_agent(content)
 
         else:
             success = InstErrorCode.INCORRECT_STATE
@@ -719,7 +715,7 @@ class NMEADeviceDriver(InstrumentDriver):
             content = {'type': DriverAnnouncement.STATE_CHANGE,
                        'transducer': NMEADeviceChannel.GPS,
                         'value': NMEADeviceState.UPDATE_PARAMS}
-            yield self.send(self.proc_supid, 'driver_event_occurred', content)
+            yield self.announce_to_agent(content)
 
             log.debug("UPDATE PARAMS handler: sent state change")
 
@@ -780,7 +776,7 @@ class NMEADeviceDriver(InstrumentDriver):
             content = {'type': DriverAnnouncement.STATE_CHANGE,
                        'transducer':    NMEADeviceChannel.GPS,
                         'value':        NMEADeviceState.UPDATE_PARAMS}
-            yield self.send(self.proc_supid, 'driver_event_occurred', content)
+            yield self.announce_to_agent(content)
 
             # Transition-in action(s)
 
@@ -2432,23 +2432,24 @@ class InstrumentAgent(Process):
                         'driver event occured evoked from a non-child process')
             return
 
+        # Keep the observatory state pushed by the driver.
+        if self._driver_client != None:
+            self._driver_client.update_state(content)
+
         # If data received, coordinate buffering and publishing.
         if type == DriverAnnouncement.DATA_RECEIVED:
             # Remember the transducer in case we need to transmit at a time
             # other than these events.
             self._prev_data_transducer = transducer
 
-            # Get the driver observatory state.
-            key = (DriverChannel.INSTRUMENT, DriverStatus.OBSERVATORY_STATE)
-            reply = yield self._driver_client.get_status([key])
-            success = reply['success']
-            result = reply['result']
-            obs_status = result.get(key, None)
+            # Get the driver observatory state, from the cache when the
+            # driver pushes it.
+            obs_state = yield self._driver_client.get_observatory_state()
             json_val = None
 
             # If in streaming mode, buffer data and publish at intervals.
-            if InstErrorCode.is_ok(success) and obs_status != None:
-                if obs_status[1] == ObservatoryState.STREAMING:
+            if obs_state != None:
+                if obs_state == ObservatoryState.STREAMING:
                     self._data_buffer.append(value)
                     if len(self._data_buffer) > self._data_buffer_limit:
                         # strval = self._get_data_string(self._data_buffer)
@@ -12,6 +12,9 @@ from twisted.internet import defer, reactor
 
 import ion.util.ionlog
 from ion.core.process.process import Process, ProcessClient
+from ion.agents.instrumentagents.instrument_constants import DriverChannel
+from ion.agents.instrumentagents.instrument_constants import DriverStatus
+from ion.agents.instrumentagents.instrument_constants import InstErrorCode
 
 
 
@@ -153,6 +156,25 @@ class InstrumentDriver(Process):
             device_state_list for the common states.)
          """
 
+    def announce_to_agent(self, content):
+        """
+        Send a driver event to the agent. The observatory state of the device
+        is pushed with every announcement so the agent can answer it from a
+        local cache rather than calling get_status for each data event.
+        @param content a dict with 'type' and 'transducer' strings and 'value'
+            object.
+        @retval A deferred that fires when the event is sent.
+        """
+        content['observatory_state'] = self._get_observatory_state()
+        return self.send(self.proc_supid, 'driver_event_occurred', content)
+
+    def _get_observatory_state(self):
+        """
+        Return the observatory state of the device. Drivers that do not
+        override this push None and the agent asks with get_status.
+        """
+        return None
+
 
 class InstrumentDriverClient(ProcessClient):
     """
@@ -160,6 +182,45 @@ class InstrumentDriverClient(ProcessClient):
     Provides RPC messaging to the driver service.    
     """
 
+    """
+    The observatory state last pushed by the driver, None until the driver
+    announces it.
+    """
+    observatory_state = None
+
+    def update_state(self, content):
+        """
+        Update the cached observatory state from a driver announcement.
+        @param content the content dict of a driver_event_occurred message.
+        """
+        obs_state = content.get('observatory_state', None)
+        if obs_state != None:
+            self.observatory_state = obs_state
+
+    def clear_state(self):
+        """
+        Forget the cached observatory state.
+        """
+        self.observatory_state = None
+
+    @defer.inlineCallbacks
+    def get_observatory_state(self):
+        """
+        Get the observatory state of the device from the state pushed by the
+        driver. Only if the driver has not pushed it is the driver asked.
+        @retval The observatory state or None if it is not available.
+        """
+        if self.observatory_state != None:
+            defer.returnValue(self.observatory_state)
+
+        key = (DriverChannel.INSTRUMENT, DriverStatus.OBSERVATORY_STATE)
+        reply = yield self.get_status([key])
+        obs_status = reply['result'].get(key, None)
+        if InstErrorCode.is_ok(reply['success']) and obs_status != None:
+            defer.returnValue(obs_status[1])
+
+        defer.returnValue(None)
+
     @defer.inlineCallbacks
     def execute(self,channels,command,timeout=None):
         """
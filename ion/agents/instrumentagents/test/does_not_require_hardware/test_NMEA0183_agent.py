@@ -30,6 +30,7 @@ from ion.agents.instrumentagents.driver_NMEA0183 import NMEADeviceParam
 from ion.agents.instrumentagents.driver_NMEA0183 import NMEADeviceMetadataParameter
 from ion.agents.instrumentagents.driver_NMEA0183 import NMEADeviceStatus
 import ion.agents.instrumentagents.helper_NMEA0183 as NMEA
+from ion.agents.instrumentagents.instrument_driver import InstrumentDriverClient
 from ion.core.process.process import Process
 
 from ion.services.dm.distribution.events import DataBlockEventSubscriber
@@ -688,3 +689,45 @@ class TestNMEA0183Agent (IonTestCase):
         success = reply['success']
         self.assert_(InstErrorCode.is_ok (success))
         
+
+    @defer.inlineCallbacks
+    def test_publish_data_from_state_cache (self):
+        """
+        Test that streaming data is published using the observatory state
+        pushed by the driver, without a get_status call per sample.
+        """
+        status_calls = []
+        get_status = InstrumentDriverClient.get_status
+        def counting_get_status(client, params, timeout=None):
+            status_calls.append(params)
+            return get_status(client, params, timeout)
+        InstrumentDriverClient.get_status = counting_get_status
+
+        try:
+            reply = yield self.ia_client.start_transaction()
+            tid = reply['transaction_id']
+            self.assert_(InstErrorCode.is_ok (reply['success']))
+
+            # Initialize, connect and enter observatory mode.
+            for event in (AgentEvent.INITIALIZE, AgentEvent.GO_ACTIVE, AgentEvent.RUN):
+                reply = yield self.ia_client.execute_observatory ([AgentCommand.TRANSITION, event], tid)
+                self.assert_(InstErrorCode.is_ok (reply['success']))
+
+            reply = yield self.ia_client.execute_device([NMEADeviceChannel.GPS],
+                [NMEADeviceCommand.START_AUTO_SAMPLING], tid)
+            self.assert_(InstErrorCode.is_ok (reply['success']))
+
+            # Let the simulator stream a few samples.
+            yield pu.asleep(3.0)
+
+            reply = yield self.ia_client.execute_device([NMEADeviceChannel.GPS],
+                [NMEADeviceCommand.STOP_AUTO_SAMPLING], tid)
+            self.assert_(InstErrorCode.is_ok (reply['success']))
+
+            reply = yield self.ia_client.end_transaction (tid)
+            self.assert_(InstErrorCode.is_ok (reply['success']))
+
+        finally:
+            InstrumentDriverClient.get_status = get_status
+
+        self.assertEqual(status_calls, [])
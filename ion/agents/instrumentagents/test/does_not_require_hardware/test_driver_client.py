@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""
+@file ion/agents/instrumentagents/test/does_not_require_hardware/test_driver_client.py
+@brief Test the observatory state cache of the instrument driver client.
+@author David Stuebe
+"""
+
+from twisted.internet import defer
+
+import ion.util.ionlog
+from ion.test.iontest import IonTestCase
+
+from ion.core.process.process import Process
+from ion.agents.instrumentagents.instrument_driver import InstrumentDriverClient
+from ion.agents.instrumentagents.instrument_constants import DriverAnnouncement
+from ion.agents.instrumentagents.instrument_constants import DriverChannel
+from ion.agents.instrumentagents.instrument_constants import DriverStatus
+from ion.agents.instrumentagents.instrument_constants import InstErrorCode
+from ion.agents.instrumentagents.instrument_constants import ObservatoryState
+
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class CountingDriverClient(InstrumentDriverClient):
+    """
+    Answers get_status locally and counts the calls.
+    """
+
+    status_calls = 0
+
+    def get_status(self, params, timeout=None):
+        self.status_calls += 1
+        key = (DriverChannel.INSTRUMENT, DriverStatus.OBSERVATORY_STATE)
+        return defer.succeed({'success':InstErrorCode.OK,
+                              'result':{key:(InstErrorCode.OK, ObservatoryState.STANDBY)}})
+
+
+class TestDriverClientStateCache(IonTestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        yield self._start_container()
+        self.client = CountingDriverClient(proc=Process(), target='driver')
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self._stop_container()
+
+    @defer.inlineCallbacks
+    def test_pushed_state(self):
+
+        # Nothing pushed yet - ask the driver
+        obs_state = yield self.client.get_observatory_state()
+        self.assertEqual(obs_state, ObservatoryState.STANDBY)
+        self.assertEqual(self.client.status_calls, 1)
+
+        # Announcements without a state leave the cache alone
+        self.client.update_state({'type':DriverAnnouncement.DATA_RECEIVED,
+                                  'transducer':DriverChannel.INSTRUMENT,
+                                  'value':'sample'})
+        self.assertEqual(self.client.observatory_state, None)
+
+        self.client.update_state({'type':DriverAnnouncement.STATE_CHANGE,
+                                  'transducer':DriverChannel.INSTRUMENT,
+                                  'value':'DRIVER_STATE_AUTOSAMPLE',
+                                  'observatory_state':ObservatoryState.STREAMING})
+
+        # Data events cost no round trips now
+        for i in range(100):
+            self.client.update_state({'type':DriverAnnouncement.DATA_RECEIVED,
+                                      'transducer':DriverChannel.INSTRUMENT,
+                                      'value':'sample %d' % i,
+                                      'observatory_state':ObservatoryState.STREAMING})
+            obs_state = yield self.client.get_observatory_state()
+            self.assertEqual(obs_state, ObservatoryState.STREAMING)
+
+        self.assertEqual(self.client.status_calls, 1)
+
+        self.client.update_state({'type':DriverAnnouncement.STATE_CHANGE,
+                                  'transducer':DriverChannel.INSTRUMENT,
+                                  'value':'DRIVER_STATE_CONNECTED',
+                                  'observatory_state':ObservatoryState.STANDBY})
+        obs_state = yield self.client.get_observatory_state()
+        self.assertEqual(obs_state, ObservatoryState.STANDBY)
+
+        self.client.clear_state()
+        self.assertEqual(self.client.observatory_state, None)
@@ -0,0 +1,272 @@
+"""
+@file ion/core/data/cached_store.py
+@author David Stuebe
+@brief A process local read through cache in front of any store. Blobs are keyed by the sha1 of their content and
+never change, so once read or written a value can be served from memory, and so can the answer to has_key.
+"""
+
+from zope.interface import implements
+
+from twisted.internet import defer, reactor
+
+from ion.core.data import store
+from ion.util.cache import LRUDict
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+# Existence entries held - positive and negative
+DEFAULT_EXISTENCE_LIMIT = 100000
+
+
+def _request_values(batch_request):
+    """
+    The key and value of each row in a batch put request - None for a row which only updates index attributes
+    """
+    for key, request in batch_request._br.iteritems():
+        if isinstance(request, tuple):
+            # SimpleBatchRequest - (value, index_attributes)
+            value = request[0]
+        else:
+            # CassandraBatchRequest - the columns to write for each column family
+            value = None
+            for columns in request.itervalues():
+                value = columns.get('value', value)
+        yield key, value
+
+
+class CachedStore(object):
+    """
+    Wraps a store with a size bounded cache of values and a cache of has_key results.
+
+    A value is cached when it is read or written through the cache. A key known to exist is cached until it is removed
+    through the cache. A key known not to exist is cached for negative_ttl seconds only - another process may put it.
+    A get which misses is never cached; it always goes to the backend.
+
+    Attributes which are not part of the store interface (life cycle methods and the like) are those of the backend.
+
+    @param backend the store to wrap
+    @param max_bytes the limit on the size of the cached values
+    @param max_keys the limit on the number of cached has_key results
+    @param negative_ttl seconds for which a missing key is remembered, zero to not remember missing keys
+    @param clock an IReactorTime provider
+    """
+    implements(store.IStore)
+
+    def __init__(self, backend, max_bytes=10**7, max_keys=DEFAULT_EXISTENCE_LIMIT, negative_ttl=5.0, clock=None):
+
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self.clock = clock or reactor
+
+        self._values = LRUDict(max_bytes, use_size=True)
+        # key -> True if the key exists, else the time at which the negative entry expires
+        self._exists = LRUDict(max_keys)
+
+        self.value_hits = 0
+        self.value_misses = 0
+        self.exists_hits = 0
+        self.exists_misses = 0
+
+    def __getattr__(self, name):
+        if name == 'backend':
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def get_stats(self):
+        """
+        @retval a dictionary of the hit and miss counts and the size of the cache
+        """
+        return {'value_hits':self.value_hits,
+                'value_misses':self.value_misses,
+                'exists_hits':self.exists_hits,
+                'exists_misses':self.exists_misses,
+                'cached_values':len(self._values),
+                'cached_bytes':self._values.total_size,
+                'cached_keys':len(self._exists)}
+
+    def clear_cache(self):
+        self._values.clear()
+        self._exists.clear()
+
+    def new_batch_request(self):
+        return self.backend.new_batch_request()
+
+    def _cache_value(self, key, value):
+        if value is None:
+            return
+
+        self._exists[key] = True
+        # A value larger than the whole cache would flush it
+        if value.__sizeof__() < self.max_bytes:
+            self._values[key] = value
+
+    def _cache_exists(self, key, exists):
+        if exists:
+            self._exists[key] = True
+        elif self.negative_ttl > 0:
+            self._exists[key] = self.clock.seconds() + self.negative_ttl
+
+    def _cached_exists(self, key):
+        """
+        @retval True or False if the cache knows, else None
+        """
+        entry = self._exists.get(key, None)
+        if entry is True:
+            return True
+        elif entry is None:
+            return None
+        elif entry > self.clock.seconds():
+            return False
+
+        del self._exists[key]
+        return None
+
+    def _invalidate(self, key):
+        if key in self._values:
+            del self._values[key]
+        if key in self._exists:
+            del self._exists[key]
+
+    @defer.inlineCallbacks
+    def get(self, key):
+        """
+        @see IStore.get
+        """
+        value = self._values.get(key, None)
+        if value is not None:
+            self.value_hits += 1
+            defer.returnValue(value)
+
+        self.value_misses += 1
+        value = yield self.backend.get(key)
+        self._cache_value(key, value)
+        defer.returnValue(value)
+
+    @defer.inlineCallbacks
+    def batch_get(self, batch_request):
+        """
+        @see IStore.batch_get - only the keys which are not cached are read from the backend
+        """
+        result = {}
+        miss_request = self.backend.new_batch_request()
+        for key in batch_request._br.iterkeys():
+            value = self._values.get(key, None)
+            if value is not None:
+                self.value_hits += 1
+                result[key] = value
+            else:
+                self.value_misses += 1
+                miss_request.add_request(key)
+
+        if len(miss_request) > 0:
+            values = yield self.backend.batch_get(miss_request)
+            for key, value in values.iteritems():
+                self._cache_value(key, value)
+                result[key] = value
+
+        defer.returnValue(result)
+
+    @defer.inlineCallbacks
+    def put(self, key, value):
+        """
+        @see IStore.put - the value is cached once the backend has it
+        """
+        self._invalidate(key)
+        yield self.backend.put(key, value)
+        self._cache_value(key, value)
+
+    @defer.inlineCallbacks
+    def batch_put(self, batch_request):
+        """
+        @see IStore.batch_put
+        """
+        for key in batch_request._br.iterkeys():
+            self._invalidate(key)
+
+        yield self.backend.batch_put(batch_request)
+
+        for key, value in _request_values(batch_request):
+            self._cache_value(key, value)
+
+    @defer.inlineCallbacks
+    def remove(self, key):
+        """
+        @see IStore.remove
+        """
+        self._invalidate(key)
+        yield self.backend.remove(key)
+        self._invalidate(key)
+
+    @defer.inlineCallbacks
+    def has_key(self, key):
+        """
+        @see IStore.has_key
+        """
+        exists = self._cached_exists(key)
+        if exists is not None:
+            self.exists_hits += 1
+            defer.returnValue(exists)
+
+        self.exists_misses += 1
+        exists = yield self.backend.has_key(key)
+        self._cache_exists(key, exists)
+        defer.returnValue(exists)
+
+    @defer.inlineCallbacks
+    def batch_has_key(self, batch_request):
+        """
+        @see IStore.batch_has_key - only the keys which are not cached are checked in the backend
+        """
+        result = {}
+        miss_request = self.backend.new_batch_request()
+        for key in batch_request._br.iterkeys():
+            exists = self._cached_exists(key)
+            if exists is not None:
+                self.exists_hits += 1
+                result[key] = exists
+            else:
+                self.exists_misses += 1
+                miss_request.add_request(key)
+
+        if len(miss_request) > 0:
+            found = yield self.backend.batch_has_key(miss_request)
+            for key, exists in found.iteritems():
+                self._cache_exists(key, exists)
+                result[key] = exists
+
+        defer.returnValue(result)
+
+
+class CachedIndexStore(CachedStore):
+    """
+    A cache in front of an index store such as the commit store. The value of a row is cached like a blob, but its
+    index attributes change as branches move - queries and index updates always go to the backend, and missing keys
+    are not remembered by default.
+    """
+    implements(store.IIndexStore)
+
+    def __init__(self, backend, max_bytes=10**7, max_keys=DEFAULT_EXISTENCE_LIMIT, negative_ttl=0, clock=None):
+        CachedStore.__init__(self, backend, max_bytes, max_keys, negative_ttl, clock)
+
+    @defer.inlineCallbacks
+    def put(self, key, value, index_attributes=None):
+        """
+        @see IIndexStore.put
+        """
+        self._invalidate(key)
+        yield self.backend.put(key, value, index_attributes)
+        self._cache_value(key, value)
+
+    def query(self, query_predicates):
+        return self.backend.query(query_predicates)
+
+    def query_cursor(self, query_predicates, page_size=store.DEFAULT_QUERY_PAGE_SIZE):
+        return self.backend.query_cursor(query_predicates, page_size)
+
+    def update_index(self, key, index_attributes):
+        return self.backend.update_index(key, index_attributes)
+
+    def get_query_attributes(self):
+        return self.backend.get_query_attributes()
@@ -676,30 +676,28 @@ class CassandraIndexedStore(CassandraStore):
         """
         #log.info('Query against cache: %s' % self._cache_name)
 
+        queries = query_predicates.expand_in()
+        if queries != [query_predicates]:
+            # Cassandra can not search an index for a set of values - make the queries for each value together
+            semaphore = defer.DeferredSemaphore(store.DEFAULT_IN_QUERY_CONCURRENCY)
+            results = yield defer.DeferredList([semaphore.run(self.query, q, row_count) for q in queries], fireOnOneErrback=True, consumeErrors=True)
+            result = {}
+            for success, rows in results:
+                result.update(rows)
+            defer.returnValue(result)
+
         tic = time.time()
 
 
         predicates = query_predicates.get_predicates()
-        def fix_preds(query_tuple):
-            if query_tuple[2] == Query.EQ:
-                new_pred = IndexOperator.EQ
-            elif query_tuple[2] == Query.GT:
-                new_pred = IndexOperator.GT
-            else:
-                raise CassandraError("Illegal predicate value")
-            args = {'column_name':query_tuple[0], 'op':new_pred, 'value': query_tuple[1]}
-            return IndexExpression(**args)
-        selection_predicates = map(fix_preds, predicates)
+        selection_predicates = self._selection_predicates(query_predicates)
         #log.debug("Calling get_indexed_slices selection_predicate %s " % (selection_predicates,))
         
         rows = yield self.client.get_indexed_slices(self._cache_name, selection_predicates, count=row_count)
         #log.info("Got rows back")
         result ={}
         for row in rows:
-            row_vals = {}
-            for column in row.columns:
-                row_vals[column.column.name] = column.column.value
-            result[row.key] = row_vals
+            result[row.key] = _row_columns(row)
 
 
         toc = time.time()
@@ -715,6 +713,42 @@ class CassandraIndexedStore(CassandraStore):
 
         defer.returnValue(result)
         
+    def query_cursor(self, query_predicates, page_size=store.DEFAULT_QUERY_PAGE_SIZE):
+        """
+        Search for rows in the Cassandra instance, returning the results in pages of at most page_size rows. Each
+        page is a separate get_indexed_slices call which starts at the last key of the previous page, so neither the
+        client nor the server holds more than one page of the result.
+
+        @param query_predicates is an instance of store.Query.
+        @param page_size the maximum number of rows in each page of results
+        @retVal a CassandraQueryCursor
+
+        raises a CassandraError if the query_predicate object is malformed.
+        """
+        queries = query_predicates.expand_in()
+        if queries != [query_predicates]:
+            # Cassandra can not search an index for a set of values - page through the queries for several values at once
+            return store.ChainedQueryCursor([self.query_cursor(q, page_size) for q in queries], page_size)
+
+        selection_predicates = self._selection_predicates(query_predicates)
+
+        return CassandraQueryCursor(self, selection_predicates, page_size)
+
+    def _selection_predicates(self, query_predicates):
+        """
+        Convert the predicates of a store.Query to a list of thrift IndexExpressions
+        """
+        def fix_preds(query_tuple):
+            if query_tuple[2] == Query.EQ:
+                new_pred = IndexOperator.EQ
+            elif query_tuple[2] == Query.GT:
+                new_pred = IndexOperator.GT
+            else:
+                raise CassandraError("Illegal predicate value")
+            args = {'column_name':query_tuple[0], 'op':new_pred, 'value': query_tuple[1]}
+            return IndexExpression(**args)
+        return map(fix_preds, query_predicates.get_predicates())
+
     @timeout(cassandra_timeout)
     @defer.inlineCallbacks
     def get_query_attributes(self):
@@ -735,6 +769,67 @@ class CassandraIndexedStore(CassandraStore):
 
 
 
+def _row_columns(row):
+    """
+    Convert a thrift KeySlice to a dictionary of column names and values
+    """
+    row_vals = {}
+    for column in row.columns:
+        row_vals[column.column.name] = column.column.value
+    return row_vals
+
+
+class CassandraQueryCursor(store.QueryCursor):
+    """
+    Query cursor for the CassandraIndexedStore. Cassandra returns the rows of an indexed slice in token order and
+    includes the start key in the result, so each page after the first asks for one extra row and drops the row
+    which was the last row of the previous page.
+    """
+
+    def __init__(self, indexed_store, selection_predicates, page_size=store.DEFAULT_QUERY_PAGE_SIZE):
+
+        store.QueryCursor.__init__(self, page_size)
+
+        self._indexed_store = indexed_store
+        self._selection_predicates = selection_predicates
+
+        self._start_key = ''
+
+    @timeout(cassandra_timeout)
+    @defer.inlineCallbacks
+    def next_page(self):
+
+        if self.exhausted:
+            defer.returnValue({})
+
+        tic = time.time()
+
+        count = self.page_size
+        if self._start_key:
+            count += 1
+
+        indexed_store = self._indexed_store
+        rows = yield indexed_store.client.get_indexed_slices(indexed_store._cache_name, self._selection_predicates, start_key=self._start_key, count=count)
+
+        if len(rows) < count:
+            self.exhausted = True
+
+        page = {}
+        for row in rows:
+            if row.key == self._start_key:
+                continue
+            page[row.key] = _row_columns(row)
+
+        if rows:
+            self._start_key = rows[-1].key
+
+        toc = time.time()
+
+        indexed_store.query_stats.add_stats(tic, toc, len(self._selection_predicates), len(page))
+
+        defer.returnValue(self._add_page(page))
+
+
 class CassandraStorageResource:
     """
     This class holds the connection information in the
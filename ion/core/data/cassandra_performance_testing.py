@@ -3,14 +3,20 @@
 @author Matt Rodriguez
 @brief Generates cassandra-cli commands given the storage.cfg file as input.
 
+Run against cassandra on localhost, or with -t sqlite or -t memory against the sqlite backend in a temporary
+directory or the in memory stores, to compare their throughput.
 """
 from ion.core.data.cassandra_bootstrap import CassandraStoreBootstrap, CassandraIndexedStoreBootstrap
 from ion.core.data.store import Query
+from ion.core.data import store
+from ion.core.data import sqlite_store
 from twisted.internet import defer
 from twisted.internet import reactor
 
 import sha, time
 import random
+import shutil
+import tempfile
 from optparse import OptionParser
 
 import ion.util.ionlog
@@ -19,18 +25,42 @@ log = ion.util.ionlog.getLogger(__name__)
 KB = 1024
 MB = 1024 * 1024
 
+CASSANDRA = 'cassandra'
+SQLITE = 'sqlite'
+MEMORY = 'memory'
+TECHNOLOGIES = [CASSANDRA, SQLITE, MEMORY]
+
 
 
 
 class CassandraPerformanceTester:
     
-    def __init__(self,  num_rows = 100, blob_size=MB, index=False,):
+    def __init__(self,  num_rows = 100, blob_size=MB, index=False, technology=CASSANDRA):
         self.index = index
         self.blob_size = blob_size
-        if self.index:
-            self.store = CassandraIndexedStoreBootstrap("ooiuser", "oceans11", {"host":"localhost", "port":9160}, "sysname", "commits")
+        self.technology = technology
+        self.indexes = ["branch_name","keyword","object_branch",
+                   "object_commit","object_key","predicate_branch",
+                   "predicate_commit","predicate_key","repository_key",
+                   "subject_branch","subject_commit","subject_key" ]
+        self.directory = None
+
+        if technology == CASSANDRA:
+            if self.index:
+                self.store = CassandraIndexedStoreBootstrap("ooiuser", "oceans11", {"host":"localhost", "port":9160}, "sysname", "commits")
+            else:
+                self.store = CassandraStoreBootstrap("ooiuser", "oceans11", {"host":"localhost", "port":9160}, "sysname", "blobs")
+        elif technology == SQLITE:
+            self.directory = tempfile.mkdtemp()
+            if self.index:
+                self.store = sqlite_store.SqliteIndexStore("sysname", "commits", indices=self.indexes, directory=self.directory)
+            else:
+                self.store = sqlite_store.SqliteStore("sysname", "blobs", directory=self.directory)
         else:
-            self.store = CassandraStoreBootstrap("ooiuser", "oceans11", {"host":"localhost", "port":9160}, "sysname", "blobs")
+            if self.index:
+                self.store = store.IndexStore(indices=self.indexes, private=True)
+            else:
+                self.store = store.Store()
         
         self.num_rows = num_rows
         self.blobs = {}
@@ -45,13 +75,10 @@ class CassandraPerformanceTester:
         diff = t2 - t1
         print "Time creating blobs %s " % (diff,)
         
-        #Have the store connect to the Cassandra cluster
-        self.store.initialize()
-        self.store.activate()
-        self.indexes = ["branch_name","keyword","object_branch",
-                   "object_commit","object_key","predicate_branch",
-                   "predicate_commit","predicate_key","repository_key",
-                   "subject_branch","subject_commit","subject_key" ]
+        if technology == CASSANDRA:
+            #Have the store connect to the Cassandra cluster
+            self.store.initialize()
+            self.store.activate()
         self.index_values_dict = {}
         
         
@@ -263,12 +290,15 @@ class CassandraPerformanceTester:
         t2 = time.time()
         diff = t2 - t1
         print "Time to do %s removes %s " % (len(keys),diff)
+        if self.directory is not None:
+            self.store.close()
+            shutil.rmtree(self.directory)
         reactor.stop()
           
 class CassandraBenchmarkTests(CassandraPerformanceTester):
     
-    def __init__(self, num_rows = 100, blob_size=MB, index=False):
-        CassandraPerformanceTester.__init__(self, num_rows, blob_size, index)
+    def __init__(self, num_rows = 100, blob_size=MB, index=False, technology=CASSANDRA):
+        CassandraPerformanceTester.__init__(self, num_rows, blob_size, index, technology)
         
 
             
@@ -361,8 +391,8 @@ class CassandraBenchmarkTests(CassandraPerformanceTester):
         
 class CassandraQueryBenchmarks(CassandraPerformanceTester):
     
-    def __init__(self,  num_rows = 100, blob_size=MB, index=True):
-        CassandraPerformanceTester.__init__(self, num_rows, blob_size, index)
+    def __init__(self,  num_rows = 100, blob_size=MB, index=True, technology=CASSANDRA):
+        CassandraPerformanceTester.__init__(self, num_rows, blob_size, index, technology)
     
     def runTests(self):
         self.runQueryBenchMarks()
@@ -398,8 +428,12 @@ class CassandraQueryBenchmarks(CassandraPerformanceTester):
     def runQuery(self, q, pred_type):
         dl = []
         t1 = time.time()
+        # Only cassandra takes a limit on the number of rows
+        kwargs = {}
+        if self.technology == CASSANDRA:
+            kwargs['row_count'] = 1000
         for i in range(50):
-            query_def =  self.store.query(q,row_count=1000)
+            query_def =  self.store.query(q,**kwargs)
             dl.append(query_def)
         yield defer.DeferredList(dl)    
         t2 = time.time()
@@ -457,12 +491,13 @@ def main():
     parser.add_option("-s", "--size", dest="size", default=MB, help="The number of blobs or rows to put into Cassandra")
     parser.add_option("-i", "--indexed", action="store_true", dest="indexed", default=False, help="Use the indexed column family or the nonindexed column family")
     parser.add_option("-q", "--query", action="store_true", dest="query", default=False, help="Run the query benchmarks, assumes we are using indexes")
+    parser.add_option("-t", "--technology", dest="technology", default=CASSANDRA, choices=TECHNOLOGIES, help="The store backend to benchmark: %s" % ", ".join(TECHNOLOGIES))
     opts, args = parser.parse_args()
     if opts.query:
-        tester = CassandraQueryBenchmarks(num_rows=int(opts.blobs),blob_size=int(opts.size))
+        tester = CassandraQueryBenchmarks(num_rows=int(opts.blobs),blob_size=int(opts.size),technology=opts.technology)
         
     else:
-        tester = CassandraBenchmarkTests(num_rows=int(opts.blobs),blob_size=int(opts.size),index=opts.indexed)
+        tester = CassandraBenchmarkTests(num_rows=int(opts.blobs),blob_size=int(opts.size),index=opts.indexed,technology=opts.technology)
     
     tester.runBenchMarks()
     reactor.run() 
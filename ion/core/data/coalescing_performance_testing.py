@@ -0,0 +1,125 @@
+"""
+@file ion/core/data/coalescing_performance_testing.py
+@author David Stuebe
+@brief Measure the time to flush the blobs of a repository to the blob store - one put per blob, as
+flush_repo_to_backend issues them, straight to the store against the write behind CoalescingStore.
+
+The blob store is an in memory stand in for cassandra: it has one connection, so mutations are written one at a time,
+and each costs a fixed round trip plus a transfer time per byte.
+
+Run as a script:
+python ion/core/data/coalescing_performance_testing.py -b 1000,5000,10000 -s 1024 -t 0.002 -r 500
+"""
+
+import time
+from optparse import OptionParser
+
+from twisted.internet import defer, reactor, task
+
+from ion.core.data import store
+from ion.core.data.coalescing_store import CoalescingStore
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class SlowBlobStore(store.Store):
+    """
+    A memory store with its own storage where each put or batch_put waits for the mutation before it
+    """
+
+    def __init__(self, round_trip, bytes_per_second):
+        self.kvs = {}
+        self.round_trip = round_trip
+        self.bytes_per_second = bytes_per_second
+        self.mutations = 0
+        self._lock = defer.DeferredLock()
+
+    @defer.inlineCallbacks
+    def _mutate(self, rows):
+        yield self._lock.acquire()
+        try:
+            self.mutations += 1
+            size = sum([len(value) for value in rows.itervalues()])
+            yield task.deferLater(reactor, self.round_trip + float(size) / self.bytes_per_second, lambda: None)
+            self.kvs.update(rows)
+        finally:
+            self._lock.release()
+
+    def put(self, key, value):
+        return self._mutate({key:value})
+
+    def batch_put(self, batch_request):
+        return self._mutate(dict([(key, value) for key, (value, index_attributes) in batch_request._br.iteritems()]))
+
+
+class CoalescingPerformanceTester:
+
+    def __init__(self, blob_counts, blob_size, round_trip, max_rows, delay, bytes_per_second):
+
+        self.blob_counts = blob_counts
+        self.blob_size = blob_size
+        self.round_trip = round_trip
+        self.max_rows = max_rows
+        self.delay = delay
+        self.bytes_per_second = bytes_per_second
+
+    def make_blobs(self, num_blobs):
+        return dict([('blob_%08d' % i, '%08d' % i + 'x' * (self.blob_size - 8)) for i in xrange(num_blobs)])
+
+    def flush(self, blob_store, blobs):
+        # Like flush_repo_to_backend - a put per blob, then wait for all of them
+        def_list = []
+        for key, value in blobs.iteritems():
+            def_list.append(blob_store.put(key, value))
+        return defer.DeferredList(def_list, fireOnOneErrback=True)
+
+    @defer.inlineCallbacks
+    def run_direct(self, blobs):
+        backend = SlowBlobStore(self.round_trip, self.bytes_per_second)
+        yield self.flush(backend, blobs)
+        defer.returnValue(backend)
+
+    @defer.inlineCallbacks
+    def run_coalesced(self, blobs):
+        backend = SlowBlobStore(self.round_trip, self.bytes_per_second)
+        blob_store = CoalescingStore(backend, delay=self.delay, max_rows=self.max_rows)
+        yield self.flush(blob_store, blobs)
+        defer.returnValue(backend)
+
+    @defer.inlineCallbacks
+    def runBenchMarks(self):
+        for num_blobs in self.blob_counts:
+            blobs = self.make_blobs(num_blobs)
+
+            for name, method in [('Put per blob', self.run_direct), ('Coalesced puts', self.run_coalesced)]:
+                t1 = time.time()
+                backend = yield method(blobs)
+                t2 = time.time()
+                assert len(backend.kvs) == num_blobs
+
+                print "%s: %d blobs of %d bytes - %f seconds (%f blobs per second), %d mutations" % \
+                    (name, num_blobs, self.blob_size, t2 - t1, num_blobs / (t2 - t1), backend.mutations)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-b", "--blobs", dest="blobs", default="1000,5000,10000", help="Comma separated list of the number of blobs in the repository")
+    parser.add_option("-s", "--size", dest="size", default=1024, help="The size of each blob in bytes")
+    parser.add_option("-t", "--round_trip", dest="round_trip", default=0.002, help="Simulated round trip time of a mutation in seconds")
+    parser.add_option("-w", "--bandwidth", dest="bandwidth", default=50000000, help="Simulated cassandra bandwidth in bytes per second")
+    parser.add_option("-r", "--rows", dest="rows", default=500, help="The number of rows at which a batch is written")
+    parser.add_option("-d", "--delay", dest="delay", default=0.005, help="Seconds to wait for more puts before writing a batch")
+    opts, args = parser.parse_args()
+
+    blob_counts = [int(x) for x in opts.blobs.split(',')]
+    tester = CoalescingPerformanceTester(blob_counts, int(opts.size), float(opts.round_trip), int(opts.rows),
+                                         float(opts.delay), float(opts.bandwidth))
+
+    d = tester.runBenchMarks()
+    d.addErrback(log.error)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+@file ion/core/data/coalescing_store.py
+@author David Stuebe
+@brief A write behind layer for any store. Puts issued within a short window are gathered into one batch_put - one
+batch_mutate for a cassandra store - instead of a round trip each. Every caller still gets its own deferred, which
+fires when its write is in the backend.
+"""
+
+from zope.interface import implements
+
+from twisted.internet import defer, reactor
+from twisted.python import failure
+
+from ion.core.data import store
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class CoalescingStore(object):
+    """
+    Wraps a store so that puts are written in batches. A batch is written when it has max_rows rows or max_bytes
+    bytes of values, or delay seconds after its first put.
+
+    Writes reach the backend in the order they were made: one batch or other mutation is in flight at a time, and a
+    put to a key which is already waiting starts a new batch. Reads wait for the writes made before them.
+
+    If a batch fails, every put in it fails with the same error.
+
+    Attributes which are not part of the store interface (life cycle methods and the like) are those of the backend.
+
+    @param backend the store to wrap
+    @param delay seconds to wait for more puts before writing a batch
+    @param max_rows the number of rows at which a batch is written at once
+    @param max_bytes the size of the values at which a batch is written at once
+    @param clock an IReactorTime provider
+    """
+    implements(store.IStore)
+
+    def __init__(self, backend, delay=0.005, max_rows=500, max_bytes=4*1024*1024, clock=None):
+
+        self.backend = backend
+        self.delay = delay
+        self.max_rows = max(int(max_rows), 1)
+        self.max_bytes = max_bytes
+        self.clock = clock or reactor
+
+        # The puts waiting to be written: (key, value, index_attributes, deferred)
+        self._pending = []
+        self._pending_keys = set()
+        self._pending_bytes = 0
+        self._timer = None
+
+        # Mutations ready to write, in order: (operation, [deferreds])
+        self._queue = []
+        self._running = False
+
+        # Operations queued and completed so far, and the reads waiting for them: (sequence, deferred)
+        self._issued = 0
+        self._completed = 0
+        self._barriers = []
+
+        # Statistics
+        self.puts = 0
+        self.batches = 0
+
+    def __getattr__(self, name):
+        if name == 'backend':
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def new_batch_request(self):
+        return self.backend.new_batch_request()
+
+    def put(self, key, value):
+        """
+        @see IStore.put
+        @retval a deferred which fires when the value is in the backend
+        """
+        return self._add_put(key, value, None)
+
+    def batch_put(self, batch_request):
+        """
+        @see IStore.batch_put - written after the puts made before it
+        """
+        return self._enqueue(lambda: self.backend.batch_put(batch_request))
+
+    def remove(self, key):
+        """
+        @see IStore.remove
+        """
+        return self._enqueue(lambda: self.backend.remove(key))
+
+    @defer.inlineCallbacks
+    def get(self, key):
+        yield self.flush()
+        value = yield self.backend.get(key)
+        defer.returnValue(value)
+
+    @defer.inlineCallbacks
+    def batch_get(self, batch_request):
+        yield self.flush()
+        result = yield self.backend.batch_get(batch_request)
+        defer.returnValue(result)
+
+    @defer.inlineCallbacks
+    def has_key(self, key):
+        yield self.flush()
+        result = yield self.backend.has_key(key)
+        defer.returnValue(result)
+
+    @defer.inlineCallbacks
+    def batch_has_key(self, batch_request):
+        yield self.flush()
+        result = yield self.backend.batch_has_key(batch_request)
+        defer.returnValue(result)
+
+    def flush(self):
+        """
+        Write the waiting puts now
+        @retval a deferred which fires when every write made so far is done, whether or not it succeeded
+        """
+        self._send_pending()
+
+        if self._completed >= self._issued:
+            return defer.succeed(None)
+
+        d = defer.Deferred()
+        self._barriers.append((self._issued, d))
+        return d
+
+    def _add_put(self, key, value, index_attributes):
+
+        # Keep the order of writes to the same key
+        if key in self._pending_keys:
+            self._send_pending()
+
+        d = defer.Deferred()
+        self._pending.append((key, value, index_attributes, d))
+        self._pending_keys.add(key)
+        self._pending_bytes += len(value)
+        self.puts += 1
+
+        if len(self._pending) >= self.max_rows or self._pending_bytes >= self.max_bytes:
+            self._send_pending()
+        elif self._timer is None:
+            self._timer = self.clock.callLater(self.delay, self._timeout)
+
+        return d
+
+    def _timeout(self):
+        self._timer = None
+        self._send_pending()
+
+    def _send_pending(self):
+        if self._timer is not None:
+            if self._timer.active():
+                self._timer.cancel()
+            self._timer = None
+
+        if not self._pending:
+            return
+
+        rows = self._pending
+        self._pending = []
+        self._pending_keys = set()
+        self._pending_bytes = 0
+
+        self._queue.append((lambda: self._write(rows), [row[3] for row in rows]))
+        self._issued += 1
+        self.batches += 1
+        self._run()
+
+    @defer.inlineCallbacks
+    def _write(self, rows):
+        batch_request = self.backend.new_batch_request()
+        for key, value, index_attributes, d in rows:
+            yield batch_request.add_request(key, value, index_attributes)
+
+        yield self.backend.batch_put(batch_request)
+
+    def _enqueue(self, operation):
+        """
+        Queue a mutation behind the puts made before it
+        """
+        self._send_pending()
+
+        d = defer.Deferred()
+        self._queue.append((operation, [d]))
+        self._issued += 1
+        self._run()
+        return d
+
+    def _run(self):
+        if self._running or not self._queue:
+            return
+
+        self._running = True
+        operation, waiters = self._queue.pop(0)
+
+        d = defer.maybeDeferred(operation)
+        d.addBoth(self._done, waiters)
+
+    def _done(self, result, waiters):
+        self._running = False
+        self._completed += 1
+
+        if isinstance(result, failure.Failure):
+            log.error('Coalesced write of %d rows failed: %s' % (len(waiters), result.getErrorMessage()))
+            for waiter in waiters:
+                waiter.errback(result)
+        else:
+            for waiter in waiters:
+                waiter.callback(result)
+
+        self._run()
+
+        ready = [d for sequence, d in self._barriers if sequence <= self._completed]
+        self._barriers = [(sequence, d) for sequence, d in self._barriers if sequence > self._completed]
+        for d in ready:
+            d.callback(None)
+
+        return None
+
+
+class CoalescingIndexStore(CoalescingStore):
+    """
+    A write behind layer for an index store. Index updates are written in order with the puts; queries wait for the
+    writes made before them.
+    """
+    implements(store.IIndexStore)
+
+    def put(self, key, value, index_attributes=None):
+        """
+        @see IIndexStore.put
+        """
+        if index_attributes is None:
+            index_attributes = {}
+        return self._add_put(key, value, index_attributes)
+
+    def update_index(self, key, index_attributes):
+        return self._enqueue(lambda: self.backend.update_index(key, index_attributes))
+
+    @defer.inlineCallbacks
+    def query(self, query_predicates):
+        yield self.flush()
+        rows = yield self.backend.query(query_predicates)
+        defer.returnValue(rows)
+
+    def query_cursor(self, query_predicates, page_size=store.DEFAULT_QUERY_PAGE_SIZE):
+        self._send_pending()
+        if self._completed >= self._issued:
+            return self.backend.query_cursor(query_predicates, page_size)
+
+        # Writes are in flight - query once they are done
+        return store.ResultQueryCursor(self.query, query_predicates, page_size)
+
+    def get_query_attributes(self):
+        return self.backend.get_query_attributes()
@@ -0,0 +1,151 @@
+"""
+@file ion/core/data/index_store_performance_testing.py
+@author David Stuebe
+@brief Compare the time to query the in memory IndexStore using the query planner and sorted indices against the old
+evaluation - predicates applied in the order given, and a scan of every value of the index for a GT predicate.
+
+Run as a script:
+python ion/core/data/index_store_performance_testing.py -r 100000,300000 -n 20
+"""
+
+import time
+from optparse import OptionParser
+
+from ion.core.data import store
+from ion.core.data.store import Query
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+INDEXES = ['object_type', 'repository_key', 'keyword', 'date']
+
+
+def _result(deferred):
+    """
+    The in memory store returns deferreds which have already fired - get the result
+    """
+    result = []
+    deferred.addCallback(result.append)
+    return result[0]
+
+
+class ScanIndexStore(store.IndexStore):
+    """
+    The IndexStore with the query evaluation it had before the planner
+    """
+
+    def _query_keys(self, query_predicates):
+        predicates = query_predicates.get_predicates()
+
+        eq_filter = lambda x: x[2] == Query.EQ or x[2] == Query.IN
+        preds_eq = filter(eq_filter, predicates)
+        keys = set()
+        if len(preds_eq) == 0:
+            raise store.IndexStoreError('Invalid arguments to IndexStore - must provide at least one equal to operator for search!')
+        else:
+            k,v,pred = preds_eq.pop()
+            kindex = self.indices.get(k, None)
+            if kindex:
+                if pred == Query.IN:
+                    for value in v:
+                        keys.update(kindex.get(value,set()))
+                else:
+                    keys.update(kindex.get(v,set()))
+
+        for k,v,p in predicates:
+
+            kindex = self.indices.get(k,None)
+            if p == Query.EQ:
+                if kindex:
+                    keys.intersection_update(kindex.get(v,set()))
+            elif p == Query.IN:
+                if kindex:
+                    matches = set()
+                    for value in v:
+                        matches.update(kindex.get(value,set()))
+                    keys.intersection_update(matches)
+            elif p == Query.GT:
+                matches = set()
+                for attr_val in kindex.keys():
+                    if attr_val > v:
+                        matches.update(kindex.get(attr_val,set()))
+                keys.intersection_update(matches)
+
+        return keys
+
+
+class IndexStorePerformanceTester:
+
+    def __init__(self, row_counts, nqueries):
+
+        self.row_counts = row_counts
+        self.nqueries = nqueries
+
+    def load(self, store_class, num_rows):
+        """
+        Rows like the commit store: a few object types, many repositories and a date per row
+        """
+        index_store = store_class(indices=INDEXES, private=True)
+        for i in xrange(num_rows):
+            index_store.put('key_%d' % i, 'value', {'object_type':'type_%d' % (i % 5),
+                                                    'repository_key':'repo_%d' % (i / 10),
+                                                    'keyword':'keyword_%d' % (i % 100),
+                                                    'date':'%012d' % i})
+        return index_store
+
+    def queries(self, num_rows):
+        """
+        @retval a list of (name, [Query]) - the least selective EQ predicate is last, where the scan starts
+        """
+        eq_queries = []
+        gt_queries = []
+        for i in range(self.nqueries):
+            q = Query()
+            q.add_predicate_eq('repository_key', 'repo_%d' % (i * num_rows / 10 / self.nqueries))
+            q.add_predicate_eq('keyword', 'keyword_%d' % (i % 100))
+            q.add_predicate_eq('object_type', 'type_%d' % (i % 5))
+            eq_queries.append(q)
+
+            q = Query()
+            q.add_predicate_gt('date', '%012d' % (num_rows - num_rows / 100))
+            q.add_predicate_eq('object_type', 'type_%d' % (i % 5))
+            gt_queries.append(q)
+
+        return [('EQ', eq_queries), ('GT', gt_queries)]
+
+    def runBenchMarks(self):
+        for num_rows in self.row_counts:
+
+            stores = [('Planner', self.load(store.IndexStore, num_rows)), ('Scan', self.load(ScanIndexStore, num_rows))]
+
+            for query_name, queries in self.queries(num_rows):
+                results = {}
+                for store_name, index_store in stores:
+                    t1 = time.time()
+                    nrows = 0
+                    keys = []
+                    for q in queries:
+                        rows = _result(index_store.query(q))
+                        nrows += len(rows)
+                        keys.append(sorted(rows.keys()))
+                    t2 = time.time()
+                    results[store_name] = keys
+
+                    print "%s: %d %s queries over %d rows returned %d rows in %f seconds (%f queries per second)" % \
+                        (store_name, len(queries), query_name, num_rows, nrows, t2 - t1, len(queries) / (t2 - t1))
+
+                assert results['Planner'] == results['Scan'], 'The planner and the scan returned different rows!'
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-r", "--rows", dest="rows", default="100000,300000", help="Comma separated list of the number of rows in the store")
+    parser.add_option("-n", "--queries", dest="queries", default=20, help="The number of queries of each kind to time")
+    opts, args = parser.parse_args()
+
+    row_counts = [int(x) for x in opts.rows.split(',')]
+    tester = IndexStorePerformanceTester(row_counts, int(opts.queries))
+    tester.runBenchMarks()
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,8 @@ from ion.core.object import object_utils
 
 from ion.core.data.store import Query
 
-from ion.core.data.store import IIndexStore, IndexStore, IndexStoreError
+from ion.core.data.store import IIndexStore, IndexStore, IndexStoreError, ResultQueryCursor, DEFAULT_QUERY_PAGE_SIZE
+from ion.core.data.store import DEFAULT_IN_QUERY_CONCURRENCY
 from zope.interface import implements
 
 from ion.core import ioninit
@@ -230,6 +231,16 @@ class IndexStoreServiceClient(ServiceClient):
     @defer.inlineCallbacks
     def query(self, query_predicates):
         log.info("Called Index Store Service client: Query")
+
+        queries = query_predicates.expand_in()
+        if queries != [query_predicates]:
+            # The query message can not carry a set of values - send one query per value
+            semaphore = defer.DeferredSemaphore(DEFAULT_IN_QUERY_CONCURRENCY)
+            results = yield defer.DeferredList([semaphore.run(self.query, q) for q in queries], fireOnOneErrback=True, consumeErrors=True)
+            rows = {}
+            for success, result in results:
+                rows.update(result)
+            defer.returnValue(rows)
         
         request = yield self.mc.create_instance(QUERY_ATTRIBUTES_TYPE)
 
@@ -253,7 +264,13 @@ class IndexStoreServiceClient(ServiceClient):
             results[row.key] = cols
 
         defer.returnValue(results)
-        
+
+    def query_cursor(self, query_predicates, page_size=DEFAULT_QUERY_PAGE_SIZE):
+        """
+        The service returns the result of a query in a single message - page through it on the client side.
+        """
+        return ResultQueryCursor(self.query, query_predicates, page_size)
+
     @defer.inlineCallbacks
     def put(self, key, value, index_attributes=None):
         log.info("Called Index Store Service client: put")
@@ -0,0 +1,122 @@
+"""
+@file ion/core/data/query_cursor_performance_testing.py
+@author David Stuebe
+@brief Compare the peak memory used to read the result of an index store query all at once with query versus a page
+at a time with query_cursor, as the number of matching rows grows.
+
+Each measurement runs in a forked child process so that the peak resident set size (ru_maxrss) of the child measures
+only that read. Uses the in memory IndexStore.
+
+Run as a script:
+python ion/core/data/query_cursor_performance_testing.py -r 1000,10000,100000 -p 1000
+"""
+
+import os
+import sys
+import time
+import resource
+from optparse import OptionParser
+
+from ion.core.data import store
+from ion.core.data.store import Query
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+KB = 1024
+
+INDEXES = ['repository_key', 'branch_name', 'keyword']
+
+
+def _result(deferred):
+    """
+    The in memory store returns deferreds which have already fired - get the result
+    """
+    result = []
+    deferred.addCallback(result.append)
+    return result[0]
+
+
+class QueryCursorPerformanceTester:
+
+    def __init__(self, row_counts, page_size=store.DEFAULT_QUERY_PAGE_SIZE, value_size=KB):
+
+        self.row_counts = row_counts
+        self.page_size = page_size
+        self.value_size = value_size
+
+    def setup_store(self, num_rows):
+        """
+        Load num_rows rows which all match the same query
+        """
+        store.IndexStore.kvs.clear()
+        store.IndexStore.indices.clear()
+        index_store = store.IndexStore(indices=INDEXES)
+
+        for i in xrange(num_rows):
+            # Each row gets its own value - like the blobs in the commit store
+            value = ('%010d' % i) * (self.value_size / 10)
+            _result(index_store.put('key_%d' % i, value, {'repository_key':'repo', 'branch_name':'master', 'keyword':str(i)}))
+
+        q = Query()
+        q.add_predicate_eq('repository_key', 'repo')
+        q.add_predicate_gt('branch_name', '')
+
+        return index_store, q
+
+    def read_query(self, index_store, q):
+        rows = _result(index_store.query(q))
+        # Touch the rows like a caller would
+        total = 0
+        for key, row in rows.iteritems():
+            total += len(row['value'])
+        return len(rows), total
+
+    def read_cursor(self, index_store, q):
+        cursor = index_store.query_cursor(q, page_size=self.page_size)
+        total = 0
+        while not cursor.exhausted:
+            rows = _result(cursor.next_page())
+            for key, row in rows.iteritems():
+                total += len(row['value'])
+        return cursor.row_count, total
+
+    def measure(self, method, index_store, q):
+        """
+        Run the read in a child process and report the growth of its peak resident set size
+        """
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            t1 = time.time()
+            nrows, total = method(index_store, q)
+            t2 = time.time()
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print "%s: read %d rows (%d bytes) in %f seconds; peak memory growth %d KB" % (method.__name__, nrows, total, t2 - t1, peak - base)
+            sys.stdout.flush()
+            os._exit(0)
+
+        os.waitpid(pid, 0)
+
+    def runBenchMarks(self):
+        for num_rows in self.row_counts:
+            print "Rows matching the query: %d, page size: %d" % (num_rows, self.page_size)
+            index_store, q = self.setup_store(num_rows)
+            self.measure(self.read_query, index_store, q)
+            self.measure(self.read_cursor, index_store, q)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-r", "--rows", dest="rows", default="1000,10000,100000", help="Comma separated list of the number of rows matching the query")
+    parser.add_option("-p", "--page_size", dest="page_size", default=store.DEFAULT_QUERY_PAGE_SIZE, help="The number of rows in each page of the cursor")
+    parser.add_option("-s", "--size", dest="size", default=KB, help="The size of the value in each row")
+    opts, args = parser.parse_args()
+
+    row_counts = [int(x) for x in opts.rows.split(',')]
+    tester = QueryCursorPerformanceTester(row_counts, page_size=int(opts.page_size), value_size=int(opts.size))
+    tester.runBenchMarks()
+
+if __name__ == "__main__":
+    main()
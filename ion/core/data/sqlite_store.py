@@ -0,0 +1,508 @@
+"""
+@file ion/core/data/sqlite_store.py
+@author David Stuebe
+@brief File backed implementations of IStore and IIndexStore using sqlite from the standard library - for single
+node deployments and performance labs where running cassandra is too heavy.
+
+A persistent archive is a database file in the configured directory, named for the archive (the sysname), and each
+cache is a table in it - like a keyspace and its column families. Each indexed attribute of an index store is a
+column with a sqlite index on it.
+
+Keys, values and index attribute values must be strings, as for cassandra. They are stored as blobs, so they compare
+byte by byte for GT predicates, like python strings.
+
+The calls are made in the reactor thread: each write is one transaction on the local file.
+"""
+
+import os
+import sqlite3
+
+from zope.interface import implements
+
+from twisted.internet import defer
+
+from ion.core import ioninit
+from ion.core.data import store
+from ion.core.data.store import IndexStoreError, Query, SimpleBatchRequest
+from ion.core.data.storage_configuration_utility import BLOB_CACHE, COMMIT_CACHE
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+CONF = ioninit.config(__name__)
+
+# Sqlite limits the number of parameters in one statement to 999
+MAX_PARAMETERS = 500
+
+KEY = 'key'
+VALUE = 'value'
+
+
+def archive_filename(persistent_archive, directory=None):
+    """
+    @param persistent_archive the name of the persistent archive
+    @param directory the directory of the database files - the configured directory by default
+    @retval the path of the database file for the persistent archive
+    """
+    if directory is None:
+        directory = CONF.getValue('directory', default='sqlite_archives')
+    return os.path.join(directory, '%s.db' % persistent_archive)
+
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def _connect(filename):
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    connection = sqlite3.connect(filename)
+    connection.text_factory = str
+    # The write ahead log makes a commit one append to the log instead of a rewrite of the pages
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+def _table_columns(connection, table):
+    """
+    @retval the names of the columns of the table, or None if there is no such table
+    """
+    rows = connection.execute('PRAGMA table_info(%s)' % _quote(table)).fetchall()
+    if not rows:
+        return None
+    return [row[1] for row in rows]
+
+
+def _create_table(connection, table, indices):
+    """
+    Create the table for a cache if it does not exist, and add a column and an index for each attribute in indices
+    which it does not have yet.
+    @retval the list of indexed attributes of the table
+    """
+    for name in indices:
+        if name in (KEY, VALUE):
+            raise IndexStoreError('Can not index an attribute named "%s" in a sqlite store' % name)
+
+    with connection:
+        columns = _table_columns(connection, table)
+        if columns is None:
+            connection.execute('CREATE TABLE %s (%s BLOB PRIMARY KEY, %s BLOB)' % (_quote(table), _quote(KEY), _quote(VALUE)))
+            columns = [KEY, VALUE]
+
+        for name in indices:
+            if name not in columns:
+                connection.execute('ALTER TABLE %s ADD COLUMN %s BLOB' % (_quote(table), _quote(name)))
+                connection.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (_quote('%s__%s' % (table, name)), _quote(table), _quote(name)))
+                columns.append(name)
+
+    return [name for name in columns if name not in (KEY, VALUE)]
+
+
+def _chunks(items, size=MAX_PARAMETERS):
+    items = list(items)
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+
+class SqliteStore(object):
+    """
+    IStore implementation which keeps the rows of a cache in a table of a sqlite database file.
+
+    @param persistent_archive the name of the persistent archive - the database file
+    @param cache the name of the cache - the table
+    @param directory the directory of the database files - the configured directory by default
+    """
+    implements(store.IStore)
+
+    def __init__(self, persistent_archive, cache=BLOB_CACHE, directory=None):
+
+        self.filename = archive_filename(persistent_archive, directory)
+        self._table = _quote(cache)
+        self._cache_name = cache
+
+        log.info('Opening sqlite store: file - %s, table - %s' % (self.filename, cache))
+        self._connection = _connect(self.filename)
+        self._setup_table([])
+
+    def _setup_table(self, indices):
+        return _create_table(self._connection, self._cache_name, indices)
+
+    def close(self):
+        """
+        Close the database file - every write is already committed
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def new_batch_request(self):
+
+        return SimpleBatchRequest()
+
+    def get(self, key):
+        """
+        @see IStore.get
+        """
+        return defer.maybeDeferred(self._get, key)
+
+    def _get(self, key):
+        row = self._connection.execute('SELECT %s FROM %s WHERE %s = ?' % (_quote(VALUE), self._table, _quote(KEY)),
+                                       (sqlite3.Binary(key),)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return str(row[0])
+
+    def batch_get(self, batch_request):
+        """
+        @see IStore.batch_get
+        """
+        assert isinstance(batch_request, SimpleBatchRequest), 'SqliteStore batch_get method takes a SimpleBatchRequest object, got type: %s' % type(batch_request)
+
+        return defer.maybeDeferred(self._batch_get, batch_request._br.keys())
+
+    def _batch_get(self, keys):
+        kv = dict.fromkeys(keys)
+        for chunk in _chunks(keys):
+            sql = 'SELECT %s, %s FROM %s WHERE %s IN (%s)' % (_quote(KEY), _quote(VALUE), self._table, _quote(KEY), ','.join('?' * len(chunk)))
+            for key, value in self._connection.execute(sql, [sqlite3.Binary(key) for key in chunk]):
+                kv[str(key)] = value if value is None else str(value)
+        return kv
+
+    def put(self, key, value):
+        """
+        @see IStore.put
+        """
+        return defer.maybeDeferred(self._write, [(key, value)])
+
+    def batch_put(self, batch_request):
+        """
+        @see IStore.batch_put - the batch is written in one transaction
+        """
+        assert isinstance(batch_request, SimpleBatchRequest), 'SqliteStore batch_put method takes a SimpleBatchRequest object, got type: %s' % type(batch_request)
+
+        rows = [(key, value) for key, (value, index_attributes) in batch_request._br.iteritems()]
+        return defer.maybeDeferred(self._write, rows)
+
+    def _write(self, rows):
+        sql = 'INSERT OR REPLACE INTO %s (%s, %s) VALUES (?, ?)' % (self._table, _quote(KEY), _quote(VALUE))
+        with self._connection:
+            self._connection.executemany(sql, [(sqlite3.Binary(key), sqlite3.Binary(value)) for key, value in rows])
+
+    def remove(self, key):
+        """
+        @see IStore.remove
+        """
+        return defer.maybeDeferred(self._remove, key)
+
+    def _remove(self, key):
+        with self._connection:
+            self._connection.execute('DELETE FROM %s WHERE %s = ?' % (self._table, _quote(KEY)), (sqlite3.Binary(key),))
+
+    def has_key(self, key):
+        """
+        @see IStore.has_key
+        """
+        return defer.maybeDeferred(self._has_key, key)
+
+    def _has_key(self, key):
+        row = self._connection.execute('SELECT 1 FROM %s WHERE %s = ?' % (self._table, _quote(KEY)), (sqlite3.Binary(key),)).fetchone()
+        return row is not None
+
+    def batch_has_key(self, batch_request):
+        """
+        @see IStore.batch_has_key
+        """
+        assert isinstance(batch_request, SimpleBatchRequest), 'SqliteStore batch_has_key method takes a SimpleBatchRequest object, got type: %s' % type(batch_request)
+
+        return defer.maybeDeferred(self._batch_has_key, batch_request._br.keys())
+
+    def _batch_has_key(self, keys):
+        kv = dict.fromkeys(keys, False)
+        for chunk in _chunks(keys):
+            sql = 'SELECT %s FROM %s WHERE %s IN (%s)' % (_quote(KEY), self._table, _quote(KEY), ','.join('?' * len(chunk)))
+            for (key,) in self._connection.execute(sql, [sqlite3.Binary(key) for key in chunk]):
+                kv[str(key)] = True
+        return kv
+
+
+class SqliteIndexStore(SqliteStore):
+    """
+    IIndexStore implementation which keeps the rows of a cache in a table of a sqlite database file, with a column and
+    an index for each indexed attribute. Queries have the same semantics as the in memory IndexStore.
+
+    @param persistent_archive the name of the persistent archive - the database file
+    @param cache the name of the cache - the table
+    @param indices the attributes to index - attributes the table already indexes are kept
+    @param directory the directory of the database files - the configured directory by default
+    """
+    implements(store.IIndexStore)
+
+    def __init__(self, persistent_archive, cache=COMMIT_CACHE, indices=None, directory=None):
+
+        self._indices = indices or []
+        SqliteStore.__init__(self, persistent_archive, cache, directory)
+
+    def _setup_table(self, indices):
+        columns = _create_table(self._connection, self._cache_name, self._indices)
+        # Used by the batch request to check the index attributes
+        self.indices = dict.fromkeys(columns)
+        return columns
+
+    def new_batch_request(self):
+
+        return SimpleBatchRequest(self)
+
+    def _check_index(self, index_attributes):
+        bad_attrs = set(index_attributes.keys()).difference(self.indices.keys())
+        if bad_attrs:
+            raise IndexStoreError("These attributes: %s %s %s"  % (",".join(bad_attrs),os.linesep,"are not indexed."))
+
+    def put(self, key, value, index_attributes=None):
+        """
+        @see IIndexStore.put - the row is replaced, including any index attributes which are not given
+        """
+        if index_attributes is None:
+            index_attributes = {}
+
+        return defer.maybeDeferred(self._write, [(key, value, index_attributes)])
+
+    def batch_put(self, batch_request):
+        """
+        @see IIndexStore.batch_put - the batch is written in one transaction. A request without a value updates the
+        index attributes of an existing row.
+        """
+        assert isinstance(batch_request, SimpleBatchRequest), 'SqliteIndexStore batch_put method takes a SimpleBatchRequest object, got type: %s' % type(batch_request)
+
+        rows = [(key, value, index_attributes or {}) for key, (value, index_attributes) in batch_request._br.iteritems()]
+        return defer.maybeDeferred(self._write, rows)
+
+    def _write(self, rows):
+        for key, value, index_attributes in rows:
+            self._check_index(index_attributes)
+
+        names = sorted(self.indices.keys())
+        sql = 'INSERT OR REPLACE INTO %s (%s) VALUES (%s)' % (self._table,
+            ', '.join([_quote(name) for name in [KEY, VALUE] + names]), ', '.join('?' * (len(names) + 2)))
+
+        with self._connection:
+            for key, value, index_attributes in rows:
+                if value is None:
+                    self._update(key, index_attributes)
+                    continue
+
+                params = [sqlite3.Binary(key), sqlite3.Binary(value)]
+                for name in names:
+                    attr_val = index_attributes.get(name, None)
+                    params.append(attr_val if attr_val is None else sqlite3.Binary(attr_val))
+                self._connection.execute(sql, params)
+
+    def _update(self, key, index_attributes):
+        if not index_attributes:
+            return
+
+        names = sorted(index_attributes.keys())
+        sql = 'UPDATE %s SET %s WHERE %s = ?' % (self._table, ', '.join(['%s = ?' % _quote(name) for name in names]), _quote(KEY))
+        params = [sqlite3.Binary(index_attributes[name]) for name in names] + [sqlite3.Binary(key)]
+        if self._connection.execute(sql, params).rowcount == 0:
+            raise IndexStoreError('Can not update the index attributes of a row which does not exist: %s' % repr(key))
+
+    def update_index(self, key, index_attributes):
+        """
+        @see IIndexStore.update_index
+        """
+        return defer.maybeDeferred(self._update_index, key, index_attributes)
+
+    def _update_index(self, key, index_attributes):
+        self._check_index(index_attributes)
+        with self._connection:
+            self._update(key, index_attributes)
+
+    def query(self, query_predicates):
+        """
+        @see IIndexStore.query
+        """
+        return defer.maybeDeferred(self._query, query_predicates)
+
+    def _query(self, query_predicates):
+        where, params = self._where(query_predicates)
+        return self._select(where, params)
+
+    def query_cursor(self, query_predicates, page_size=store.DEFAULT_QUERY_PAGE_SIZE):
+        """
+        @see IIndexStore.query_cursor - each page is a range of the matching rows in key order
+        """
+        where, params = self._where(query_predicates)
+        return SqliteQueryCursor(self, where, params, page_size)
+
+    def _where(self, query_predicates):
+        """
+        @retval the sql condition and its parameters for the query predicates
+        """
+        predicates = query_predicates.get_predicates()
+
+        if not [pred for pred in predicates if pred[2] == Query.EQ or pred[2] == Query.IN]:
+            raise IndexStoreError('Invalid arguments to IndexStore - must provide at least one equal to operator for search!')
+
+        conditions = []
+        params = []
+        for name, value, pred in predicates:
+
+            if not self.indices.has_key(name):
+                # No row can have an attribute which is not indexed
+                return '0', []
+
+            if pred == Query.EQ:
+                conditions.append('%s = ?' % _quote(name))
+                params.append(sqlite3.Binary(value))
+            elif pred == Query.GT:
+                conditions.append('%s > ?' % _quote(name))
+                params.append(sqlite3.Binary(value))
+            elif pred == Query.IN:
+                if not value:
+                    return '0', []
+                conditions.append('%s IN (%s)' % (_quote(name), ','.join('?' * len(value))))
+                params.extend([sqlite3.Binary(v) for v in value])
+
+        return ' AND '.join(conditions), params
+
+    def _select(self, where, params, after=None, limit=None):
+        """
+        @retval a dictionary of the rows which match, in the same format as IndexStore.query
+        """
+        names = [KEY, VALUE] + self.indices.keys()
+        sql = 'SELECT %s FROM %s WHERE %s' % (', '.join([_quote(name) for name in names]), self._table, where)
+
+        if after is not None:
+            sql += ' AND %s > ?' % _quote(KEY)
+            params = params + [sqlite3.Binary(after)]
+
+        if limit is not None:
+            sql += ' ORDER BY %s LIMIT %d' % (_quote(KEY), limit)
+
+        result = {}
+        for row in self._connection.execute(sql, params):
+            columns = {}
+            for name, column in zip(names[1:], row[1:]):
+                if column is not None:
+                    columns[name] = str(column)
+            result[str(row[0])] = columns
+
+        return result
+
+    def get_query_attributes(self):
+        """
+        Return the column names that are indexed.
+        """
+        return defer.succeed(self.indices.keys())
+
+
+class SqliteQueryCursor(store.QueryCursor):
+    """
+    Query cursor for the sqlite index store. Each page selects the next page_size matching rows after the last key
+    returned, so rows written after the query was made may be included.
+    """
+
+    def __init__(self, index_store, where, params, page_size=store.DEFAULT_QUERY_PAGE_SIZE):
+
+        store.QueryCursor.__init__(self, page_size)
+
+        self._index_store = index_store
+        self._where = where
+        self._params = params
+        self._last_key = None
+
+    def next_page(self):
+
+        if self.exhausted:
+            return defer.succeed({})
+
+        return defer.maybeDeferred(self._next_page)
+
+    def _next_page(self):
+        page = self._index_store._select(self._where, self._params, after=self._last_key, limit=self.page_size)
+
+        if len(page) < self.page_size:
+            self.exhausted = True
+        if page:
+            self._last_key = max(page.keys())
+
+        return self._add_page(page)
+
+
+class SqliteDataManager(object):
+    """
+    IDataManager implementation for sqlite: a persistent archive is a database file and a cache is a table in it.
+
+    @param directory the directory of the database files - the configured directory by default
+    """
+    implements(store.IDataManager)
+
+    def __init__(self, directory=None):
+        self.directory = directory
+
+    def _filename(self, persistent_archive):
+        return archive_filename(persistent_archive.name, self.directory)
+
+    def _indices(self, cache):
+        return [column.column_name for column in getattr(cache, 'column_metadata', [])]
+
+    def create_persistent_archive(self, persistent_archive):
+        """
+        @brief Create the database file of a persistent archive
+        @param persistent_archive an object with the name of the archive
+        """
+        log.info("Creating sqlite archive: %s" % self._filename(persistent_archive))
+        _connect(self._filename(persistent_archive)).close()
+        return defer.succeed(None)
+
+    def update_persistent_archive(self, persistent_archive):
+        """
+        @brief A sqlite archive has no properties to update
+        """
+        return defer.succeed(None)
+
+    def remove_persistent_archive(self, persistent_archive):
+        """
+        @brief Delete the database file of a persistent archive
+        @param persistent_archive an object with the name of the archive
+        """
+        filename = self._filename(persistent_archive)
+        log.info("Removing sqlite archive: %s" % filename)
+        for path in (filename, filename + '-wal', filename + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        return defer.succeed(None)
+
+    def create_cache(self, persistent_archive, cache):
+        """
+        @brief Create the table of a cache, with a column and an index for each attribute in its column_metadata
+        @param persistent_archive an object with the name of the archive
+        @param cache an object with the name of the cache and optionally its column_metadata
+        """
+        return self.update_cache(persistent_archive, cache)
+
+    def update_cache(self, persistent_archive, cache):
+        """
+        @brief Add the indexed attributes of the cache which its table does not have yet
+        """
+        connection = _connect(self._filename(persistent_archive))
+        try:
+            _create_table(connection, cache.name, self._indices(cache))
+        finally:
+            connection.close()
+        return defer.succeed(None)
+
+    def remove_cache(self, persistent_archive, cache):
+        """
+        @brief Drop the table of a cache
+        """
+        connection = _connect(self._filename(persistent_archive))
+        try:
+            with connection:
+                connection.execute('DROP TABLE IF EXISTS %s' % _quote(cache.name))
+        finally:
+            connection.close()
+        return defer.succeed(None)
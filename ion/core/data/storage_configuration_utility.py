@@ -24,6 +24,9 @@ DEFAULT_KEYSPACE_NAME ='DEFAULT NAME - DO NOT USE'
 BLOB_CACHE = 'blobs'
 BLOB_INDEXED_COLUMNS=[]
 
+# The child links of each blob, by blob key
+CHILD_LINK_CACHE = 'child_links'
+
 
 ### COMMIT CACHE SETUP
 COMMIT_CACHE = 'commits'
@@ -52,6 +55,9 @@ COMMIT_INDEXED_COLUMNS=[REPOSITORY_KEY, BRANCH_NAME, SUBJECT_KEY, SUBJECT_BRANCH
                      PREDICATE_BRANCH, PREDICATE_COMMIT, OBJECT_KEY, OBJECT_BRANCH, OBJECT_COMMIT, KEYWORD, RESOURCE_LIFE_CYCLE_STATE, RESOURCE_OBJECT_TYPE]
 
 
+# Identity subject index - maps a certificate subject to the ooi_id of the identity
+IDENTITY_SUBJECT_CACHE = 'identity_subjects'
+
 # Common Columns:
 VALUE = 'value'
 
@@ -99,6 +105,14 @@ blob_cf = base_cf_def.copy()
 blob_cf['name']=BLOB_CACHE
 # No columns to declare for indexing
 
+child_link_cf = base_cf_def.copy()
+child_link_cf['name']=CHILD_LINK_CACHE
+# No columns to declare for indexing
+
+identity_subject_cf = base_cf_def.copy()
+identity_subject_cf['name']=IDENTITY_SUBJECT_CACHE
+# No columns to declare for indexing
+
 ### Storage Keyspace Name is provided by the sysname!!!
 #ion_ks = base_ks_def.copy()
 #ion_ks['cf_defs'] = [blob_cf, commit_cf]
@@ -130,6 +144,8 @@ def get_cassandra_configuration(sysname=None):
     """
     my_blob_cf = blob_cf.copy()
     my_commit_cf = commit_cf.copy()
+    my_child_link_cf = child_link_cf.copy()
+    my_identity_subject_cf = identity_subject_cf.copy()
 
     ion_ks = base_ks_def.copy()
 
@@ -163,7 +179,7 @@ def get_cassandra_configuration(sysname=None):
     if ion_ks['cf_defs'] is None:
         ion_ks['cf_defs'] =[]
 
-    ion_ks['cf_defs'].extend( [my_blob_cf, my_commit_cf])
+    ion_ks['cf_defs'].extend( [my_blob_cf, my_commit_cf, my_child_link_cf, my_identity_subject_cf])
 
     # update the sysname
     sysname = sysname or ioninit.sys_name
@@ -9,6 +9,7 @@
         in memory implementation
 """
 import os
+import bisect
 from zope.interface import Interface
 from zope.interface import implements
 
@@ -25,6 +26,12 @@ class IndexStoreError(Exception):
     An exception class for the index store
     """
 
+# The default number of rows returned in each page of a query cursor
+DEFAULT_QUERY_PAGE_SIZE = 1000
+
+# The default number of queries made at the same time by backends which expand an IN predicate in to one query per value
+DEFAULT_IN_QUERY_CONCURRENCY = 16
+
 class SimpleBatchRequest(object):
 
 
@@ -241,6 +248,14 @@ class IIndexStore(IStore):
         @retVal a thrift representation of the rows returned by the query.
         """
         
+    def query_cursor(query_predicates, page_size=DEFAULT_QUERY_PAGE_SIZE):
+        """
+        Search for rows, returning the results incrementally.
+        @param query_predicates is a store.Query object
+        @param page_size the maximum number of rows in each page of results
+        @retVal a QueryCursor - call next_page until the cursor is exhausted.
+        """
+
     def update_index(key, index_attributes):
         """
         @param key  an immutable key associated with a value
@@ -284,6 +299,11 @@ class IndexStore(object):
     
     self.indices is an index to map attribute names to attribute values to keys
         {attr_names:{attr_value: set( keys)}}.
+    Each attribute index is a SecondaryIndex which also keeps its values sorted for GT predicates.
+
+    By default the rows are stored in the class - shared by every instance, so that a service can read the rows of
+    the datastore in the same container. Pass namespace='name' to share the rows only with the instances created with
+    the same namespace, or private=True to give the instance rows of its own.
     """
     implements(IIndexStore)
 
@@ -291,13 +311,25 @@ class IndexStore(object):
     indices = {}
 
     def __init__(self, *args, **kwargs):
-        #self.kvs = {}
-        #self.indices = {}
+
+        if kwargs.get('private', False):
+            self.kvs = {}
+            self.indices = {}
+        elif kwargs.get('namespace', None) is not None:
+            self.kvs, self.indices = _NAMESPACES.setdefault(kwargs.get('namespace'), ({}, {}))
         
         if kwargs.has_key('indices'):
             for name in kwargs.get('indices'):
                 if not self.indices.has_key(name):
-                    self.indices[name]={}
+                    self.indices[name]=SecondaryIndex()
+
+    def clear(self):
+        """
+        Remove all the rows from the storage of this store - the indexed attributes are kept
+        """
+        self.kvs.clear()
+        for kindex in self.indices.itervalues():
+            kindex.clear()
 
 
     def new_batch_request(self):
@@ -344,7 +376,7 @@ class IndexStore(object):
         if index_attributes is None:
             index_attributes = {}
             
-        self._update_index(key, index_attributes)
+        self._update_index(key, index_attributes, replace=True)
                         
         return defer.maybeDeferred(self.kvs.update, {key: dict({"value":value},**index_attributes)})        
 
@@ -360,12 +392,13 @@ class IndexStore(object):
 
         batch={}
         for key, (value, index_atts) in batch_request._br.iteritems():
-            self._update_index(key, index_atts)
 
             if value is not None:
+                self._update_index(key, index_atts, replace=True)
                 batch[key] = dict({"value":value},**index_atts)
             else:
                 # Don't overwrite this row, update it!
+                self._update_index(key, index_atts)
                 self.kvs[key].update(index_atts)
 
         return defer.maybeDeferred(self.kvs.update, batch)
@@ -375,9 +408,11 @@ class IndexStore(object):
         """
         @see IStore.remove
         """
-        # could test for existence of key. this will error otherwise
-        if self.kvs.has_key(key):
-            del self.kvs[key]            
+        row = self.kvs.pop(key, None)
+        if row is not None:
+            for name, kindex in self.indices.iteritems():
+                if row.has_key(name):
+                    kindex.discard(row[name], key)
         return defer.succeed(None)
         
     def query(self, query_predicates):
@@ -393,33 +428,7 @@ class IndexStore(object):
         """
         log.debug("In query: predicates %s" % query_predicates)
 
-        predicates = query_predicates.get_predicates()
-
-        eq_filter = lambda x: x[2] == Query.EQ
-        preds_eq = filter(eq_filter, predicates)
-        keys = set()
-        if len(preds_eq) == 0:
-            raise IndexStoreError('Invalid arguments to IndexStore - must provide at least one equal to operator for search!')
-        else:
-            k,v,pred = preds_eq.pop()
-            kindex = self.indices.get(k, None)
-            if kindex:
-                keys.update(kindex.get(v,set()))
-
-        for k,v,p in predicates:
-
-            kindex = self.indices.get(k,None)
-            if p == Query.EQ:
-                
-                if kindex:
-                    keys.intersection_update(kindex.get(v,set()))
-            elif p == Query.GT:
-                
-                matches = set()
-                for attr_val in kindex.keys():
-                    if attr_val > v:
-                        matches.update(kindex.get(attr_val,set()))
-                keys.intersection_update(matches)
+        keys = self._query_keys(query_predicates)
 
         #log.debug("keys: "+ str(keys))
         result = {}
@@ -430,9 +439,96 @@ class IndexStore(object):
 
         log.debug("Query Results: %s" % result)
 
-        return defer.succeed(result)                
+        return defer.succeed(result)
+
+    def query_cursor(self, query_predicates, page_size=DEFAULT_QUERY_PAGE_SIZE):
+        """
+        Search for rows, returning the results in pages of at most page_size rows.
+
+        The matching keys are found when the cursor is created; the rows are copied one page at a time.
+
+        @param query_predicates is a store.Query object
+        @param page_size the maximum number of rows in each page of results
+        @retVal an IndexStoreQueryCursor
+        """
+        log.debug("In query_cursor: predicates %s" % query_predicates)
+
+        keys = self._query_keys(query_predicates)
+
+        return IndexStoreQueryCursor(self, keys, page_size)
+
+    def _query_keys(self, query_predicates):
+        """
+        Return the set of keys which match the query predicates
+
+        The EQ and IN predicates are looked up in the indices and intersected starting from the one with the fewest
+        keys. Each GT predicate then checks the remaining rows, or takes the keys of the matching values from the sorted
+        index if there are fewer of those than rows left.
+
+        Every predicate must match, as in the cassandra store - a predicate on an attribute which is not indexed, or
+        on an index which has no rows, matches nothing. Before the query planner the in memory store ignored such an
+        EQ predicate unless it happened to be the first one looked up.
+        """
+        predicates = query_predicates.get_predicates()
+
+        matches = []
+        ranges = []
+        for k,v,p in predicates:
+
+            kindex = self.indices.get(k,None)
+            if p == Query.GT:
+                ranges.append((k,v,kindex))
+            elif kindex is None:
+                # No row can have an attribute which is not indexed
+                matches.append(set())
+            elif p == Query.IN:
+                keys = set()
+                for value in v:
+                    keys.update(kindex.get(value,()))
+                matches.append(keys)
+            else:
+                matches.append(kindex.get(v,set()))
+
+        if len(matches) == 0:
+            raise IndexStoreError('Invalid arguments to IndexStore - must provide at least one equal to operator for search!')
+
+        matches.sort(key=len)
+        keys = set(matches[0])
+        for match in matches[1:]:
+            if not keys:
+                break
+            keys.intersection_update(match)
+
+        for k,v,kindex in ranges:
+            if kindex is None:
+                return set()
+
+        ranges.sort(key=lambda (k,v,kindex): kindex.count_gt(v))
+        for k,v,kindex in ranges:
+
+            if not keys:
+                break
+
+            if len(keys) <= kindex.count_gt(v):
+                matched = set()
+                for key in keys:
+                    attr_val = self.kvs.get(key,{}).get(k,None)
+                    if attr_val is not None and attr_val > v and key in kindex.get(attr_val,()):
+                        matched.add(key)
+                keys = matched
+            else:
+                matched = set()
+                for attr_val in kindex.values_gt(v):
+                    matched.update(kindex[attr_val])
+                keys.intersection_update(matched)
+
+        return keys
     
-    def _update_index(self, key, index_attributes):
+    def _update_index(self, key, index_attributes, replace=False):
+        """
+        Index the key by index_attributes, dropping the old values of those attributes - or of every attribute of the
+        row if replace is set
+        """
         log.debug("In _update_index: key %s index_attributes %s" % (key,index_attributes))
         #Ensure that we are updating attributes that are indexed.
         query_attribute_names = set(self.indices.keys())
@@ -445,26 +541,12 @@ class IndexStore(object):
         current_attrs = self.kvs.get(key)
         if current_attrs is not None:
 
-            changed_attrs = {}
-            for k in index_attributes.keys():
-                if current_attrs.has_key(k):
-                    changed_attrs[k] = current_attrs.get(k)
-
-
-            for k,v in changed_attrs.items():
-                kindex = self.indices.get(k)
-                # Create a set of keys if it does not already exist
-                kindex[v].discard(key)
-
+            for k, kindex in self.indices.iteritems():
+                if current_attrs.has_key(k) and (replace or index_attributes.has_key(k)):
+                    kindex.discard(current_attrs.get(k), key)
 
         for k, v in index_attributes.items():
-            kindex = self.indices.get(k, None)
-            #if not kindex:
-            #    kindex = {}
-            #    self.indices[k] = kindex
-            # Create a set of keys if it does not already exist
-            kindex[v] = kindex.get(v, set())
-            kindex[v].add(key)
+            self.indices[k].add(v, key)
     
 
     def update_index(self, key, index_attributes):
@@ -511,6 +593,231 @@ class IndexStore(object):
         """
         return defer.maybeDeferred(self.indices.keys)
 
+# Storage of the in memory index stores created with a namespace: {namespace:(kvs, indices)}
+_NAMESPACES = {}
+
+
+class SecondaryIndex(dict):
+    """
+    The index of one attribute in the in memory IndexStore - a dictionary of attribute value to the set of keys with
+    that value. The values are also kept in a sorted list, so a GT predicate is a bisect rather than a scan of every
+    value. Values with no keys are dropped.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self._values = []
+
+    def add(self, value, key):
+        keys = self.get(value)
+        if keys is None:
+            keys = set()
+            self[value] = keys
+            bisect.insort(self._values, value)
+        keys.add(key)
+
+    def discard(self, value, key):
+        keys = self.get(value)
+        if keys is None:
+            return
+
+        keys.discard(key)
+        if not keys:
+            del self[value]
+            del self._values[bisect.bisect_left(self._values, value)]
+
+    def clear(self):
+        dict.clear(self)
+        self._values = []
+
+    def values_gt(self, value):
+        """
+        @retval the values greater than value, in order
+        """
+        return self._values[bisect.bisect_right(self._values, value):]
+
+    def count_gt(self, value):
+        """
+        @retval the number of values greater than value
+        """
+        return len(self._values) - bisect.bisect_right(self._values, value)
+
+
+class QueryCursor(object):
+    """
+    Base class for the cursor returned by the query_cursor method of an index store. Each call to next_page returns
+    a deferred dictionary of at most page_size rows in the same format as the result of query. Rows are returned
+    only once. When the last page has been returned the cursor is exhausted and next_page returns empty results.
+
+    usage:
+    cursor = index_store.query_cursor(q, page_size=500)
+    while not cursor.exhausted:
+        rows = yield cursor.next_page()
+        for key, row in rows.iteritems():
+            ...
+    """
+
+    def __init__(self, page_size=DEFAULT_QUERY_PAGE_SIZE):
+
+        page_size = int(page_size)
+        if page_size < 1:
+            raise IndexStoreError('Invalid page size for a query cursor: %d' % page_size)
+
+        self.page_size = page_size
+
+        self.exhausted = False
+
+        # Number of rows and pages returned so far
+        self.row_count = 0
+        self.page_count = 0
+
+    def next_page(self):
+        """
+        @retVal a deferred dictionary of keys and rows
+        """
+        raise NotImplementedError('next_page is not implemented in the base class')
+
+    def _add_page(self, page):
+        self.row_count += len(page)
+        self.page_count += 1
+        return page
+
+
+class IndexStoreQueryCursor(QueryCursor):
+    """
+    Query cursor for the in memory IndexStore. The rows are copied from the store when the page is returned - keys
+    removed after the query was made are skipped.
+    """
+
+    def __init__(self, index_store, keys, page_size=DEFAULT_QUERY_PAGE_SIZE):
+
+        QueryCursor.__init__(self, page_size)
+
+        self._index_store = index_store
+
+        # Return the keys in order - like a range scan over the rows
+        self._keys = sorted(keys)
+        self._position = 0
+
+        if not self._keys:
+            self.exhausted = True
+
+    def next_page(self):
+
+        page = {}
+        kvs = self._index_store.kvs
+        nkeys = len(self._keys)
+
+        while len(page) < self.page_size and self._position < nkeys:
+
+            key = self._keys[self._position]
+            self._position += 1
+
+            row = kvs.get(key)
+            if row is not None:
+                page[key] = row.copy()
+
+        if self._position >= nkeys:
+            self.exhausted = True
+            # Let go of the keys
+            self._keys = []
+
+        return defer.succeed(self._add_page(page))
+
+
+class ResultQueryCursor(QueryCursor):
+    """
+    Query cursor which pages through the result of a query method which returns all rows at once. Used by index
+    store clients whose backend can not return partial results. The query is made when the first page is requested.
+    """
+
+    def __init__(self, query_method, query_predicates, page_size=DEFAULT_QUERY_PAGE_SIZE):
+
+        QueryCursor.__init__(self, page_size)
+
+        self._query_method = query_method
+        self._query_predicates = query_predicates
+        self._keys = None
+        self._rows = None
+        self._position = 0
+
+    @defer.inlineCallbacks
+    def next_page(self):
+
+        if self.exhausted:
+            defer.returnValue({})
+
+        if self._rows is None:
+            self._rows = yield self._query_method(self._query_predicates)
+            self._keys = sorted(self._rows.keys())
+
+        end = self._position + self.page_size
+
+        page = {}
+        for key in self._keys[self._position:end]:
+            page[key] = self._rows.pop(key)
+
+        self._position = end
+
+        if self._position >= len(self._keys):
+            self.exhausted = True
+
+        defer.returnValue(self._add_page(page))
+
+
+class ChainedQueryCursor(QueryCursor):
+    """
+    Query cursor which returns the pages of several cursors. Used by backends which expand a query with an IN
+    predicate in to one query per value. Up to max_concurrent of the cursors are read at the same time, so the number
+    of sequential round trips is the number of values divided by max_concurrent rather than the number of values.
+    Keys are returned only once even if they match more than one of the queries.
+    """
+
+    def __init__(self, cursors, page_size=DEFAULT_QUERY_PAGE_SIZE, max_concurrent=DEFAULT_IN_QUERY_CONCURRENCY):
+
+        QueryCursor.__init__(self, page_size)
+
+        max_concurrent = int(max_concurrent)
+        if max_concurrent < 1:
+            raise IndexStoreError('Invalid concurrency for a chained query cursor: %d' % max_concurrent)
+
+        self.max_concurrent = max_concurrent
+
+        self._cursors = list(cursors)
+        self._seen = set()
+
+        # Rows read from the cursors which have not been returned yet - at most one page per cursor read together
+        self._buffer = {}
+
+        if not self._cursors:
+            self.exhausted = True
+
+    @defer.inlineCallbacks
+    def next_page(self):
+
+        while self._cursors and len(self._buffer) < self.page_size:
+
+            cursors = self._cursors[:self.max_concurrent]
+            results = yield defer.DeferredList([cursor.next_page() for cursor in cursors], fireOnOneErrback=True, consumeErrors=True)
+
+            for success, rows in results:
+                for key, row in rows.iteritems():
+                    if key not in self._seen:
+                        self._seen.add(key)
+                        self._buffer[key] = row
+
+            self._cursors = [cursor for cursor in self._cursors if not cursor.exhausted]
+
+        page = {}
+        for key in sorted(self._buffer.keys())[:self.page_size]:
+            page[key] = self._buffer.pop(key)
+
+        if not self._cursors and not self._buffer:
+            self.exhausted = True
+
+        defer.returnValue(self._add_page(page))
+
+
 class Query:
     """
     Class that holds the predicates used to query an IndexStore.
@@ -518,6 +825,7 @@ class Query:
     
     EQ = "EQ"
     GT = "GT"
+    IN = "IN"
     def __init__(self):
         self._predicates = []
 
@@ -533,9 +841,41 @@ class Query:
     
     def add_predicate_gt(self, name, value):
         self._predicates.append((name,value,Query.GT))
+
+    def add_predicate_in(self, name, values):
+        """
+        Match rows where the column is equal to any one of the values. Backends which can not search for a set of
+        values make one query per value - see expand_in.
+        """
+        self._predicates.append((name,tuple(values),Query.IN))
         
     def get_predicates(self):
         return self._predicates    
+
+    def expand_in(self):
+        """
+        Return a list of queries using only EQ and GT predicates whose combined results are the results of this query.
+        Only one IN predicate is allowed in a query.
+        """
+        in_preds = [pred for pred in self._predicates if pred[2] == Query.IN]
+        if len(in_preds) == 0:
+            return [self]
+        elif len(in_preds) > 1:
+            raise IndexStoreError('Only one IN predicate is allowed in a query!')
+
+        name, values, pred_type = in_preds[0]
+
+        queries = []
+        for value in values:
+            q = Query()
+            for pred in self._predicates:
+                if pred[2] == Query.IN:
+                    q.add_predicate_eq(name, value)
+                else:
+                    q._predicates.append(pred)
+            queries.append(q)
+
+        return queries
         
     
 
@@ -0,0 +1,369 @@
+"""
+@file ion/core/data/store_benchmark.py
+@author David Stuebe
+@brief Benchmark harness for any IStore or IIndexStore implementation. Runs the standard workloads - put, batch_put,
+get, batch_get, has_key, update_index, EQ and GT queries and remove - at each value size and key count, timing every
+operation. Reports throughput and p50/p95/p99 latency as one JSON object per line, so results from different backends
+or revisions can be compared by a script.
+
+The index attributes are commit store columns, so the cassandra commits column family can be used as is.
+
+Run as a script:
+python ion/core/data/store_benchmark.py -b memory,sqlite -s 100,10000 -k 1000,10000 -o results.json
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import shutil
+import tempfile
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from twisted.internet import defer, reactor
+
+from ion.core.data import store
+from ion.core.data import sqlite_store
+from ion.core.data.store import Query
+from ion.core.data.storage_configuration_utility import REPOSITORY_KEY, RESOURCE_OBJECT_TYPE, BRANCH_NAME, KEYWORD
+from ion.core.data.storage_configuration_utility import COMMIT_INDEXED_COLUMNS, BLOB_CACHE, COMMIT_CACHE
+import ion.util.procutils as pu
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+
+MEMORY = 'memory'
+SQLITE = 'sqlite'
+CASSANDRA = 'cassandra'
+BACKENDS = [MEMORY, SQLITE, CASSANDRA]
+
+# Rows per request of the batch workloads
+DEFAULT_BATCH_SIZE = 100
+
+# Number of queries of each kind
+DEFAULT_QUERY_COUNT = 100
+
+
+def percentile(samples, pct):
+    """
+    @param samples a sorted list
+    @param pct the percentile, between 0 and 100
+    @retval the nearest rank percentile of the samples, or None if there are none
+    """
+    if not samples:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(samples))) - 1
+    return samples[min(max(rank, 0), len(samples) - 1)]
+
+
+class LatencyStats(object):
+    """
+    The latency of each operation in a workload and the rows it moved
+    """
+
+    def __init__(self, workload):
+        self.workload = workload
+        self.samples = []
+        self.rows = 0
+        self.elapsed = 0.0
+
+    def add(self, seconds, rows=1):
+        self.samples.append(seconds)
+        self.rows += rows
+
+    def result(self, **fields):
+        """
+        @retval a dictionary of the workload statistics and fields - latencies in milliseconds
+        """
+        samples = sorted(self.samples)
+        elapsed = self.elapsed or sum(samples)
+
+        result = {'workload':self.workload,
+                  'ops':len(samples),
+                  'rows':self.rows,
+                  'seconds':elapsed,
+                  'ops_per_second':len(samples) / elapsed if elapsed else None,
+                  'rows_per_second':self.rows / elapsed if elapsed else None,
+                  'max_ms':samples[-1] * 1000. if samples else None,
+                  }
+        for pct in PERCENTILES:
+            value = percentile(samples, pct)
+            result['p%d_ms' % pct] = value * 1000. if value is not None else None
+
+        result.update(fields)
+        return result
+
+
+class StoreBenchmark(object):
+    """
+    Runs the workloads against stores made by a factory. The factory is called with the value size and key count of
+    each run and returns a deferred (store, cleanup) - cleanup is called with no arguments when the run is done.
+
+    @param name the name of the backend in the results
+    @param factory makes an empty store for each run
+    @param index run the index store workloads as well
+    @param output a file to write each result to as a line of JSON
+    """
+
+    def __init__(self, name, factory, index=False, value_sizes=(1024,), key_counts=(1000,),
+                 batch_size=DEFAULT_BATCH_SIZE, query_count=DEFAULT_QUERY_COUNT, output=None):
+
+        self.name = name
+        self.factory = factory
+        self.index = index
+        self.value_sizes = value_sizes
+        self.key_counts = key_counts
+        self.batch_size = batch_size
+        self.query_count = query_count
+        self.output = output
+
+        self.results = []
+
+    @defer.inlineCallbacks
+    def run(self):
+        """
+        @retval a deferred list of the result dictionaries
+        """
+        for value_size in self.value_sizes:
+            for key_count in self.key_counts:
+                index_store, cleanup = yield defer.maybeDeferred(self.factory, value_size, key_count)
+                try:
+                    yield self.run_workloads(index_store, value_size, key_count)
+                finally:
+                    yield defer.maybeDeferred(cleanup)
+
+        defer.returnValue(self.results)
+
+    def _report(self, stats, value_size, key_count):
+        result = stats.result(backend=self.name, value_size=value_size, key_count=key_count)
+        self.results.append(result)
+
+        if self.output is not None:
+            self.output.write(json.dumps(result, sort_keys=True) + '\n')
+            self.output.flush()
+
+        return result
+
+    def attributes(self, i):
+        """
+        Index attributes of row i: about 10 rows per repository, 5 object types, and a branch name to order by
+        """
+        return {REPOSITORY_KEY:'repo_%08d' % (i / 10),
+                RESOURCE_OBJECT_TYPE:'type_%d' % (i % 5),
+                BRANCH_NAME:'%012d' % i}
+
+    @defer.inlineCallbacks
+    def _workload(self, name, value_size, key_count, operations):
+        """
+        Run operations - a list of (method, args, rows) - one at a time
+        """
+        stats = LatencyStats(name)
+        start = time.time()
+        for method, args, rows in operations:
+            tic = time.time()
+            yield method(*args)
+            stats.add(time.time() - tic, rows)
+        stats.elapsed = time.time() - start
+
+        defer.returnValue(self._report(stats, value_size, key_count))
+
+    def _batch(self, index_store, rows):
+        batch = index_store.new_batch_request()
+        for row in rows:
+            batch.add_request(*row)
+        return batch
+
+    @defer.inlineCallbacks
+    def run_workloads(self, index_store, value_size, key_count):
+
+        template = os.urandom(value_size)
+        value = lambda i: ('%08d' % i + template)[:value_size]
+
+        keys = ['put_%08d' % i for i in xrange(key_count)]
+        batch_keys = ['batch_%08d' % i for i in xrange(key_count)]
+
+        if self.index:
+            put_args = [(key, value(i), self.attributes(i)) for i, key in enumerate(keys)]
+            batch_rows = [(key, value(i), self.attributes(i)) for i, key in enumerate(batch_keys)]
+        else:
+            put_args = [(key, value(i)) for i, key in enumerate(keys)]
+            batch_rows = [(key, value(i)) for i, key in enumerate(batch_keys)]
+
+        yield self._workload('put', value_size, key_count,
+                             [(index_store.put, args, 1) for args in put_args])
+
+        batches = [batch_rows[i:i + self.batch_size] for i in xrange(0, key_count, self.batch_size)]
+        yield self._workload('batch_put', value_size, key_count,
+                             [(index_store.batch_put, (self._batch(index_store, rows),), len(rows)) for rows in batches])
+
+        shuffled = list(keys)
+        random.shuffle(shuffled)
+        yield self._workload('get', value_size, key_count,
+                             [(index_store.get, (key,), 1) for key in shuffled])
+
+        get_batches = [[(key,) for key in shuffled[i:i + self.batch_size]] for i in xrange(0, key_count, self.batch_size)]
+        yield self._workload('batch_get', value_size, key_count,
+                             [(index_store.batch_get, (self._batch(index_store, rows),), len(rows)) for rows in get_batches])
+
+        # Half the keys are missing
+        has_keys = [key if i % 2 else 'missing_%08d' % i for i, key in enumerate(shuffled)]
+        yield self._workload('has_key', value_size, key_count,
+                             [(index_store.has_key, (key,), 1) for key in has_keys])
+
+        if self.index:
+            yield self._workload('update_index', value_size, key_count,
+                                 [(index_store.update_index, (key, {KEYWORD:'keyword_%d' % (i % 100)}), 1) for i, key in enumerate(keys)])
+
+            yield self.run_queries(index_store, value_size, key_count)
+
+        yield self._workload('remove', value_size, key_count,
+                             [(index_store.remove, (key,), 1) for key in keys + batch_keys])
+
+    @defer.inlineCallbacks
+    def run_queries(self, index_store, value_size, key_count):
+        """
+        EQ queries which each match one repository, and GT queries which match the last 1% of one object type
+        """
+        rng = random.Random(key_count)
+        eq_queries = []
+        gt_queries = []
+        for i in range(self.query_count):
+            q = Query()
+            q.add_predicate_eq(REPOSITORY_KEY, 'repo_%08d' % rng.randrange(max(key_count / 10, 1)))
+            eq_queries.append(q)
+
+            q = Query()
+            q.add_predicate_eq(RESOURCE_OBJECT_TYPE, 'type_%d' % (i % 5))
+            q.add_predicate_gt(BRANCH_NAME, '%012d' % (key_count - key_count / 100))
+            gt_queries.append(q)
+
+        for name, queries in (('query_eq', eq_queries), ('query_gt', gt_queries)):
+            stats = LatencyStats(name)
+            start = time.time()
+            for q in queries:
+                tic = time.time()
+                rows = yield index_store.query(q)
+                stats.add(time.time() - tic, len(rows))
+            stats.elapsed = time.time() - start
+
+            self._report(stats, value_size, key_count)
+
+
+def memory_factory(index):
+    """
+    @retval a factory of in memory stores with their own rows
+    """
+    def factory(value_size, key_count):
+        if index:
+            s = store.IndexStore(indices=COMMIT_INDEXED_COLUMNS, private=True)
+        else:
+            s = store.Store()
+            # Give this instance its own backend - the memory store is shared by default
+            s.kvs = {}
+        return s, lambda: None
+    return factory
+
+
+def sqlite_factory(index):
+    """
+    @retval a factory of sqlite stores, each in a new temporary directory
+    """
+    def factory(value_size, key_count):
+        directory = tempfile.mkdtemp()
+        if index:
+            s = sqlite_store.SqliteIndexStore('benchmark', COMMIT_CACHE, indices=COMMIT_INDEXED_COLUMNS, directory=directory)
+        else:
+            s = sqlite_store.SqliteStore('benchmark', BLOB_CACHE, directory=directory)
+
+        def cleanup():
+            s.close()
+            shutil.rmtree(directory)
+        return s, cleanup
+    return factory
+
+
+def cassandra_factory(index, host='localhost', port=9160, keyspace='sysname', username=None, password=None):
+    """
+    @retval a factory of clients to a running cassandra cluster - the column families must exist
+    """
+    from ion.core.data.cassandra_bootstrap import CassandraStoreBootstrap, CassandraIndexedStoreBootstrap
+
+    @defer.inlineCallbacks
+    def factory(value_size, key_count):
+        provider = {'host':host, 'port':port}
+        if index:
+            s = CassandraIndexedStoreBootstrap(username, password, provider, keyspace, COMMIT_CACHE)
+        else:
+            s = CassandraStoreBootstrap(username, password, provider, keyspace, BLOB_CACHE)
+        yield s.initialize()
+        yield s.activate()
+
+        def cleanup():
+            return s.terminate()
+        defer.returnValue((s, cleanup))
+    return factory
+
+
+def class_factory(class_name, index):
+    """
+    @retval a factory of instances of a store class which takes no arguments - or only indices for an index store
+    """
+    cls = pu.get_class(class_name)
+    def factory(value_size, key_count):
+        if index:
+            return cls(indices=COMMIT_INDEXED_COLUMNS), lambda: None
+        return cls(), lambda: None
+    return factory
+
+
+@defer.inlineCallbacks
+def run_benchmarks(backends, index, value_sizes, key_counts, batch_size, query_count, output):
+    for name, factory in backends:
+        benchmark = StoreBenchmark(name, factory, index=index, value_sizes=value_sizes, key_counts=key_counts,
+                                   batch_size=batch_size, query_count=query_count, output=output)
+        yield benchmark.run()
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-b", "--backends", dest="backends", default="memory,sqlite", help="Comma separated list of backends: %s" % ", ".join(BACKENDS))
+    parser.add_option("-c", "--store_class", dest="store_class", default=None, help="Benchmark this store class as well")
+    parser.add_option("-i", "--index", action="store_true", dest="index", default=False, help="Benchmark the index store of each backend")
+    parser.add_option("-s", "--sizes", dest="sizes", default="100,10000", help="Comma separated list of value sizes in bytes")
+    parser.add_option("-k", "--keys", dest="keys", default="1000,10000", help="Comma separated list of key counts")
+    parser.add_option("-n", "--batch_size", dest="batch_size", default=DEFAULT_BATCH_SIZE, help="Rows per batch request")
+    parser.add_option("-q", "--queries", dest="queries", default=DEFAULT_QUERY_COUNT, help="The number of queries of each kind")
+    parser.add_option("-o", "--output", dest="output", default=None, help="File to write the results to - stdout by default")
+    opts, args = parser.parse_args()
+
+    factories = {MEMORY:memory_factory, SQLITE:sqlite_factory, CASSANDRA:cassandra_factory}
+
+    backends = []
+    for name in opts.backends.split(','):
+        if name not in factories:
+            parser.error('Unknown backend: %s' % name)
+        backends.append((name, factories[name](opts.index)))
+
+    if opts.store_class is not None:
+        backends.append((opts.store_class, class_factory(opts.store_class, opts.index)))
+
+    output = sys.stdout
+    if opts.output is not None:
+        output = open(opts.output, 'w')
+
+    d = run_benchmarks(backends, opts.index, [int(x) for x in opts.sizes.split(',')], [int(x) for x in opts.keys.split(',')],
+                       int(opts.batch_size), int(opts.queries), output)
+    d.addErrback(log.error)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/data/test/test_cached_store.py
+@author David Stuebe
+@test ion.core.data.cached_store Run the store tests through the read through cache and check what it caches
+"""
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from twisted.trial import unittest
+from twisted.internet import defer
+from twisted.internet.task import Clock
+
+from ion.core.data import store
+from ion.core.data.cached_store import CachedStore, CachedIndexStore
+from ion.core.data.test import test_store
+
+
+class CachedStoreInterfaceTest(test_store.IStoreTest):
+
+    def _setup_backend(self):
+        return defer.succeed(CachedStore(store.Store()))
+
+
+class CachedIndexStoreInterfaceTest(test_store.IndexStoreTest):
+
+    def _setup_backend(self):
+        return defer.succeed(CachedIndexStore(store.IndexStore(indices=self.columns)))
+
+
+class BlobStore(store.Store):
+    """
+    A memory store with its own storage, counting the calls which reach it
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.kvs = {}
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        return store.Store.get(self, key)
+
+    def batch_get(self, batch_request):
+        self.calls += 1
+        return store.Store.batch_get(self, batch_request)
+
+    def has_key(self, key):
+        self.calls += 1
+        return store.Store.has_key(self, key)
+
+    def batch_has_key(self, batch_request):
+        self.calls += 1
+        return store.Store.batch_has_key(self, batch_request)
+
+
+class CommitStore(store.IndexStore):
+
+    def __init__(self, *args, **kwargs):
+        self.kvs = {}
+        self.indices = {}
+        store.IndexStore.__init__(self, *args, **kwargs)
+
+
+class CachedStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.backend = BlobStore()
+        self.cache = CachedStore(self.backend, max_bytes=1000, negative_ttl=5.0, clock=self.clock)
+
+    @defer.inlineCallbacks
+    def test_read_through(self):
+        self.backend.kvs['blob1'] = 'value1'
+
+        for i in range(3):
+            value = yield self.cache.get('blob1')
+            self.assertEqual(value, 'value1')
+            exists = yield self.cache.has_key('blob1')
+            self.assertEqual(exists, True)
+
+        # One read reaches the backend, and it answers has_key too
+        self.assertEqual(self.backend.calls, 1)
+
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['value_hits'], stats['value_misses']), (2, 1))
+        self.assertEqual((stats['exists_hits'], stats['exists_misses']), (3, 0))
+
+    @defer.inlineCallbacks
+    def test_batch(self):
+        yield self.cache.put('blob1', 'value1')
+        self.backend.kvs['blob2'] = 'value2'
+
+        batch = self.cache.new_batch_request()
+        for key in ['blob1', 'blob2', 'blob3']:
+            yield batch.add_request(key)
+
+        result = yield self.cache.batch_get(batch)
+        self.assertEqual(result, {'blob1':'value1', 'blob2':'value2', 'blob3':None})
+        self.assertEqual(self.backend.calls, 1)
+
+        result = yield self.cache.batch_has_key(batch)
+        self.assertEqual(result, {'blob1':True, 'blob2':True, 'blob3':False})
+        self.assertEqual(self.backend.calls, 2)
+
+        # Everything is known now
+        result = yield self.cache.batch_has_key(batch)
+        self.assertEqual(result, {'blob1':True, 'blob2':True, 'blob3':False})
+        self.assertEqual(self.backend.calls, 2)
+
+    @defer.inlineCallbacks
+    def test_negative_ttl(self):
+        exists = yield self.cache.has_key('blob1')
+        self.assertEqual(exists, False)
+
+        # Another process puts the blob
+        self.backend.kvs['blob1'] = 'value1'
+
+        exists = yield self.cache.has_key('blob1')
+        self.assertEqual(exists, False)
+
+        self.clock.advance(6)
+        exists = yield self.cache.has_key('blob1')
+        self.assertEqual(exists, True)
+
+        # A missing value is never cached
+        value = yield self.cache.get('blob2')
+        self.assertEqual(value, None)
+        self.backend.kvs['blob2'] = 'value2'
+        value = yield self.cache.get('blob2')
+        self.assertEqual(value, 'value2')
+
+    @defer.inlineCallbacks
+    def test_put_and_remove(self):
+        exists = yield self.cache.has_key('blob1')
+        self.assertEqual(exists, False)
+
+        yield self.cache.put('blob1', 'value1')
+        exists = yield self.cache.has_key('blob1')
+        self.assertEqual(exists, True)
+
+        yield self.cache.remove('blob1')
+        exists = yield self.cache.has_key('blob1')
+        self.assertEqual(exists, False)
+        value = yield self.cache.get('blob1')
+        self.assertEqual(value, None)
+
+    @defer.inlineCallbacks
+    def test_size_bound(self):
+        for i in range(100):
+            yield self.cache.put('blob%d' % i, 'x' * 50)
+
+        self.assertTrue(self.cache.get_stats()['cached_bytes'] <= 1000)
+
+        # The oldest values were evicted, but are still in the backend
+        value = yield self.cache.get('blob0')
+        self.assertEqual(value, 'x' * 50)
+        self.assertEqual(self.cache.get_stats()['value_misses'], 1)
+
+        # A value larger than the cache is not cached, and does not flush it
+        yield self.cache.put('big', 'x' * 2000)
+        self.assertTrue('blob0' in self.cache._values)
+        self.assertFalse('big' in self.cache._values)
+
+
+class CachedIndexStoreTest(unittest.TestCase):
+    """
+    The commit store is mutable - the branch attributes of a row change as the branch moves
+    """
+
+    def setUp(self):
+        self.backend = CommitStore(indices=['repository_key', 'branch_name'])
+        self.cache = CachedIndexStore(self.backend, max_bytes=1000)
+
+    @defer.inlineCallbacks
+    def test_index_attributes(self):
+        yield self.cache.put('commit1', 'commit value', index_attributes={'repository_key':'repo', 'branch_name':'master'})
+
+        value = yield self.cache.get('commit1')
+        self.assertEqual(value, 'commit value')
+
+        # Move the branch head - queries see the change
+        yield self.cache.update_index('commit1', {'branch_name':''})
+
+        q = store.Query()
+        q.add_predicate_eq('repository_key', 'repo')
+        q.add_predicate_eq('branch_name', 'master')
+        rows = yield self.cache.query(q)
+        self.assertEqual(rows, {})
+
+        # An attribute only batch put keeps the value
+        batch = self.cache.new_batch_request()
+        yield batch.add_request('commit1', value=None, index_attributes={'branch_name':'master'})
+        yield self.cache.batch_put(batch)
+
+        rows = yield self.cache.query(q)
+        self.assertEqual(rows.keys(), ['commit1'])
+        self.assertEqual(rows['commit1']['value'], 'commit value')
+
+        value = yield self.cache.get('commit1')
+        self.assertEqual(value, 'commit value')
+
+    @defer.inlineCallbacks
+    def test_missing_keys_not_cached(self):
+        exists = yield self.cache.has_key('commit2')
+        self.assertEqual(exists, False)
+
+        # Another datastore pushes a new branch head
+        yield self.backend.put('commit2', 'commit value', index_attributes={'repository_key':'repo', 'branch_name':'master'})
+
+        exists = yield self.cache.has_key('commit2')
+        self.assertEqual(exists, True)
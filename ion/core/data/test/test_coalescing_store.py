@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/data/test/test_coalescing_store.py
+@author David Stuebe
+@test ion.core.data.coalescing_store Run the store tests through the write behind layer and check how it batches,
+orders and fails writes
+"""
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from twisted.trial import unittest
+from twisted.internet import defer
+from twisted.internet.task import Clock
+
+from ion.core.data import store
+from ion.core.data.coalescing_store import CoalescingStore, CoalescingIndexStore
+from ion.core.data.test import test_store
+
+
+class CoalescingStoreInterfaceTest(test_store.IStoreTest):
+
+    def _setup_backend(self):
+        return defer.succeed(CoalescingStore(store.Store(), delay=0.001))
+
+
+class CoalescingIndexStoreInterfaceTest(test_store.IndexStoreTest):
+
+    def _setup_backend(self):
+        return defer.succeed(CoalescingIndexStore(store.IndexStore(indices=self.columns), delay=0.001))
+
+
+class BackendError(Exception):
+    pass
+
+
+class BlobStore(store.Store):
+    """
+    A memory store with its own storage which records each batch put. If hold is set, a batch put is written when the
+    test fires its deferred.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.kvs = {}
+        self.batches = []
+        self.held = []
+        self.hold = False
+        self.fail = False
+
+    def batch_put(self, batch_request):
+        self.batches.append(sorted(batch_request._br.keys()))
+
+        if self.fail:
+            return defer.fail(BackendError('The backend is down'))
+
+        if not self.hold:
+            return store.Store.batch_put(self, batch_request)
+
+        d = defer.Deferred()
+        d.addCallback(lambda _: store.Store.batch_put(self, batch_request))
+        self.held.append(d)
+        return d
+
+
+class CommitStore(store.IndexStore):
+
+    def __init__(self, *args, **kwargs):
+        self.kvs = {}
+        self.indices = {}
+        store.IndexStore.__init__(self, *args, **kwargs)
+
+
+class CoalescingStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.backend = BlobStore()
+        self.store = CoalescingStore(self.backend, delay=0.01, max_rows=4, clock=self.clock)
+
+    def test_coalesce(self):
+        results = []
+        for i in range(3):
+            self.store.put('blob%d' % i, 'value%d' % i).addCallback(results.append)
+
+        # Nothing is written until the window closes
+        self.assertEqual(self.backend.batches, [])
+        self.assertEqual(results, [])
+
+        self.clock.advance(0.01)
+        self.assertEqual(self.backend.batches, [['blob0', 'blob1', 'blob2']])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(self.backend.kvs, {'blob0':'value0', 'blob1':'value1', 'blob2':'value2'})
+
+    def test_max_rows(self):
+        for i in range(10):
+            self.store.put('blob%02d' % i, 'value')
+
+        # Two full batches are written at once, the rest when the window closes
+        self.assertEqual(len(self.backend.batches), 2)
+        self.clock.advance(0.01)
+        self.assertEqual(len(self.backend.batches), 3)
+        self.assertEqual(len(self.backend.kvs), 10)
+        self.assertEqual((self.store.puts, self.store.batches), (10, 3))
+
+    def test_ordering(self):
+        self.backend.hold = True
+
+        self.store.put('blob1', 'first')
+        self.store.put('blob2', 'value')
+        # A second write to a waiting key starts a new batch
+        self.store.put('blob1', 'second')
+        self.store.remove('blob2')
+        self.clock.advance(0.01)
+
+        # One batch at a time
+        self.assertEqual(self.backend.batches, [['blob1', 'blob2']])
+        self.backend.held.pop(0).callback(None)
+        self.assertEqual(self.backend.batches, [['blob1', 'blob2'], ['blob1']])
+        self.assertEqual(self.backend.kvs, {'blob1':'first', 'blob2':'value'})
+
+        self.backend.held.pop(0).callback(None)
+        self.assertEqual(self.backend.kvs, {'blob1':'second'})
+
+    def test_read_your_writes(self):
+        self.backend.hold = True
+        self.store.put('blob1', 'value1')
+
+        results = []
+        self.store.get('blob1').addCallback(results.append)
+        self.store.has_key('blob1').addCallback(results.append)
+
+        # The read sends the batch without waiting for the window, then waits for it
+        self.assertEqual(len(self.backend.batches), 1)
+        self.assertEqual(results, [])
+
+        self.backend.held.pop(0).callback(None)
+        self.assertEqual(results, ['value1', True])
+
+    def test_error(self):
+        self.backend.fail = True
+
+        errors = []
+        for i in range(3):
+            self.store.put('blob%d' % i, 'value').addErrback(errors.append)
+
+        flushed = []
+        self.store.flush().addCallback(flushed.append)
+
+        # Every caller in the failed batch gets the error - a flush only waits
+        self.assertEqual(len(errors), 3)
+        for error in errors:
+            error.trap(BackendError)
+        self.assertEqual(flushed, [None])
+
+        # Later writes are not affected
+        self.backend.fail = False
+        results = []
+        self.store.put('blob1', 'value').addCallback(results.append)
+        self.clock.advance(0.01)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(self.backend.kvs, {'blob1':'value'})
+
+
+class CoalescingIndexStoreTest(unittest.TestCase):
+
+    columns = ['name', 'age']
+
+    def setUp(self):
+        self.clock = Clock()
+        self.backend = CommitStore(indices=self.columns)
+        self.store = CoalescingIndexStore(self.backend, delay=0.01, clock=self.clock)
+
+    @defer.inlineCallbacks
+    def test_index_attributes(self):
+        self.store.put('commit1', 'value1', {'name':'a', 'age':1})
+        self.store.put('commit2', 'value2')
+        self.store.update_index('commit1', {'name':'b'})
+
+        query = store.Query()
+        query.add_predicate_eq('name', 'b')
+
+        # The query waits for the puts and the index update
+        rows = yield self.store.query(query)
+        self.assertEqual(rows.keys(), ['commit1'])
+        self.assertEqual(rows['commit1']['value'], 'value1')
+
+        self.store.put('commit2', 'value2', {'name':'b', 'age':2})
+        cursor = self.store.query_cursor(query, page_size=1)
+        pages = []
+        while not cursor.exhausted:
+            page = yield cursor.next_page()
+            pages.append(sorted(page.keys()))
+        self.assertEqual(sorted(sum(pages, [])), ['commit1', 'commit2'])
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/data/test/test_sqlite_store.py
+@author David Stuebe
+@test ion.core.data.sqlite_store Run the store tests against the sqlite backend and check that it persists
+"""
+
+import os
+import shutil
+import tempfile
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from twisted.trial import unittest
+from twisted.internet import defer
+
+from ion.core.data import store
+from ion.core.data.store import Query
+from ion.core.data.sqlite_store import SqliteStore, SqliteIndexStore, SqliteDataManager, archive_filename
+from ion.core.data.test import test_store
+
+
+class SqliteStoreInterfaceTest(test_store.IStoreTest):
+
+    def _setup_backend(self):
+        self.directory = tempfile.mkdtemp()
+        return defer.succeed(SqliteStore('test_archive', 'blobs', directory=self.directory))
+
+    def tearDown(self):
+        self.ds.close()
+        shutil.rmtree(self.directory)
+
+
+class SqliteIndexStoreInterfaceTest(test_store.IndexStoreTest):
+
+    def _setup_backend(self):
+        self.directory = tempfile.mkdtemp()
+        return defer.succeed(SqliteIndexStore('test_archive', 'commits', indices=self.columns, directory=self.directory))
+
+    def tearDown(self):
+        self.ds.close()
+        shutil.rmtree(self.directory)
+
+
+class Cache(object):
+
+    def __init__(self, name, columns=()):
+        self.name = name
+        self.column_metadata = [Column(column) for column in columns]
+
+
+class Column(object):
+
+    def __init__(self, column_name):
+        self.column_name = column_name
+
+
+class SqliteStoreTest(unittest.TestCase):
+
+    columns = ['name', 'state']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stores = []
+
+    def tearDown(self):
+        for s in self.stores:
+            s.close()
+        shutil.rmtree(self.directory)
+
+    def _open(self, cls, *args, **kwargs):
+        s = cls(directory=self.directory, *args, **kwargs)
+        self.stores.append(s)
+        return s
+
+    @defer.inlineCallbacks
+    def test_persistence(self):
+        blobs = self._open(SqliteStore, 'archive', 'blobs')
+        commits = self._open(SqliteIndexStore, 'archive', 'commits', indices=self.columns)
+
+        # Binary keys and values
+        yield blobs.put('\x00\xffkey', '\x00value\xff')
+        yield commits.put('commit1', 'value1', {'name':'a', 'state':'RI'})
+        blobs.close()
+        commits.close()
+
+        blobs = self._open(SqliteStore, 'archive', 'blobs')
+        value = yield blobs.get('\x00\xffkey')
+        self.assertEqual(value, '\x00value\xff')
+
+        # The indexed attributes come from the table
+        commits = self._open(SqliteIndexStore, 'archive', 'commits')
+        attrs = yield commits.get_query_attributes()
+        self.assertEqual(sorted(attrs), self.columns)
+
+        query = Query()
+        query.add_predicate_eq('state', 'RI')
+        rows = yield commits.query(query)
+        self.assertEqual(rows, {'commit1':{'value':'value1', 'name':'a', 'state':'RI'}})
+
+    @defer.inlineCallbacks
+    def test_batch_put_index_update(self):
+        commits = self._open(SqliteIndexStore, 'archive', 'commits', indices=self.columns)
+        yield commits.put('commit1', 'value1', {'name':'a'})
+
+        batch = commits.new_batch_request()
+        yield batch.add_request('commit1', None, {'state':'MA'})
+        yield batch.add_request('commit2', 'value2', {'state':'MA'})
+        yield commits.batch_put(batch)
+
+        query = Query()
+        query.add_predicate_eq('state', 'MA')
+        rows = yield commits.query(query)
+        self.assertEqual(rows['commit1'], {'value':'value1', 'name':'a', 'state':'MA'})
+        self.assertEqual(rows['commit2'], {'value':'value2', 'state':'MA'})
+
+        # A failed batch writes nothing
+        batch = commits.new_batch_request()
+        yield batch.add_request('commit3', 'value3', {'state':'MA'})
+        yield batch.add_request('missing', None, {'state':'MA'})
+        try:
+            yield commits.batch_put(batch)
+        except store.IndexStoreError:
+            pass
+        else:
+            self.fail('Did not raise Index Store Error')
+
+        has_key = yield commits.has_key('commit3')
+        self.assertEqual(has_key, False)
+
+    @defer.inlineCallbacks
+    def test_matches_index_store(self):
+        commits = self._open(SqliteIndexStore, 'archive', 'commits', indices=self.columns)
+        memory = store.IndexStore(indices=self.columns, private=True)
+
+        for i in range(50):
+            attrs = {'name':'name_%d' % (i % 7)}
+            if i % 3:
+                attrs['state'] = 'state_%d' % (i % 5)
+            yield commits.put('key_%02d' % i, 'value', attrs)
+            yield memory.put('key_%02d' % i, 'value', attrs)
+
+        queries = []
+        q = Query()
+        q.add_predicate_eq('name', 'name_3')
+        queries.append(q)
+        q = Query()
+        q.add_predicate_in('name', ['name_1', 'name_2'])
+        q.add_predicate_gt('state', 'state_2')
+        queries.append(q)
+        q = Query()
+        q.add_predicate_eq('name', 'name_1')
+        q.add_predicate_gt('state', '')
+        queries.append(q)
+        q = Query()
+        q.add_predicate_eq('name', 'name_1')
+        q.add_predicate_eq('color', 'blue')
+        queries.append(q)
+
+        for q in queries:
+            expected = yield memory.query(q)
+            rows = yield commits.query(q)
+            self.assertEqual(rows, expected)
+
+            cursor = commits.query_cursor(q, page_size=2)
+            paged = {}
+            while not cursor.exhausted:
+                page = yield cursor.next_page()
+                self.assertTrue(len(page) <= 2)
+                paged.update(page)
+            self.assertEqual(paged, expected)
+
+    @defer.inlineCallbacks
+    def test_data_manager(self):
+        manager = SqliteDataManager(directory=self.directory)
+        archive = Cache('managed')
+
+        yield manager.create_persistent_archive(archive)
+        yield manager.create_cache(archive, Cache('commits', ['name']))
+        yield manager.update_cache(archive, Cache('commits', ['name', 'state']))
+
+        commits = self._open(SqliteIndexStore, 'managed', 'commits')
+        attrs = yield commits.get_query_attributes()
+        self.assertEqual(sorted(attrs), self.columns)
+        commits.close()
+
+        yield manager.remove_persistent_archive(archive)
+        self.assertFalse(os.path.exists(archive_filename('managed', self.directory)))
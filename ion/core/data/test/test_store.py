@@ -13,6 +13,7 @@
 import ion.util.ionlog
 log = ion.util.ionlog.getLogger(__name__)
 from uuid import uuid4
+import random
 
 from twisted.trial import unittest
 from twisted.internet import defer
@@ -421,6 +422,124 @@ class IndexStoreTest(IStoreTest):
             self.assertIn(key, rows['htayler'])
 
 
+    @defer.inlineCallbacks
+    def _read_cursor(self, cursor):
+        """
+        Read all the pages from a query cursor, checking the page size
+        """
+        rows = {}
+        npages = 0
+        while not cursor.exhausted:
+            page = yield cursor.next_page()
+            self.assertTrue(len(page) <= cursor.page_size)
+            for key in page.keys():
+                self.assertNotIn(key, rows)
+            rows.update(page)
+            npages += 1
+
+        self.assertEqual(cursor.row_count, len(rows))
+
+        defer.returnValue((rows, npages))
+
+    @defer.inlineCallbacks
+    def test_query_cursor(self):
+
+        query = Query()
+        query.add_predicate_eq('state', 'UT')
+
+        cursor = self.ds.query_cursor(query, page_size=2)
+        rows, npages = yield self._read_cursor(cursor)
+
+        self.assertEqual(len(rows),3)
+        self.assertTrue(npages >= 2)
+        self.assertEqual(rows['bsanderson']['value'], self.binary_value1)
+        self.assertEqual(rows['htayler']['value'], self.binary_value3)
+        self.assertEqual(rows['jstewart']['value'], self.binary_value4)
+
+        for key in self.d1.keys():
+            self.assertIn(key, rows['bsanderson'])
+
+        # Once exhausted the cursor returns nothing
+        page = yield cursor.next_page()
+        self.assertEqual(page, {})
+
+    @defer.inlineCallbacks
+    def test_query_cursor_matches_query(self):
+
+        for i in range(25):
+            yield self.ds.put('key_%02d' % i, 'value_%d' % i, {'state':'MA', 'birth_date':str(1950 + i)})
+
+        query = Query()
+        query.add_predicate_gt('birth_date','1960')
+        query.add_predicate_eq('state','MA')
+
+        expected = yield self.ds.query(query)
+        self.assertEqual(len(expected), 14)
+
+        for page_size in (1, 3, 14, 100):
+            cursor = self.ds.query_cursor(query, page_size=page_size)
+            rows, npages = yield self._read_cursor(cursor)
+            self.assertEqual(rows, expected)
+
+
+    @defer.inlineCallbacks
+    def test_query_cursor_no_results(self):
+
+        query = Query()
+        query.add_predicate_eq('birth_date', '1978')
+
+        cursor = self.ds.query_cursor(query, page_size=10)
+        rows, npages = yield self._read_cursor(cursor)
+        self.assertEqual(rows, {})
+
+    @defer.inlineCallbacks
+    def test_query_in(self):
+
+        query = Query()
+        query.add_predicate_in('birth_date', ['1968', '1973', '1999'])
+        rows = yield self.ds.query(query)
+        self.assertEqual(set(rows.keys()), set(['htayler', 'prothfuss']))
+
+        query = Query()
+        query.add_predicate_eq('state','UT')
+        query.add_predicate_in('birth_date', ['1968', '1973', '1975'])
+        rows = yield self.ds.query(query)
+        self.assertEqual(set(rows.keys()), set(['htayler', 'bsanderson']))
+
+        cursor = self.ds.query_cursor(query, page_size=1)
+        rows, npages = yield self._read_cursor(cursor)
+        self.assertEqual(set(rows.keys()), set(['htayler', 'bsanderson']))
+
+        query = Query()
+        query.add_predicate_in('birth_date', [])
+        rows = yield self.ds.query(query)
+        self.assertEqual(rows, {})
+
+    @defer.inlineCallbacks
+    def test_chained_query_cursor(self):
+
+        query = Query()
+        query.add_predicate_gt('birth_date', '')
+        query.add_predicate_in('state', ['UT', 'MA', 'UT', 'NY'])
+
+        expected = yield self.ds.query(query)
+
+        # Expand the IN the way a backend which can not search for a set of values does
+        for page_size, max_concurrent in ((1, 1), (1, 2), (2, 3), (100, 16)):
+            cursors = [self.ds.query_cursor(q, page_size=page_size) for q in query.expand_in()]
+            cursor = store.ChainedQueryCursor(cursors, page_size=page_size, max_concurrent=max_concurrent)
+            rows, npages = yield self._read_cursor(cursor)
+            self.assertEqual(rows, expected)
+
+        self.assertRaises(store.IndexStoreError, store.ChainedQueryCursor, [], 10, 0)
+
+    def test_query_cursor_bad_page_size(self):
+
+        query = Query()
+        query.add_predicate_eq('state', 'UT')
+
+        self.assertRaises(store.IndexStoreError, self.ds.query_cursor, query, 0)
+
 
 
 
@@ -564,3 +683,139 @@ class IndexStoreServiceTest(IndexStoreTest, IonTestCase):
     def test_batch(self):
 
         raise unittest.SkipTest('Not implementing batch_put in store service!')
+
+
+class InMemoryIndexStoreTest(unittest.TestCase):
+    """
+    Tests of the in memory index engine - storage, sorted indices and the query planner
+    """
+
+    columns = ['name', 'state', 'year']
+
+    def setUp(self):
+        self.ds = store.IndexStore(indices=self.columns, private=True)
+
+    def _query(self, query):
+        rows = []
+        self.ds.query(query).addCallback(rows.append)
+        return set(rows[0].keys())
+
+    def _scan(self, rows, predicates):
+        """
+        Evaluate the predicates against every row
+        """
+        keys = set()
+        for key, row in rows.iteritems():
+            match = True
+            for name, value, pred in predicates:
+                if not row.has_key(name):
+                    match = False
+                elif pred == Query.EQ:
+                    match = match and row[name] == value
+                elif pred == Query.IN:
+                    match = match and row[name] in value
+                else:
+                    match = match and row[name] > value
+            if match:
+                keys.add(key)
+        return keys
+
+    def test_storage(self):
+        shared = store.IndexStore(indices=self.columns, namespace='test_storage')
+        other = store.IndexStore(indices=self.columns, namespace='test_storage')
+        shared.clear()
+
+        shared.put('key1', 'value1', {'state':'RI'})
+        self.assertEqual(other.kvs.keys(), ['key1'])
+        self.assertNotIn('key1', self.ds.kvs)
+        self.assertNotIn('key1', store.IndexStore.kvs)
+
+        other.clear()
+        self.assertEqual(shared.kvs, {})
+
+        # The indexed attributes are kept
+        shared.put('key2', 'value2', {'state':'MA'})
+        query = Query()
+        query.add_predicate_eq('state', 'MA')
+        self.assertEqual(self._query(query), set(['key2']))
+
+    def test_gt_after_changes(self):
+        for year in range(1990, 2000):
+            self.ds.put('key_%d' % year, 'value', {'state':'RI', 'year':str(year)})
+
+        self.ds.remove('key_1998')
+        self.ds.update_index('key_1991', {'year':'2005'})
+        # A put replaces the row - key_1999 no longer has a year
+        self.ds.put('key_1999', 'value', {'state':'RI'})
+
+        query = Query()
+        query.add_predicate_eq('state', 'RI')
+        query.add_predicate_gt('year', '1996')
+        self.assertEqual(self._query(query), set(['key_1997', 'key_1991']))
+
+        # The sorted values only hold values which some key has
+        self.assertEqual(self.ds.indices['year'].values_gt('1996'), ['1997', '2005'])
+
+    def test_unindexed_attribute(self):
+        self.ds.put('key1', 'value', {'state':'RI'})
+
+        query = Query()
+        query.add_predicate_eq('state', 'RI')
+        query.add_predicate_gt('color', 'blue')
+        self.assertEqual(self._query(query), set())
+
+        query = Query()
+        query.add_predicate_gt('state', 'A')
+        self.assertRaises(store.IndexStoreError, self.ds.query, query)
+
+    def test_eq_unindexed_attribute(self):
+        self.ds.put('key1', 'value', {'state':'RI'})
+
+        # No row has an attribute which is not indexed - the predicate is not ignored
+        query = Query()
+        query.add_predicate_eq('state', 'RI')
+        query.add_predicate_eq('color', 'blue')
+        self.assertEqual(self._query(query), set())
+
+        query = Query()
+        query.add_predicate_eq('color', 'blue')
+        self.assertEqual(self._query(query), set())
+
+    def test_eq_index_without_rows(self):
+        self.ds.put('key1', 'value', {'state':'RI'})
+
+        # No row has a year yet - the empty index matches nothing rather than being ignored
+        query = Query()
+        query.add_predicate_eq('state', 'RI')
+        query.add_predicate_eq('year', '2010')
+        self.assertEqual(self._query(query), set())
+
+        self.ds.put('key2', 'value', {'state':'RI', 'year':'2010'})
+        self.assertEqual(self._query(query), set(['key2']))
+
+    def test_planner_matches_scan(self):
+        rng = random.Random(1)
+        rows = {}
+        for i in range(2000):
+            key = 'key_%d' % rng.randrange(300)
+            attrs = {}
+            for name in self.columns:
+                if rng.random() < 0.8:
+                    attrs[name] = str(rng.randrange(10))
+            self.ds.put(key, 'value', attrs)
+            rows[key] = attrs
+
+            if rng.random() < 0.2:
+                key = 'key_%d' % rng.randrange(300)
+                self.ds.remove(key)
+                rows.pop(key, None)
+
+        for i in range(200):
+            query = Query()
+            query.add_predicate_eq('state', str(rng.randrange(10)))
+            if rng.random() < 0.5:
+                query.add_predicate_in('name', [str(rng.randrange(10)) for j in range(3)])
+            if rng.random() < 0.7:
+                query.add_predicate_gt('year', str(rng.randrange(10)))
+
+            self.assertEqual(self._query(query), self._scan(rows, query.get_predicates()))
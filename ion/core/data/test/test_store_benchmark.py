@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/data/test/test_store_benchmark.py
+@author David Stuebe
+@test ion.core.data.store_benchmark Check the percentiles and run the workloads against the in memory stores
+"""
+
+from StringIO import StringIO
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from twisted.trial import unittest
+from twisted.internet import defer
+
+from ion.core.data import store_benchmark
+from ion.core.data.store_benchmark import StoreBenchmark, LatencyStats, percentile
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_percentile(self):
+        samples = range(1, 101)
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 95), 95)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile(samples, 100), 100)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([], 50), None)
+
+    def test_latency_stats(self):
+        stats = LatencyStats('get')
+        for i in range(10):
+            stats.add(0.001 * (i + 1), rows=2)
+        stats.elapsed = 0.1
+
+        result = stats.result(backend='memory')
+        self.assertEqual(result['workload'], 'get')
+        self.assertEqual(result['backend'], 'memory')
+        self.assertEqual((result['ops'], result['rows']), (10, 20))
+        self.assertAlmostEqual(result['ops_per_second'], 100.0)
+        self.assertAlmostEqual(result['p50_ms'], 5.0)
+        self.assertAlmostEqual(result['p99_ms'], 10.0)
+
+
+class StoreBenchmarkTest(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def _run(self, index):
+        output = StringIO()
+        benchmark = StoreBenchmark('memory', store_benchmark.memory_factory(index), index=index, value_sizes=(10, 100),
+                                   key_counts=(50,), batch_size=20, query_count=5, output=output)
+        results = yield benchmark.run()
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(lines), len(results))
+        defer.returnValue(results)
+
+    @defer.inlineCallbacks
+    def test_store(self):
+        results = yield self._run(False)
+
+        workloads = [r['workload'] for r in results if r['value_size'] == 10]
+        self.assertEqual(workloads, ['put', 'batch_put', 'get', 'batch_get', 'has_key', 'remove'])
+
+        for result in results:
+            self.assertEqual(result['key_count'], 50)
+            self.assertTrue(result['p50_ms'] <= result['p95_ms'] <= result['p99_ms'] <= result['max_ms'])
+
+        batch_put = [r for r in results if r['workload'] == 'batch_put'][0]
+        self.assertEqual((batch_put['ops'], batch_put['rows']), (3, 50))
+
+    @defer.inlineCallbacks
+    def test_index_store(self):
+        results = yield self._run(True)
+
+        by_workload = dict([(r['workload'], r) for r in results if r['value_size'] == 100])
+        self.assertEqual(sorted(by_workload.keys()),
+                         ['batch_get', 'batch_put', 'get', 'has_key', 'put', 'query_eq', 'query_gt', 'remove', 'update_index'])
+
+        # Each repository has 10 rows from put and 10 from batch_put
+        self.assertEqual(by_workload['query_eq']['ops'], 5)
+        self.assertEqual(by_workload['query_eq']['rows'], 5 * 20)
@@ -314,31 +314,41 @@ class PolicyInterceptor(EnvelopeInterceptor):
 
     @defer.inlineCallbacks
     def check_owner(self, user_id, uuid_list, invocation):
-        self.mc = MessageClient(proc=invocation.process)
-        self.asc = AssociationServiceClient(proc=invocation.process)
-
-        for uuid in uuid_list:        
-            request = yield self.mc.create_instance(ASSOCIATION_QUERY_MSG_TYPE)
-
-            request.object = request.CreateObject(IDREF_TYPE)
-            request.object.key = user_id
-
-            request.predicate = request.CreateObject(IDREF_TYPE)
-            request.predicate.key = OWNED_BY_ID
+        """
+        Check that the user owns every resource in the list with a single association query. Ownership is checked on
+        every message rather than cached, so a transferred or removed ownership takes effect at once.
+        """
+        unique = []
+        for uuid in uuid_list:
+            if uuid not in unique:
+                unique.append(uuid)
 
-            request.subject = request.CreateObject(IDREF_TYPE)
-            request.subject.key = uuid
+        owned = yield self.find_owned(user_id, unique, invocation)
 
-            # make the request
-            log.warn('Calling association service for user id <%s> and uuid <%s>' % (user_id, uuid))
-            result = yield self.asc.association_exists(request)
-            log.warn('Return from association service call for user id <%s> and uuid <%s>' % (user_id, uuid))
-            if result.result == False:
+        for uuid in unique:
+            if uuid not in owned:
                 log.warn('Policy Interceptor: Authentication failed. User <%s> does not own resource <%s>.' % (user_id, uuid))
                 invocation.drop(note='Not authorized', code=Invocation.CODE_UNAUTHORIZED)
                 return
             else:
-                log.warn('Policy Interceptor: User <%s> owns resource <%s>.' % (user_id, uuid))
+                log.info('Policy Interceptor: User <%s> owns resource <%s>.' % (user_id, uuid))
+
+    @defer.inlineCallbacks
+    def find_owned(self, user_id, uuid_list, invocation):
+        """
+        Find which of the resources in the list are owned by the user with one call to the association service. Only
+        the ownership associations of the resources in the list are read.
+        @param user_id the ooi id of the user
+        @param uuid_list the resource ids to check
+        @param invocation the invocation with the process to send from
+        @retval the set of the resource ids in uuid_list which the user owns
+        """
+        self.asc = AssociationServiceClient(proc=invocation.process)
+
+        log.info('Calling association service for user id <%s> and %d uuids' % (user_id, len(uuid_list)))
+        owner_map = yield self.asc.get_associations_map({'subject': list(uuid_list), 'predicate': OWNED_BY_ID, 'object': user_id})
+
+        defer.returnValue(set([uuid for uuid in uuid_list if owner_map.get(uuid) == user_id]))
 
     def find_uuids(self, invocation, msg, user_id, resources):
         """
@@ -0,0 +1,105 @@
+"""
+@file ion/core/intercept/policy_performance_testing.py
+@author David Stuebe
+@brief Measure the latency an owner restricted message spends in the policy interceptor when ownership is checked with
+one association call per resource and with one batched call.
+
+The association service is simulated by a fixed round trip time per call so that the benchmark runs without a
+container.
+
+Run as a script:
+python ion/core/intercept/policy_performance_testing.py -r 1,10,100 -m 100 -t 0.005
+"""
+
+import time
+from optparse import OptionParser
+
+from twisted.internet import defer, reactor, task
+
+from ion.core.process.cprocess import Invocation
+from ion.core.intercept.policy import PolicyInterceptor
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+USER = 'policy_benchmark_user'
+
+
+class SimulatedOwnerInterceptor(PolicyInterceptor):
+    """
+    Answers the ownership query after one simulated round trip to the association service per call
+    """
+
+    def __init__(self, owned, round_trip, per_resource=False):
+        PolicyInterceptor.__init__(self, 'policy_benchmark')
+        self.owned = owned
+        self.round_trip = round_trip
+        self.per_resource = per_resource
+        self.calls = 0
+
+    @defer.inlineCallbacks
+    def find_owned(self, user_id, uuid_list, invocation):
+
+        if self.per_resource:
+            # The old check - one association_exists call after another
+            owned = set()
+            for uuid in uuid_list:
+                self.calls += 1
+                yield task.deferLater(reactor, self.round_trip, lambda: None)
+                if uuid in self.owned:
+                    owned.add(uuid)
+            defer.returnValue(owned)
+
+        self.calls += 1
+        yield task.deferLater(reactor, self.round_trip, lambda: None)
+        defer.returnValue(set([uuid for uuid in uuid_list if uuid in self.owned]))
+
+
+class PolicyPerformanceTester:
+
+    def __init__(self, resource_counts, num_messages, round_trip):
+
+        self.resource_counts = resource_counts
+        self.num_messages = num_messages
+        self.round_trip = round_trip
+
+    @defer.inlineCallbacks
+    def measure(self, name, num_resources, per_resource):
+
+        uuids = ['resource_%d' % i for i in xrange(num_resources)]
+        interceptor = SimulatedOwnerInterceptor(set(uuids), self.round_trip, per_resource)
+
+        t1 = time.time()
+        for i in xrange(self.num_messages):
+            invocation = Invocation()
+            yield interceptor.check_owner(USER, uuids, invocation)
+            assert invocation.status == Invocation.STATUS_PROCESS
+        t2 = time.time()
+
+        print "%s: %d messages with %d resources - %f ms per message, %d association calls" % \
+            (name, self.num_messages, num_resources, (t2 - t1) * 1000.0 / self.num_messages, interceptor.calls)
+
+    @defer.inlineCallbacks
+    def runBenchMarks(self):
+        for num_resources in self.resource_counts:
+            yield self.measure('One call per resource', num_resources, True)
+            yield self.measure('Batched call', num_resources, False)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-r", "--resources", dest="resources", default="1,10,100", help="Comma separated list of the number of resources in each message")
+    parser.add_option("-m", "--messages", dest="messages", default=100, help="The number of messages to send through the interceptor")
+    parser.add_option("-t", "--round_trip", dest="round_trip", default=0.005, help="Simulated round trip time of an association call in seconds")
+    opts, args = parser.parse_args()
+
+    resource_counts = [int(x) for x in opts.resources.split(',')]
+    tester = PolicyPerformanceTester(resource_counts, int(opts.messages), float(opts.round_trip))
+
+    d = tester.runBenchMarks()
+    d.addErrback(log.error)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/intercept/test/test_policy.py
+@author David Stuebe
+@brief Test the role checks and the batched ownership checks of the policy interceptor
+"""
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from ion.core.process.cprocess import Invocation
+from ion.core.intercept.policy import PolicyInterceptor
+from ion.core.intercept.policy import map_ooi_id_to_role, unmap_ooi_id_from_role
+
+
+class OwnerCountingInterceptor(PolicyInterceptor):
+    """
+    Answers the ownership query from a dictionary and counts the queries
+    """
+
+    def __init__(self, owned):
+        PolicyInterceptor.__init__(self, 'policy_test')
+        self.owned = owned
+        self.queries = []
+
+    def find_owned(self, user_id, uuid_list, invocation):
+        self.queries.append(list(uuid_list))
+        return defer.succeed(set([uuid for uuid in uuid_list if uuid in self.owned.get(user_id, ())]))
+
+
+class PolicyInterceptorTest(unittest.TestCase):
+
+    USER = 'policy_test_user'
+
+    def setUp(self):
+        self.interceptor = OwnerCountingInterceptor({self.USER:set(['res_1', 'res_2', 'res_3'])})
+
+    def tearDown(self):
+        unmap_ooi_id_from_role(self.USER, 'ADMIN')
+
+    def _request(self, op):
+        return {'performative':'request', 'user-id':self.USER, 'expiry':'0', 'receiver':'foo.hello_policy', 'op':op}
+
+    @defer.inlineCallbacks
+    def test_role_change(self):
+
+        invocation = Invocation()
+        yield self.interceptor.is_authorized(self._request('hello_update_resource'), invocation)
+        self.assertEqual(invocation.status, Invocation.STATUS_DROP)
+
+        # A new role is seen at once
+        map_ooi_id_to_role(self.USER, 'ADMIN')
+        invocation = Invocation()
+        yield self.interceptor.is_authorized(self._request('hello_update_resource'), invocation)
+        self.assertEqual(invocation.status, Invocation.STATUS_PROCESS)
+
+        unmap_ooi_id_from_role(self.USER, 'ADMIN')
+        invocation = Invocation()
+        yield self.interceptor.is_authorized(self._request('hello_update_resource'), invocation)
+        self.assertEqual(invocation.status, Invocation.STATUS_DROP)
+
+    @defer.inlineCallbacks
+    def test_check_owner_batched(self):
+
+        invocation = Invocation()
+        yield self.interceptor.check_owner(self.USER, ['res_1', 'res_2', 'res_3', 'res_1'], invocation)
+        self.assertEqual(invocation.status, Invocation.STATUS_PROCESS)
+
+        # One query for all of the resources
+        self.assertEqual(self.interceptor.queries, [['res_1', 'res_2', 'res_3']])
+
+        invocation = Invocation()
+        yield self.interceptor.check_owner(self.USER, ['res_1', 'res_4'], invocation)
+        self.assertEqual(invocation.status, Invocation.STATUS_DROP)
+        self.assertEqual(self.interceptor.queries[-1], ['res_1', 'res_4'])
+
+        # The user becomes the owner
+        self.interceptor.owned[self.USER].add('res_4')
+        invocation = Invocation()
+        yield self.interceptor.check_owner(self.USER, ['res_4'], invocation)
+        self.assertEqual(invocation.status, Invocation.STATUS_PROCESS)
+        self.assertEqual(len(self.interceptor.queries), 3)
+
+    @defer.inlineCallbacks
+    def test_owner_change(self):
+
+        invocation = Invocation()
+        yield self.interceptor.check_owner(self.USER, ['res_1', 'res_2'], invocation)
+        self.assertEqual(invocation.status, Invocation.STATUS_PROCESS)
+
+        # The resource changes hands - the next message is refused
+        self.interceptor.owned[self.USER].remove('res_1')
+
+        invocation = Invocation()
+        yield self.interceptor.check_owner(self.USER, ['res_1', 'res_2'], invocation)
+        self.assertEqual(invocation.status, Invocation.STATUS_DROP)
+        self.assertEqual(len(self.interceptor.queries), 2)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+@file ion/core/object/cdm_methods/array_structure.py
+@brief Interval index over the bounds of the bounded arrays in a cdm array structure (the content of a variable).
+Used for point lookups (GetValue) and hyperslab intersection queries (GetIntersectingBoundedArrays, extract_data)
+so that they do not need to scan every bounded array.
+@author David Stuebe
+"""
+
+import weakref
+from bisect import bisect_left, bisect_right
+
+from ion.util.cache import LRUDict
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class BoundsIndex(object):
+    """
+    A static interval index over a list of multidimensional extents.
+
+    The bounded arrays of a variable are almost always split along one dimension (time for a supplemented dataset)
+    and span the full extent of the others. The index picks the dimension with the most distinct origins, sorts the
+    extents by their start in that dimension and keeps a running maximum of the ends. A query is two binary searches
+    to find the candidate range followed by a check of the remaining dimensions for each candidate - O(log n + k) for
+    arrays which do not nest in the split dimension.
+
+    Results are positions in the list of extents given to the constructor, in ascending order.
+    """
+
+    def __init__(self, extents):
+        """
+        @param extents A list with one entry per bounded array. Each entry is a list of (origin, size) tuples - one
+        per dimension.
+        """
+        self.count = len(extents)
+
+        # store half open [start, end) ranges
+        self._extents = [tuple([(origin, origin + size) for origin, size in extent]) for extent in extents]
+
+        self.ranks = set([len(extent) for extent in self._extents])
+
+        # Pick the dimension which best splits the extents
+        self._dim = None
+        if self.ranks:
+            best = 1
+            for dim in xrange(min(self.ranks)):
+                ndistinct = len(set([extent[dim][0] for extent in self._extents]))
+                if ndistinct > best:
+                    best = ndistinct
+                    self._dim = dim
+
+        if self._dim is None:
+            # Nothing to split on - every extent is a candidate for every query
+            self._order = range(self.count)
+            self._starts = None
+            self._maxends = None
+            return
+
+        dim = self._dim
+        self._order = sorted(xrange(self.count), key=lambda i: (self._extents[i][dim][0], i))
+        self._starts = [self._extents[i][dim][0] for i in self._order]
+
+        self._maxends = []
+        maxend = None
+        for i in self._order:
+            maxend = max(maxend, self._extents[i][dim][1])
+            self._maxends.append(maxend)
+
+    def __len__(self):
+        return self.count
+
+    def intersecting(self, ranges):
+        """
+        @brief Find the extents which intersect a hyperslab
+        @param ranges A list of half open (start, end) tuples - one per dimension
+        @retval A sorted list of the positions of the intersecting extents
+        """
+        ranges = tuple(ranges)
+
+        if self._dim is None:
+            candidates = self._order
+        else:
+            if len(ranges) <= self._dim:
+                return []
+            qstart, qend = ranges[self._dim]
+            # Candidates start before the end of the query and come after the first extent reaching past its start
+            hi = bisect_left(self._starts, qend)
+            lo = bisect_right(self._maxends, qstart)
+            candidates = self._order[lo:hi]
+
+        result = []
+        for i in candidates:
+            extent = self._extents[i]
+            if len(extent) != len(ranges):
+                continue
+
+            for (start, end), (qstart, qend) in zip(extent, ranges):
+                if start >= qend or qstart >= end:
+                    break
+            else:
+                result.append(i)
+
+        result.sort()
+        return result
+
+    def find(self, point):
+        """
+        @brief Find the first extent (in the original order) which contains a point
+        @param point A list of integer indices - one per dimension
+        @retval The position of the extent or None
+        """
+        result = self.intersecting([(index, index + 1) for index in point])
+        if result:
+            return result[0]
+        return None
+
+
+# Indexes for committed array structures are keyed by their sha1 - they never change.
+_committed_index_cache = LRUDict(1000)
+
+# Indexes for modified array structures are kept with the wrapper along with the modification count of its repository
+# when the index was built.
+_workspace_index_cache = weakref.WeakKeyDictionary()
+
+
+def get_bounds_index(array_structure):
+    """
+    @brief Get the (lazily built) interval index over the bounded arrays of an array structure object
+    @param array_structure - a cdm array structure wrapper (the content of a variable)
+    @retval a BoundsIndex whose positions are indices into array_structure.bounded_arrays
+    """
+    if not array_structure.Modified:
+        key = array_structure.MyId
+        index = _committed_index_cache.get(key)
+        if index is None:
+            index = _build_bounds_index(array_structure)
+            _committed_index_cache[key] = index
+        return index
+
+    # The wrapper is in the workspace - bounded arrays may be added, removed or have their bounds edited in place
+    # without a change to its id, so the index is rebuilt after any modification in the repository.
+    root = array_structure.Root
+    count = array_structure.Repository._modification_count
+
+    entry = _workspace_index_cache.get(root)
+    if entry is not None and entry[0] == count:
+        return entry[1]
+
+    index = _build_bounds_index(array_structure)
+    _workspace_index_cache[root] = (count, index)
+    return index
+
+
+def _build_bounds_index(array_structure):
+    log.debug('Building bounds index for %d bounded arrays' % len(array_structure.bounded_arrays))
+    extents = []
+    for ba in array_structure.bounded_arrays:
+        extents.append([(bounds.origin, bounds.size) for bounds in ba.bounds])
+
+    return BoundsIndex(extents)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+@file ion/core/object/cdm_methods/bounded_array.py
+@brief Wrapper methods for the cdm bounded array object. Provides bulk access to the content of the ndarray as a numpy
+array so that clients do not need to read and write the repeated value field one element at a time.
+@author David Stuebe
+"""
+
+import numpy
+
+# Get the object decorator used on wrapper methods!
+from ion.core.object.object_utils import _gpb_source
+
+from ion.core.object.object_utils import OOIObjectError
+from ion.core.object.object_utils import CDM_ARRAY_INT32_TYPE, CDM_ARRAY_UINT32_TYPE, CDM_ARRAY_INT64_TYPE, \
+    CDM_ARRAY_UINT64_TYPE, CDM_ARRAY_FLOAT32_TYPE, CDM_ARRAY_FLOAT64_TYPE
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+# Map the ndarray object types to numpy dtypes - keyed by object_id because GPB Types hash by id!
+NDARRAY_DTYPES = {CDM_ARRAY_INT32_TYPE.object_id : numpy.dtype(numpy.int32),
+                  CDM_ARRAY_UINT32_TYPE.object_id : numpy.dtype(numpy.uint32),
+                  CDM_ARRAY_INT64_TYPE.object_id : numpy.dtype(numpy.int64),
+                  CDM_ARRAY_UINT64_TYPE.object_id : numpy.dtype(numpy.uint64),
+                  CDM_ARRAY_FLOAT32_TYPE.object_id : numpy.dtype(numpy.float32),
+                  CDM_ARRAY_FLOAT64_TYPE.object_id : numpy.dtype(numpy.float64),
+                  }
+
+# The reverse map - used to create a new ndarray object for a numpy array
+DTYPE_NDARRAYS = {numpy.dtype(numpy.int32) : CDM_ARRAY_INT32_TYPE,
+                  numpy.dtype(numpy.uint32) : CDM_ARRAY_UINT32_TYPE,
+                  numpy.dtype(numpy.int64) : CDM_ARRAY_INT64_TYPE,
+                  numpy.dtype(numpy.uint64) : CDM_ARRAY_UINT64_TYPE,
+                  numpy.dtype(numpy.float32) : CDM_ARRAY_FLOAT32_TYPE,
+                  numpy.dtype(numpy.float64) : CDM_ARRAY_FLOAT64_TYPE,
+                  }
+
+
+def get_numpy_dtype(ndarray_type):
+    """
+    @brief Get the numpy dtype which corresponds to a cdm ndarray object type
+    @param ndarray_type - the GPB type of an ndarray object (the type of the link to it)
+    """
+    try:
+        return NDARRAY_DTYPES[ndarray_type.object_id]
+    except KeyError:
+        raise OOIObjectError('No numpy dtype for ndarray object type: %s' % str(ndarray_type).replace('\n', ' '))
+
+
+def get_ndarray_type(dtype):
+    """
+    @brief Get the cdm ndarray object type which corresponds to a numpy dtype
+    @param dtype - a numpy dtype (or anything numpy.dtype accepts)
+    """
+    try:
+        return DTYPE_NDARRAYS[numpy.dtype(dtype)]
+    except KeyError:
+        raise OOIObjectError('No cdm ndarray object type for numpy dtype: %s' % str(dtype))
+
+
+def ndarray_values_to_numpy(values, dtype):
+    """
+    @brief Convert the repeated value field of an ndarray object to a flat numpy array in one bulk conversion
+    @param values - the value field of an ndarray object (a wrapped repeated scalar container)
+    @param dtype - the numpy dtype of the result
+    """
+    # Slicing the container returns a copy of the underlying list in one operation
+    return numpy.array(values[0:len(values)], dtype=dtype)
+
+
+def _check_castable(array, dtype):
+    """
+    Apply the same rules to the numpy array that the GPB type checker applies to each value - no floats in integer
+    fields and no integer values outside the range of the field.
+    """
+    if dtype.kind not in 'iu' or array.size == 0:
+        return
+
+    if array.dtype.kind not in 'iub':
+        raise OOIObjectError('Can not set values of numpy dtype %s in an integer ndarray of dtype %s' % (array.dtype, dtype))
+
+    info = numpy.iinfo(dtype)
+    if array.min() < info.min or array.max() > info.max:
+        raise OOIObjectError('Values out of range for an ndarray of dtype %s' % dtype)
+
+
+#------------------------------------------#
+# Wrapper_BoundedArray Specialized Methods #
+#------------------------------------------#
+
+@_gpb_source
+def _get_ba_shape(self):
+    """
+    Specialized method for CDM bounded arrays to retrieve the shape (the size in each dimension) of its bounds
+    """
+    return [bounds.size for bounds in self.bounds]
+
+
+@_gpb_source
+def GetNumpyArray(self):
+    """
+    @brief Get the content of the bounded array as a numpy array
+    @param self - a cdm bounded array object
+    @retval a numpy array with the dtype of the ndarray and the shape of the bounds
+
+    usage:
+    arr = ba.GetNumpyArray()
+    """
+    dtype = get_numpy_dtype(self.GetLink('ndarray').type)
+    shape = tuple([bounds.size for bounds in self.bounds])
+
+    result = ndarray_values_to_numpy(self.ndarray.value, dtype)
+
+    if result.size != numpy.prod(shape):
+        raise OOIObjectError('The number of values in the ndarray (%d) does not match the shape of the bounded array %s' % (result.size, shape))
+
+    return result.reshape(shape)
+
+
+@_gpb_source
+def SetNumpyArray(self, array):
+    """
+    @brief Set the content of the bounded array from a numpy array in one bulk assignment. The bounds must already
+    be set. If the bounded array has no ndarray, one is created with the type matching the dtype of the array.
+    @param self - a cdm bounded array object
+    @param array - a numpy array (or a sequence numpy can convert) with the same number of values as the bounds
+
+    usage:
+    ba.SetNumpyArray(numpy.arange(10, dtype=numpy.float64))
+    """
+    array = numpy.asarray(array)
+    shape = tuple([bounds.size for bounds in self.bounds])
+
+    if array.size != numpy.prod(shape):
+        raise OOIObjectError('The size of the numpy array (%d) does not match the shape of the bounded array %s' % (array.size, shape))
+
+    if self.IsFieldSet('ndarray'):
+        ndarray = self.ndarray
+        dtype = get_numpy_dtype(self.GetLink('ndarray').type)
+    else:
+        ndarray = self.Repository.create_object(get_ndarray_type(array.dtype))
+        self.ndarray = ndarray
+        dtype = array.dtype
+
+    _check_castable(array, dtype)
+
+    # tolist converts to python scalars in C - no per element python call
+    ndarray.value._bulk_replace(numpy.ravel(array).astype(dtype).tolist())
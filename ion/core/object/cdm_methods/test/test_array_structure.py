@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/object/cdm_methods/test/test_array_structure.py
+@author David Stuebe
+@brief test for the interval index over the bounds of the bounded arrays in an array structure
+"""
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from twisted.trial import unittest
+
+from ion.core.object import workbench
+from ion.core.object.object_utils import ARRAY_STRUCTURE_TYPE, CDM_BOUNDED_ARRAY_TYPE
+from ion.core.object.cdm_methods.array_structure import BoundsIndex, get_bounds_index
+
+
+class BoundsIndexTest(unittest.TestCase):
+
+    def _brute_force(self, extents, ranges):
+        result = []
+        for i, extent in enumerate(extents):
+            for (origin, size), (qstart, qend) in zip(extent, ranges):
+                if origin >= qend or qstart >= origin + size:
+                    break
+            else:
+                result.append(i)
+        return result
+
+    def test_split_first_dimension(self):
+
+        # 100 arrays of 10 x 20 stacked along the first dimension
+        extents = [[(i * 10, 10), (0, 20)] for i in range(100)]
+        index = BoundsIndex(extents)
+
+        self.assertEqual(len(index), 100)
+        self.assertEqual(index.ranks, set([2]))
+
+        self.assertEqual(index.intersecting([(0, 10), (0, 20)]), [0])
+        self.assertEqual(index.intersecting([(5, 25), (3, 4)]), [0, 1, 2])
+        self.assertEqual(index.intersecting([(995, 2000), (0, 1)]), [99])
+        self.assertEqual(index.intersecting([(1000, 2000), (0, 1)]), [])
+        self.assertEqual(index.intersecting([(0, 10), (20, 30)]), [])
+
+        self.assertEqual(index.find([0, 0]), 0)
+        self.assertEqual(index.find([123, 19]), 12)
+        self.assertEqual(index.find([123, 20]), None)
+
+    def test_split_second_dimension(self):
+
+        extents = [[(0, 4), (i * 3, 3)] for i in range(10)]
+        index = BoundsIndex(extents)
+
+        self.assertEqual(index.intersecting([(1, 2), (8, 10)]), [2, 3])
+        self.assertEqual(index.find([3, 29]), 9)
+
+    def test_unordered_and_nested(self):
+
+        # Out of order, overlapping and nested extents must give the same answer as a scan
+        extents = [[(50, 10)], [(0, 100)], [(10, 5)], [(12, 30)], [(90, 20)], [(0, 1)], [(55, 1)]]
+        index = BoundsIndex(extents)
+
+        for qstart in range(-5, 115, 3):
+            for qsize in (1, 2, 7, 40):
+                ranges = [(qstart, qstart + qsize)]
+                self.assertEqual(index.intersecting(ranges), self._brute_force(extents, ranges))
+
+        # The first array in the original order wins for a point lookup
+        self.assertEqual(index.find([55]), 0)
+        self.assertEqual(index.find([13]), 1)
+        self.assertEqual(index.find([105]), 4)
+
+    def test_single_and_empty(self):
+
+        index = BoundsIndex([[(0, 10), (0, 10)]])
+        self.assertEqual(index.find([9, 9]), 0)
+        self.assertEqual(index.intersecting([(10, 11), (0, 1)]), [])
+
+        index = BoundsIndex([])
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.ranks, set())
+        self.assertEqual(index.find([0]), None)
+
+    def test_rank_mismatch(self):
+
+        index = BoundsIndex([[(0, 10)], [(10, 10)]])
+        self.assertEqual(index.intersecting([(0, 20), (0, 20)]), [])
+
+
+class ArrayStructureBoundsIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        wb = workbench.WorkBench('No Process Test')
+        self.wb = wb
+
+        self.repo, self.content = self.wb.init_repository(ARRAY_STRUCTURE_TYPE)
+
+    def _add_bounded_array(self, origin, size):
+        ba = self.repo.create_object(CDM_BOUNDED_ARRAY_TYPE)
+        bounds = ba.bounds.add()
+        bounds.origin = origin
+        bounds.size = size
+        ref = self.content.bounded_arrays.add()
+        ref.SetLink(ba)
+
+    def test_workspace_index(self):
+
+        self._add_bounded_array(0, 10)
+        self._add_bounded_array(10, 10)
+
+        index = get_bounds_index(self.content)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.find([15]), 1)
+
+        # Same index until the content changes
+        self.assertIdentical(get_bounds_index(self.content), index)
+
+        self._add_bounded_array(20, 10)
+        index = get_bounds_index(self.content)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.find([25]), 2)
+        self.assertIdentical(get_bounds_index(self.content), index)
+
+        # Bounds edited in place
+        self.content.bounded_arrays[2].bounds[0].origin = 30
+        index = get_bounds_index(self.content)
+        self.assertEqual(index.find([25]), None)
+        self.assertEqual(index.find([35]), 2)
+
+        # A bounded array removed and another added - the count does not change
+        del self.content.bounded_arrays[0]
+        self._add_bounded_array(40, 10)
+        index = get_bounds_index(self.content)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.find([5]), None)
+        self.assertEqual(index.find([45]), 2)
+
+    def test_committed_index(self):
+
+        for i in range(5):
+            self._add_bounded_array(i * 10, 10)
+
+        self.repo.commit('Bounded arrays')
+
+        index = get_bounds_index(self.content)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.intersecting([(15, 35)]), [1, 2, 3])
+
+        self.assertIdentical(get_bounds_index(self.content), index)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/object/cdm_methods/test/test_bounded_array.py
+@author David Stuebe
+@brief test for the numpy array methods of the cdm bounded array
+"""
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+import numpy
+
+from twisted.trial import unittest
+
+from ion.core.object import workbench
+from ion.core.object.object_utils import OOIObjectError, CDM_BOUNDED_ARRAY_TYPE, CDM_ARRAY_FLOAT64_TYPE, \
+    CDM_ARRAY_INT32_TYPE, CDM_ARRAY_FLOAT32_TYPE, CDM_ARRAY_STRING_TYPE
+
+
+class BoundedArrayNumpyTest(unittest.TestCase):
+
+    def setUp(self):
+        wb = workbench.WorkBench('No Process Test')
+        self.wb = wb
+
+        self.repo, self.ba = self.wb.init_repository(CDM_BOUNDED_ARRAY_TYPE)
+
+    def _set_bounds(self, shape):
+        for size in shape:
+            bounds = self.ba.bounds.add()
+            bounds.origin = 0
+            bounds.size = size
+
+    def test_get_numpy_array(self):
+
+        self._set_bounds([3, 4])
+        arr = self.repo.create_object(CDM_ARRAY_FLOAT64_TYPE)
+        arr.value.extend([float(val) for val in range(12)])
+        self.ba.ndarray = arr
+
+        result = self.ba.GetNumpyArray()
+
+        self.assertEqual(result.dtype, numpy.float64)
+        self.assertEqual(result.shape, (3, 4))
+        self.assertEqual(result[2, 1], 9.0)
+        self.assertEqual(list(result.ravel()), [float(val) for val in range(12)])
+
+    def test_get_numpy_array_int(self):
+
+        self._set_bounds([5])
+        arr = self.repo.create_object(CDM_ARRAY_INT32_TYPE)
+        arr.value.extend(range(5))
+        self.ba.ndarray = arr
+
+        result = self.ba.GetNumpyArray()
+        self.assertEqual(result.dtype, numpy.int32)
+        self.assertEqual(list(result), range(5))
+
+    def test_get_numpy_array_bad_size(self):
+
+        self._set_bounds([3, 4])
+        arr = self.repo.create_object(CDM_ARRAY_FLOAT64_TYPE)
+        arr.value.extend([1.0, 2.0])
+        self.ba.ndarray = arr
+
+        self.assertRaises(OOIObjectError, self.ba.GetNumpyArray)
+
+    def test_get_numpy_array_string(self):
+
+        self._set_bounds([1])
+        arr = self.repo.create_object(CDM_ARRAY_STRING_TYPE)
+        arr.value.append('junk')
+        self.ba.ndarray = arr
+
+        self.assertRaises(OOIObjectError, self.ba.GetNumpyArray)
+
+    def test_set_numpy_array_creates_ndarray(self):
+
+        self._set_bounds([2, 3])
+
+        self.ba.SetNumpyArray(numpy.arange(6, dtype=numpy.int32).reshape(2, 3))
+
+        self.assertEqual(self.ba.GetLink('ndarray').type, CDM_ARRAY_INT32_TYPE)
+        self.assertEqual(list(self.ba.ndarray.value), range(6))
+
+        # Round trip
+        self.assertEqual(self.ba.GetNumpyArray().tolist(), [[0, 1, 2], [3, 4, 5]])
+
+    def test_set_numpy_array_existing(self):
+
+        self._set_bounds([4])
+        arr = self.repo.create_object(CDM_ARRAY_FLOAT32_TYPE)
+        arr.value.extend([0.0] * 4)
+        self.ba.ndarray = arr
+
+        # Set float64 values in a float32 array
+        self.ba.SetNumpyArray(numpy.array([0.5, 1.5, 2.5, 3.5]))
+
+        self.assertEqual(self.ba.GetLink('ndarray').type, CDM_ARRAY_FLOAT32_TYPE)
+        self.assertEqual(list(self.ba.ndarray.value), [0.5, 1.5, 2.5, 3.5])
+
+        # Setting the content must modify the structure
+        self.assertEqual(self.ba.Modified, True)
+
+    def test_set_numpy_array_errors(self):
+
+        self._set_bounds([4])
+        arr = self.repo.create_object(CDM_ARRAY_INT32_TYPE)
+        self.ba.ndarray = arr
+
+        # Wrong size
+        self.assertRaises(OOIObjectError, self.ba.SetNumpyArray, numpy.arange(5))
+
+        # Floats in an integer array
+        self.assertRaises(OOIObjectError, self.ba.SetNumpyArray, numpy.arange(4, dtype=numpy.float64))
+
+        # Out of range for int32
+        self.assertRaises(OOIObjectError, self.ba.SetNumpyArray, numpy.array([0, 1, 2, 2**40]))
+
+    def test_set_numpy_array_commit(self):
+
+        self._set_bounds([100])
+        self.ba.SetNumpyArray(numpy.linspace(0.0, 1.0, 100))
+
+        self.repo.commit('Numpy content')
+
+        # The committed ndarray must hold the same values
+        ndarray_key = self.ba.GetLink('ndarray').key
+        element = self.repo.index_hash[ndarray_key]
+        ndarray = self.repo._load_element(element)
+
+        self.assertEqual(list(ndarray.value), list(numpy.linspace(0.0, 1.0, 100)))
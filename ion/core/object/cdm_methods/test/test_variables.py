@@ -262,3 +262,21 @@ class CdmVariableTest(IonTestCase):
         
         
         
+
+    @defer.inlineCallbacks
+    def test_GetIntersectingBoundedArrays(self):
+        num_dims = 2
+        num_arrs = 10
+        num_vals = 5
+        yield self.setup_nD_multiple_BA(num_dims, num_arrs, num_vals)
+
+        keys = [link.key for link in self.var.content.bounded_arrays.GetLinks()]
+
+        query = self.var.Repository.create_object(CDM_BOUNDED_ARRAY_TYPE)
+        for origin, size in [(3, 4), (0, num_vals)]:
+            bounds = query.bounds.add()
+            bounds.origin = origin
+            bounds.size = size
+
+        result = self.var.GetIntersectingBoundedArrays(query)
+        self.assertEquals(result, keys[3:7])
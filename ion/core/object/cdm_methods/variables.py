@@ -4,7 +4,6 @@
 @brief Wrapper methods for the cdm variable object
 @author David Stuebe
 @author Tim LaRocque
-TODO: Implement get_intersecting...
 """
 
 # Get the object decorator used on wrapper methods!
@@ -16,6 +15,7 @@ import ion.util.ionlog
 log = ion.util.ionlog.getLogger(__name__)
 
 from ion.core.object.cdm_methods import group
+from ion.core.object.cdm_methods import array_structure
 
 from math import ceil
 
@@ -79,37 +79,31 @@ def GetValue(self, *args):
     as.getValue(1,3,9)
     """
     
-    # @todo: Need tests for multidim arrays
-    # @todo: Check the rank outside the for loop
     # @todo: Check to make sure args are integers!
 
     value = None
-    
-    for ba in self.content.bounded_arrays:
-    
 
+    # Use the interval index over the bounds to find the bounded array which covers this point
+    bounds_index = array_structure.get_bounds_index(self.content)
+    position = bounds_index.find(args)
+
+    if position is not None:
+        # We now have the the ndarray of interest..  extract the value!
+        ba = self.content.bounded_arrays[position]
+
+        # Create a list of this bounded_array's sizes and use origin to determine
+        # the given indices position in the ndarray
+        indices = []
+        shape = []
         for index, bounds in zip(args, ba.bounds):
-            if bounds.origin > index or index >= bounds.origin + bounds.size :
-                break
-
-        else:
-            # We now have the the ndarray of interest..  extract the value!
-
-            # Create a list of this bounded_array's sizes and use origin to determine
-            # the given indices position in the ndarray
-            indices = []
-            shape = []
-            for index, bounds in zip(args, ba.bounds):
-                  indices.append(index - bounds.origin)  
-                  shape.append(bounds.size)  
-            
-            # Find the flattened index (make sure to apply the origin values as an offset!)
-            flattened_index = _flatten_index(indices, shape)
-            
-            # Grab the value from the ndarray
-            value = ba.ndarray.value[flattened_index]
-            break
+            indices.append(index - bounds.origin)
+            shape.append(bounds.size)
 
+        # Find the flattened index (make sure to apply the origin values as an offset!)
+        flattened_index = _flatten_index(indices, shape)
+
+        # Grab the value from the ndarray
+        value = ba.ndarray.value[flattened_index]
 
     return value
 
@@ -122,12 +116,19 @@ def GetIntersectingBoundedArrays(self, bounded_array):
     @param bounded_array - a bounded array which specifies an index space coverage of interest
 
     usage for a 3Dimensional variable:
-    as.getValue(1,3,9)
+    as.GetIntersectingBoundedArrays(ba)
     """
 
-    # Get the MyId attribute of the bounded arrays that intersect - that will be the sha1 name for that BA...
+    # Get the key of the links to the bounded arrays that intersect - that will be the sha1 name for that BA...
+    content = self.content
+    bounds_index = array_structure.get_bounds_index(content)
+
+    ranges = [(bounds.origin, bounds.origin + bounds.size) for bounds in bounded_array.bounds]
 
     sha1_list = []
+    for position in bounds_index.intersecting(ranges):
+        sha1_list.append(content.bounded_arrays.GetLink(position).key)
+
     return sha1_list
 
 
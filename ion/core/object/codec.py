@@ -101,40 +101,39 @@ def pack_structure(content):
     root_obj = repo.root_object
     root_obj_se = repo.index_hash.get(root_obj.MyId)
 
-    items = set([root_obj])
+    items = set([root_obj_se])
 
     # extract the excluded_object_types list if we have one!
-    excluded_object_types = []
+    excluded_object_types = set()
     if hasattr(content, 'excluded_object_types') and len(content.excluded_object_types) > 0:
         log.debug("Codec pack_structure has %d excluded_object_types" % len(content.excluded_object_types))
-        excluded_object_types = [x.GPBMessage for x in content.excluded_object_types]
+        excluded_object_types = gpb_wrapper.type_ids(content.excluded_object_types)
 
-    # Recurse through the DAG and add the keys to a set - obj_set.
+    # Walk the DAG on the keys of the structure elements and add them to a set - obj_set. Elements know their children
+    # once committed or loaded, others are decoded to find them - the objects are not loaded.
     while len(items) > 0:
         child_items = set()
         for item in items:
 
-            # Add this item to the set we are sending
-            if item not in obj_set:
+            if len(item.ChildLinks) == 0:
+                item.get_child_links()
 
-                for link in item.ChildLinks:
+            for key in item.ChildLinks:
 
-                    # if this link's key is not in the index_hash, then its type must be in the excluded_type list we
-                    # pull out of the message above. if not, we have an error.
+                # if this link's key is not in the index_hash, then its type must be in the excluded_type list we
+                # pull out of the message above. if not, we have an error.
 
-                    hashobj = repo.index_hash.get(link.key, None)
-                    if hashobj is None:
-                        # link is a CASRef to a GPBType
-                        if link.GPBMessage.type not in excluded_object_types:
-                            raise CodecError("Hashed CREF not found (and not excluded)! Please call David")
-                    else:
-                        # store the object we just pulled out of the index_hash for passing to the _pack_container method
-                        obj_set.add(hashobj)
+                hashobj = repo.index_hash.get(key, None)
+                if hashobj is None:
+                    # link is a CASRef to a GPBType
+                    link_type = [link[1:] for link in item.get_child_links() if link[0] == key][0]
+                    if link_type not in excluded_object_types:
+                        raise CodecError("Hashed CREF not found (and not excluded)! Please call David")
 
-                        # load this object so we can examine its childlinks - should be simple extraction from
-                        # repo._workspace, but use the public method.
-                        subobj = repo.get_linked_object(link)
-                        child_items.add(subobj)
+                elif hashobj not in obj_set:
+                    # store the element we just pulled out of the index_hash for passing to the _pack_container method
+                    obj_set.add(hashobj)
+                    child_items.add(hashobj)
 
         items = child_items
 
@@ -0,0 +1,136 @@
+"""
+@file ion/core/object/commit_performance_testing.py
+@author David Stuebe
+@brief Measure the latency of a repository commit for wide trees (many linked objects under one root), deep trees
+(nested groups) and trees with large ndarray leaves which may be hashed by worker threads.
+
+Run as a script:
+python ion/core/object/commit_performance_testing.py -w 1000,10000 -d 100,5000 -n 10 -s 1000000 -t 0,4
+"""
+
+import time
+from optparse import OptionParser
+
+import numpy
+
+from ion.core.object import workbench
+from ion.core.object import gpb_wrapper
+from ion.core.object import object_utils
+from ion.core.object.object_utils import CDM_DATASET_TYPE, ARRAY_STRUCTURE_TYPE, CDM_BOUNDED_ARRAY_TYPE, \
+    CDM_ARRAY_FLOAT64_TYPE
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+PERSON_TYPE = object_utils.create_type_identifier(object_id=20001, version=1)
+ADDRESSLINK_TYPE = object_utils.create_type_identifier(object_id=20003, version=1)
+
+
+class CommitPerformanceTester:
+
+    def __init__(self, widths, depths, num_arrays, array_size, threads):
+
+        self.widths = widths
+        self.depths = depths
+        self.num_arrays = num_arrays
+        self.array_size = array_size
+        self.threads = threads
+
+        self.wb = workbench.WorkBench('No Process Performance Test')
+
+    def make_wide(self, width):
+        """
+        An address book with width linked person objects
+        """
+        repo, ab = self.wb.init_repository(ADDRESSLINK_TYPE)
+        ab.title = 'Commit performance'
+
+        for i in xrange(width):
+            p = repo.create_object(PERSON_TYPE)
+            p.name = 'Person %d' % i
+            p.id = i
+            p.email = 'person%d@ooici.net' % i
+            ab.person.add()
+            ab.person[i] = p
+
+        return repo
+
+    def make_deep(self, depth):
+        """
+        A dataset with a chain of depth nested groups
+        """
+        repo, dataset = self.wb.init_repository(CDM_DATASET_TYPE)
+        dataset.MakeRootGroup()
+
+        group = dataset.root_group
+        for i in xrange(depth):
+            group = group.AddGroup('group_%d' % i)
+
+        return repo
+
+    def make_arrays(self, num_arrays):
+        """
+        A dataset with one variable whose content is num_arrays bounded arrays of array_size doubles
+        """
+        repo, dataset = self.wb.init_repository(CDM_DATASET_TYPE)
+        dataset.MakeRootGroup()
+        root = dataset.root_group
+
+        dim = root.AddDimension('time', num_arrays * self.array_size)
+        var = root.AddVariable('data', root.DataType.DOUBLE, [dim])
+
+        content = repo.create_object(ARRAY_STRUCTURE_TYPE)
+        for i in xrange(num_arrays):
+            ba = repo.create_object(CDM_BOUNDED_ARRAY_TYPE)
+            bounds = ba.bounds.add()
+            bounds.origin = i * self.array_size
+            bounds.size = self.array_size
+
+            ba.ndarray = repo.create_object(CDM_ARRAY_FLOAT64_TYPE)
+            ba.SetNumpyArray(numpy.arange(i * self.array_size, (i + 1) * self.array_size, dtype='float64'))
+
+            ref = content.bounded_arrays.add()
+            ref.SetLink(ba)
+        var.content = content
+
+        return repo
+
+    def measure(self, name, repo):
+
+        t1 = time.time()
+        repo.commit('Commit performance')
+        t2 = time.time()
+
+        print "%s: committed %d structure elements in %f seconds" % (name, len(repo.index_hash), t2 - t1)
+
+    def runBenchMarks(self):
+
+        for width in self.widths:
+            self.measure('Wide tree of %d persons' % width, self.make_wide(width))
+
+        for depth in self.depths:
+            self.measure('Deep tree of %d nested groups' % depth, self.make_deep(depth))
+
+        for threads in self.threads:
+            gpb_wrapper.COMMIT_HASH_THREADS = threads
+            self.measure('%d arrays of %d doubles with %d hash threads' % (self.num_arrays, self.array_size, threads),
+                         self.make_arrays(self.num_arrays))
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-w", "--wide", dest="wide", default="1000,10000", help="Comma separated list of the number of objects in a wide tree")
+    parser.add_option("-d", "--deep", dest="deep", default="100,5000", help="Comma separated list of the depth of a deep tree")
+    parser.add_option("-n", "--arrays", dest="arrays", default=10, help="The number of large ndarray leaves")
+    parser.add_option("-s", "--size", dest="size", default=10**6, help="The number of doubles in each ndarray leaf")
+    parser.add_option("-t", "--threads", dest="threads", default="0,4", help="Comma separated list of the number of hash threads to use for the ndarray leaves")
+    opts, args = parser.parse_args()
+
+    widths = [int(x) for x in opts.wide.split(',')]
+    depths = [int(x) for x in opts.deep.split(',')]
+    threads = [int(x) for x in opts.threads.split(',')]
+    tester = CommitPerformanceTester(widths, depths, int(opts.arrays), int(opts.size), threads)
+    tester.runBenchMarks()
+
+if __name__ == "__main__":
+    main()
@@ -13,12 +13,13 @@ from ion.core.object.object_utils import get_type_from_obj, sha1bin, sha1hex,\
 
 import StringIO
 
-from ion.core.object.object_utils import CDM_GROUP_TYPE, CDM_DATASET_TYPE, CDM_ATTRIBUTE_TYPE, CDM_DIMENSION_TYPE, CDM_VARIABLE_TYPE
+from ion.core.object.object_utils import CDM_GROUP_TYPE, CDM_DATASET_TYPE, CDM_ATTRIBUTE_TYPE, CDM_DIMENSION_TYPE, CDM_VARIABLE_TYPE, CDM_BOUNDED_ARRAY_TYPE
 
 # Get the object decorators used on all wrapper methods!
 from ion.core.object.object_utils import _gpb_source, _gpb_source_root
 
 import struct
+import weakref
 
 from google.protobuf import message
 from google.protobuf.internal import containers
@@ -29,6 +30,7 @@ from ion.core.object.cdm_methods import variables
 from ion.core.object.cdm_methods import attribute
 from ion.core.object.cdm_methods import group
 from ion.core.object.cdm_methods import attribute_merge
+from ion.core.object.cdm_methods import bounded_array
 
 import ion.util.ionlog
 from ion.core import ioninit
@@ -544,6 +546,7 @@ class WrapperType(type):
             clsDict['SetDimension'] = group._set_dimension
 
             clsDict['GetValue'] = variables.GetValue
+            clsDict['GetIntersectingBoundedArrays'] = variables.GetIntersectingBoundedArrays
 
             clsDict['MergeAttSrc'] = attribute_merge.MergeAttSrc
             clsDict['MergeAttDst'] = attribute_merge.MergeAttDst
@@ -552,6 +555,11 @@ class WrapperType(type):
             clsDict['MergeAttDstOver'] = attribute_merge.MergeAttDstOver
             clsDict['_GetNumericValue'] = attribute_merge._GetNumericValue
 
+        elif obj_type == CDM_BOUNDED_ARRAY_TYPE:
+            clsDict['GetShape'] = bounded_array._get_ba_shape
+            clsDict['GetNumpyArray'] = bounded_array.GetNumpyArray
+            clsDict['SetNumpyArray'] = bounded_array.SetNumpyArray
+
 
 class Wrapper(object):
     '''
@@ -995,8 +1003,13 @@ class Wrapper(object):
     @GPBSource
     def RecurseCommit(self, structure):
         """
-        Recursively build up the serialized structure elements which are needed
-        to commit this wrapper and reset all the links using its CAS name.
+        Build up the serialized structure elements which are needed to commit
+        this wrapper and reset all the links using its CAS name.
+
+        The modified objects are walked with an explicit stack rather than by
+        recursion so that deeply nested structures do not reach the recursion
+        limit. Children are committed before their parents (post order) because
+        the serialized parent contains the keys of its children.
         """
 
         # Should this error if called on a non root object?
@@ -1004,41 +1017,50 @@ class Wrapper(object):
             raise OOIObjectError('Can not call Recurse Commit on a non root object wrapper.')
 
         self.recurse_count.count += 1
-        local_cnt = self.recurse_count.count
         log.debug('Entering Recurse Commit: recurse counter - %d, Object Type - %s, child links - %d, objects to commit - %d, Modified - %s' %
-              (local_cnt, type(self), len(self.ChildLinks), len(structure), self.Modified))
+              (self.recurse_count.count, type(self), len(self.ChildLinks), len(structure), self.Modified))
 
         if not  self.Modified:
             # This object is already committed!
-            log.debug('Exiting Recurse Commit: recurse counter - %d' % local_cnt)
-
             return
 
-        # Create the Structure Element in which the binary blob will be stored
-        se = StructureElement()
         repo = self.Repository
 
-        for link in  self.ChildLinks:
+        # Large leaves may be serialized and hashed up front by worker threads
+        prepared = _prepare_leaf_elements(self, structure)
 
-            if link.Invalid:
-                log.error('Link in child links is invalid!')
-                log.debug('Current Wrapper: %s' % self.Debug())
-                log.debug('Invalid Link %s' % link.Debug())
+        # Each frame is the wrapper, an iterator over its child links, its structure element and the link to the child
+        # which is being committed before we can continue
+        stack = [[self, iter(self.ChildLinks), StructureElement(), None]]
 
-            # Test to see if it is already serialized!
-            child_se = repo.index_hash.get(link.key, structure.get(link.key, None))
-            #child_se = repo.index_hash.get(link.key, None)
+        while len(stack) > 0:
 
-            #log.debug('Setting child Link: %s' % str(child_se))
-            if  child_se is not None:
-                # Set the links is leaf property
-                link.isleaf = child_se.isleaf
+            frame = stack[-1]
+            wrapper, links, se, pending = frame
+
+            if pending is not None:
+                # The child is committed - the link now has its key
+                se.ChildLinks.add(pending.key)
+                frame[3] = None
+
+            for link in links:
+
+                if link.Invalid:
+                    log.error('Link in child links is invalid!')
+                    log.debug('Current Wrapper: %s' % wrapper.Debug())
+                    log.debug('Invalid Link %s' % link.Debug())
+
+                # Test to see if it is already serialized!
+                child_se = repo.index_hash.get(link.key, structure.get(link.key, None))
+
+                if  child_se is not None:
+                    # Set the links is leaf property
+                    link.isleaf = child_se.isleaf
 
-            else:
                 # if isleaf set, type set, and the key is an actual SHA1 - we don't need to recurse into it or do anything, really.
-                if link.IsFieldSet('isleaf') and link.IsFieldSet('type') and len(link.key) == 20:
+                elif link.IsFieldSet('isleaf') and link.IsFieldSet('type') and len(link.key) == 20:
                     log.debug('Disregarding un-index-hashed link %s' % link.key)
-                    pass
+
                 else:
                     child = repo.get_linked_object(link)
 
@@ -1048,20 +1070,47 @@ class Wrapper(object):
                     else:
                         link.isleaf = False
 
-                    child.RecurseCommit(structure)
+                    child.recurse_count.count += 1
+                    if child.Modified:
+                        # Commit the child first - come back to this link when it is done
+                        frame[3] = link
+                        stack.append([child, iter(child.ChildLinks), StructureElement(), None])
+                        break
+
+                # Save the link info as a convience for sending!
+                se.ChildLinks.add(link.key)
+
+            else:
+                stack.pop()
+                wrapper._commit_structure_element(se, structure, prepared.pop(id(wrapper), None))
+
+        log.debug('Exiting Recurse Commit: objects to commit - %d' % len(structure))
 
-            # Save the link info as a convience for sending!
-            se.ChildLinks.add(link.key)
+    @GPBSource
+    def _commit_structure_element(self, se, structure, prepared=None):
+        """
+        Serialize this wrapper into its structure element once all of its children are committed and set its new name
+        in the workspace and in the links of its parents.
+        @param se the structure element with the child links of this wrapper
+        @param structure the dictionary of structure elements being committed
+        @param prepared a structure element for this leaf which was already serialized and hashed
+        """
+        repo = self.Repository
 
-        se.value = self.SerializeToString()
-        #se.key = sha1hex(se.value)
+        if prepared is not None:
+            se = prepared
 
-        # Structure element wrapper provides for setting type!
-        se.type = self.ObjectType
+        else:
+            se.value = self.SerializeToString()
+            #se.key = sha1hex(se.value)
+
+            # Structure element wrapper provides for setting type!
+            se.type = self.ObjectType
 
-        # Calculate the sha1 from the serialized value and type!
-        # Sha1 is a property - not a method...
-        se.key = se.sha1
+            # Calculate the sha1 from the serialized value and type!
+            # Sha1 is a property - not a method...
+            se.key = se.sha1
+            se.verified = True
 
         # Determine whether I am a leaf
         if len(self.ChildLinks) is 0:
@@ -1130,7 +1179,6 @@ class Wrapper(object):
             if link.key != se.key:
                 link.key = se.key
 
-        log.debug('Exiting Recurse Commit: recurse counter - %d' % local_cnt)
 
 
     @GPBSource
@@ -1209,6 +1257,10 @@ class Wrapper(object):
         This method recursively changes an objects parents to a modified state
         All links are reset as they are no longer hashed values
         """
+        # Count every modification - objects which are already modified do not propagate to their parents
+        repo = self.Repository
+        if repo is not None:
+            repo._modification_count += 1
 
         if self.Modified:
             # Be clear about what we are doing here!
@@ -1925,6 +1977,17 @@ class ScalarContainerWrapper(object):
         self._gpbcontainer.__setslice__(start, stop, values)
         self._wrapper._set_parents_modified()
 
+    @GPBSourceSCW
+    def _bulk_replace(self, values):
+        """
+        Replace the entire content of the container with a single list assignment. The per element type check done by
+        the GPB container is skipped - the caller must guarantee that values is a list of the correct python type.
+        Used by the numpy array methods of the cdm bounded array.
+        """
+        self._gpbcontainer._values[:] = values
+        self._gpbcontainer._message_listener.Modified()
+        self._wrapper._set_parents_modified()
+
     @GPBSourceSCW
     def __delitem__(self, key):
         """Deletes the item at the specified position."""
@@ -1975,6 +2038,138 @@ class StructureElementError(Exception):
     """
 
 
+# Integrity verification policies for structure elements
+VERIFY_ALWAYS = 'always'
+"""
+Check the sha1 of every element when it is parsed
+"""
+VERIFY_TRUST_BOUNDARY = 'trust_boundary'
+"""
+Check the sha1 of elements parsed from an untrusted source. Elements read from our own store were checked when they
+arrived in a message and are not checked again.
+"""
+VERIFY_LAZY = 'lazy'
+"""
+Check the sha1 of an element when its content is first loaded
+"""
+VERIFY_POLICIES = (VERIFY_ALWAYS, VERIFY_TRUST_BOUNDARY, VERIFY_LAZY)
+
+
+class VerifiedKeyCache(object):
+    """
+    @brief The structure elements whose sha1 key has been checked in this process. An element with the same key and
+    content as one in the cache is not hashed again. The elements are held weakly - they are only remembered while the
+    process holds them somewhere else.
+    """
+
+    def __init__(self):
+
+        self._elements = weakref.WeakValueDictionary()
+
+        self.hashed = 0
+        self.hits = 0
+
+    def verify(self, element):
+        """
+        @brief Check the key of element against its content
+        @param element a StructureElement
+        @retval True if the key is valid
+        """
+        key = element.key
+        known = self._elements.get(key)
+        if known is not None:
+            if known._element is element._element or (known.type == element.type and known.value == element.value):
+                self.hits += 1
+                return True
+
+        self.hashed += 1
+        if key != element.sha1:
+            return False
+
+        self._elements[key] = element
+        return True
+
+    def clear(self):
+        self._elements.clear()
+        self.hashed = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._elements)
+
+verified_keys = VerifiedKeyCache()
+
+
+# The child links of a structure element are recorded as a version byte followed by, for each child, the length of its
+# key, the key and the object id and version of its type
+CHILD_LINKS_FORMAT = '\x01'
+
+def encode_child_links(links):
+    """
+    @brief Serialize the child links of a structure element - stored beside the element so that the object graph can be
+    walked without decoding it.
+    @param links a list of (key, object_id, version) tuples
+    @retval a string
+    """
+    parts = [CHILD_LINKS_FORMAT]
+    for key, object_id, version in links:
+        parts.append(struct.pack('!H', len(key)))
+        parts.append(key)
+        parts.append(struct.pack('!ii', object_id, version))
+    return ''.join(parts)
+
+def decode_child_links(record):
+    """
+    @brief Parse child links serialized by encode_child_links
+    @param record a string
+    @retval a list of (key, object_id, version) tuples
+    """
+    if record[:1] != CHILD_LINKS_FORMAT:
+        raise StructureElementError('Unknown child links format: %r' % record[:1])
+
+    links = []
+    offset = 1
+    end = len(record)
+    while offset < end:
+        (keylen,) = struct.unpack_from('!H', record, offset)
+        offset += 2
+        key = record[offset:offset + keylen]
+        offset += keylen
+        object_id, version = struct.unpack_from('!ii', record, offset)
+        offset += 8
+        links.append((key, object_id, version))
+    return links
+
+def type_ids(types):
+    """
+    @brief The (object_id, version) pairs of a list of GPBTypes, wrapped or not - to compare against child links
+    """
+    return set([(t.object_id, t.version) for t in types])
+
+def _find_child_links(gpb, links, link_name):
+    """
+    Find the links in a raw protobuf message - like Wrapper.FindChildLinks, without wrapping anything.
+    @param link_name the full name of the link message
+    """
+    for field in gpb.DESCRIPTOR.fields:
+        if not field.message_type:
+            continue
+
+        if field.label == descriptor.FieldDescriptor.LABEL_REPEATED:
+            items = getattr(gpb, field.name)
+        elif gpb.HasField(field.name):
+            items = (getattr(gpb, field.name),)
+        else:
+            # An optional field which is not set can not hold any links
+            continue
+
+        for item in items:
+            if item.DESCRIPTOR.full_name == link_name:
+                links.append((item.key, item.type.object_id, item.type.version))
+            else:
+                _find_child_links(item, links, link_name)
+
+
 class StructureElement(object):
     """
     @brief Wrapper for the container structure element. These are the objects
@@ -1983,6 +2178,8 @@ class StructureElement(object):
     need not be decoded to find them.
     """
 
+    verify_policy = CONF.getValue('verify_policy', VERIFY_ALWAYS)
+
     def __init__(self, se=None):
         if se:
             self._element = se
@@ -1990,19 +2187,55 @@ class StructureElement(object):
             self._element = get_gpb_class_from_type_id(STRUCTURE_ELEMENT_TYPE)()
         self.ChildLinks = set()
 
+        # The (key, object_id, version) of each child, once known
+        self._child_links = None
+
+        self.verified = False
+
     @classmethod
-    def parse_structure_element(cls, blob):
+    def set_verify_policy(cls, policy):
+        """
+        @brief Set the integrity verification policy for all structure elements in the process
+        @param policy one of VERIFY_ALWAYS, VERIFY_TRUST_BOUNDARY or VERIFY_LAZY
+        """
+        if policy not in VERIFY_POLICIES:
+            raise StructureElementError('Invalid verification policy "%s", must be one of %s' % (policy, VERIFY_POLICIES))
+
+        cls.verify_policy = policy
+
+    @classmethod
+    def parse_structure_element(cls, blob, trusted=False):
+        """
+        @brief Parse a serialized structure element and check its key according to the verification policy
+        @param blob the serialized structure element
+        @param trusted True if the blob was read from our own store
+        """
         se = get_gpb_class_from_type_id(STRUCTURE_ELEMENT_TYPE)()
         se.ParseFromString(blob)
 
         instance = cls(se)
 
-        if instance.key != instance.sha1:
+        if cls.verify_policy == VERIFY_ALWAYS or (cls.verify_policy == VERIFY_TRUST_BOUNDARY and not trusted):
+            instance.verify()
+
+        elif cls.verify_policy == VERIFY_TRUST_BOUNDARY:
+            instance.verified = True
+
+        return instance
+
+    def verify(self):
+        """
+        @brief Check that the key matches the sha1 of the content - at most once per element.
+        """
+        if self.verified:
+            return
+
+        if not verified_keys.verify(self):
             log.error('The sha1 key does not match the value. The data is corrupted! \n' +\
-                      'Element key %s, Calculated key %s' % (sha1_to_hex(instance.key), sha1_to_hex(instance.sha1)))
+                      'Element key %s, Calculated key %s' % (sha1_to_hex(self.key), sha1_to_hex(self.sha1)))
             raise StructureElementError('Error reading serialized structure element. Sha1 value does not match.')
 
-        return instance
+        self.verified = True
 
     @property
     def sha1(self):
@@ -2081,6 +2314,43 @@ class StructureElement(object):
 
     isleaf = property(_get_isleaf, _set_isleaf)
 
+    @property
+    def child_links_known(self):
+        return self._child_links is not None or self.isleaf
+
+    def get_child_links(self):
+        """
+        @brief The children of this element - decoded from the content the first time unless they were set from the
+        child links stored with it. Leaves have none and are never decoded.
+        @retval a list of (key, object_id, version) tuples
+        """
+        if self._child_links is None:
+            links = []
+            if not self.isleaf:
+                gpb = get_gpb_class_from_type_id(self.type)()
+                gpb.ParseFromString(self.value)
+                _find_child_links(gpb, links, get_gpb_class_from_type_id(LINK_TYPE).DESCRIPTOR.full_name)
+
+            self.set_child_links(links)
+
+        return self._child_links
+
+    def set_child_links(self, links):
+        """
+        @brief Set the children of this element, as read from the child links stored with it
+        @param links a list of (key, object_id, version) tuples
+        """
+        # An object may link to the same child more than once
+        keys = set()
+        unique = []
+        for link in links:
+            if link[0] not in keys:
+                keys.add(link[0])
+                unique.append(link)
+
+        self.ChildLinks.update(keys)
+        self._child_links = unique
+
     def __str__(self):
         msg = ''
         if len(self._element.key) == 20:
@@ -2100,3 +2370,91 @@ class StructureElement(object):
         #print 'GPB Size: ', self._element.ByteSize()
 
         return self._element.ByteSize()
+
+
+# Worker threads used to hash large leaves during a commit - hashlib releases the GIL while it works. Zero to hash
+# everything in the calling thread.
+COMMIT_HASH_THREADS = CONF.getValue('commit_hash_threads', 0)
+
+# Leaves with a serialized value of at least this many bytes are hashed by the worker threads
+COMMIT_HASH_THRESHOLD = CONF.getValue('commit_hash_threshold', 2**20)
+
+_commit_hash_pool = None
+
+def _get_commit_hash_pool():
+    """
+    Get the thread pool for hashing large leaves - created on first use or when the number of threads changes
+    """
+    global _commit_hash_pool
+
+    if _commit_hash_pool is None or _commit_hash_pool._processes != COMMIT_HASH_THREADS:
+        if _commit_hash_pool is not None:
+            _commit_hash_pool.close()
+
+        from multiprocessing.pool import ThreadPool
+        _commit_hash_pool = ThreadPool(COMMIT_HASH_THREADS)
+
+    return _commit_hash_pool
+
+
+def _prepare_leaf_elements(root, structure):
+    """
+    Serialize the large modified leaves below root and hash them as one batch in the worker threads. The keys are
+    exactly those the commit would calculate - a leaf does not depend on anything else in the structure.
+    @param root the root wrapper being committed
+    @param structure the dictionary of structure elements already committed
+    @retval a dictionary of id(wrapper) -> structure element for the prepared leaves
+    """
+    prepared = {}
+    if COMMIT_HASH_THREADS <= 0:
+        return prepared
+
+    repo = root.Repository
+
+    leaves = []
+    visited = set()
+    stack = [root]
+    while len(stack) > 0:
+
+        wrapper = stack.pop()
+        for link in wrapper.ChildLinks:
+
+            if repo.index_hash.get(link.key, structure.get(link.key, None)) is not None:
+                continue
+
+            if link.IsFieldSet('isleaf') and link.IsFieldSet('type') and len(link.key) == 20:
+                continue
+
+            child = repo.get_linked_object(link)
+            if not child.Modified or id(child) in visited:
+                continue
+            visited.add(id(child))
+
+            if len(child.ChildLinks) == 0:
+                leaves.append(child)
+            else:
+                stack.append(child)
+
+    elements = []
+    for leaf in leaves:
+        value = leaf.SerializeToString()
+        if len(value) < COMMIT_HASH_THRESHOLD:
+            continue
+
+        se = StructureElement()
+        se.value = value
+        se.type = leaf.ObjectType
+        elements.append((leaf, se))
+
+    if len(elements) == 0:
+        return prepared
+
+    content_keys = _get_commit_hash_pool().map(sha1bin, [se.value for leaf, se in elements])
+
+    for (leaf, se), content_key in zip(elements, content_keys):
+        # The same as se.sha1 - hash the content hash and the type
+        se.key = sha1bin(content_key + se.type.SerializeToString())
+        se.verified = True
+        prepared[id(leaf)] = se
+
+    return prepared
@@ -0,0 +1,111 @@
+"""
+@file ion/core/object/ndarray_performance_testing.py
+@author David Stuebe
+@brief Compare the per element GetValue / value field access to the bulk numpy array methods of the cdm bounded array.
+
+Run as a script:
+python ion/core/object/ndarray_performance_testing.py -n 1000000
+"""
+
+import time
+from optparse import OptionParser
+
+import numpy
+
+from ion.core.object import workbench
+from ion.core.object.object_utils import CDM_DATASET_TYPE, ARRAY_STRUCTURE_TYPE, CDM_BOUNDED_ARRAY_TYPE, \
+    CDM_ARRAY_FLOAT64_TYPE, CDM_ARRAY_INT32_TYPE
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class NDArrayPerformanceTester:
+
+    def __init__(self, num_values=10**6):
+
+        self.num_values = num_values
+        self.wb = workbench.WorkBench('No Process Performance Test')
+
+    def make_variable(self, ndarray_type, name):
+        """
+        Create a 1D variable with one bounded array and an empty ndarray of the given type
+        """
+        repo, dataset = self.wb.init_repository(CDM_DATASET_TYPE)
+        dataset.MakeRootGroup()
+        root = dataset.root_group
+
+        dim = root.AddDimension('dim_' + name, self.num_values)
+        var = root.AddVariable(name, root.DataType.DOUBLE, [dim])
+
+        content = repo.create_object(ARRAY_STRUCTURE_TYPE)
+        ba = repo.create_object(CDM_BOUNDED_ARRAY_TYPE)
+        bounds = ba.bounds.add()
+        bounds.origin = 0
+        bounds.size = self.num_values
+
+        ba.ndarray = repo.create_object(ndarray_type)
+        ref = content.bounded_arrays.add()
+        ref.SetLink(ba)
+        var.content = content
+
+        return var, ba
+
+    def run_type(self, ndarray_type, dtype, name):
+
+        var, ba = self.make_variable(ndarray_type, name)
+        values = numpy.arange(self.num_values).astype(dtype)
+        pylist = values.tolist()
+
+        # Per element write
+        t1 = time.time()
+        value_field = ba.ndarray.value
+        for val in pylist:
+            value_field.append(val)
+        t2 = time.time()
+        print "%s: Time to set %d values one at a time: %f" % (name, self.num_values, t2 - t1)
+
+        # Bulk write
+        t1 = time.time()
+        ba.SetNumpyArray(values)
+        t2 = time.time()
+        print "%s: Time to set %d values with SetNumpyArray: %f" % (name, self.num_values, t2 - t1)
+
+        # Per element read through the variable
+        t1 = time.time()
+        for i in xrange(self.num_values):
+            var.GetValue(i)
+        t2 = time.time()
+        print "%s: Time to get %d values with GetValue: %f" % (name, self.num_values, t2 - t1)
+
+        # Per element read of the ndarray
+        t1 = time.time()
+        value_field = ba.ndarray.value
+        for i in xrange(self.num_values):
+            value_field[i]
+        t2 = time.time()
+        print "%s: Time to get %d values one at a time from the ndarray: %f" % (name, self.num_values, t2 - t1)
+
+        # Bulk read
+        t1 = time.time()
+        result = ba.GetNumpyArray()
+        t2 = time.time()
+        print "%s: Time to get %d values with GetNumpyArray: %f" % (name, self.num_values, t2 - t1)
+
+        assert numpy.all(result == values), 'Numpy round trip failed!'
+
+    def runBenchMarks(self):
+        self.run_type(CDM_ARRAY_FLOAT64_TYPE, numpy.float64, 'float64')
+        self.run_type(CDM_ARRAY_INT32_TYPE, numpy.int32, 'int32')
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-n", "--num_values", dest="num_values", default=10**6, help="The number of values in the bounded array")
+    opts, args = parser.parse_args()
+
+    tester = NDArrayPerformanceTester(num_values=int(opts.num_values))
+    tester.runBenchMarks()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+@file ion/core/object/push_performance_testing.py
+@author David Stuebe
+@brief Compare what a push offers when every blob in the repository is listed to what a negotiated push offers when
+the remote already has the previous head, for repositories with deep histories and large trees.
+
+The old push lists every key in the repository and the receiver fetches every key it does not hold in memory, so the
+bytes fetched are for a receiver with a cold cache. The negotiated push lists only the new commits and the part of
+their trees which changed.
+
+Run as a script:
+python ion/core/object/push_performance_testing.py -p 100,1000,10000 -c 10,100
+"""
+
+import time
+from optparse import OptionParser
+
+from ion.core.object import workbench
+from ion.core.object import object_utils
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+PERSON_TYPE = object_utils.create_type_identifier(object_id=20001, version=1)
+ADDRESSLINK_TYPE = object_utils.create_type_identifier(object_id=20003, version=1)
+
+SHA1_LEN = 20
+
+
+class PushPerformanceTester:
+
+    def __init__(self, num_persons, num_commits):
+
+        self.num_persons = num_persons
+        self.num_commits = num_commits
+
+    def make_repository(self, num_persons, num_commits):
+        """
+        Create an address book with num_persons linked person objects and a history of num_commits commits which each
+        change the name of one person
+        """
+        wb = workbench.WorkBench('No Process Performance Test')
+        repo = wb.create_repository(ADDRESSLINK_TYPE)
+        ab = repo.root_object
+        ab.title = 'Push performance'
+
+        for i in xrange(num_persons):
+            p = repo.create_object(PERSON_TYPE)
+            p.name = 'Person %d' % i
+            p.id = i
+            p.email = 'person%d@ooici.net' % i
+            ab.person.add()
+            ab.person[i] = p
+
+        previous = repo.commit('Created the address book')
+
+        for i in xrange(1, num_commits):
+            ab.person[i % num_persons].name = 'Person %d - commit %d' % (i % num_persons, i)
+            previous = repo.commit_head.MyId
+            repo.commit('Commit %d' % i)
+
+        return wb, repo, previous
+
+    def measure(self, name, repo, method):
+
+        t1 = time.time()
+        keys = method()
+        t2 = time.time()
+
+        nbytes = 0
+        for key in keys:
+            nbytes += len(repo.index_hash.get(key).value)
+
+        print "%s: listed %d keys (%d bytes of keys) in %f seconds; blobs to fetch %d bytes" % \
+            (name, len(keys), len(keys) * SHA1_LEN, t2 - t1, nbytes)
+
+    def runBenchMarks(self):
+        for num_persons in self.num_persons:
+            for num_commits in self.num_commits:
+                print "Tree of %d persons with %d commits in the history" % (num_persons, num_commits)
+                wb, repo, previous = self.make_repository(num_persons, num_commits)
+
+                self.measure('list_repository_blobs', repo, lambda: wb.list_repository_blobs(repo))
+                self.measure('list_push_blobs', repo, lambda: wb.list_push_blobs(repo, set([previous])))
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-p", "--persons", dest="persons", default="100,1000,10000", help="Comma separated list of the number of objects in the tree")
+    parser.add_option("-c", "--commits", dest="commits", default="10,100", help="Comma separated list of the number of commits in the history")
+    opts, args = parser.parse_args()
+
+    num_persons = [int(x) for x in opts.persons.split(',')]
+    num_commits = [int(x) for x in opts.commits.split(',')]
+    tester = PushPerformanceTester(num_persons, num_commits)
+    tester.runBenchMarks()
+
+if __name__ == "__main__":
+    main()
@@ -231,6 +231,12 @@ class ObjectContainer(object):
         The list of currently excluded object types
         """
 
+        self._modification_count = 0
+        """
+        Incremented each time an object in the workspace is modified - used to invalidate values derived from the
+        workspace objects
+        """
+
 
     @property
     def root_object(self):
@@ -479,9 +485,10 @@ class ObjectContainer(object):
 
     def _load_element(self, element):
 
-        # check that the calculated value in element.sha1 matches the stored value
-        if not element.key == element.sha1:
-            #@TODO Consider removing this somewhat costly check - it is already done when an object is read from a message
+        # check that the calculated value in element.sha1 matches the stored value - unless it already has been
+        try:
+            element.verify()
+        except gpb_wrapper.StructureElementError, ex:
             raise RepositoryError('The sha1 key does not match the value. The data is corrupted! \n' +\
             'Element key %s, Calculated key %s' % (object_utils.sha1_to_hex(element.key), object_utils.sha1_to_hex(element.sha1)))
 
@@ -589,6 +596,12 @@ class Repository(ObjectContainer):
         # Only used by the datastore to track blobs worth holding onto...
         self.keys_to_keep = set()
 
+        self.remote_commits = {}
+        """
+        The head commits held by each remote process (by scoped name) this repository was last pulled from or pushed
+        to. A push only sends what is not reachable from them.
+        """
+
 
         ### Structures for managing associations to a repository:
 
@@ -770,6 +783,7 @@ class Repository(ObjectContainer):
         self._current_branch = None
         self.branchnicknames.clear()
         self._stash.clear()
+        self.remote_commits.clear()
         self.upstream = None
         self._process = None
 
@@ -92,6 +92,39 @@ class WorkBenchTest(unittest.TestCase):
         self.assertIn(self.ab.MyId, cref_se.ChildLinks)
 
 
+    def test_list_push_blobs(self):
+
+        cref1 = self.repo.commit(comment='testing commit')
+        old_ab_key = self.ab.MyId
+        old_john_key = self.ab.person[1].MyId
+
+        self.ab.person[1].name = 'Johnny'
+        cref2 = self.repo.commit(comment='changed a name')
+
+        # Nothing known - everything in the repository
+        keys = self.wb.list_push_blobs(self.repo, set())
+        self.assertEqual(set(keys), set(self.wb.list_repository_blobs(self.repo)))
+        self.assertIn(old_ab_key, keys)
+        self.assertIn(old_john_key, keys)
+
+        # Only the new commit and the blobs which changed
+        keys = self.wb.list_push_blobs(self.repo, set([cref1]))
+        self.assertEqual(set(keys), set([cref2, self.ab.MyId, self.ab.person[1].MyId]))
+
+        keys = self.wb.list_push_blobs(self.repo, set([cref2]))
+        self.assertEqual(keys, [])
+
+    def test_known_commits_header(self):
+
+        known_commits = {'repo_a':set([object_utils.sha1bin('a'), object_utils.sha1bin('b')]),
+                         'repo_b':set([object_utils.sha1bin('c')])}
+
+        value = workbench.encode_known_commits(known_commits)
+        self.assertEqual(workbench.decode_known_commits(value), known_commits)
+
+        self.assertEqual(workbench.decode_known_commits(None), {})
+
+
     def test_create_repo(self):
 
         # Try it with no arguments
@@ -790,6 +823,59 @@ class WorkBenchProcessTest(IonTestCase):
         self.assertEqual(self.repo1.root_object, repo2.root_object)
 
 
+    @defer.inlineCallbacks
+    def test_push_negotiated(self):
+
+        result = yield self.proc1.workbench.push(self.proc2.id.full, self.repo1)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        targetname = self.proc1.get_scoped_name('system', self.proc2.id.full)
+        self.assertEqual(self.repo1.remote_commits[targetname], set([self.cref1]))
+
+        # update and commit an new head object - only the new part is offered
+        self.repo1.root_object.title = 'New Addressbook'
+        cref2 = self.repo1.commit('An updated addressbook')
+
+        result = yield self.proc1.workbench.push(self.proc2.id.full, self.repo1)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+        self.assertEqual(self.repo1.remote_commits[targetname], set([cref2]))
+
+        repo2 = self.proc2.workbench.get_repository(self.repo1.repository_key)
+
+        ab = yield repo2.checkout('master')
+
+        self.assertEqual(self.repo1.commit_head, repo2.commit_head)
+        self.assertEqual(self.repo1.root_object, repo2.root_object)
+
+    @defer.inlineCallbacks
+    def test_push_unknown_commits(self):
+
+        targetname = self.proc1.get_scoped_name('system', self.proc2.id.full)
+        self.repo1.remote_commits[targetname] = set([self.cref1])
+
+        # proc2 has never seen the repository - the push falls back to sending everything
+        result = yield self.proc1.workbench.push(self.proc2.id.full, self.repo1)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        repo2 = self.proc2.workbench.get_repository(self.repo1.repository_key)
+
+        ab = yield repo2.checkout('master')
+
+        self.assertEqual(self.repo1.commit_head, repo2.commit_head)
+        self.assertEqual(self.repo1.root_object, repo2.root_object)
+
+    @defer.inlineCallbacks
+    def test_pull_remote_commits(self):
+
+        result = yield self.proc2.workbench.pull(self.proc1.id.full, self.repo1.repository_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        repo2 = self.proc2.workbench.get_repository(self.repo1.repository_key)
+
+        targetname = self.proc2.get_scoped_name('system', self.proc1.id.full)
+        self.assertEqual(repo2.remote_commits[targetname], set([self.cref1]))
+
+
     @defer.inlineCallbacks
     def test_push_diverge(self):
 
@@ -17,6 +17,7 @@ from net.ooici.play import addressbook_pb2
 from ion.core.object import gpb_wrapper
 from ion.core.object.gpb_wrapper import LINK_TYPE, CDM_DATASET_TYPE, OOIObjectError
 from ion.core.object import workbench
+from ion.core.object import repository
 from ion.core.object import object_utils
 
 
@@ -419,6 +420,145 @@ class TestStructureElementWrapper(unittest.TestCase):
         self.assertEqual(se.__sizeof__(), 127)
 
 
+class StructureElementVerifyTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.policy = gpb_wrapper.StructureElement.verify_policy
+        gpb_wrapper.verified_keys.clear()
+
+        wb = workbench.WorkBench('no process test')
+        self.repo = wb.create_repository(PERSON_TYPE)
+        self.repo.root_object.name = 'David Stuebe'
+        self.repo.commit('committed...')
+
+        se = self.repo.index_hash.get(self.repo.root_object.MyId)
+        self.blob = se.serialize()
+
+        # Change the content but keep the key
+        tampered = gpb_wrapper.StructureElement.parse_structure_element(self.blob)
+        tampered._element.value = tampered.value.replace('David', 'Evil!')
+        self.tampered_blob = tampered.serialize()
+
+        gpb_wrapper.verified_keys.clear()
+
+    def tearDown(self):
+        gpb_wrapper.StructureElement.set_verify_policy(self.policy)
+        gpb_wrapper.verified_keys.clear()
+
+    def test_always(self):
+
+        gpb_wrapper.StructureElement.set_verify_policy(gpb_wrapper.VERIFY_ALWAYS)
+
+        se = gpb_wrapper.StructureElement.parse_structure_element(self.blob, trusted=True)
+        self.assertEqual(se.verified, True)
+        self.assertEqual(gpb_wrapper.verified_keys.hashed, 1)
+
+        # The same blob again is not hashed while the first is held
+        se2 = gpb_wrapper.StructureElement.parse_structure_element(self.blob)
+        self.assertEqual(gpb_wrapper.verified_keys.hashed, 1)
+        self.assertEqual(gpb_wrapper.verified_keys.hits, 1)
+
+        # Loading the content does not hash it again
+        self.repo._load_element(se2)
+        self.assertEqual(gpb_wrapper.verified_keys.hashed, 1)
+
+        # A tampered blob with a verified key is still rejected
+        self.assertRaises(gpb_wrapper.StructureElementError, gpb_wrapper.StructureElement.parse_structure_element, self.tampered_blob, True)
+
+    def test_trust_boundary(self):
+
+        gpb_wrapper.StructureElement.set_verify_policy(gpb_wrapper.VERIFY_TRUST_BOUNDARY)
+
+        # Blobs from our own store are not hashed
+        se = gpb_wrapper.StructureElement.parse_structure_element(self.blob, trusted=True)
+        self.assertEqual(se.verified, True)
+        self.assertEqual(gpb_wrapper.verified_keys.hashed, 0)
+
+        se = gpb_wrapper.StructureElement.parse_structure_element(self.blob)
+        self.assertEqual(se.verified, True)
+        self.assertEqual(gpb_wrapper.verified_keys.hashed, 1)
+
+        self.assertRaises(gpb_wrapper.StructureElementError, gpb_wrapper.StructureElement.parse_structure_element, self.tampered_blob)
+
+    def test_lazy(self):
+
+        gpb_wrapper.StructureElement.set_verify_policy(gpb_wrapper.VERIFY_LAZY)
+
+        se = gpb_wrapper.StructureElement.parse_structure_element(self.tampered_blob)
+        self.assertEqual(se.verified, False)
+        self.assertEqual(gpb_wrapper.verified_keys.hashed, 0)
+
+        # Rejected when the content is accessed
+        self.assertRaises(repository.RepositoryError, self.repo._load_element, se)
+
+        se = gpb_wrapper.StructureElement.parse_structure_element(self.blob)
+        obj = self.repo._load_element(se)
+        self.assertEqual(obj.name, 'David Stuebe')
+        self.assertEqual(se.verified, True)
+
+    def test_invalid_policy(self):
+
+        self.assertRaises(gpb_wrapper.StructureElementError, gpb_wrapper.StructureElement.set_verify_policy, 'never')
+
+
+class StructureElementChildLinksTest(unittest.TestCase):
+
+    def setUp(self):
+        wb = workbench.WorkBench('no process test')
+        self.repo, self.ab = wb.init_repository(ADDRESSLINK_TYPE)
+
+        for i in range(2):
+            p = self.repo.create_object(PERSON_TYPE)
+            p.name = 'Person %d' % i
+            self.ab.person.add()
+            self.ab.person[i] = p
+
+        self.ab.owner = self.ab.person[0]
+        self.repo.commit('committed...')
+
+    def test_get_child_links(self):
+
+        ab_se = self.repo.index_hash.get(self.ab.MyId)
+
+        # A parsed element does not know its children until they are found in its content
+        se = gpb_wrapper.StructureElement.parse_structure_element(ab_se.serialize())
+        self.assertEqual(se.child_links_known, False)
+
+        links = se.get_child_links()
+        self.assertEqual(se.child_links_known, True)
+
+        # The owner is one of the people - each child is listed once
+        self.assertEqual(len(links), 2)
+        self.assertEqual(se.ChildLinks, ab_se.ChildLinks)
+        for key, object_id, version in links:
+            self.assertEqual((object_id, version), (PERSON_TYPE.object_id, PERSON_TYPE.version))
+
+        # Leaves are never decoded
+        person_se = self.repo.index_hash.get(self.ab.person[0].MyId)
+        leaf = gpb_wrapper.StructureElement.parse_structure_element(person_se.serialize())
+        leaf._element.value = 'not a person'
+        self.assertEqual(leaf.get_child_links(), [])
+
+    def test_encode_decode(self):
+
+        se = self.repo.index_hash.get(self.ab.MyId)
+        links = se.get_child_links()
+
+        record = gpb_wrapper.encode_child_links(links)
+        self.assertEqual(gpb_wrapper.decode_child_links(record), links)
+
+        self.assertEqual(gpb_wrapper.decode_child_links(gpb_wrapper.encode_child_links([])), [])
+        self.assertRaises(gpb_wrapper.StructureElementError, gpb_wrapper.decode_child_links, '')
+
+    def test_type_ids(self):
+
+        self.assertEqual(gpb_wrapper.type_ids([PERSON_TYPE]), set([(20001, 1)]))
+
+        # Wrapped types, as in the excluded types of a message
+        self.assertEqual(gpb_wrapper.type_ids([self.ab.GetLink('owner').type]), set([(20001, 1)]))
+
+
 class TestSpecializedCdmMethods(unittest.TestCase):
     """
     """
@@ -1428,7 +1568,83 @@ class NodeLinkTest(unittest.TestCase):
 
             
 class RecurseCommitTest(unittest.TestCase):
-        
+
+    def tearDown(self):
+        gpb_wrapper.COMMIT_HASH_THREADS = 0
+
+    def _make_addressbook(self, wb, num_persons):
+
+        repo, ab = wb.init_repository(ADDRESSLINK_TYPE)
+        ab.title = 'Hash me'
+        for i in range(num_persons):
+            p = repo.create_object(PERSON_TYPE)
+            p.name = 'Person %d' % i
+            p.id = i
+            ab.person.add()
+            ab.person[i] = p
+
+        ab.owner = ab.person[0]
+        return repo, ab
+
+    def test_threaded_hash_keys(self):
+        wb = workbench.WorkBench('No Process Test')
+
+        repo1, ab1 = self._make_addressbook(wb, 20)
+        strct1 = {}
+        ab1.RecurseCommit(strct1)
+
+        # Hash every leaf in the worker threads
+        gpb_wrapper.COMMIT_HASH_THREADS = 2
+        threshold = gpb_wrapper.COMMIT_HASH_THRESHOLD
+        gpb_wrapper.COMMIT_HASH_THRESHOLD = 1
+        try:
+            repo2, ab2 = self._make_addressbook(wb, 20)
+            strct2 = {}
+            ab2.RecurseCommit(strct2)
+        finally:
+            gpb_wrapper.COMMIT_HASH_THRESHOLD = threshold
+
+        self.assertEqual(ab1.MyId, ab2.MyId)
+        self.assertEqual(set(strct1.keys()), set(strct2.keys()))
+        self.assertEqual(len(strct1), 21)
+
+        for key, se in strct2.iteritems():
+            self.assertEqual(se.key, se.sha1)
+            self.assertEqual(se.ChildLinks, strct1[key].ChildLinks)
+
+        self.assertEqual(ab2.person[3].name, 'Person 3')
+        self.assertEqual(ab2.person[3].MyId, ab1.person[3].MyId)
+
+    def test_deep_structure(self):
+        wb = workbench.WorkBench('No Process Test')
+
+        repo, dataset = wb.init_repository(CDM_DATASET_TYPE)
+        dataset.MakeRootGroup()
+
+        # Much deeper than the recursion limit would allow
+        depth = 2000
+        group = dataset.root_group
+        for i in range(depth):
+            group = group.AddGroup('group_%d' % i)
+
+        repo.commit('Deep')
+
+        self.assertEqual(repo.status, repo.UPTODATE)
+
+        # Walk back down through the committed elements
+        key = dataset.root_group.MyId
+        count = 0
+        while True:
+            se = repo.index_hash.get(key)
+            self.assertEqual(se.key, se.sha1)
+            if len(se.ChildLinks) == 0:
+                break
+            key = list(se.ChildLinks)[0]
+            count += 1
+
+        self.assertEqual(count, depth)
+        self.assertEqual(group.name, 'group_%d' % (depth - 1))
+
             
     def test_simple_commit(self):
         wb = workbench.WorkBench('No Process Test')
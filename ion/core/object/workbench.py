@@ -25,6 +25,7 @@ from ion.core.object.gpb_wrapper import OOIObjectError
 from ion.core.exception import ReceivedApplicationError, ApplicationError
 
 import weakref
+import binascii
 
 # Static entry point for "thread local" context storage during request
 # processing, eg. to retaining user-id from request message
@@ -74,11 +75,44 @@ DATA_CHUNK_MESSAGE_TYPE = object_utils.create_type_identifier(object_id=57, vers
 GET_OBJECT_REQUEST_MESSAGE_TYPE = object_utils.create_type_identifier(object_id=55, version=1)
 GET_OBJECT_REPLY_MESSAGE_TYPE = object_utils.create_type_identifier(object_id=56, version=1)
 
+# Message header used to negotiate a push - the commits the sender believes the receiver already has
+PUSH_KNOWN_COMMITS_HEADER = 'known-commits'
+
 class WorkBenchError(ApplicationError):
     """
     An exception class for errors that occur in the Object WorkBench class
     """
 
+
+def encode_known_commits(known_commits):
+    """
+    @brief Encode the commits a pushing process believes the receiver already has as a message header value
+    @param known_commits a dictionary of repository key -> set of binary sha1 commit keys
+    @retval a string - repository_key:HEX,HEX;repository_key:HEX
+    """
+    repos = []
+    for repository_key, commit_keys in known_commits.iteritems():
+        repos.append('%s:%s' % (repository_key, ','.join([sha1_to_hex(key) for key in commit_keys])))
+
+    return ';'.join(repos)
+
+
+def decode_known_commits(value):
+    """
+    @brief Decode the known commits message header value
+    @param value the header value or None if the push was not negotiated
+    @retval a dictionary of repository key -> set of binary sha1 commit keys
+    """
+    known_commits = {}
+    if not value:
+        return known_commits
+
+    for repo in value.split(';'):
+        repository_key, commit_keys = repo.rsplit(':', 1)
+        known_commits[repository_key] = set([binascii.unhexlify(key) for key in commit_keys.split(',') if key])
+
+    return known_commits
+
 class WorkBench(object):
     
     def __init__(self, process, cache_size=10**7):
@@ -425,28 +459,25 @@ class WorkBench(object):
         """
 
 
-    def _get_blobs(self, repo, startkeys, filtermethod=None):
+    def _get_blobs(self, repo, startkeys, excluded_types=None):
         """
         Common blob fetching helper method.
         Used by checkout and pull.
 
         @param  repo            Repository for the response.
         @param  startkeys       The keys that should start the fetching process.
-        @param  filtermethod    A callable to be applied to all children of fetched items. If the callable returns true,
-                                the item is included.
+        @param  excluded_types  GPBTypes of children which are not fetched.
 
         @returns                A dictionary of keys => blobs.
         """
         # Slightly different machinary here than in the workbench - Could be made more similar?
         blobs={}
         keys_to_get=set(startkeys)
-        def_filter = lambda x: True
-        filtermethod = filtermethod or def_filter
+        excluded = gpb_wrapper.type_ids(excluded_types or [])
 
         while len(keys_to_get) > 0:
             new_links_to_get = set()
 
-            def_list = []
             #@TODO - put some error checking here so that we don't overflow due to a stupid request!
             for key in keys_to_get:
                 # Short cut if we have already got it!
@@ -454,20 +485,19 @@ class WorkBench(object):
 
                 if wse:
                     blobs[wse.key]=wse
-                    # get the object
-                    obj = repo._load_element(wse)
 
-                    # only add new items to get if they meet our criteria, meaning they are not in the excluded type list
-                    new_links_to_get.update(obj.ChildLinks)
+                    # The children are found without loading the object
+                    new_links_to_get.update(wse.get_child_links())
                 else:
 
                     log.warn('Blob not found in _get_blobs.')
 
 
             keys_to_get.clear()
-            for link in new_links_to_get:
-                if not blobs.has_key(link.key) and filtermethod(link):
-                    keys_to_get.add(link.key)
+            for key, object_id, version in new_links_to_get:
+                # only add new items to get if they meet our criteria, meaning they are not in the excluded type list
+                if not blobs.has_key(key) and (object_id, version) not in excluded:
+                    keys_to_get.add(key)
 
         return blobs
 
@@ -483,15 +513,9 @@ class WorkBench(object):
 
         response = yield self._process.message_client.create_instance(BLOBS_MESSAGE_TYPE)
 
-        def filtermethod(x):
-            """
-            Returns true if the passed in link's type is not in the excluded_types list of the passed in message.
-            """
-            return (x.type not in content.excluded_types)
-
         # this is inherited by DatastoreWorkbench, which requires the _get_blobs call be a deferred, whereas here it is not.
         # tldr; maybeDeferred necessary.
-        blobs = yield defer.maybeDeferred(self._get_blobs, response.Repository, [content.commit_root_object], filtermethod)
+        blobs = yield defer.maybeDeferred(self._get_blobs, response.Repository, [content.commit_root_object], content.excluded_types)
 
         for element in blobs.values():
             link = response.blob_elements.add()
@@ -607,10 +631,17 @@ class WorkBench(object):
         new_head = repo._load_element(head_element)
         new_head.Modified = True
         new_head.MyId = repo.new_id()
+
+        # Remember the heads of the remote so that a push need only send what is new
+        remote_heads = set()
+        for branch in new_head.branches:
+            for link in branch.commitrefs.GetLinks():
+                remote_heads.add(link.key)
         
         # Now merge the state!
         self._update_repo_to_head(repo,new_head)
 
+        repo.remote_commits[targetname] = remote_heads
 
         # Where to get objects not yet transfered.
         repo.upstream = targetname
@@ -683,13 +714,7 @@ class WorkBench(object):
 
             keys = [x.GetLink('objectroot').key for x in repo.current_heads()]
 
-            def filtermethod(x):
-                """
-                Returns true if the passed in link's type is not in the excluded_types list of the passed in message.
-                """
-                return (x.type not in request.excluded_types)
-
-            blobs = self._get_blobs(response.Repository, keys, filtermethod)
+            blobs = self._get_blobs(response.Repository, keys, request.excluded_types)
 
             for element in blobs.itervalues():
 
@@ -740,6 +765,7 @@ class WorkBench(object):
         # Calculate the sha1 from the serialized value and type!
         # Sha1 is a property - not a method...
         se.key = se.sha1
+        se.verified = True
 
         # Mutable is never a leaf!
         se.isleaf = False
@@ -781,6 +807,10 @@ class WorkBench(object):
         Push the current state of the repository.
         When the operation is complete - the transfer of all objects in the
         repository is complete.
+
+        The commits last pulled from or pushed to the origin are sent in the known commits header and only the part of
+        each repository which is not reachable from them is offered. If the origin does not have those commits it
+        replies NOT_FOUND and the complete repositories are pushed instead.
         """
 
         log.info('push - start')
@@ -809,22 +839,77 @@ class WorkBench(object):
 
         instances = list(repositories_and_associations)
 
+        known_commits = {}
+        pushed_heads = []
+        for instance in instances:
+
+            # Just in case this thing is an instance object
+            repo = instance.Repository
+
+            if repo.commit_head is None:
+                log.warning('No commits found in repository during push: \n' + str(repo))
+                raise WorkBenchError('Can not push a repository which has no commits!')
+
+            commit_keys = repo.remote_commits.get(targetname)
+            if commit_keys:
+                known_commits[repo.repository_key] = commit_keys
+
+            pushed_heads.append((repo, set([cref.MyId for cref in repo.current_heads()])))
 
+        while True:
+
+            pushmsg = yield self._create_push_message(instances, known_commits)
+
+            headers = {}
+            if known_commits:
+                headers[PUSH_KNOWN_COMMITS_HEADER] = encode_known_commits(known_commits)
+
+            try:
+                result, headers, msg = yield self._process.rpc_send(targetname,'push', pushmsg, headers)
+
+                # @TODO Return more info about the result - detect divergence?
+            except ReceivedApplicationError, re:
+
+                if known_commits and re.msg_content.MessageResponseCode == re.msg_content.ResponseCodes.NOT_FOUND:
+                    log.info('Push target does not have the known commits - pushing the complete repositories')
+                    known_commits = {}
+                    continue
+
+                log.debug('ReceivedError', str(re))
+                raise WorkBenchError('Push returned an exception! "%s"' % re.msg_content)
+
+            except ReceivedError, re:
+            
+                log.debug('ReceivedError', str(re))
+                raise WorkBenchError('Push returned an exception! "%s"' % re.msg_content)
+
+            break
+
+        # The target now has everything that was pushed
+        for repo, head_keys in pushed_heads:
+            repo.remote_commits[targetname] = head_keys
+
+        log.info('push - complete')
+
+        defer.returnValue(result)
+        # @TODO - check results?
+
+    @defer.inlineCallbacks
+    def _create_push_message(self, instances, known_commits):
+        """
+        Create the push message for a list of repositories
+        @param instances the repositories or instances to push
+        @param known_commits a dictionary of repository key -> set of commit keys the target already has
+        """
         # Create push message
         pushmsg = yield self._process.message_client.create_instance(PUSH_MESSAGE_TYPE)
 
-
         #Iterate the list and build the message to send
         for instance in instances:
 
             # Just in case this thing is an instance object
             repo = instance.Repository
 
-            commit_head = repo.commit_head
-            if commit_head is None:
-                log.warning('No commits found in repository during push: \n' + str(repo))
-                raise WorkBenchError('Can not push a repository which has no commits!')
-
             repostate = pushmsg.repositories.add()
 
             repostate.repository_key = repo.repository_key
@@ -837,22 +922,13 @@ class WorkBench(object):
             obj = repostate.Repository._wrap_message_object(head_element._element)
             repostate.repo_head_element = obj
 
-            repostate.blob_keys.extend(self.list_repository_blobs(repo))
-
-        try:
-            result, headers, msg = yield self._process.rpc_send(targetname,'push', pushmsg)
-
-            # @TODO Return more info about the result - detect divergence?
-        except ReceivedError, re:
-            
-            log.debug('ReceivedError', str(re))
-            raise WorkBenchError('Push returned an exception! "%s"' % re.msg_content)
-
+            commit_keys = known_commits.get(repo.repository_key)
+            if commit_keys:
+                repostate.blob_keys.extend(self.list_push_blobs(repo, commit_keys))
+            else:
+                repostate.blob_keys.extend(self.list_repository_blobs(repo))
 
-        log.info('push - complete')
-
-        defer.returnValue(result)
-        # @TODO - check results?
+        defer.returnValue(pushmsg)
 
         
     @defer.inlineCallbacks
@@ -867,6 +943,11 @@ class WorkBench(object):
         if not hasattr(pushmsg, 'MessageType') or pushmsg.MessageType != PUSH_MESSAGE_TYPE:
             raise WorkBenchError('Invalid push request. Bad Message Type!', pushmsg.ResponseCodes.BAD_REQUEST)
 
+        # A negotiated push only offers what is not reachable from the known commits - make sure we have them
+        known_commits = decode_known_commits(headers.get(PUSH_KNOWN_COMMITS_HEADER))
+        missing = yield self._missing_known_commits(known_commits)
+        if missing:
+            raise WorkBenchError('Invalid push request. %d known commits not found!' % len(missing), pushmsg.ResponseCodes.NOT_FOUND)
 
         for repostate in pushmsg.repositories:
 
@@ -1034,6 +1115,118 @@ class WorkBench(object):
 
         return repo.index_hash.keys()
 
+    def list_push_blobs(self, repo, known_commits):
+        """
+        This method creates a list of the commits and blobs in a repository which a remote holding known_commits does
+        not have. History is walked from the heads and stops at the known commits. Only the part of the trees of the
+        new commits which is not shared with the trees of the known commits they descend from is listed.
+        The return value is a list of binary SHA1 keys
+        """
+
+        new_commits = []
+        boundary = set()
+        visited = set()
+
+        stack = [cref.MyId for cref in repo.current_heads()]
+        while len(stack) > 0:
+
+            key = stack.pop()
+            if key in visited:
+                continue
+            visited.add(key)
+
+            if key in known_commits:
+                boundary.add(key)
+                continue
+
+            cref = repo._commit_index.get(key)
+            if cref is None:
+                # The history has been truncated - the remote got these commits when we did
+                continue
+
+            new_commits.append(cref)
+            for pref in cref.parentrefs:
+                stack.append(pref.GetLink('commitref').key)
+
+        shared_roots = [repo._commit_index[key].GetLink('objectroot').key for key in boundary if key in repo._commit_index]
+
+        # Anything below a known commit which is not here was not sent to us - the remote has it
+        shared, absent = self._walk_blobs(repo, shared_roots)
+        shared.update(absent)
+
+        blobs, absent = self._walk_blobs(repo, [cref.GetLink('objectroot').key for cref in new_commits], stop_keys=shared)
+
+        keys = [cref.MyId for cref in new_commits]
+        keys.extend(blobs)
+
+        return keys
+
+    def _walk_blobs(self, repo, root_keys, stop_keys=None):
+        """
+        Walk the blobs below root_keys which are held in the repository - no remote fetches.
+        @param repo the repository to walk
+        @param root_keys the keys at which to start
+        @param stop_keys keys which are not walked, nor are their children
+        @retval a tuple of the set of keys found and the set of keys which are not held locally
+        """
+        stop_keys = stop_keys or set()
+
+        found = set()
+        absent = set()
+
+        front = set(root_keys).difference(stop_keys)
+        while len(front) > 0:
+
+            children = set()
+            for key in front:
+
+                element = repo.index_hash.get(key)
+                if element is None:
+                    absent.add(key)
+                    continue
+
+                found.add(key)
+                if element.isleaf:
+                    continue
+
+                if len(element.ChildLinks) == 0:
+                    # Elements received in a message do not know their children until they are decoded
+                    element.get_child_links()
+
+                children.update(element.ChildLinks)
+
+            front = children.difference(found, absent, stop_keys)
+
+        return found, absent
+
+    def _missing_known_commits(self, known_commits):
+        """
+        Find the known commits of a negotiated push which are not held here along with all of their blobs. The
+        workbench may have purged the blobs of previous states so the trees are checked too.
+        @param known_commits a dictionary of repository key -> set of commit keys
+        @retval the set of commit keys which are missing
+        """
+        missing = set()
+        for repository_key, commit_keys in known_commits.iteritems():
+
+            repo = self.get_repository(repository_key)
+
+            for key in commit_keys:
+
+                cref = None
+                if repo is not None:
+                    cref = repo._commit_index.get(key)
+
+                if cref is None:
+                    missing.add(key)
+                    continue
+
+                found, absent = self._walk_blobs(repo, [cref.GetLink('objectroot').key])
+                if absent:
+                    missing.add(key)
+
+        return missing
+
 
     def _update_repo_to_head(self, repo, head, truncate_commits=True, loaded_commits=None):
         log.debug('_update_repo_to_head: Loading a repository!')
@@ -30,6 +30,7 @@ from ion.services.coi.datastore_bootstrap.ion_preload_config import TYPE_OF_ID,
     DATASET_RESOURCE_TYPE_ID, DATASOURCE_RESOURCE_TYPE_ID, HAS_A_ID, OWNED_BY_ID
 
 from ion.integration.ais.common.ais_utils import AIS_Mixin
+from ion.integration.ais.common.spatial_temporal_index import SpatialTemporalIndex
 
 
 #
@@ -98,6 +99,11 @@ class MetadataCache(AIS_Mixin):
 
         self.__metadata = {}
 
+        #
+        # The extent of each cached data set, so that a bounded search need
+        # not test every data set
+        #
+        self.__index = SpatialTemporalIndex()
 
         #
         # A lock to ensure exclusive access to cache when updating
@@ -111,12 +117,28 @@ class MetadataCache(AIS_Mixin):
     def getNumDatasources(self):
         return self.numDSources
 
-    def getDatasets(self):
-        dSetList = []                
-        for ds in self.__metadata.itervalues():
-            if (ds[TYPE] is DSET):
-                dSetList.append(ds)
-        return dSetList                
+    def getDatasets(self, bounds=None):
+        """
+        Get the metadata of the cached data sets.  If a loaded
+        SpatialTemporalBounds is given only the data sets which may be in
+        the bounds are returned; the caller must still test them with
+        isInBounds.
+        """
+        candidates = None
+        if bounds is not None:
+            candidates = self.__index.search(bounds)
+
+        dSetList = []
+        if candidates is None:
+            for ds in self.__metadata.itervalues():
+                if (ds[TYPE] is DSET):
+                    dSetList.append(ds)
+        else:
+            for dSetID in candidates:
+                ds = self.__metadata.get(dSetID, None)
+                if ds is not None and ds[TYPE] is DSET:
+                    dSetList.append(ds)
+        return dSetList
 
 
     def getDataSources(self):
@@ -293,6 +315,7 @@ class MetadataCache(AIS_Mixin):
                 # Set the persistent flag to False
                 #
                 dSetMetadata = self.__metadata.pop(dSetID)
+                self.__index.remove(dSetID)
                 dSet = dSetMetadata[DSET]
                 dSet.Repository.persistent = False
     
@@ -560,6 +583,7 @@ class MetadataCache(AIS_Mixin):
             # Store this dSetMetadata in the dictionary, indexed by the resourceID
             #
             self.__metadata[dSet.ResourceIdentity] = dSetMetadata
+            self.__index.add(dSet.ResourceIdentity, dSetMetadata)
     
             if log.getEffectiveLevel() <= logging.DEBUG:
                 self.__printMetadata('Dataset Metadata', dSet)
@@ -0,0 +1,82 @@
+"""
+@file ion/integration/ais/common/metadata_index_performance_testing.py
+@author David Stuebe
+@brief Compare the time to find the cached data sets within a set of bounds by calling isInBounds on every data set
+with the time to search the spatial temporal index and call isInBounds on the candidates only.
+
+Run as a script:
+python ion/integration/ais/common/metadata_index_performance_testing.py -d 1000,10000,100000 -q 100
+"""
+
+import time
+import random
+from optparse import OptionParser
+
+from ion.integration.ais.common.spatial_temporal_index import SpatialTemporalIndex
+from ion.integration.ais.test.test_spatial_temporal_index import make_metadata, make_bounds
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class MetadataIndexPerformanceTester:
+
+    def __init__(self, num_datasets, num_queries):
+
+        self.num_datasets = num_datasets
+        self.num_queries = num_queries
+
+    def runBenchMarks(self):
+        rand = random.Random(1234)
+
+        for num_datasets in self.num_datasets:
+
+            metadata = {}
+            for i in xrange(num_datasets):
+                metadata['dataset_%d' % i] = make_metadata(rand)
+
+            index = SpatialTemporalIndex()
+            t1 = time.time()
+            for key, md in metadata.iteritems():
+                index.add(key, md)
+            t2 = time.time()
+            print "Indexed %d data sets in %f seconds" % (num_datasets, t2 - t1)
+
+            queries = [make_bounds(rand) for i in xrange(self.num_queries)]
+
+            scan_time = 0.0
+            index_time = 0.0
+            num_candidates = 0
+            for bounds in queries:
+                t1 = time.time()
+                expected = [key for key, md in metadata.iteritems() if bounds.isInBounds(md)]
+                t2 = time.time()
+
+                candidates = index.search(bounds)
+                if candidates is None:
+                    candidates = metadata.keys()
+                found = [key for key in candidates if bounds.isInBounds(metadata[key])]
+                t3 = time.time()
+
+                assert set(found) == set(expected)
+                scan_time += t2 - t1
+                index_time += t3 - t2
+                num_candidates += len(candidates)
+
+            print "Scan: %d data sets - %f ms per query" % (num_datasets, scan_time * 1000.0 / self.num_queries)
+            print "Index: %d data sets - %f ms per query, %d candidates per query" % \
+                (num_datasets, index_time * 1000.0 / self.num_queries, num_candidates / self.num_queries)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-d", "--datasets", dest="datasets", default="1000,10000,100000", help="Comma separated list of the number of cached data sets")
+    parser.add_option("-q", "--queries", dest="queries", default=100, help="The number of bounded searches to run")
+    opts, args = parser.parse_args()
+
+    num_datasets = [int(x) for x in opts.datasets.split(',')]
+    tester = MetadataIndexPerformanceTester(num_datasets, int(opts.queries))
+    tester.runBenchMarks()
+
+if __name__ == "__main__":
+    main()
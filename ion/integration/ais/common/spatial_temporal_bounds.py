@@ -57,6 +57,12 @@ class SpatialTemporalBounds(object):
         """
         log.debug('__loadBounds %s' %(bounds))
 
+        #
+        # The bounds are held until isInBounds is called for each candidate
+        # data set, so they must not be shared with other requests
+        #
+        self.bounds = {}
+
         #
         # Set these flags; they're used for further tests; only set if the field is NOT NaN
         # (not a number); i.e., the field must be a number.
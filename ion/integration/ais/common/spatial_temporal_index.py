@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+"""
+@file ion/integration/ais/common/spatial_temporal_index.py
+@author David Stuebe
+@brief Index of the spatial, vertical and temporal extent of cached data set
+metadata.  A search returns the data sets which might be within a set of
+SpatialTemporalBounds - a superset of the answer - so that isInBounds only
+needs to be called on those candidates rather than on every cached data set.
+The index is updated as data sets are added to and removed from the cache.
+"""
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+from ion.util.procutils import isnan
+
+import math
+import time, datetime
+from bisect import bisect_left, bisect_right, insort
+
+from ion.integration.ais.common.spatial_temporal_bounds import MIN_LATITUDE, MAX_LATITUDE, MIN_LONGITUDE, \
+    MAX_LONGITUDE, MIN_VERTICAL, MAX_VERTICAL
+
+#
+# Data set metadata keys - the same as the metadata cache
+#
+TIME_START   = 'ion_time_coverage_start'
+TIME_END     = 'ion_time_coverage_end'
+LAT_MIN      = 'ion_geospatial_lat_min'
+LAT_MAX      = 'ion_geospatial_lat_max'
+LON_MIN      = 'ion_geospatial_lon_min'
+LON_MAX      = 'ion_geospatial_lon_max'
+VERT_MIN     = 'ion_geospatial_vertical_min'
+VERT_MAX     = 'ion_geospatial_vertical_max'
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Size of the grid cells in degrees
+DEFAULT_CELL_SIZE = 10
+
+# Data sets which cover more cells than this are kept in a list which every spatial search includes
+DEFAULT_MAX_CELLS = 64
+
+
+def _number(metadata, key):
+    """
+    Get a numeric metadata value as a float, None if it is missing or not a number.
+    """
+    value = metadata.get(key, None)
+    if value is None:
+        return None
+    try:
+        if isnan(value):
+            return None
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class IntervalIndex(object):
+    """
+    Sorted lists of the low and high ends of a set of intervals.  Finding the
+    intervals which overlap a query walks only the shorter side of the search.
+    Keys which have no interval, or a reversed one, are always returned.
+    """
+
+    def __init__(self):
+        self._intervals = {}
+        self._lows = []
+        self._highs = []
+        self.unbounded = set()
+
+    def add(self, key, low, high):
+        self.remove(key)
+        if low is None or high is None or low > high:
+            # The time test of isInBounds can pass a reversed interval which does not overlap the query
+            self.unbounded.add(key)
+            return
+
+        self._intervals[key] = (low, high)
+        insort(self._lows, (low, key))
+        insort(self._highs, (high, key))
+
+    def remove(self, key):
+        self.unbounded.discard(key)
+        interval = self._intervals.pop(key, None)
+        if interval is None:
+            return
+
+        low, high = interval
+        del self._lows[bisect_left(self._lows, (low, key))]
+        del self._highs[bisect_left(self._highs, (high, key))]
+
+    def overlapping(self, low, high):
+        """
+        @param low the lowest value of the query, None for no limit
+        @param high the highest value of the query, None for no limit
+        @retval the set of keys whose interval has low end <= high and high end >= low
+        """
+        if low is None and high is None:
+            return set(self._intervals.keys()) | self.unbounded
+
+        result = set(self.unbounded)
+
+        if high is None:
+            # Only the high end is constrained
+            i = bisect_left(self._highs, (low,))
+            result.update(key for h, key in self._highs[i:])
+            return result
+
+        if low is None:
+            i = bisect_right(self._lows, (high, MAX_KEY))
+            result.update(key for l, key in self._lows[:i])
+            return result
+
+        n_lows = bisect_right(self._lows, (high, MAX_KEY))
+        i_highs = bisect_left(self._highs, (low,))
+
+        intervals = self._intervals
+        if n_lows <= len(self._highs) - i_highs:
+            for l, key in self._lows[:n_lows]:
+                if intervals[key][1] >= low:
+                    result.add(key)
+        else:
+            for h, key in self._highs[i_highs:]:
+                if intervals[key][0] <= high:
+                    result.add(key)
+
+        return result
+
+    def __len__(self):
+        return len(self._intervals) + len(self.unbounded)
+
+
+class _MaxKey(object):
+    """
+    Compares greater than any key so that bisect_right finds every entry with an equal value.
+    """
+    def __cmp__(self, other):
+        if other is self:
+            return 0
+        return 1
+
+MAX_KEY = _MaxKey()
+
+
+class SpatialTemporalIndex(object):
+    """
+    A grid over latitude and longitude plus interval indexes over the time
+    coverage and the vertical extent of the data sets.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE, max_cells=DEFAULT_MAX_CELLS):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+
+        # (lat cell, lon cell) -> set of keys
+        self._cells = {}
+        # key -> the cells it is in
+        self._placed = {}
+        # Keys which are not in the grid - every spatial search includes them
+        self._unplaced = set()
+
+        self._time = IntervalIndex()
+        self._vertical = IntervalIndex()
+
+    def _cell(self, value):
+        return int(math.floor(value / self.cell_size))
+
+    def add(self, key, metadata):
+        """
+        Add or replace the extent of a data set
+        @param key the resource id of the data set
+        @param metadata the dictionary of data set metadata from the metadata cache
+        """
+        self.remove(key)
+
+        lat_min = _number(metadata, LAT_MIN)
+        lat_max = _number(metadata, LAT_MAX)
+        lon_min = _number(metadata, LON_MIN)
+        lon_max = _number(metadata, LON_MAX)
+
+        cells = None
+        if None not in (lat_min, lat_max, lon_min, lon_max) and \
+                -90 <= lat_min <= lat_max <= 90 and -180 <= lon_min <= lon_max <= 180:
+
+            lat_cells = range(self._cell(lat_min), self._cell(lat_max) + 1)
+            lon_cells = range(self._cell(lon_min), self._cell(lon_max) + 1)
+            if len(lat_cells) * len(lon_cells) <= self.max_cells:
+                cells = [(i, j) for i in lat_cells for j in lon_cells]
+
+        if cells is None:
+            self._unplaced.add(key)
+        else:
+            for cell in cells:
+                self._cells.setdefault(cell, set()).add(key)
+            self._placed[key] = cells
+
+        self._vertical.add(key, _number(metadata, VERT_MIN), _number(metadata, VERT_MAX))
+
+        try:
+            start = time.mktime(datetime.datetime.strptime(metadata[TIME_START], TIME_FORMAT).timetuple())
+            end = time.mktime(datetime.datetime.strptime(metadata[TIME_END], TIME_FORMAT).timetuple())
+        except (KeyError, TypeError, ValueError):
+            # isInBounds does not filter data sets whose time can not be read
+            start = end = None
+        self._time.add(key, start, end)
+
+    def remove(self, key):
+        self._unplaced.discard(key)
+        for cell in self._placed.pop(key, ()):
+            keys = self._cells[cell]
+            keys.discard(key)
+            if len(keys) == 0:
+                del self._cells[cell]
+
+        self._vertical.remove(key)
+        self._time.remove(key)
+
+    def search(self, bounds):
+        """
+        Find the data sets which may be within the bounds.
+        @param bounds a SpatialTemporalBounds which has been loaded
+        @retval a set of keys which includes every data set within the bounds, or None if the bounds do not
+        filter at all
+        """
+        candidates = None
+
+        lat_low = lat_high = lon_low = lon_high = None
+        if bounds.filterByLatitude:
+            # The same tests as isInBounds - note that the minimum latitude of the data is tested when the
+            # minimum bound is set and the maximum when the maximum bound is set
+            if bounds.bIsMaxLatitudeSet:
+                lat_low = float(bounds.bounds[MIN_LATITUDE])
+            if bounds.bIsMinLatitudeSet:
+                lat_high = float(bounds.bounds[MAX_LATITUDE])
+
+        if bounds.filterByLongitude:
+            if bounds.bIsMinLongitudeSet:
+                lon_low = float(bounds.bounds[MIN_LONGITUDE])
+            if bounds.bIsMaxLongitudeSet:
+                lon_high = float(bounds.bounds[MAX_LONGITUDE])
+
+        if (lat_low, lat_high, lon_low, lon_high) != (None, None, None, None):
+            candidates = self._search_grid(lat_low, lat_high, lon_low, lon_high)
+
+        if bounds.filterByVertical:
+            vertical = self._vertical.overlapping(float(bounds.bounds[MIN_VERTICAL]), float(bounds.bounds[MAX_VERTICAL]))
+            candidates = vertical if candidates is None else candidates & vertical
+
+        if bounds.filterByTime and bounds.bounds['minTime'] <= bounds.bounds['maxTime']:
+            in_time = self._time.overlapping(bounds.bounds['minTime'], bounds.bounds['maxTime'])
+            candidates = in_time if candidates is None else candidates & in_time
+
+        return candidates
+
+    def _search_grid(self, lat_low, lat_high, lon_low, lon_high):
+
+        # A reversed range, such as one across the date line, only matches data sets which span it - search the
+        # whole axis
+        if lat_low is not None and lat_high is not None and lat_low > lat_high:
+            lat_low = lat_high = None
+        if lon_low is not None and lon_high is not None and lon_low > lon_high:
+            lon_low = lon_high = None
+
+        lat_first = self._cell(max(lat_low, -90) if lat_low is not None else -90)
+        lat_last = self._cell(min(lat_high, 90) if lat_high is not None else 90)
+        lon_first = self._cell(max(lon_low, -180) if lon_low is not None else -180)
+        lon_last = self._cell(min(lon_high, 180) if lon_high is not None else 180)
+
+        result = set(self._unplaced)
+        cells = self._cells
+        for i in xrange(lat_first, lat_last + 1):
+            for j in xrange(lon_first, lon_last + 1):
+                keys = cells.get((i, j), None)
+                if keys is not None:
+                    result.update(keys)
+
+        return result
+
+    def __len__(self):
+        return len(self._placed) + len(self._unplaced)
@@ -253,8 +253,13 @@ class FindDataResources(object):
         # the private __getDataResources() method.  Or, just store the IDs
         # of the datasets here instead of the metadata.
         #
-        dSetList = self.metadataCache.getDatasets()
-        log.debug('findDataResources: cache contains %d datasets' %len(dSetList))
+        # Only the data sets which may be within the bounds come back from
+        # the cache; they are tested with isInBounds in __getDataResources()
+        #
+        bounds = SpatialTemporalBounds()
+        bounds.loadBounds(msg.message_parameters_reference)
+        dSetList = self.metadataCache.getDatasets(bounds)
+        log.debug('findDataResources: cache contains %d candidate datasets' %len(dSetList))
         
         #
         # Iterate through this list getting those owned by the userID
@@ -320,7 +325,7 @@ class FindDataResources(object):
 
         log.debug('findDataResources: finalList has %d datasets' %len(finalList))
         
-        response = yield self.__getDataResources(msg, finalList, rspMsg, typeFlag = self.ALL)
+        response = yield self.__getDataResources(msg, finalList, rspMsg, typeFlag = self.ALL, bounds = bounds)
 
         defer.returnValue(response)
 
@@ -369,8 +374,13 @@ class FindDataResources(object):
         # the private __getDataResources() method.  Or, just store the IDs
         # of the datasets here instead of the metadata.
         #
-        dSetList = self.metadataCache.getDatasets()
-        log.debug('findDataResourcesByUser: cache contains %d datasets' %len(dSetList))
+        # Only the data sets which may be within the bounds come back from
+        # the cache; they are tested with isInBounds in __getDataResources()
+        #
+        bounds = SpatialTemporalBounds()
+        bounds.loadBounds(msg.message_parameters_reference)
+        dSetList = self.metadataCache.getDatasets(bounds)
+        log.debug('findDataResourcesByUser: cache contains %d candidate datasets' %len(dSetList))
         
         #
         # iterate through this list getting those owned by the userID
@@ -382,17 +392,18 @@ class FindDataResources(object):
                 
         log.debug('findDataResourcesByUser: ownedByList has %d datasets' %len(ownedByList))
 
-        response = yield self.__getDataResources(msg, ownedByList, rspMsg, typeFlag = self.BY_USER)
+        response = yield self.__getDataResources(msg, ownedByList, rspMsg, typeFlag = self.BY_USER, bounds = bounds)
         
         defer.returnValue(response)
 
 
     @defer.inlineCallbacks
-    def __getDataResources(self, msg, dSetList, rspMsg, typeFlag = ALL):
+    def __getDataResources(self, msg, dSetList, rspMsg, typeFlag = ALL, bounds = None):
         """
         Given the list of datasetIDs, determine in the data represented by
         the dataset is within the given spatial and temporal bounds, and
-        if so, add it to the response GPB.
+        if so, add it to the response GPB.  The bounds are loaded from the
+        message unless the caller has already loaded them.
         """
 
         log.debug('__getDataResources entry')        
@@ -400,8 +411,9 @@ class FindDataResources(object):
         # Instantiate a bounds object, and load it up with the given bounds
         # info
         #
-        bounds = SpatialTemporalBounds()
-        bounds.loadBounds(msg.message_parameters_reference)
+        if bounds is None:
+            bounds = SpatialTemporalBounds()
+            bounds.loadBounds(msg.message_parameters_reference)
         #userID = msg.message_parameters_reference.user_ooi_id       
         #
         # Now iterate through the list if dataset resource IDs and for each ID:
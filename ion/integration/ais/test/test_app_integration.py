@@ -159,7 +159,8 @@ class AppIntegrationTest(IonTestCase):
             {
                 'name':'identity_registry',
                 'module':'ion.services.coi.identity_registry',
-                'class':'IdentityRegistryService'
+                'class':'IdentityRegistryService',
+                'spawnargs':{'subject_store_class':'ion.core.data.store.Store'}
             },
             {
                 'name':'app_integration',
@@ -53,7 +53,8 @@ class NotificationAlertTest(IonTestCase):
             {
                 'name':'identity_registry',
                 'module':'ion.services.coi.identity_registry',
-                'class':'IdentityRegistryService'
+                'class':'IdentityRegistryService',
+                'spawnargs':{'subject_store_class':'ion.core.data.store.Store'}
             },
             
             {
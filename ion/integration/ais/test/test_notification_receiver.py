@@ -55,7 +55,8 @@ class NotificationReceiverTest(IonTestCase):
             {
                 'name':'identity_registry',
                 'module':'ion.services.coi.identity_registry',
-                'class':'IdentityRegistryService'
+                'class':'IdentityRegistryService',
+                'spawnargs':{'subject_store_class':'ion.core.data.store.Store'}
             },
             
             {
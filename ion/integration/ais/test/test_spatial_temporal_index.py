@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+"""
+@file ion/integration/ais/test/test_spatial_temporal_index.py
+@test ion.integration.ais.common.spatial_temporal_index
+@author David Stuebe
+@brief Test that a search of the index followed by isInBounds finds the same data sets as isInBounds on every data set
+"""
+
+import random
+from decimal import Decimal
+
+from twisted.trial import unittest
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from ion.integration.ais.common.spatial_temporal_bounds import SpatialTemporalBounds
+from ion.integration.ais.common.spatial_temporal_index import SpatialTemporalIndex, TIME_START, TIME_END, \
+    LAT_MIN, LAT_MAX, LON_MIN, LON_MAX, VERT_MIN, VERT_MAX
+
+
+class BoundsMessage(object):
+    """
+    Stands in for the bounds fields of a find data resources request message
+    """
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def IsFieldSet(self, name):
+        return name in self.__dict__
+
+
+def make_metadata(rand):
+    lat = sorted([rand.uniform(-90, 90), rand.uniform(-90, 90)])
+    lon = sorted([rand.uniform(-180, 180), rand.uniform(-180, 180)])
+    if rand.random() < 0.8:
+        # Mostly small data sets
+        lat[1] = min(90.0, lat[0] + rand.uniform(0, 5))
+        lon[1] = min(180.0, lon[0] + rand.uniform(0, 5))
+    vert = sorted([rand.uniform(-100, 1000), rand.uniform(-100, 1000)])
+    start = rand.randint(2000, 2010)
+    end = start + rand.randint(0, 2)
+
+    metadata = {
+        LAT_MIN:Decimal(str(lat[0])),
+        LAT_MAX:Decimal(str(lat[1])),
+        LON_MIN:Decimal(str(lon[0])),
+        LON_MAX:Decimal(str(lon[1])),
+        VERT_MIN:Decimal(str(vert[0])),
+        VERT_MAX:Decimal(str(vert[1])),
+        TIME_START:'%d-0%d-01T00:00:00Z' % (start, rand.randint(1, 9)),
+        TIME_END:'%d-0%d-01T00:00:00Z' % (end, rand.randint(1, 9)),
+        }
+
+    odd = rand.random()
+    if odd < 0.02:
+        metadata[LAT_MIN] = Decimal('NaN')
+    elif odd < 0.04:
+        del metadata[LON_MAX]
+    elif odd < 0.06:
+        metadata[TIME_START] = 'not a time'
+    elif odd < 0.08:
+        # A reversed time interval
+        metadata[TIME_START], metadata[TIME_END] = '2011-01-01T00:00:00Z', '2001-01-01T00:00:00Z'
+    elif odd < 0.10:
+        metadata[LON_MIN], metadata[LON_MAX] = Decimal('170'), Decimal('-170')
+
+    return metadata
+
+
+def make_bounds(rand):
+    fields = {}
+    if rand.random() < 0.7:
+        fields['minLatitude'] = rand.uniform(-90, 60)
+    if rand.random() < 0.7:
+        fields['maxLatitude'] = rand.uniform(-60, 90)
+    if rand.random() < 0.7:
+        fields['minLongitude'] = rand.uniform(-180, 150)
+    if rand.random() < 0.7:
+        fields['maxLongitude'] = rand.uniform(-150, 180)
+    if rand.random() < 0.5:
+        fields['minVertical'] = rand.uniform(-100, 500)
+        fields['maxVertical'] = rand.uniform(0, 1000)
+        fields['posVertical'] = rand.choice(['up', 'down', 'sideways'])
+    if rand.random() < 0.5:
+        fields['minTime'] = '%d-06-01T00:00:00Z' % rand.randint(2000, 2010)
+        fields['maxTime'] = '%d-01-01T00:00:00Z' % rand.randint(2000, 2012)
+
+    bounds = SpatialTemporalBounds()
+    bounds.loadBounds(BoundsMessage(**fields))
+    return bounds
+
+
+class SpatialTemporalIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rand = random.Random(1234)
+        self.index = SpatialTemporalIndex(cell_size=10)
+        self.metadata = {}
+        for i in range(500):
+            key = 'dataset_%d' % i
+            self.metadata[key] = make_metadata(self.rand)
+            self.index.add(key, self.metadata[key])
+
+    def _check(self, bounds):
+
+        expected = set([key for key, md in self.metadata.items() if bounds.isInBounds(md)])
+
+        candidates = self.index.search(bounds)
+        if candidates is None:
+            candidates = self.metadata.keys()
+        else:
+            self.assertTrue(candidates <= set(self.metadata.keys()))
+
+        found = set([key for key in candidates if bounds.isInBounds(self.metadata[key])])
+        self.assertEqual(found, expected)
+        return candidates
+
+    def test_search(self):
+
+        pruned = 0
+        for i in range(200):
+            candidates = self._check(make_bounds(self.rand))
+            if len(candidates) < len(self.metadata):
+                pruned += 1
+
+        # The index must actually prune something
+        self.assertTrue(pruned > 100)
+
+    def test_add_remove(self):
+
+        for i in range(250):
+            key = 'dataset_%d' % i
+            self.index.remove(key)
+            del self.metadata[key]
+
+        for i in range(100, 150):
+            # Replace the extent of a data set
+            key = 'dataset_%d' % (i + 250)
+            self.metadata[key] = make_metadata(self.rand)
+            self.index.add(key, self.metadata[key])
+
+        self.assertEqual(len(self.index), len(self.metadata))
+
+        for i in range(50):
+            self._check(make_bounds(self.rand))
+
+    def test_no_bounds(self):
+        bounds = SpatialTemporalBounds()
+        bounds.loadBounds(BoundsMessage())
+        self.assertEqual(self.index.search(bounds), None)
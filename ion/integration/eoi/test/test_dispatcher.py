@@ -113,7 +113,8 @@ class DispatcherTest(IonTestCase):
             {
                 'name':'identity_registry',
                 'module':'ion.services.coi.identity_registry',
-                'class':'IdentityRegistryService'
+                'class':'IdentityRegistryService',
+                'spawnargs':{'subject_store_class':'ion.core.data.store.Store'}
             },
             {
                 'name':'store_service',
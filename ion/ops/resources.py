@@ -1149,14 +1149,7 @@ class RepairBench(DataStoreWorkbench):
     @defer.inlineCallbacks
     def checkout(self, repo, cref):
 
-        def filtermethod(x):
-                """
-                Returns true if the passed in link's type is not in the excluded_types list of the passed in message.
-                """
-                return (x.type.GPBMessage not in repo.excluded_types)
-
-
-        yield self._get_blobs(repo, [cref.GetLink('objectroot').key, ], filtermethod)
+        yield self._get_blobs(repo, [cref.GetLink('objectroot').key, ], repo.excluded_types)
 
         defer.returnValue(cref.objectroot)
 
@@ -76,7 +76,8 @@ class HelloPolicyTest(IonTestCase):
             {'name':'resource_registry1','module':'ion.services.coi.resource_registry.resource_registry','class':'ResourceRegistryService',
              'spawnargs':{'datastore_service':'datastore'}},
             {'name':'association_service', 'module':'ion.services.dm.inventory.association_service', 'class':'AssociationService'},
-            {'name':'identity_registry','module':'ion.services.coi.identity_registry','class':'IdentityRegistryService'},
+            {'name':'identity_registry','module':'ion.services.coi.identity_registry','class':'IdentityRegistryService',
+             'spawnargs':{'subject_store_class':'ion.core.data.store.Store'}},
             {'name':'hello_policy','module':'ion.play.hello_policy','class':'HelloPolicy'}
         ]
 
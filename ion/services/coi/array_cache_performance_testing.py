@@ -0,0 +1,162 @@
+"""
+@file ion/services/coi/array_cache_performance_testing.py
+@author David Stuebe
+@brief Measure the decoded ndarray cache of the datastore with a workload of repeated, overlapping extractions.
+
+The ndarray blobs are held in an in memory store behind a simulated round trip. Each extraction reads a window of
+consecutive bounded arrays of one variable - a few popular variables (the axes) are read far more often than the rest,
+and several extractions run at the same time. Every array which is not cached is read from the store, parsed and
+converted to numpy as op_extract_data does.
+
+Run as a script:
+python ion/services/coi/array_cache_performance_testing.py -b 0,1000000,10000000,100000000 -x 200 -c 4
+"""
+
+import time
+import random
+from optparse import OptionParser
+
+import numpy
+
+from twisted.internet import defer, reactor, task
+
+from ion.core.data import store
+from ion.core.object import workbench, gpb_wrapper
+from ion.core.object.object_utils import CDM_ARRAY_FLOAT64_TYPE
+from ion.core.object.cdm_methods.bounded_array import ndarray_values_to_numpy
+from ion.services.coi.datastore import DecodedArrayCache
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class ArrayCachePerformanceTester:
+
+    def __init__(self, budgets, num_variables, num_arrays, array_size, num_extractions, window, concurrency, round_trip):
+
+        self.budgets = budgets
+        self.num_variables = num_variables
+        self.num_arrays = num_arrays
+        self.array_size = array_size
+        self.num_extractions = num_extractions
+        self.window = window
+        self.concurrency = concurrency
+        self.round_trip = round_trip
+
+        self.decodes = 0
+
+    def setup_store(self):
+        """
+        Put the ndarrays of every variable in an in memory store
+        @retval a list, per variable, of the keys of its bounded arrays
+        """
+        self.store = store.Store()
+        self.store.kvs = {}
+
+        wb = workbench.WorkBench('No Process Test')
+        variables = []
+        for v in range(self.num_variables):
+            keys = []
+            for a in range(self.num_arrays):
+                # Each array is the root of its own repository so that committing it hashes it into a blob
+                repo = wb.create_repository(CDM_ARRAY_FLOAT64_TYPE)
+                repo.root_object.value.extend([float(v * self.num_arrays + a + i) for i in xrange(self.array_size)])
+                repo.commit('Variable %d array %d' % (v, a))
+
+                element = repo.index_hash[repo.root_object.MyId]
+                self.store.kvs[element.key] = element.serialize()
+                keys.append(element.key)
+            variables.append(keys)
+
+        self.repo = wb.create_repository(CDM_ARRAY_FLOAT64_TYPE)
+        return variables
+
+    @defer.inlineCallbacks
+    def load(self, key):
+        """
+        Read, parse and convert one ndarray - what the datastore does for an array which is not cached
+        """
+        blob = yield self.store.get(key)
+        if self.round_trip > 0:
+            yield task.deferLater(reactor, self.round_trip, lambda: None)
+
+        self.decodes += 1
+        element = gpb_wrapper.StructureElement.parse_structure_element(blob, trusted=True)
+        ndarray = self.repo._load_element(element)
+        defer.returnValue(ndarray_values_to_numpy(ndarray.value, numpy.float64))
+
+    def workload(self, variables):
+        """
+        @retval a list of extractions - each a list of ndarray keys
+        """
+        rand = random.Random(2011)
+        popular = variables[:max(1, len(variables) / 10)]
+
+        extractions = []
+        for i in range(self.num_extractions):
+            # Nine in ten extractions read a popular variable
+            if rand.random() < 0.9:
+                keys = rand.choice(popular)
+            else:
+                keys = rand.choice(variables)
+
+            start = rand.randint(0, max(0, len(keys) - self.window))
+            extractions.append(keys[start:start + self.window])
+
+        return extractions
+
+    @defer.inlineCallbacks
+    def extract(self, cache, queue):
+        while queue:
+            keys = queue.pop()
+            for key in keys:
+                array = yield cache.get_array(key, self.load, key)
+                assert len(array) == self.array_size
+
+    @defer.inlineCallbacks
+    def runBenchMarks(self):
+        variables = self.setup_store()
+        extractions = self.workload(variables)
+
+        nbytes = self.num_variables * self.num_arrays * self.array_size * 8
+        print "%d variables of %d arrays of %d float64 (%d bytes decoded), %d extractions of %d arrays, %d at a time" % \
+            (self.num_variables, self.num_arrays, self.array_size, nbytes, len(extractions), self.window, self.concurrency)
+
+        for budget in self.budgets:
+            cache = DecodedArrayCache(budget)
+            self.decodes = 0
+
+            queue = list(reversed(extractions))
+            t1 = time.time()
+            yield defer.DeferredList([self.extract(cache, queue) for i in range(self.concurrency)], fireOnOneErrback=True)
+            t2 = time.time()
+
+            stats = cache.get_stats()
+            print "Budget %d bytes: %f seconds, %d decodes - hits %d, misses %d, shared %d, evictions %d, %d arrays %d bytes held" % \
+                (budget, t2 - t1, self.decodes, stats['hits'], stats['misses'], stats['shared'], stats['evictions'],
+                 stats['arrays'], stats['bytes'])
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-b", "--budgets", dest="budgets", default="0,1000000,10000000,100000000", help="Comma separated list of cache budgets in bytes - zero for no cache")
+    parser.add_option("-v", "--variables", dest="variables", default=20, help="The number of variables")
+    parser.add_option("-a", "--arrays", dest="arrays", default=10, help="The number of bounded arrays per variable")
+    parser.add_option("-s", "--size", dest="size", default=10000, help="The number of values in each bounded array")
+    parser.add_option("-x", "--extractions", dest="extractions", default=200, help="The number of extractions")
+    parser.add_option("-w", "--window", dest="window", default=4, help="The number of consecutive bounded arrays each extraction reads")
+    parser.add_option("-c", "--concurrency", dest="concurrency", default=4, help="The number of extractions running at a time")
+    parser.add_option("-t", "--round_trip", dest="round_trip", default=0.001, help="Simulated round trip time of a store read in seconds")
+    opts, args = parser.parse_args()
+
+    budgets = [int(x) for x in opts.budgets.split(',')]
+    tester = ArrayCachePerformanceTester(budgets, int(opts.variables), int(opts.arrays), int(opts.size),
+                                         int(opts.extractions), int(opts.window), int(opts.concurrency), float(opts.round_trip))
+
+    d = tester.runBenchMarks()
+    d.addErrback(log.error)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,7 @@ from ion.util.cache import LRUDict
 
 import ion.util.ionlog
 log = ion.util.ionlog.getLogger(__name__)
-from twisted.internet import defer
+from twisted.internet import defer, reactor
 
 import ion.util.procutils as pu
 from ion.core.process.process import ProcessFactory
@@ -23,20 +23,25 @@ from ion.core.process.service_process import ServiceProcess, ServiceClient
 from ion.core.exception import ReceivedError, ApplicationError, IonError
 
 from ion.services.coi.resource_registry import resource_client
+from ion.services.coi import hyperslab
 from ion.core.messaging.message_client import MessageClient
 from types import FunctionType
-import math
 
 from ion.core.object import object_utils
 from ion.core.object import gpb_wrapper, repository
-from ion.core.object.workbench import WorkBench, WorkBenchError, PUSH_MESSAGE_TYPE, PULL_MESSAGE_TYPE, PULL_RESPONSE_MESSAGE_TYPE, BLOBS_REQUSET_MESSAGE_TYPE, BLOBS_MESSAGE_TYPE, GET_OBJECT_REQUEST_MESSAGE_TYPE, GET_OBJECT_REPLY_MESSAGE_TYPE, GPBTYPE_TYPE, DATA_REQUEST_MESSAGE_TYPE, DATA_REPLY_MESSAGE_TYPE, DATA_CHUNK_MESSAGE_TYPE, GET_LCS_REQUEST_MESSAGE_TYPE, GET_LCS_RESPONSE_MESSAGE_TYPE
+from ion.core.object.cdm_methods import array_structure
+from ion.core.object.cdm_methods.bounded_array import NDARRAY_DTYPES, ndarray_values_to_numpy, get_ndarray_type
+from ion.core.object.workbench import WorkBench, WorkBenchError, PUSH_MESSAGE_TYPE, PUSH_KNOWN_COMMITS_HEADER, decode_known_commits, PULL_MESSAGE_TYPE, PULL_RESPONSE_MESSAGE_TYPE, BLOBS_REQUSET_MESSAGE_TYPE, BLOBS_MESSAGE_TYPE, GET_OBJECT_REQUEST_MESSAGE_TYPE, GET_OBJECT_REPLY_MESSAGE_TYPE, GPBTYPE_TYPE, DATA_REQUEST_MESSAGE_TYPE, DATA_REPLY_MESSAGE_TYPE, DATA_CHUNK_MESSAGE_TYPE, GET_LCS_REQUEST_MESSAGE_TYPE, GET_LCS_RESPONSE_MESSAGE_TYPE
 from ion.core.data import store
 from ion.core.data import cassandra
+from ion.core.data import cached_store
+from ion.core.data import coalescing_store
+from ion.core.data import sqlite_store
 #from ion.core.data import cassandra_bootstrap
 from ion.core.data.store import Query
 
 
-from ion.core.data.storage_configuration_utility import BLOB_CACHE, COMMIT_CACHE
+from ion.core.data.storage_configuration_utility import BLOB_CACHE, COMMIT_CACHE, CHILD_LINK_CACHE
 from ion.core.data.storage_configuration_utility import COMMIT_INDEXED_COLUMNS
 from ion.core.data.storage_configuration_utility import REPOSITORY_KEY, BRANCH_NAME
 
@@ -92,6 +97,7 @@ class NDArrayWrap(object):
         self._getblobs = getblobs
 
         self._ndarray = None
+        self._array = None
         if len(bounds) == 0:
             self._size = itembytes      # scalar value, just one itembytes size
         else:
@@ -109,6 +115,7 @@ class NDArrayWrap(object):
         Removes this ndarray from the associated repo to free memory.
         """
         log.debug("NDArrayWrap object clearing")
+        self._array = None
         # remove from repo's index_hash if it exists
         if self._repo.index_hash.has_key(self._key):
             del self._repo.index_hash[self._key]
@@ -120,7 +127,7 @@ class NDArrayWrap(object):
         the value property.
         """
         if self._ndarray is None:
-            ndblobs = yield self._getblobs(self._repo, [self._key], lambda x: True)
+            ndblobs = yield self._getblobs(self._repo, [self._key])
             self._repo.index_hash.update(ndblobs)
 
             self._ndarray = self._repo._load_element(self._repo.index_hash[self._key])
@@ -129,6 +136,18 @@ class NDArrayWrap(object):
 
     value = property(_get_value)
 
+    @defer.inlineCallbacks
+    def get_array(self, dtype):
+        """
+        Loads/retrieves the ndarray's value as a flat numpy array. The value is converted in one bulk conversion the
+        first time and kept for later calls.
+        """
+        if self._array is None:
+            value = yield self._get_value()
+            self._array = ndarray_values_to_numpy(value, dtype)
+
+        defer.returnValue(self._array)
+
 class NDArrayLRUDict(LRUDict):
     """
     Custom least-recently-used dictionary cache object for holding NDarrays.
@@ -162,21 +181,233 @@ class NDArrayLRUDict(LRUDict):
         value = yield ndarray.value
         defer.returnValue(value)
 
+    @defer.inlineCallbacks
+    def get_ndarray_array(self, key, bounds, itembytes, getblobs, dtype):
+        """
+        Gets an ndarray's value as a flat numpy array of dtype, like get_ndarray_value.
+        """
+        if not self.has_key(key):
+            ndarray = NDArrayWrap(key, self._repo, bounds, itembytes, getblobs)
+            self[key] = ndarray
+            log.debug("LRUDict loading, item size %d, lru now %d items %d bytes total" % (ndarray._size, len(self.keys()), self.total_size))
+        else:
+            ndarray = self.get(key)
+
+        array = yield ndarray.get_array(dtype)
+        defer.returnValue(array)
+
+class _DecodedArray(object):
+    """
+    An entry in the DecodedArrayCache - sized by the bytes of the array, and counted when the LRUDict evicts it.
+    """
+    __slots__ = ['array', 'cache']
+
+    def __init__(self, array, cache):
+        self.array = array
+        self.cache = cache
+
+    def __sizeof__(self):
+        return self.array.nbytes
+
+    def clear(self):
+        self.cache.evictions += 1
+        self.array = None
+
+class DecodedArrayCache(object):
+    """
+    Process wide cache of decoded ndarray values, keyed by the sha1 of the ndarray blob. Blobs never change, so a
+    decoded array stays valid for as long as it is held - across extract_data requests and shared by those running at
+    the same time. Concurrent requests for an array which is being loaded wait for that load rather than starting
+    their own.
+
+    The arrays handed out are read only.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        @param max_bytes The limit on the size of the cached arrays - zero for no cache.
+        """
+        self.max_bytes = max_bytes
+        self._arrays = LRUDict(max(max_bytes, 1), use_size=True)
+
+        # key -> the deferreds of requests waiting for the array to load
+        self._loading = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+
+    @defer.inlineCallbacks
+    def get_array(self, key, load, *args):
+        """
+        Get the decoded array of the ndarray blob with this key.
+        @param key The sha1 key of the ndarray blob.
+        @param load A callable returning a deferred numpy array, called with args if the array is not cached.
+        """
+        if self.max_bytes <= 0:
+            array = yield load(*args)
+            defer.returnValue(array)
+
+        entry = self._arrays.get(key)
+        if entry is not None:
+            self.hits += 1
+            defer.returnValue(entry.array)
+
+        if key in self._loading:
+            self.shared += 1
+            d = defer.Deferred()
+            self._loading[key].append(d)
+            array = yield d
+            defer.returnValue(array)
+
+        self.misses += 1
+        self._loading[key] = []
+        try:
+            array = yield load(*args)
+        except Exception, ex:
+            for d in self._loading.pop(key):
+                d.errback(ex)
+            raise
+
+        array.flags.writeable = False
+        # An array larger than the whole cache would flush it
+        if array.nbytes < self.max_bytes:
+            self._arrays[key] = _DecodedArray(array, self)
+
+        for d in self._loading.pop(key):
+            d.callback(array)
+
+        defer.returnValue(array)
+
+    def get_stats(self):
+        """
+        @retval a dictionary of the hit, miss, shared load and eviction counts and the size of the cache
+        """
+        return {'hits':self.hits,
+                'misses':self.misses,
+                'shared':self.shared,
+                'evictions':self.evictions,
+                'arrays':len(self._arrays),
+                'bytes':self._arrays.total_size,
+                'max_bytes':self.max_bytes}
+
+    def clear(self):
+        """
+        Drop the cached arrays - not counted as evictions.
+        """
+        evictions = self.evictions
+        self._arrays.clear()
+        self.evictions = evictions
+
 class DataStoreWorkBenchError(WorkBenchError):
     """
     An Exception class for errors in the data store workbench
     """
 
+
+# Headers of a flow controlled extract_data stream - the DataRequestMessage and DataChunkMessage are defined in
+# ionproto and have no fields for them.
+# Sent with the request: the initial number of chunk credits, and the largest chunk (in elements) the consumer wants
+EXTRACT_CREDITS_HEADER = 'extract-credits'
+EXTRACT_CHUNK_SIZE_HEADER = 'extract-chunk-size'
+# Sent with each chunk: the stream to grant credits to, and the process to send them to
+EXTRACT_STREAM_HEADER = 'extract-stream'
+EXTRACT_CREDIT_TO_HEADER = 'extract-credit-to'
+
+# Sent with a reduce_data request: the reduction to compute over the hyperslab, one of hyperslab.REDUCTIONS
+REDUCE_KIND_HEADER = 'reduce-kind'
+
+
+class ExtractCredits(object):
+    """
+    The chunk credits a consumer has granted to a flow controlled extract_data stream. The datastore takes a credit
+    before it builds each chunk, so it holds one chunk at a time and the consumer never has more chunks in flight
+    than it has granted, however large the extraction.
+    """
+
+    def __init__(self, credits, timeout=None):
+        """
+        @param credits The initial window of chunks.
+        @param timeout Seconds to wait for a credit before giving up on the consumer.
+        """
+        self.credits = credits
+        self.granted = credits
+        self.timeout = timeout
+
+        # Number of times the producer had to wait for the consumer
+        self.waits = 0
+
+        self._waiting = None
+        self._timer = None
+
+    def grant(self, credits):
+        """
+        Add credits - wakes the producer if it is waiting for one.
+        """
+        self.credits += credits
+        self.granted += credits
+
+        if self._waiting is not None and self.credits > 0:
+            self.credits -= 1
+            d = self._waiting
+            self._clear()
+            d.callback(None)
+
+    def take(self):
+        """
+        Take a credit.
+        @retval A deferred which fires when a credit has been taken, or fails with a DataStoreWorkBenchError after
+        the timeout.
+        """
+        assert self._waiting is None, 'Only one chunk is built at a time'
+
+        if self.credits > 0:
+            self.credits -= 1
+            return defer.succeed(None)
+
+        self.waits += 1
+        self._waiting = defer.Deferred()
+        if self.timeout:
+            self._timer = reactor.callLater(self.timeout, self._expire)
+        return self._waiting
+
+    def cancel(self):
+        """
+        Stop waiting - the stream is finished.
+        """
+        self._clear()
+
+    def _clear(self):
+        self._waiting = None
+        if self._timer is not None and self._timer.active():
+            self._timer.cancel()
+        self._timer = None
+
+    def _expire(self):
+        d = self._waiting
+        self._timer = None
+        self._waiting = None
+        d.errback(DataStoreWorkBenchError('Timed out waiting %s seconds for the consumer of the extract_data stream to grant a chunk credit' % self.timeout))
+
 class DataStoreWorkbench(WorkBench):
 
 
-    def __init__(self, process, blob_store, commit_store, cache_size=10**8):
+    def __init__(self, process, blob_store, commit_store, cache_size=10**8, link_store=None, array_cache_bytes=0):
 
         WorkBench.__init__(self, process, cache_size)
 
         self._blob_store = blob_store
         self._commit_store = commit_store
 
+        # The child links of each blob, by blob key - the object graph is walked on these instead of decoding the blobs
+        self._link_store = link_store
+
+        # Decoded ndarray values kept between extract_data requests
+        self._array_cache = DecodedArrayCache(array_cache_bytes)
+
+        # The credits of flow controlled extract_data streams in progress, by data routing key
+        self._extract_streams = {}
 
     def pull(self, *args, **kwargs):
 
@@ -187,30 +418,37 @@ class DataStoreWorkbench(WorkBench):
         raise NotImplementedError("The Datastore Service can not Push")
 
     @defer.inlineCallbacks
-    def _get_blobs(self, repo, startkeys, filtermethod=None):
+    def _get_blobs(self, repo, startkeys, excluded_types=None):
         """
         Common blob fetching helper method.
         Used by checkout and pull.
 
+        The graph is walked on the child links stored beside the blobs, so the blobs are not decoded. Blobs written
+        before the link store existed are decoded once and their links are stored then.
+
         @param  repo            Repository for the response.
         @param  startkeys       The keys that should start the fetching process.
-        @param  filtermethod    A callable to be applied to all children of fetched items. If the callable returns true,
-                                the item is included.
+        @param  excluded_types  GPBTypes of children which are not fetched.
 
         @returns                A dictionary of keys => blobs.
         """
         # Slightly different machinary here than in the workbench - Could be made more similar?
         blobs={}
         keys_to_get=set(startkeys)
-        def_filter = lambda x: True
-        filtermethod = filtermethod or def_filter
+        excluded = gpb_wrapper.type_ids(excluded_types or [])
 
-        objects = {}
         new_links_to_get = set()
         while len(keys_to_get) > 0:
             new_links_to_get.clear()
 
             batch_req = self._blob_store.new_batch_request()
+            link_req = None
+            if self._link_store is not None:
+                link_req = self._link_store.new_batch_request()
+
+            need_blobs = False
+            need_links = False
+
             #@TODO - put some error checking here so that we don't overflow due to a stupid request!
             for key in keys_to_get:
                 # Short cut if we have already got it!
@@ -218,47 +456,87 @@ class DataStoreWorkbench(WorkBench):
 
                 if wse:
                     blobs[wse.key]=wse
-                    # get the object
+                    if wse.child_links_known:
+                        continue
+                else:
+                    batch_req.add_request(key)
+                    need_blobs = True
 
-                    obj = repo._load_element(wse)
+                if link_req is not None:
+                    link_req.add_request(key)
+                    need_links = True
 
-                    objects[key] = obj
+            # Get the blobs and their links together
+            blobs_d = defer.succeed({})
+            if need_blobs:
+                blobs_d = self._blob_store.batch_get(batch_req)
 
-                    # only add new items to get if they meet our criteria, meaning they are not in the excluded type list
-                    new_links_to_get.update(obj.ChildLinks)
-                else:
-                    batch_req.add_request( key)
+            links_d = defer.succeed({})
+            if need_links:
+                links_d = self._link_store.batch_get(link_req)
 
-            result_dict = yield self._blob_store.batch_get(batch_req)
+            result_dict = yield blobs_d
+            links_dict = yield links_d
 
             for key, blob in result_dict.iteritems():
                 # these should never happen becuase we check for them above, but leaving them in for now...
                 assert blob is not None, 'Blob not found in blob store!'
 
-                wse = gpb_wrapper.StructureElement.parse_structure_element(blob)
+                wse = gpb_wrapper.StructureElement.parse_structure_element(blob, trusted=True)
                 blobs[wse.key]=wse
 
                 # Add it to the repository index
                 repo.index_hash[wse.key] = wse
 
-                # load the object so we can find its children
-                obj = repo._load_element(wse)
+            missing_links = []
+            for key in keys_to_get:
+                wse = blobs[key]
+                if wse.child_links_known:
+                    pass
 
-                new_links_to_get.update(obj.ChildLinks)
+                elif links_dict.get(key) is not None:
+                    # the links stored beside the blob
+                    wse.set_child_links(gpb_wrapper.decode_child_links(links_dict[key]))
 
-            keys_to_get.clear()
-            for link in new_links_to_get:
-                if not blobs.has_key(link.key) and filtermethod(link):
-                    keys_to_get.add(link.key)
+                else:
+                    # decode the blob to find its children
+                    missing_links.append(wse)
 
-            for obj in objects.itervalues():
-                obj.Invalidate()
+                new_links_to_get.update(wse.get_child_links())
+
+            if missing_links and self._link_store is not None:
+                log.debug('_get_blobs: storing the child links of %d blobs' % len(missing_links))
+                yield self._put_child_links(missing_links)
+
+            keys_to_get.clear()
+            for key, object_id, version in new_links_to_get:
+                # only add new items to get if they meet our criteria, meaning they are not in the excluded type list
+                if not blobs.has_key(key) and (object_id, version) not in excluded:
+                    keys_to_get.add(key)
 
-            objects.clear()
-            
         defer.returnValue(blobs)
         #return blobs
 
+    def _put_child_links(self, elements):
+        """
+        Store the child links of structure elements beside them - called wherever blobs are put. A leaf has no
+        children and is never decoded to find them, so no links are stored for it.
+        @param elements A list of StructureElements
+        @retval A deferred which fires when the links are stored
+        """
+        if self._link_store is None:
+            return defer.succeed(None)
+
+        batch_request = self._link_store.new_batch_request()
+        for element in elements:
+            if not element.isleaf:
+                batch_request.add_request(element.key, value=gpb_wrapper.encode_child_links(element.get_child_links()))
+
+        if len(batch_request) == 0:
+            return defer.succeed(None)
+
+        return self._link_store.batch_put(batch_request)
+
     @defer.inlineCallbacks
     def _resolve_repo_state(self, repository_key, fail_if_not_found=True, ncom=60):
         """
@@ -281,82 +559,50 @@ class DataStoreWorkbench(WorkBench):
         q = Query()
         q.add_predicate_eq(REPOSITORY_KEY, repository_key)
 
-        rows = yield self._commit_store.query(q)
-
-        if len(rows) == 0:
-
-            if fail_if_not_found:
-                self.clear_repository(repo)
-                raise DataStoreWorkBenchError('Repository Key "%s" not found in Datastore' % repository_key, 404)   # @TODO: constant
-
-            else:
-                # return early with the empty repository
-                log.info('_resolve_repo_state: complete - early!!!')
-
-                defer.returnValue(repo)
-
+        # Read the commits a page at a time - the head commits are loaded, and the values of up to ncom of the other
+        # commits which are not in the repository yet are kept for the walk through the ancestors
+        page_size = int(CONF.getValue('query_page_size', store.DEFAULT_QUERY_PAGE_SIZE))
+        cursor = self._commit_store.query_cursor(q, page_size=page_size)
 
         # Must reconstitute the head and merge with existing
         mutable_cls = object_utils.get_gpb_class_from_type_id(MUTABLE_TYPE)
         new_head = repo._wrap_message_object(mutable_cls(), addtoworkspace=False)
         new_head.repositorykey = repository_key
 
-
-        log.debug('Found %d commits in the store' % len(rows))
-
         # Make a copy of the commit_index to keep track of the cref objects that are already loaded.
         all_crefs = repo._commit_index.copy()
 
         # Keep track of the current heads...
         commits_front = set()
 
-        for key, columns in rows.items():
+        # The serialized ancestor commits read with the heads
+        paged_commits = {}
 
-            if columns[BRANCH_NAME]:
-                # If this appears to be a head commit
+        while not cursor.exhausted:
 
-                # Deal with the possibility that more than one branch points to the same commit
-                branch_names = columns[BRANCH_NAME].split(',')
+            rows = yield cursor.next_page()
 
-                for name in branch_names:
+            for key, columns in rows.iteritems():
 
-                    for branch in new_head.branches:
-                        # if the branch already exists in the new_head just add a commitref
-                        if branch.branchkey == name:
-                            link = branch.commitrefs.add()
-                            break
-                    else:
-                        # If not add a new branch
-                        branch = new_head.branches.add()
-                        branch.branchkey = name
-                        link = branch.commitrefs.add()
+                if columns[BRANCH_NAME]:
+                    self._add_head_commit(repo, new_head, key, columns, all_crefs, commits_front)
 
-                    if key not in repo._commit_index:
-
-                        if key not in repo.index_hash:
-                            blob = columns[VALUE]
-                            wse = gpb_wrapper.StructureElement.parse_structure_element(blob)
-                            repo.index_hash[key] = wse
-                        else:
-                            wse = repo.index_hash.get(key)
+                elif key not in repo.index_hash and len(paged_commits) < ncom:
+                    paged_commits[key] = columns[VALUE]
 
-                        cref = repo._load_element(wse)
+        if cursor.row_count == 0:
 
-                        ### DO NOT ADD IT TO THE COMMIT INDEX - THE STATE OF THE COMMIT INDEX IS USED IN UPDATING TO THE HEAD!
-                        #repo._commit_index[cref.MyId]=cref
-                        ### Add it to a separate dicationary of cref objects that we know about...
-                        all_crefs[key] = cref
-                        cref.ReadOnly = True
-
-                    else:
-                        cref = repo._commit_index.get(key)
+            if fail_if_not_found:
+                self.clear_repository(repo)
+                raise DataStoreWorkBenchError('Repository Key "%s" not found in Datastore' % repository_key, 404)   # @TODO: constant
 
-                    # Add all the commitrefs to the list to load from - makes the edge cases simpler...
-                    commits_front.add(cref)
+            else:
+                # return early with the empty repository
+                log.info('_resolve_repo_state: complete - early!!!')
 
+                defer.returnValue(repo)
 
-                    link.SetLink(cref)
-                    link.isleaf=False
+        log.debug('Found %d commits in the store' % cursor.row_count)
 
         if len(commits_front) is 0:
             raise DataStoreWorkBenchError('Found no head commits in datastore query for repository: %s' % repo.repository_key, 404)
@@ -373,6 +619,7 @@ class DataStoreWorkbench(WorkBench):
 
             early_exit = True
 
+            parent_keys = set()
             for cref in commits_front:
 
                 for pref in cref.parentrefs:
@@ -385,23 +632,40 @@ class DataStoreWorkbench(WorkBench):
 
                     # Any time we found a new parent - we have to keep looking for its parents...
                     early_exit = False
+                    parent_keys.add(key)
 
-                    if key not in repo.index_hash:
-                        columns = rows[key]
-                        blob = columns[VALUE]
-                        wse = gpb_wrapper.StructureElement.parse_structure_element(blob)
-                        repo.index_hash[key] = wse
-                    else:
-                        wse = repo.index_hash.get(key)
+            # Parse the parents which were read with the heads - get any others from the commit store in one batch
+            batch_request = self._commit_store.new_batch_request()
+            for key in parent_keys:
+                if key in repo.index_hash:
+                    continue
+
+                blob = paged_commits.pop(key, None)
+                if blob is not None:
+                    repo.index_hash[key] = gpb_wrapper.StructureElement.parse_structure_element(blob, trusted=True)
+                else:
+                    batch_request.add_request(key)
 
-                    parent = repo._load_element(wse)
+            if len(batch_request) > 0:
+                blobs = yield self._commit_store.batch_get(batch_request)
 
-                    ### Add it to the dictionary of cref objects that we know about...
-                    all_crefs[key] = parent
+                for key, blob in blobs.iteritems():
+                    if blob is None:
+                        raise DataStoreWorkBenchError('Parent commit "%s" not found in Datastore for repository: %s' % (key, repo.repository_key), 404)
 
-                    parent.ReadOnly = True
+                    wse = gpb_wrapper.StructureElement.parse_structure_element(blob, trusted=True)
+                    repo.index_hash[key] = wse
 
-                    new_front.add(parent)
+            for key in parent_keys:
+
+                parent = repo._load_element(repo.index_hash.get(key))
+
+                ### Add it to the dictionary of cref objects that we know about...
+                all_crefs[key] = parent
+
+                parent.ReadOnly = True
+
+                new_front.add(parent)
 
             commits_front = new_front
             new_front = set()
@@ -414,6 +678,53 @@ class DataStoreWorkbench(WorkBench):
         # return repository
         defer.returnValue(repo)
 
+    def _add_head_commit(self, repo, new_head, key, columns, all_crefs, commits_front):
+        """
+        Add a head commit found in the commit store to the new head of the repository
+        """
+        # Deal with the possibility that more than one branch points to the same commit
+        branch_names = columns[BRANCH_NAME].split(',')
+
+        for name in branch_names:
+
+            for branch in new_head.branches:
+                # if the branch already exists in the new_head just add a commitref
+                if branch.branchkey == name:
+                    link = branch.commitrefs.add()
+                    break
+            else:
+                # If not add a new branch
+                branch = new_head.branches.add()
+                branch.branchkey = name
+                link = branch.commitrefs.add()
+
+            if key not in repo._commit_index:
+
+                if key not in repo.index_hash:
+                    blob = columns[VALUE]
+                    wse = gpb_wrapper.StructureElement.parse_structure_element(blob, trusted=True)
+                    repo.index_hash[key] = wse
+                else:
+                    wse = repo.index_hash.get(key)
+
+                cref = repo._load_element(wse)
+
+                ### DO NOT ADD IT TO THE COMMIT INDEX - THE STATE OF THE COMMIT INDEX IS USED IN UPDATING TO THE HEAD!
+                #repo._commit_index[cref.MyId]=cref
+                ### Add it to a separate dicationary of cref objects that we know about...
+                all_crefs[key] = cref
+                cref.ReadOnly = True
+
+            else:
+                cref = repo._commit_index.get(key)
+
+            # Add all the commitrefs to the list to load from - makes the edge cases simpler...
+            commits_front.add(cref)
+
+
+            link.SetLink(cref)
+            link.isleaf=False
+
     @defer.inlineCallbacks
     def op_pull(self,request, headers, msg):
         """
@@ -464,13 +775,7 @@ class DataStoreWorkbench(WorkBench):
             keys = [x.GetLink('objectroot').key for x in repo.current_heads()]
 
 
-            def filtermethod(x):
-                """
-                Returns true if the passed in link's type is not in the excluded_types list of the passed in message.
-                """
-                return (x.type not in request.excluded_types)
-
-            blobs = yield self._get_blobs(response.Repository, keys, filtermethod)
+            blobs = yield self._get_blobs(response.Repository, keys, request.excluded_types)
 
             #log.critical( "OBJ GRAPH")
             #import objgraph
@@ -502,6 +807,29 @@ class DataStoreWorkbench(WorkBench):
 
 
 
+    @defer.inlineCallbacks
+    def _missing_known_commits(self, known_commits):
+        """
+        Find the known commits of a negotiated push which are not in the commit store. The blobs of a push are put
+        before its commits so the tree of any stored commit is already in the blob store.
+        @param known_commits a dictionary of repository key -> set of commit keys
+        @retval the set of commit keys which are missing
+        """
+        keys = set()
+        for commit_keys in known_commits.itervalues():
+            keys.update(commit_keys)
+
+        if not keys:
+            defer.returnValue(set())
+
+        batch_request = self._commit_store.new_batch_request()
+        for key in keys:
+            batch_request.add_request(key)
+
+        result = yield self._commit_store.batch_has_key(batch_request)
+
+        defer.returnValue(set([key for key in keys if not result[key]]))
+
     @defer.inlineCallbacks
     def op_push(self, pushmsg, headers, msg):
         """
@@ -514,6 +842,12 @@ class DataStoreWorkbench(WorkBench):
         if not hasattr(pushmsg, 'MessageType') or pushmsg.MessageType != PUSH_MESSAGE_TYPE:
             raise DataStoreWorkBenchError('Invalid push request. Bad Message Type!', pushmsg.ResponseCodes.BAD_REQUEST)
 
+        # A negotiated push only offers what is not reachable from the known commits - make sure we have them
+        known_commits = decode_known_commits(headers.get(PUSH_KNOWN_COMMITS_HEADER))
+        missing = yield self._missing_known_commits(known_commits)
+        if missing:
+            raise DataStoreWorkBenchError('Invalid push request. %d known commits not found in the datastore!' % len(missing), pushmsg.ResponseCodes.NOT_FOUND)
+
         # A dictionary of the new commits received in the push - sorted by repository
         new_commits={}
 
@@ -620,16 +954,19 @@ class DataStoreWorkbench(WorkBench):
 
         # Put any new blobs
         batch_request = self._blob_store.new_batch_request()
+        new_elements = []
         for key in new_blob_keys:
 
             element = self._workbench_cache.get(key)
 
             batch_request.add_request(key, value=element.serialize())
+            new_elements.append(element)
 
         try:
-            yield self._blob_store.batch_put(batch_request)
+            yield defer.DeferredList([self._blob_store.batch_put(batch_request), self._put_child_links(new_elements)],
+                                     fireOnOneErrback=True, consumeErrors=True)
 
-        except ex:
+        except defer.FirstError, ex:
             log.exception('Something went horrible wrong a batch_put operation!')
 
             for repostate in pushmsg.repositories:
@@ -806,11 +1143,14 @@ class DataStoreWorkbench(WorkBench):
 
         def_list = []
         batch_request = self._blob_store.new_batch_request()
+        elements = []
 
         for blob in request.blob_elements:
             batch_request.add_request(blob.key, blob.SerializeToString())
+            elements.append(gpb_wrapper.StructureElement(blob.GPBMessage))
 
         yield self._blob_store.batch_put(batch_request)
+        yield self._put_child_links(elements)
 
         yield self._process.reply_ok(message)
         log.info("op_put_blobs: Complete!")
@@ -849,7 +1189,7 @@ class DataStoreWorkbench(WorkBench):
             if blob is None:
                 raise DataStoreWorkBenchError('Invalid fetch objects request. Key Not Found!', request.ResponseCodes.NOT_FOUND)
 
-            element = gpb_wrapper.StructureElement.parse_structure_element(blob)
+            element = gpb_wrapper.StructureElement.parse_structure_element(blob, trusted=True)
             link = response.blob_elements.add()
             obj = response.Repository._wrap_message_object(element._element)
 
@@ -911,10 +1251,17 @@ class DataStoreWorkbench(WorkBench):
 
         # This is simpler than a push - all of these are guaranteed to be new objects!
         def_list = []
+        new_blobs = []
         for key, element in repo.index_hash.items():
 
             def_list.append(self._blob_store.put(key, element.serialize()))
 
+            # Commits are read from the commit store, never walked through their child links
+            if element.type != COMMIT_TYPE:
+                new_blobs.append(element)
+
+        def_list.append(self._put_child_links(new_blobs))
+
 
         # any objects in the data structure that were transmitted have already
         # been updated now it is time to set update the commits
@@ -1015,21 +1362,20 @@ class DataStoreWorkbench(WorkBench):
         defer.returnValue(len(rows)>0)
 
     @defer.inlineCallbacks
-    def op_extract_data(self, request, headers, message):
+    def _plan_extract_data(self, request, headers, opname):
         """
-        DataRequestMessage / DataReplyMessage
+        Load the array structure of a DataRequestMessage and plan the extraction of the hyperslab it asks for - shared
+        by op_extract_data and op_reduce_data.
+        @retval A tuple (repo, extraction plan, ndarray type, dtype, item size, chunk factor, cache limit). Each step of
+        the extraction plan is a list of strips, see hyperslab.py.
         """
-        log.info("op_extract_data")
-
         if not hasattr(request, 'MessageType') or request.MessageType != DATA_REQUEST_MESSAGE_TYPE:
-            raise DataStoreWorkBenchError('Invalid extract_data request. Bad Message Type!', request.ResponseCodes.BAD_REQUEST)
+            raise DataStoreWorkBenchError('Invalid %s request. Bad Message Type!' % opname, request.ResponseCodes.BAD_REQUEST)
 
         # verify there are no 0 strides in the request
         if 0 in [x.stride for x in request.request_bounds if x.IsFieldSet('stride')]:   # the if makes it so that unset strides don't even get in the list
             raise DataStoreWorkBenchError('Stride of 0 specified in request_bounds!')
 
-        response = yield self._process.message_client.create_instance(DATA_REPLY_MESSAGE_TYPE)
-
         log.debug("Extract data request bounds: %s", ["%d+%d,%d" % (x.origin, x.size, x.stride) for x in request.request_bounds])
 
         # create an anonymous repo to load things into
@@ -1045,7 +1391,7 @@ class DataStoreWorkbench(WorkBench):
                       CDM_ARRAY_OPAQUE_TYPE]
 
         # get some blobs into the repo
-        blobs = yield self._get_blobs(repo, [request.structure_array_ref], lambda x: x not in filterlist)
+        blobs = yield self._get_blobs(repo, [request.structure_array_ref], filterlist)
         repo.index_hash.update(blobs)
 
         # get element pointed to by key
@@ -1075,36 +1421,31 @@ class DataStoreWorkbench(WorkBench):
         # STEP 1: Match bounded arrays
         # ===================================================================
 
-        # iterate bounded arrays in this object
-        for ba in obj.bounded_arrays:
+        # the interval index over the bounds of the bounded arrays in this object - cached by the structure's key
+        bounds_index = array_structure.get_bounds_index(obj)
 
-            # need to be the same rank
-            if not len(ba.bounds) == len(request.request_bounds):
-                raise DataStoreWorkBenchError("Bounds dimensionality mismatch: this ba has %d dims, our request has %d" % (len(ba.bounds), len(request.request_bounds)))
+        # need to be the same rank
+        for rank in bounds_index.ranks:
+            if not rank == len(request.request_bounds):
+                raise DataStoreWorkBenchError("Bounds dimensionality mismatch: a ba has %d dims, our request has %d" % (rank, len(request.request_bounds)))
+
+        request_ranges = [(x.origin, x.origin + x.size) for x in request.request_bounds]
+
+        # iterate only the bounded arrays in this object which intersect the request
+        for position in bounds_index.intersecting(request_ranges):
+            ba = obj.bounded_arrays[position]
 
             target_range = []
             src_range = []
 
             # this for loop is doing a few things:
-            # - checking to see if the ranges intersect for each dimension.  If one does not intersect, the whole array
-            #   is rejected.
-            # - computing the intersection slices for each of those dimensions if they do intersect.
-            # - if we make it through the for without a rejection on a dimension, the else: clause is run, which marks
-            #   an array as being a required to copy array along with the ranges in both target and source.
+            # - computing the intersection slices for each dimension - the index guarantees they intersect.
+            # - once we make it through the for, the else: clause is run, which marks an array as being a required
+            #   to copy array along with the ranges in both target and source.
             for reqbounds, babounds in zip(request.request_bounds, ba.bounds):
 
                 #log.debug("Cur bounds: %d+%d, Req bounds: %d+%d" % (babounds.origin, babounds.size, reqbounds.origin, reqbounds.size))
 
-                # this bounds is below our target range
-                # requested end is lower than this bounds start (exclusive)
-                if reqbounds.origin + reqbounds.size <= babounds.origin:
-                    break
-
-                # this bounds is above our target range
-                # requested start is higher than this bounds end (exclusive)
-                if reqbounds.origin >= babounds.origin + babounds.size:
-                    break
-
                 # compute intersections and offsets into request and src bounded arrays
                 isec_start = max(babounds.origin, reqbounds.origin)
                 isec_end = min(babounds.origin + babounds.size, reqbounds.origin + reqbounds.size)
@@ -1131,8 +1472,14 @@ class DataStoreWorkbench(WorkBench):
         # could be many things.
         ITEM_SIZE = 8
 
+        # the numpy type values are gathered as - strings and opaque values have none, they are gathered as objects
+        dtype = object
+        ndarray_type = None
+
         if len(bounded_includes_list) > 0:
             ndarray_type = bounded_includes_list[0][0].GetLink('ndarray').type
+            dtype = NDARRAY_DTYPES.get(ndarray_type.object_id, object)
+
             # @TODO: cmon, the in syntax doesn't use the correct __eq__ overload or whatever? this is silly.
             if ndarray_type.object_id in [CDM_ARRAY_INT32_TYPE.object_id, CDM_ARRAY_UINT32_TYPE.object_id, CDM_ARRAY_FLOAT32_TYPE.object_id]:
                 ITEM_SIZE = 4
@@ -1157,6 +1504,11 @@ class DataStoreWorkbench(WorkBench):
         if ITEM_SIZE < 8:
             CHUNK_FACTOR = 16000
 
+        # the chunk size is negotiated - the consumer may ask for smaller chunks than the CHUNK_FACTOR, but not larger
+        requested_chunk_size = int(headers.get(EXTRACT_CHUNK_SIZE_HEADER, 0) or 0)
+        if 0 < requested_chunk_size < CHUNK_FACTOR:
+            CHUNK_FACTOR = requested_chunk_size
+
         log.debug("LRU Cache Limit set at %d bytes, CHUNK_FACTOR is %d elements" % (LRU_DICT_LIMIT, CHUNK_FACTOR))
 
         # ===================================================================
@@ -1177,100 +1529,24 @@ class DataStoreWorkbench(WorkBench):
             if len(targetshape) == 0:
                 striplist.append((ba, (0, 1), (0, 1), 1, 1))
             else:
-                # get slices out of it
-                # get dims of this bounded array
+                # get the slices of the fastest varying dimension out of it, splitting any larger than the CHUNK_FACTOR
                 ba_shape = [x.size for x in ba.bounds]
-
-                for targetslice, srcslice, laststridelen in self._get_slices(targetshape, ba_shape, targetranges, srcranges, strides):
-                    # make sure we do not exceed the CHUNK_FACTOR in a single strip here
-                    targetslicelen = targetslice[1] - targetslice[0]
-                    srcslicelen = srcslice[1] - srcslice[0]
-                    if targetslicelen > CHUNK_FACTOR:
-                        log.debug("target slice len (%d) exceeds CHUNK_FACTOR, splitting" % targetslicelen)
-
-                        upperbound = targetslicelen / CHUNK_FACTOR      # this is int division, we want to know about whole chunks only here, we'll catch leftovers below
-
-                        # figure out our chunk factor for the source as we may have striding applied
-                        src_chunk_factor = (srcslicelen * CHUNK_FACTOR) / targetslicelen
-
-                        log.debug("upperbound: %d, src chunk factor: %d" % (upperbound, src_chunk_factor))
-
-                        for i in xrange(upperbound):
-                            offset = i * CHUNK_FACTOR
-                            thislen = min(targetslicelen - offset, CHUNK_FACTOR)
-
-                            src_offset = i * src_chunk_factor
-                            src_len = min(srcslicelen - src_offset, src_chunk_factor)
-
-                            log.debug("Taking: # %d, offset %d, len %d (src: %d+%d)" % (i, offset, thislen, src_offset, src_len))
-
-                            # compute new src and target slices
-                            newtslice = (targetslice[0] + offset, targetslice[0] + offset + thislen)
-                            newsslice = (srcslice[0] + src_offset, srcslice[0] + src_offset + src_len)
-                            #log.debug("OLDTARSLICE: %s, SRCSLICE %s" % (str(targetslice), str(srcslice)))
-                            #log.debug("TARGETFLICE: %s, SRCSLICE %s" % (str(newtslice), str(newsslice)))
-                            striplist.append((ba, newtslice, newsslice, thislen, laststridelen))
-
-                        # get any remnants
-                        left = targetslicelen % CHUNK_FACTOR
-                        if left > 0:
-                            log.debug("Adding remainder of %d items" % left)
-
-                            src_left = srcslicelen % src_chunk_factor
-                            newtslice = (targetslice[1] - left, targetslice[1])
-                            newsslice = (srcslice[1] - src_left, srcslice[1])
-
-                            #log.debug("OLDTARSLICE: %s, SRCSLICE %s" % (str(targetslice), str(srcslice)))
-                            #log.debug("TARGETSLICE: %s, SRCSLICE %s" % (str(newtslice), str(newsslice)))
-                            striplist.append((ba, newtslice, newsslice, left, laststridelen))
-
-                    else:
-                        striplist.append((ba, targetslice, srcslice, targetslicelen, laststridelen))
+                slices = hyperslab.get_slices(targetshape, ba_shape, targetranges, srcranges, strides)
+                striplist.extend(hyperslab.split_strips(ba, slices, CHUNK_FACTOR))
 
         log.debug("Number of uncompressed strips: %d" % len(striplist))
 
         # ===================================================================
-        # STEP 4: Sort that list of matching strips by start index in target array to start index + length
+        # STEP 4: Sort that list of matching strips by start index in target array
         # ===================================================================
 
-        sorted_striplist = sorted(striplist, lambda x, y: x[1][1] < y[1][0])
+        sorted_striplist = hyperslab.sort_strips(striplist)
 
         # ===================================================================
         # STEP 5: Compress any contiguous strips from the same BAs
         # ===================================================================
-        compressed_striplist = []
-        accumstrip = None
-        for stripitem in sorted_striplist:
-            ba, targetslice, srcslice, leng, laststridelen = stripitem
-
-            # check for end condition
-            if accumstrip and ba != accumstrip[0]:
-                # push current strip into compressed striplist
-                compressed_striplist.append(accumstrip)
-                accumstrip = None
-
-            # brand new strip, either after we just pushed or starting this loop
-            if accumstrip is None:
-                accumstrip = stripitem[:]
-                continue
-
-            # see if we have a contiguous strip
-            # - current item's source slice start index is the same as the accumulated strip's source end index
-            # - strides are the same (should always be, this is more sanity check)
-            # - the possible accumulated strip's total length is over the max size for chunking messages
-            if srcslice[0] == accumstrip[2][1] and \
-               laststridelen == accumstrip[4] and \
-               accumstrip[3] + leng <= CHUNK_FACTOR:
-                # update accumstrip
-                accumstrip = (accumstrip[0], (accumstrip[1][0], targetslice[1]), (accumstrip[2][0], srcslice[1]), srcslice[1] - accumstrip[2][0], accumstrip[4])
-            else:
-                # not contiguous?  push into list and forget it
-                compressed_striplist.append(accumstrip)
-                accumstrip = stripitem[:]
 
-        # catch the last one
-        if accumstrip is not None:
-            compressed_striplist.append(accumstrip)
+        compressed_striplist = hyperslab.compress_strips(sorted_striplist, CHUNK_FACTOR)
 
         log.debug("Number of compressed strips: %d" % len(compressed_striplist))
 
@@ -1278,44 +1554,8 @@ class DataStoreWorkbench(WorkBench):
         # STEP 5b: find overlapping strips and omit them.
         # ===================================================================
 
-        # @TODO this is extremely naive and would benefit from better BA analysis/compression in step 1 or 2
-        # it's also O(n^2) which is crap.
-
-        non_overlap_striplist = []
-
-        # rule: if its in the striplist already, it wins.
-        for stripitem in compressed_striplist:
-            ba, targetslice, srcslice, leng, laststridelen = stripitem
-
-            # check to see if this targetslice has been taken care of already
-            for existing_stripitem in non_overlap_striplist:
-                nba, ntargetslice, nsrcslice, nleng, nlaststridelen = existing_stripitem
-
-                # since we're going linearly, we really only have to check the start of this new targetslice
-                if targetslice[0] >= ntargetslice[0] and targetslice[0] < ntargetslice[1]:
-                    # we have an intersection, figure out length of intersection
-                    intlen = ntargetslice[1] - targetslice[0]
-                    log.debug("intersection: %d, %d in %d, %d, len of %d" % (targetslice[0], targetslice[1], ntargetslice[0], ntargetslice[1], intlen))
-
-                    # decision point: if the whole intersection is covered already, throw it out
-                    if targetslice[0] + intlen >= targetslice[1]:
-                        log.debug("whole strip covered, not adding it")
-                        break # skips else clause of for
-                    else:
-                        # split the current strip item up
-                        targetslice = (targetslice[0] + intlen, targetslice[1])
-                        srcslice = (srcslice[0] + intlen * laststridelen, srcslice[1])  # src slice is always given without striding applied, so
-                                                                                        # when we update after a split we have to take that stride
-                                                                                        # into account.  If we've shaved off intlen items in target
-                                                                                        # coordinates, we need to shave off intlen * stride in source.
-                        leng = targetslice[1] - targetslice[0]
-
-                        log.debug("split slice into %d,%d -> %d,%d length %d" % (targetslice[0], targetslice[1], srcslice[0], srcslice[1], leng))
-            else:
-                # no break, means we either don't intersect at all, or we split up to not intersect
-                #log.debug("adding slice")
-                newstripitem = (ba, targetslice, srcslice, leng, laststridelen)
-                non_overlap_striplist.append(newstripitem)
+        # rule: the strip which starts first in the target wins - a sweep over the sorted strips trims the rest
+        non_overlap_striplist = hyperslab.remove_overlaps(compressed_striplist)
 
         if log.getEffectiveLevel() <= logging.DEBUG:
             lennonoverlap = len(non_overlap_striplist)
@@ -1329,34 +1569,38 @@ class DataStoreWorkbench(WorkBench):
         # STEP 6: Generate a list of extractions using heuristics, an "extraction plan"
         # ===================================================================
 
-        # list of [list of indicies into compressed_striplist]
-        extraction_plan = []
-
         # simple: relying on the LRU cache to free up BAs when done, and that datasets will be laid out in a sane
         # variety fastest varying dimension will never be broken up over multiple BAs unless dimensionality is one,
         # we can just assemble each step of the plan to be the maximum chunk size we can fit.
-        curstep = []
-        curlen = 0
-        for csidx, cstrip in enumerate(compressed_striplist):
-
-            # always need at least one strip
-            if len(curstep) == 0:
-                curstep.append(csidx)
-                curlen += cstrip[3]
-                continue
+        extraction_plan = hyperslab.plan_extraction(compressed_striplist, CHUNK_FACTOR)
 
-            # can we fit the new strip?
-            if curlen + cstrip[3] <= CHUNK_FACTOR:
-                curstep.append(csidx)
-                curlen += cstrip[3]
-            else:
-                extraction_plan.append(curstep)
-                curstep = [csidx]
-                curlen = cstrip[3]
+        defer.returnValue((repo, extraction_plan, ndarray_type, dtype, ITEM_SIZE, CHUNK_FACTOR, LRU_DICT_LIMIT))
+
+    @defer.inlineCallbacks
+    def _gather_step(self, curstrips, ndarray_cache, itemsize, dtype):
+        """
+        Get the values of one step of an extraction plan as a flat numpy array
+        """
+        # get/possibly load from ndarray_cache the values of each BA in this step
+        arrays = {}
+        for curstrip in curstrips:
+            ndarray_key = curstrip[0].GetLink('ndarray').key
+            if ndarray_key not in arrays:
+                arrays[ndarray_key] = yield self._array_cache.get_array(ndarray_key, ndarray_cache.get_ndarray_array, ndarray_key, curstrip[0].bounds, itemsize, self._get_blobs, dtype)
+
+        # one strided copy from each BA into the values for this chunk
+        defer.returnValue(hyperslab.gather(curstrips, lambda ba: arrays[ba.GetLink('ndarray').key]))
 
-        # catch any leftovers
-        if len(curstep) > 0:
-            extraction_plan.append(curstep)
+    @defer.inlineCallbacks
+    def op_extract_data(self, request, headers, message):
+        """
+        DataRequestMessage / DataReplyMessage
+        """
+        log.info("op_extract_data")
+
+        repo, extraction_plan, ndarray_type, dtype, ITEM_SIZE, CHUNK_FACTOR, LRU_DICT_LIMIT = yield self._plan_extract_data(request, headers, 'extract_data')
+
+        response = yield self._process.message_client.create_instance(DATA_REPLY_MESSAGE_TYPE)
 
         # ===================================================================
         # STEP 7: Perform extractions
@@ -1365,46 +1609,30 @@ class DataStoreWorkbench(WorkBench):
         # create a least-recently-used cache for ndarrays, using 5mb as the default max size
         ndarray_cache = NDArrayLRUDict(LRU_DICT_LIMIT, repo)
 
-        try:
-            for exidx, exstep in enumerate(extraction_plan):
-                curstrips = []
-                for sidx in exstep:
-                    curstrips.append(compressed_striplist[sidx])
-
-                # get the start index.. should be in the first item
-                targetstartidx = curstrips[0][1][0]
-
-                # calculate number of elements we are going to output in this chunk, create temp storage for it
-                elemcount = reduce(lambda x, y: x+y, [x[3] for x in curstrips])
-                targetndarray = [None] * elemcount
+        # flow control: a consumer which sends credits gets no more chunks than it has granted. It needs at least one
+        # chunk to learn where to send them.
+        credits = None
+        chunkheaders = {EXTRACT_CHUNK_SIZE_HEADER: CHUNK_FACTOR}
+        if EXTRACT_CREDITS_HEADER in headers:
+            credits = ExtractCredits(max(1, int(headers[EXTRACT_CREDITS_HEADER])), float(CONF.getValue('extract_credit_timeout', 60.0)))
+            self._extract_streams[request.data_routing_key] = credits
 
-                log.debug("Extraction step %d, # strips: %d, element count: %d, start index: %d" % (exidx, len(curstrips), elemcount, targetstartidx))
+            chunkheaders[EXTRACT_STREAM_HEADER] = request.data_routing_key
+            chunkheaders[EXTRACT_CREDIT_TO_HEADER] = str(self._process.id)
 
-                # ok, now we can perform the extractions on this step
-                targetoffset = 0
-                for curstrip in curstrips:
-                    ba, targetidxs, srcidxs, leng, stride = curstrip
-
-                    # get/possibly load from ndarray_cache
-                    ndobjval = yield ndarray_cache.get_ndarray_value(ba.GetLink('ndarray').key, ba.bounds, ITEM_SIZE, self._get_blobs)
+        try:
+            for exidx, curstrips in enumerate(extraction_plan):
 
-                    srcslice = ndobjval[srcidxs[0]:srcidxs[1]]
-                    if stride == 1:
-                        targetslice = srcslice
-                    else:
-                        targetslice = [d for i, d in enumerate(srcslice) if i % stride == 0]
+                # wait for the consumer before building the chunk, so only one is held here at a time
+                if credits is not None:
+                    yield credits.take()
 
-                    #log.debug("SETTING TNDARRAY[%d:%d]" % (targetoffset, targetoffset+leng))
-                    targetndarray[targetoffset:targetoffset+leng] = targetslice
+                # get the start index.. should be in the first item
+                targetstartidx = curstrips[0][1][0]
 
-                    # add length to target offset
-                    targetoffset += leng
+                log.debug("Extraction step %d, # strips: %d, element count: %d, start index: %d" % (exidx, len(curstrips), sum([x[3] for x in curstrips]), targetstartidx))
 
-                # ensure we filled this chunk
-                nonelist = [i for i,d in enumerate(targetndarray) if d is None]
-                if len(nonelist) > 0:
-                    log.error("extract_data: Nones found in targetndarray prior to send: %s" % str(nonelist))
-                    raise DataStoreWorkBenchError("Data extraction did not properly fill in all members of response ndarray!")
+                targetndarray = yield self._gather_step(curstrips, ndarray_cache, ITEM_SIZE, dtype)
 
                 # SEND THIS CHUNK
 
@@ -1420,13 +1648,12 @@ class DataStoreWorkbench(WorkBench):
                 # create the ndarray in this chunk
                 chunkndarray = chunkmsg.CreateObject(curstrips[0][0].GetLink('ndarray').type)
 
-                # these lines blow up with a TypeError if we screwed up the bounds and didn't fill in the targetarray fully,
-                # aka it contains Nones
-                chunkndarray.value[0:elemcount] = targetndarray[:]
+                # the gathered values already have the dtype of the ndarray - assign them in one bulk replace
+                chunkndarray.value._bulk_replace(targetndarray.tolist())
                 chunkmsg.ndarray = chunkndarray
 
                 # send this message to the passed in routing key
-                yield self._send_data_chunk(request.data_routing_key, chunkmsg)
+                yield self._send_data_chunk(request.data_routing_key, chunkmsg, chunkheaders)
         except Exception, ex:
             class FakeMsg(object):
                 pass
@@ -1435,132 +1662,100 @@ class DataStoreWorkbench(WorkBench):
                                 'protocol': 'rpc'}
             yield self._process.reply_err(fakemsg, exception=ex)
             raise ex
-            
-        self._process.reply_ok(message, response)
+        finally:
+            if credits is not None:
+                credits.cancel()
+                if credits.waits > 0:
+                    log.debug("op_extract_data: waited %d times for the consumer, %d credits granted" % (credits.waits, credits.granted))
+                del self._extract_streams[request.data_routing_key]
+
+        self._process.reply_ok(message, response, {EXTRACT_CHUNK_SIZE_HEADER: CHUNK_FACTOR})
         log.info("/op_extract_data")
-        
+
+    @defer.inlineCallbacks
+    def op_reduce_data(self, request, headers, message):
+        """
+        DataRequestMessage / DataChunkMessage
+        Reduce the hyperslab of a DataRequestMessage next to the data instead of sending it. The values are gathered
+        one step of the extraction plan at a time and folded into the reduction named by the reduce-kind header, so
+        no more than a chunk of the hyperslab is held at once. The reply is a single chunk whose ndarray holds the
+        min, max, sum, mean or count, or the values of the strided hyperslab for decimate.
+        """
+        log.info("op_reduce_data")
+
+        repo, extraction_plan, ndarray_type, dtype, ITEM_SIZE, CHUNK_FACTOR, LRU_DICT_LIMIT = yield self._plan_extract_data(request, headers, 'reduce_data')
+
+        kind = headers.get(REDUCE_KIND_HEADER)
+        try:
+            reduction = hyperslab.Reduction(kind, dtype)
+        except ValueError, ex:
+            raise DataStoreWorkBenchError('Invalid reduce_data request. %s' % str(ex), request.ResponseCodes.BAD_REQUEST)
+
+        if kind == hyperslab.REDUCE_DECIMATE:
+            # the decimated values are the answer - they must fit in one message and leave no holes in the target
+            targetsize = 1
+            for bounds in request.request_bounds:
+                targetsize *= -(-bounds.size // (bounds.stride or 1))
+
+            if targetsize * ITEM_SIZE > LRU_DICT_LIMIT:
+                raise DataStoreWorkBenchError('Invalid reduce_data request. %d decimated values is too many, use larger strides' % targetsize, request.ResponseCodes.BAD_REQUEST)
+
+            if sum([strip[3] for step in extraction_plan for strip in step]) != targetsize:
+                raise DataStoreWorkBenchError('Invalid reduce_data request. The bounded arrays do not cover the hyperslab to decimate', request.ResponseCodes.BAD_REQUEST)
+
+        ndarray_cache = NDArrayLRUDict(LRU_DICT_LIMIT, repo)
+
+        for curstrips in extraction_plan:
+            values = yield self._gather_step(curstrips, ndarray_cache, ITEM_SIZE, dtype)
+            reduction.add(values)
+
+        try:
+            result = reduction.result()
+        except ValueError, ex:
+            raise DataStoreWorkBenchError('Invalid reduce_data request. %s' % str(ex), request.ResponseCodes.BAD_REQUEST)
+
+        log.debug("op_reduce_data: %s of %d values in %d steps" % (kind, reduction.count, len(extraction_plan)))
+
+        response = yield self._process.message_client.create_instance(DATA_CHUNK_MESSAGE_TYPE)
+        response.seq_number = 0
+        response.seq_max = 1
+        response.start_index = 0
+        response.done = True
+
+        # min, max and decimate keep the type of the values - count, sum and mean may not
+        if ndarray_type is None or result.dtype != dtype:
+            ndarray_type = get_ndarray_type(result.dtype)
+
+        resultndarray = response.CreateObject(ndarray_type)
+        resultndarray.value._bulk_replace(result.tolist())
+        response.ndarray = resultndarray
+
+        self._process.reply_ok(message, response)
+        log.info("/op_reduce_data")
+
+    def op_extract_credit(self, content, headers, msg):
+        """
+        Grants chunk credits to a flow controlled extract_data stream. Sent (not an rpc) by the consumer of the stream
+        to the datastore process producing it, which receives it on its process queue while op_extract_data holds the
+        service queue.
+        """
+        stream = headers.get(EXTRACT_STREAM_HEADER)
+        credits = self._extract_streams.get(stream)
+        if credits is None:
+            log.debug("op_extract_credit: no extract_data stream %s in progress" % stream)
+            return
+
+        credits.grant(int(headers.get(EXTRACT_CREDITS_HEADER, 1)))
+
     @defer.inlineCallbacks
-    def _send_data_chunk(self, data_routing_key, chunkmsg):
+    def _send_data_chunk(self, data_routing_key, chunkmsg, headers=None):
         """
         Sends a data chunk message (from op_extract_data).  This is split out to facilitate
         testing via monkeypatching this method.
         """
         log.debug("_send_data_chunk to %s" % data_routing_key)
-        yield self._process.send(data_routing_key, 'noop', chunkmsg)
-
-
-    def _double_xrange(self, start1, end1, start2, end2):
-        """
-        This is a method just like xrange, but it operates on two diff ranges at once.
-        Used by extract_data when mapping slice ranges for data extraction.
-
-        @NOTE: This is a generator method, not to be confused with one that needs defer.inlineCallbacks decoration!
-        """
-        counter1 = start1
-        counter2 = start2
-        while counter1 < end1 and counter2 < end2:
-            yield (counter1, counter2)
-
-            counter1 += 1
-            counter2 += 1
-
-    def _get_slices(self, targetdimextents, srcdimextents, targetranges, srcranges, strides, targetidx=0, srcidx=0):
-        """
-        Returns a tuple of slice ranges (as tuples) that you can use to extract data from slices
-        inside an ndarray. This is used by extract_data.
-
-        @NOTE: This is a generator method, not to be confused with one that needs defer.inlineCallbacks decoration!
-
-        @param  targetdimextents    The dimensional extents of the target bounded array.
-        @param  srcdimextents       The dimensional extents of the source bounded array.
-        @param  targetranges        A list of tuples (one tuple per dimension), specifying a range in each
-                                    dimension that we are storing into.
-        @param  srcranges           A list of tuples (one tuple per dimension), specifying a range in each
-                                    dimension that we are pulling data out of.
-        @param  strides             A list of stride amounts for each dimension. Should be the same length
-                                    as targetranges/srcranges. The last dimension is not factored in here, but is
-                                    returned as the last member of the return tuple.
-        @param  targetidx           An accumulated index value into the target bounded array which gives the
-                                    current index calculated on each recursive call.
-        @param  srcidx              An accumulated index value into the source bounded array which gives the
-                                    current index calculated on each recursive call.
-
-        @returns                    On each yield, a tuple containing two tuples and an integer: a range to the target WITH
-                                    striding applied to all but the last dimension, a range to copy from the source WITHOUT
-                                    striding applied, and the stride length of the last dimension. 
-        """
-
-        # make sure we have sane things here
-        assert len(targetdimextents) == len(srcdimextents)
-        assert len(strides) == len(targetdimextents)
-
-        # build index extent arrays
-        targetidxextents = [None] * len(targetdimextents)
-        srcidxextents = [None] * len(srcdimextents)
-
-        targetidxextents[-1] = 1
-        srcidxextents[-1] = 1
-
-        # reduce target dim extents to extents after applying stride
-        striddentargetextents = [int(math.ceil(targetdimextents[i]/float(strides[i]))) for i in xrange(len(targetdimextents))]
-
-        # calculate index extents into target array, using stridden extents
-        for x in range(len(targetidxextents)-2, -1, -1):
-            targetidxextents[x] = reduce(lambda x,y: x*y, striddentargetextents[x+1:])
-
-        # calculate index extents into source array
-        for x in range(len(srcidxextents)-2, -1, -1):
-            srcidxextents[x] = reduce(lambda x, y: x*y, srcdimextents[x+1:])
-
-        def recslice(trs, srs, ts, ss, tstrides, cts=0, css=0, rc=0):
-            """
-            Recursive slice finder.
-            @param  trs     Target ranges.
-            @param  srs     Source ranges.
-            @param  ts      Target slice (last dimension).
-            @param  ss      Source slice (last dimension).
-            @param  tstrides List of strides in all dimensions.
-            @param  cts     Current target sum, aka index into target array.
-            @param  css     Current source sum, aka index into source array.
-            @param  rc      Recursion count, used to index into targetidxextents/srcidxextents.
-            """
-            if len(trs) == 0:
-                # exit case: traversed all dimensions, we're on the last dimension, extract our slices
-
-                slicetup = ((int(math.ceil(cts+ts[0]/float(tstrides[0]))),
-                             int(math.ceil(cts+ts[1]/float(tstrides[0])))),
-                             (css+ss[0], css+ss[1]),
-                             tstrides[0])
-                #log.debug("slicetuple: %s" % str(slicetup))
-                yield slicetup
-            else:
-                # iterative case: look at current dimension, co-iterate over the ranges in target/src,
-                #                 recurse into recslice again one dimension up until we run out.
-                ctr = trs[0]
-                csr = srs[0]
-                cstride = tstrides[0]
-
-                for tv, sv in self._double_xrange(ctr[0], ctr[1], csr[0], csr[1]):
-                    if tv % cstride == 0:
-                        for xx in recslice(trs[1:],
-                                           srs[1:],
-                                           ts,
-                                           ss,
-                                           tstrides[1:],
-                                           cts+(tv * targetidxextents[rc]),     # calculate actual index offset here and pass it
-                                           css+(sv * srcidxextents[rc]),        # calculate actual index offset here and pass it
-                                           rc+1):
-                            yield xx
-                    else:
-                        log.debug("IGNOREING STRIDED OUT DIM tv/sv %d,%d len dims %d" % (tv, sv, len(trs)))
+        yield self._process.send(data_routing_key, 'noop', chunkmsg, headers)
 
-        # iterate through all recslice generated slicepairs
-        for x in recslice(targetranges[:-1],
-                          srcranges[:-1],
-                          targetranges[-1],
-                          srcranges[-1],
-                          strides[:]):
-            yield x
 
     @defer.inlineCallbacks
     def op_get_object(self, request, headers, message):
@@ -1585,7 +1780,7 @@ class DataStoreWorkbench(WorkBench):
             @defer.inlineCallbacks
             def _fake_checkout_remote(commit, excluded_types):
                 link = commit.GetLink('objectroot')
-                yield self._get_blobs(repo, [link.key], lambda x: x.type not in excluded_types)
+                yield self._get_blobs(repo, [link.key], excluded_types)
 
                 # expects to return the root object, so load it again
                 element = repo.index_hash[link.key]
@@ -1615,7 +1810,7 @@ class DataStoreWorkbench(WorkBench):
         link = commit.GetLink('objectroot')
 
         # get blobs, update into response repository so we don't have to copy
-        blobs = yield self._get_blobs(response.Repository, [link.key], lambda x: x.type not in request.excluded_object_types)
+        blobs = yield self._get_blobs(response.Repository, [link.key], request.excluded_object_types)
         response.Repository.index_hash.update(blobs)
         repo.index_hash.update(blobs)
 
@@ -1679,6 +1874,18 @@ class DataStoreService(ServiceProcess):
 
         self._cache_size = self.spawn_args.get('cache_size', CONF.getValue('cache_size', default=10**8))
 
+        # Bytes of blob and commit values read from a cassandra backend to keep in memory - zero for no cache
+        self._blob_cache_bytes = int(self.spawn_args.get('blob_cache_bytes', CONF.getValue('blob_cache_bytes', default=5*10**7)))
+        self._commit_cache_bytes = int(self.spawn_args.get('commit_cache_bytes', CONF.getValue('commit_cache_bytes', default=10**7)))
+
+        # Bytes of decoded ndarray values to keep between extract_data requests - zero for no cache
+        self._array_cache_bytes = int(self.spawn_args.get('array_cache_bytes', CONF.getValue('array_cache_bytes', default=5*10**7)))
+
+        # Puts to a cassandra backend made within coalesce_delay seconds are written in one batch of up to
+        # coalesce_rows rows - zero rows to write each put on its own
+        self._coalesce_delay = float(self.spawn_args.get('coalesce_delay', CONF.getValue('coalesce_delay', default=0.005)))
+        self._coalesce_rows = int(self.spawn_args.get('coalesce_rows', CONF.getValue('coalesce_rows', default=500)))
+
         self._backend_classes={}
 
         log.info('conf username:%s' % CONF.getValue("username"))
@@ -1697,6 +1904,7 @@ class DataStoreService(ServiceProcess):
         
         self.c_store = None
         self.b_store = None
+        self.l_store = None
 
         # Get the configuration for cassandra - may or may not be used depending on the backend class
         self._storage_conf = get_cassandra_configuration()
@@ -1736,6 +1944,19 @@ class DataStoreService(ServiceProcess):
             self.c_store._query_attribute_names = set(query_attributes)
 
             yield self.register_life_cycle_object(self.c_store)
+
+            if self._coalesce_rows > 0:
+                self.c_store = coalescing_store.CoalescingIndexStore(self.c_store, delay=self._coalesce_delay, max_rows=self._coalesce_rows)
+
+            if self._commit_cache_bytes > 0:
+                # Only the commit values are cached - the branch names are index attributes which change
+                self.c_store = cached_store.CachedIndexStore(self.c_store, max_bytes=self._commit_cache_bytes)
+
+        elif issubclass(self._backend_classes[COMMIT_CACHE], sqlite_store.SqliteStore):
+            log.info("Instantiating Sqlite Index Store: %s" % self._backend_classes[COMMIT_CACHE])
+
+            keyspace = self._storage_conf[PERSISTENT_ARCHIVE]['name']
+            self.c_store = self._backend_classes[COMMIT_CACHE](keyspace, COMMIT_CACHE, indices=COMMIT_INDEXED_COLUMNS)
             
         else:
 
@@ -1761,6 +1982,30 @@ class DataStoreService(ServiceProcess):
             yield self.b_store.activate()
 
             yield self.register_life_cycle_object(self.b_store)
+
+            if self._coalesce_rows > 0:
+                self.b_store = coalescing_store.CoalescingStore(self.b_store, delay=self._coalesce_delay, max_rows=self._coalesce_rows)
+
+            if self._blob_cache_bytes > 0:
+                self.b_store = cached_store.CachedStore(self.b_store, max_bytes=self._blob_cache_bytes)
+
+            # The child links live in their own column family beside the blobs
+            self.l_store = self._backend_classes[BLOB_CACHE](self._username, self._password, storage_provider, keyspace, CHILD_LINK_CACHE)
+
+            yield self.l_store.initialize()
+            yield self.l_store.activate()
+
+            yield self.register_life_cycle_object(self.l_store)
+
+            if self._coalesce_rows > 0:
+                self.l_store = coalescing_store.CoalescingStore(self.l_store, delay=self._coalesce_delay, max_rows=self._coalesce_rows)
+
+        elif issubclass(self._backend_classes[BLOB_CACHE], sqlite_store.SqliteStore):
+            log.info("Instantiating Sqlite Store: %s" % self._backend_classes[BLOB_CACHE])
+
+            keyspace = self._storage_conf[PERSISTENT_ARCHIVE]['name']
+            self.b_store = self._backend_classes[BLOB_CACHE](keyspace, BLOB_CACHE)
+            self.l_store = self._backend_classes[BLOB_CACHE](keyspace, CHILD_LINK_CACHE)
         else:
 
             log.info("Clearing The In Memeory Store")
@@ -1771,13 +2016,17 @@ class DataStoreService(ServiceProcess):
             # Pass self for store service implementation
             self.b_store = self._backend_classes[BLOB_CACHE](self)
 
+            # Give the child links their own backend - the memory store is shared by default
+            self.l_store = self._backend_classes[BLOB_CACHE](self)
+            self.l_store.kvs = {}
+
         
         log.info("Created stores")
 
         self._old_workbench = self.workbench
         self.workbench.clear()
         # Create a specialized workbench for the datastore which has a persistent back end.
-        self.workbench = DataStoreWorkbench(self, self.b_store, self.c_store, cache_size=self._cache_size)
+        self.workbench = DataStoreWorkbench(self, self.b_store, self.c_store, cache_size=self._cache_size, link_store=self.l_store, array_cache_bytes=self._array_cache_bytes)
 
         # Replace the existing message client in the procss with a new one - that uses the new workbench
         # Not doing this was the source of a huge memory leak!
@@ -1797,6 +2046,8 @@ class DataStoreService(ServiceProcess):
         self.op_put_blobs = self.workbench.op_put_blobs
         self.op_get_object = self.workbench.op_get_object
         self.op_extract_data = self.workbench.op_extract_data
+        self.op_extract_credit = self.workbench.op_extract_credit
+        self.op_reduce_data = self.workbench.op_reduce_data
 
 
     @defer.inlineCallbacks
@@ -2161,12 +2412,49 @@ class DataStoreClient(ServiceClient):
         defer.returnValue(content)
 
     @defer.inlineCallbacks
-    def extract_data(self, content):
+    def extract_data(self, content, credits=None, chunk_size=None):
+        """
+        Extract a hyperslab of an array structure. The data is sent in chunks to the data_routing_key of the request.
+        @param credits If given, the stream is flow controlled: the datastore sends this many chunks and then only one
+        more for each credit granted with grant_extract_credits.
+        @param chunk_size If given, the largest chunk (in elements) to send - the datastore may send smaller ones.
+        """
+        yield self._check_init()
+
+        headers = {}
+        if credits is not None:
+            headers[EXTRACT_CREDITS_HEADER] = credits
+        if chunk_size is not None:
+            headers[EXTRACT_CHUNK_SIZE_HEADER] = chunk_size
+
+        (content, headers, msg) = yield self.rpc_send('extract_data', content, headers)
+        defer.returnValue(content)
+
+    @defer.inlineCallbacks
+    def reduce_data(self, content, kind):
+        """
+        Reduce a hyperslab of an array structure in the datastore instead of extracting it.
+        @param content A DataRequestMessage - the data_routing_key is not used.
+        @param kind The reduction - one of min, max, sum, mean, count or decimate (the values of the strided
+        hyperslab, for a preview).
+        @retval A DataChunkMessage whose ndarray holds the result.
+        """
         yield self._check_init()
 
-        (content, headers, msg) = yield self.rpc_send('extract_data', content)
+        (content, headers, msg) = yield self.rpc_send('reduce_data', content, {REDUCE_KIND_HEADER: kind})
         defer.returnValue(content)
 
+    def grant_extract_credits(self, chunk_headers, credits=1):
+        """
+        Grant chunk credits to a flow controlled extract_data stream. Called by the consumer of the data_routing_key
+        as it finishes with chunks.
+        @param chunk_headers The headers (payload) of a chunk message of the stream.
+        @param credits The number of chunks to grant.
+        """
+        headers = {EXTRACT_STREAM_HEADER: chunk_headers[EXTRACT_STREAM_HEADER],
+                   EXTRACT_CREDITS_HEADER: credits}
+        return self.proc.send(chunk_headers[EXTRACT_CREDIT_TO_HEADER], 'extract_credit', None, headers)
+
 #    @defer.inlineCallbacks
 #    def get_preloaded_datasets_dict(self):
 #        """
@@ -0,0 +1,95 @@
+"""
+@file ion/services/coi/extract_performance_testing.py
+@author David Stuebe
+@brief Compare the time to plan and gather an extract_data request with the numpy hyperslab functions against the
+recursive slice generator, pairwise overlap pass and element by element copy the datastore used before.
+
+The bounded arrays are numpy arrays in memory, so only the planning and the copy are timed - not loading the ndarrays
+or sending the chunks.
+
+Run as a script:
+python ion/services/coi/extract_performance_testing.py -s 100x100x100,20x200x200,1000x1000 -a 1,10,100 -n 3
+"""
+
+import time
+import random
+from optparse import OptionParser
+
+from ion.services.coi.test.test_hyperslab import split_layout, scan_extract, extract
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+CHUNK_FACTOR = 8000
+
+
+class ExtractPerformanceTester:
+
+    def __init__(self, shapes, array_counts, nrepeat):
+
+        self.shapes = shapes
+        self.array_counts = array_counts
+        self.nrepeat = nrepeat
+
+    def requests(self, shape):
+        """
+        @retval a list of (name, request, strides) - the whole array, a slab of the outer dimension, a column through
+        the inner dimensions and a strided subset
+        """
+        whole = [(0, size) for size in shape]
+        slab = [(size / 4, size / 2) for size in shape[:1]] + [(0, size) for size in shape[1:]]
+        column = [(0, size) for size in shape[:1]] + [(size / 2, 1) for size in shape[1:]]
+        strided = [(size / 8, size - size / 4) for size in shape]
+
+        return [('whole', whole, [1] * len(shape)),
+                ('slab', slab, [1] * len(shape)),
+                ('column', column, [1] * len(shape)),
+                ('strided', strided, [2] * len(shape))]
+
+    def time_extract(self, method, sources, request, strides):
+        t1 = time.time()
+        for i in range(self.nrepeat):
+            chunks = method(sources, request, strides, CHUNK_FACTOR)
+        t2 = time.time()
+        return chunks, (t2 - t1) / self.nrepeat
+
+    def runBenchMarks(self):
+        for shape in self.shapes:
+            for array_count in self.array_counts:
+                if array_count > shape[0]:
+                    continue
+
+                full, sources = split_layout(shape, 0, array_count)
+
+                for name, request, strides in self.requests(shape):
+                    chunks, new_time = self.time_extract(extract, sources, request, strides)
+                    nvalues = sum([len(values) for start, values in chunks])
+
+                    if strides == [1] * len(shape):
+                        old_chunks, old_time = self.time_extract(scan_extract, sources, request, strides)
+                        assert old_chunks == chunks, 'The numpy and the old extraction gave different chunks!'
+                        old = '%f seconds' % old_time
+                    else:
+                        # The old extraction did not place strided outer dimensions correctly
+                        old = 'not compared'
+
+                    print "Shape %s in %d arrays, %s request: %d values in %d chunks - numpy: %f seconds, old: %s" % \
+                        ('x'.join([str(x) for x in shape]), array_count, name, nvalues, len(chunks), new_time, old)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-s", "--shapes", dest="shapes", default="100x100x100,20x200x200,1000x1000", help="Comma separated list of array shapes, with dimensions separated by x")
+    parser.add_option("-a", "--arrays", dest="arrays", default="1,10,100", help="Comma separated list of the number of bounded arrays to split each shape into")
+    parser.add_option("-n", "--repeat", dest="repeat", default=3, help="The number of times to time each request")
+    opts, args = parser.parse_args()
+
+    shapes = [[int(x) for x in shape.split('x')] for shape in opts.shapes.split(',')]
+    array_counts = [int(x) for x in opts.arrays.split(',')]
+
+    random.seed(2011)
+    tester = ExtractPerformanceTester(shapes, array_counts, int(opts.repeat))
+    tester.runBenchMarks()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/coi/hyperslab.py
+@author David Stuebe
+@brief The strip planning and gather used by the datastore extract_data op, on numpy arrays. The strips of the fastest
+varying dimension are computed for all the outer dimensions of a bounded array at once, overlapping strips are trimmed
+in one sorted sweep, and the values for each run of strips from a bounded array are copied into the output with one
+strided take.
+
+A strip is a tuple (source, target slice, source slice, length, stride): the source is the bounded array, the target
+slice is a half open range in the flattened target with striding applied to all but the last dimension, the source
+slice is a half open range in the flattened source without striding applied, the length is the number of elements in
+the target and the stride is that of the last dimension.
+"""
+
+import operator
+
+import numpy
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+def _product(values):
+    return reduce(operator.mul, values, 1)
+
+
+def get_slices(targetdimextents, srcdimextents, targetranges, srcranges, strides):
+    """
+    Compute the slices of the fastest varying dimension to copy from a bounded array into the target - one for each
+    combination of the indices of the outer dimensions which are not strided out.
+
+    @param targetdimextents The dimensional extents of the target.
+    @param srcdimextents The dimensional extents of the source bounded array.
+    @param targetranges A list of (start, end) tuples, one per dimension, of the range in the target being filled.
+    @param srcranges A list of (start, end) tuples, one per dimension, of the range in the source being copied.
+    @param strides A list of strides, one per dimension.
+    @retval A list of (target slice, source slice, last stride) tuples in the order of the target
+    """
+    rank = len(targetdimextents)
+    assert len(srcdimextents) == rank
+    assert len(strides) == rank
+
+    # The target is indexed with striding applied, the source without
+    stridden = [_ceil_div(targetdimextents[i], strides[i]) for i in xrange(rank)]
+
+    target_offsets = numpy.zeros(1, dtype=numpy.int64)
+    src_offsets = numpy.zeros(1, dtype=numpy.int64)
+
+    for dim in xrange(rank - 1):
+        (tstart, tend), (sstart, send) = targetranges[dim], srcranges[dim]
+        length = max(0, min(tend - tstart, send - sstart))
+
+        tv = numpy.arange(tstart, tstart + length, dtype=numpy.int64)
+        sv = tv + (sstart - tstart)
+
+        # Skip the indices which are strided out of this dimension - the rest are at tv / stride in the target
+        keep = tv % strides[dim] == 0
+        tv = tv[keep] // strides[dim]
+        sv = sv[keep]
+
+        # Outer product with the offsets so far - the first dimension varies slowest
+        target_offsets = (target_offsets[:, numpy.newaxis] + tv * _product(stridden[dim + 1:])).ravel()
+        src_offsets = (src_offsets[:, numpy.newaxis] + sv * _product(srcdimextents[dim + 1:])).ravel()
+
+    (tstart, tend), (sstart, send), stride = targetranges[-1], srcranges[-1], strides[-1]
+
+    # The first element of the last dimension which is not strided out
+    first = _ceil_div(tstart, stride)
+    sstart += first * stride - tstart
+
+    target_starts = (target_offsets + first).tolist()
+    target_ends = (target_offsets + _ceil_div(tend, stride)).tolist()
+    src_starts = (src_offsets + sstart).tolist()
+    src_ends = (src_offsets + send).tolist()
+
+    return [((ts, te), (ss, se), stride) for ts, te, ss, se in zip(target_starts, target_ends, src_starts, src_ends)]
+
+
+def split_strips(source, slices, chunk_factor):
+    """
+    Make strips from the slices of a bounded array, splitting any which are longer than the chunk factor
+    @param source The bounded array the slices are taken from
+    @param slices A list of (target slice, source slice, last stride) tuples as returned by get_slices
+    @param chunk_factor The maximum number of elements in a strip
+    @retval A list of strips
+    """
+    strips = []
+    for targetslice, srcslice, laststridelen in slices:
+        targetslicelen = targetslice[1] - targetslice[0]
+        if targetslicelen <= chunk_factor:
+            strips.append((source, targetslice, srcslice, targetslicelen, laststridelen))
+            continue
+
+        # Every element of a strip is stride source elements on from the one before
+        for offset in xrange(0, targetslicelen, chunk_factor):
+            thislen = min(targetslicelen - offset, chunk_factor)
+            src_offset = srcslice[0] + offset * laststridelen
+
+            newtslice = (targetslice[0] + offset, targetslice[0] + offset + thislen)
+            newsslice = (src_offset, min(src_offset + thislen * laststridelen, srcslice[1]))
+            strips.append((source, newtslice, newsslice, thislen, laststridelen))
+
+    return strips
+
+
+def sort_strips(strips):
+    """
+    Order strips by their start in the target. The sort is stable, so strips from bounded arrays which start at the
+    same place keep the order of the bounded arrays.
+    """
+    return sorted(strips, key=lambda strip: strip[1][0])
+
+
+def compress_strips(strips, chunk_factor):
+    """
+    Join consecutive strips from the same bounded array which are contiguous in the source, up to the chunk factor
+    """
+    compressed = []
+    accumstrip = None
+    for stripitem in strips:
+        source, targetslice, srcslice, leng, laststridelen = stripitem
+
+        if accumstrip is not None and source != accumstrip[0]:
+            compressed.append(accumstrip)
+            accumstrip = None
+
+        if accumstrip is None:
+            accumstrip = stripitem
+            continue
+
+        # contiguous in the target, and the next element in the source with the stride applied
+        if targetslice[0] == accumstrip[1][1] and \
+           laststridelen == accumstrip[4] and \
+           srcslice[0] == accumstrip[2][0] + accumstrip[3] * laststridelen and \
+           accumstrip[3] + leng <= chunk_factor:
+            accumstrip = (accumstrip[0], (accumstrip[1][0], targetslice[1]), (accumstrip[2][0], srcslice[1]),
+                          accumstrip[3] + leng, accumstrip[4])
+        else:
+            compressed.append(accumstrip)
+            accumstrip = stripitem
+
+    if accumstrip is not None:
+        compressed.append(accumstrip)
+
+    return compressed
+
+
+def remove_overlaps(strips):
+    """
+    Trim the start of each strip past the part of the target already covered by the strips before it, dropping those
+    which are covered entirely. The strips must be ordered by their start in the target, so the covered part is
+    everything up to the largest end seen so far.
+    """
+    result = []
+    covered = None
+    for source, targetslice, srcslice, leng, laststridelen in strips:
+        if covered is not None and targetslice[0] < covered:
+            if covered >= targetslice[1]:
+                continue
+
+            # The source slice is not strided, so skipping n target elements skips n * stride source elements
+            intlen = covered - targetslice[0]
+            targetslice = (covered, targetslice[1])
+            srcslice = (srcslice[0] + intlen * laststridelen, srcslice[1])
+            leng = targetslice[1] - targetslice[0]
+
+        result.append((source, targetslice, srcslice, leng, laststridelen))
+
+        if covered is None or targetslice[1] > covered:
+            covered = targetslice[1]
+
+    return result
+
+
+def plan_extraction(strips, chunk_factor):
+    """
+    Group strips into the steps of an extraction plan - each step holds as many strips as fit in the chunk factor,
+    and always at least one
+    @retval A list of lists of strips
+    """
+    extraction_plan = []
+    curstep = []
+    curlen = 0
+    for strip in strips:
+        if curstep and curlen + strip[3] > chunk_factor:
+            extraction_plan.append(curstep)
+            curstep = []
+            curlen = 0
+
+        curstep.append(strip)
+        curlen += strip[3]
+
+    if curstep:
+        extraction_plan.append(curstep)
+
+    return extraction_plan
+
+
+def gather(strips, get_array):
+    """
+    Copy the values of a step of the extraction plan into one array. Each run of strips from the same bounded array
+    is copied with a single take of the strided source elements.
+
+    @param strips A list of strips
+    @param get_array A callable which returns the flat numpy array of values of the source of a strip
+    @retval A numpy array of the strided source values of each strip, one after another
+    """
+    # Runs of consecutive strips from the same bounded array
+    runs = []
+    for strip in strips:
+        if runs and runs[-1][0] is strip[0]:
+            runs[-1][1].append(strip)
+        else:
+            runs.append((strip[0], [strip]))
+
+    takes = []
+    total = 0
+    for source, run in runs:
+        values = get_array(source)
+
+        starts = numpy.array([strip[2][0] for strip in run], dtype=numpy.int64)
+        ends = numpy.minimum(numpy.array([strip[2][1] for strip in run], dtype=numpy.int64), len(values))
+        steps = numpy.array([strip[4] for strip in run], dtype=numpy.int64)
+
+        # The number of elements in values[start:end:step] for each strip
+        counts = numpy.maximum(0, _ceil_div(ends - starts, steps))
+        count = int(counts.sum())
+
+        # Element j of strip k is at starts[k] + j * steps[k], at position offsets[k] + j of the run
+        offsets = numpy.cumsum(counts) - counts
+        positions = numpy.arange(count, dtype=numpy.int64)
+        indices = numpy.repeat(starts - offsets * steps, counts) + positions * numpy.repeat(steps, counts)
+
+        takes.append((values, indices, total, count))
+        total += count
+
+    if takes:
+        dtype = takes[0][0].dtype
+    else:
+        dtype = numpy.float64
+
+    result = numpy.empty(total, dtype=dtype)
+    for values, indices, offset, count in takes:
+        if values.dtype == dtype:
+            numpy.take(values, indices, out=result[offset:offset + count])
+        else:
+            result[offset:offset + count] = values.take(indices)
+
+    return result
+
+
+# The reductions over the values of a hyperslab
+REDUCE_MIN = 'min'
+REDUCE_MAX = 'max'
+REDUCE_SUM = 'sum'
+REDUCE_MEAN = 'mean'
+REDUCE_COUNT = 'count'
+REDUCE_DECIMATE = 'decimate'
+
+REDUCTIONS = (REDUCE_MIN, REDUCE_MAX, REDUCE_SUM, REDUCE_MEAN, REDUCE_COUNT, REDUCE_DECIMATE)
+
+# The dtype sums are accumulated in, by the kind of the dtype of the values
+_SUM_DTYPES = {'i': numpy.dtype(numpy.int64),
+               'u': numpy.dtype(numpy.uint64),
+               'f': numpy.dtype(numpy.float64)}
+
+
+class Reduction(object):
+    """
+    A reduction of the values of a hyperslab, folded in one step of the extraction plan at a time so the hyperslab is
+    never held whole. Sums (and the sum for the mean) are accumulated in int64, uint64 or float64. The decimated values
+    are the strided hyperslab itself - the strides of the request do the decimation.
+    """
+
+    def __init__(self, kind, dtype):
+        """
+        @param kind One of REDUCTIONS
+        @param dtype The numpy dtype of the values
+        """
+        if kind not in REDUCTIONS:
+            raise ValueError('Unknown reduction "%s", must be one of %s' % (kind, REDUCTIONS))
+
+        dtype = numpy.dtype(dtype)
+        if kind in (REDUCE_SUM, REDUCE_MEAN) and dtype.kind not in _SUM_DTYPES:
+            raise ValueError('Can not %s values of dtype %s' % (kind, dtype))
+
+        self.kind = kind
+        self.dtype = dtype
+        self.count = 0
+        self.value = None
+        self._chunks = []
+
+    def add(self, values):
+        """
+        Fold the values of one step of the extraction plan into the reduction
+        @param values A flat numpy array
+        """
+        if len(values) == 0:
+            return
+
+        self.count += len(values)
+
+        if self.kind in (REDUCE_MIN, REDUCE_MAX):
+            # numpy.minimum and maximum propagate nans as the min and max of an array do - strings and opaque values
+            # are compared as python objects
+            if self.kind == REDUCE_MIN:
+                value = values.min()
+                combine = self.dtype.kind == 'O' and min or numpy.minimum
+            else:
+                value = values.max()
+                combine = self.dtype.kind == 'O' and max or numpy.maximum
+
+            if self.value is not None:
+                value = combine(self.value, value)
+            self.value = value
+
+        elif self.kind in (REDUCE_SUM, REDUCE_MEAN):
+            value = values.sum(dtype=_SUM_DTYPES[self.dtype.kind])
+            if self.value is not None:
+                value = self.value + value
+            self.value = value
+
+        elif self.kind == REDUCE_DECIMATE:
+            self._chunks.append(values)
+
+    def result(self):
+        """
+        @retval A numpy array of the result - one value, or the decimated values in the order of the target
+        """
+        if self.kind == REDUCE_COUNT:
+            return numpy.array([self.count], dtype=numpy.int64)
+
+        if self.kind == REDUCE_DECIMATE:
+            if not self._chunks:
+                return numpy.empty(0, dtype=self.dtype)
+            return numpy.concatenate(self._chunks)
+
+        if self.kind == REDUCE_SUM:
+            if self.value is None:
+                return numpy.zeros(1, dtype=_SUM_DTYPES[self.dtype.kind])
+            return numpy.array([self.value], dtype=_SUM_DTYPES[self.dtype.kind])
+
+        if self.value is None:
+            raise ValueError('No values to take the %s of' % self.kind)
+
+        if self.kind == REDUCE_MEAN:
+            return numpy.array([float(self.value) / self.count], dtype=numpy.float64)
+
+        return numpy.array([self.value], dtype=self.dtype)
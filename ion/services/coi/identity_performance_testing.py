@@ -0,0 +1,151 @@
+"""
+@file ion/services/coi/identity_performance_testing.py
+@author David Stuebe
+@brief Compare the time the identity registry takes to find a user by certificate subject when it pulls every identity
+resource and compares the subjects with the time it takes using the subject store.
+
+The association service and the resource registry are simulated by a fixed round trip time per call so that the
+benchmark runs without a container.
+
+Run as a script:
+python ion/services/coi/identity_performance_testing.py -i 100,1000,5000 -l 20 -t 0.002
+"""
+
+import time
+import random
+from optparse import OptionParser
+
+from twisted.internet import defer, reactor, task
+
+from ion.core.data import store
+from ion.services.coi.identity_registry import IdentityRegistryService
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class SimulatedIdRef(object):
+
+    def __init__(self, key):
+        self.key = key
+
+
+class SimulatedIdentity(object):
+
+    def __init__(self, key, subject):
+        self.ResourceIdentity = key
+        self.subject = subject
+
+
+class SimulatedResourceClient(object):
+    """
+    Returns the identity resource after one simulated round trip to the datastore
+    """
+
+    def __init__(self, identities, round_trip):
+        self.identities = identities
+        self.round_trip = round_trip
+        self.calls = 0
+
+    @defer.inlineCallbacks
+    def get_instance(self, ooi_id):
+        self.calls += 1
+        yield task.deferLater(reactor, self.round_trip, lambda: None)
+        defer.returnValue(self.identities[getattr(ooi_id, 'key', ooi_id)])
+
+
+class SimulatedIdentityRegistry(IdentityRegistryService):
+
+    def __init__(self, identities, round_trip):
+        IdentityRegistryService.__init__(self)
+        self.round_trip = round_trip
+        self.rc = SimulatedResourceClient(identities, round_trip)
+
+        # A private memory store in place of the cassandra subject store
+        self.subject_store = store.Store(self)
+        self.subject_store.kvs = {}
+
+    @defer.inlineCallbacks
+    def _findIdentities(self):
+        self.rc.calls += 1
+        yield task.deferLater(reactor, self.round_trip, lambda: None)
+        defer.returnValue([SimulatedIdRef(key) for key in self.rc.identities.keys()])
+
+    @defer.inlineCallbacks
+    def scan_find_user(self, Subject):
+        """
+        The old lookup - pull the identities one at a time until the subject matches
+        """
+        ooi_id_list = yield self._findIdentities()
+        for ooi_id in ooi_id_list:
+            Resource = yield self.rc.get_instance(ooi_id)
+            if Subject == Resource.subject:
+                defer.returnValue([Resource, ooi_id.key])
+
+        defer.returnValue([None, None])
+
+
+class IdentityPerformanceTester:
+
+    def __init__(self, identity_counts, num_lookups, round_trip):
+
+        self.identity_counts = identity_counts
+        self.num_lookups = num_lookups
+        self.round_trip = round_trip
+
+    @defer.inlineCallbacks
+    def measure(self, name, registry, method, subjects):
+
+        registry.rc.calls = 0
+        t1 = time.time()
+        for subject in subjects:
+            identity, ooi_id = yield method(subject)
+            assert identity.subject == subject
+        t2 = time.time()
+
+        print "%s: %d lookups - %f ms per lookup, %f datastore calls per lookup" % \
+            (name, len(subjects), (t2 - t1) * 1000.0 / len(subjects), float(registry.rc.calls) / len(subjects))
+
+    @defer.inlineCallbacks
+    def runBenchMarks(self):
+        rand = random.Random(1234)
+
+        for num_identities in self.identity_counts:
+            identities = {}
+            for i in xrange(num_identities):
+                key = 'identity-%d' % i
+                identities[key] = SimulatedIdentity(key, '/DC=org/DC=cilogon/C=US/O=Benchmark/CN=User %d' % i)
+
+            subjects = [identities[key].subject for key in rand.sample(identities.keys(), min(self.num_lookups, num_identities))]
+
+            print "Registry with %d identities" % num_identities
+            registry = SimulatedIdentityRegistry(identities, self.round_trip)
+
+            yield self.measure('Scan', registry, registry.scan_find_user, subjects)
+
+            registry.rc.calls = 0
+            t1 = time.time()
+            yield registry._migrateSubjectIndex()
+            t2 = time.time()
+            print "Index the subjects (once per subject store): %f seconds" % (t2 - t1)
+
+            yield self.measure('Subject store', registry, registry._findUser, subjects)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-i", "--identities", dest="identities", default="100,1000,5000", help="Comma separated list of the number of registered identities")
+    parser.add_option("-l", "--lookups", dest="lookups", default=20, help="The number of subjects to look up")
+    parser.add_option("-t", "--round_trip", dest="round_trip", default=0.002, help="Simulated round trip time of a datastore call in seconds")
+    opts, args = parser.parse_args()
+
+    identity_counts = [int(x) for x in opts.identities.split(',')]
+    tester = IdentityPerformanceTester(identity_counts, int(opts.lookups), float(opts.round_trip))
+
+    d = tester.runBenchMarks()
+    d.addErrback(log.error)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+if __name__ == "__main__":
+    main()
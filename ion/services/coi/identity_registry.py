@@ -24,6 +24,11 @@ from ion.services.dm.inventory.association_service import AssociationServiceClie
 from ion.services.coi.resource_registry.association_client import AssociationClient
 
 from ion.core.object import object_utils
+from ion.core.data import store
+from ion.core.data import cassandra
+from ion.core.data.storage_configuration_utility import IDENTITY_SUBJECT_CACHE
+from ion.core.data.storage_configuration_utility import get_cassandra_configuration, STORAGE_PROVIDER, PERSISTENT_ARCHIVE
+import ion.util.procutils as pu
 
 from ion.core.intercept.policy import subject_has_admin_role, \
                                       map_ooi_id_to_subject_admin_role, \
@@ -46,6 +51,9 @@ from ion.services.dm.inventory.association_service import PREDICATE_OBJECT_QUERY
 PREDICATE_REFERENCE_TYPE = object_utils.create_type_identifier(object_id=25, version=1)
 
 IDENTITY_TYPE = object_utils.create_type_identifier(object_id=1401, version=1)
+
+# Key in the subject store which records that every existing identity has been indexed
+SUBJECT_INDEX_COMPLETE = '__identity_subject_index_complete__'
 """
 from ion-object-definitions/net/ooici/services/coi/identity/identity_management.proto
 message UserIdentity {
@@ -228,18 +236,49 @@ class IdentityRegistryService(ServiceProcess):
 
         self.broadcast_count = 0
 
+        # The store which maps a certificate subject to the ooi_id of the identity
+        subject_store_class_name = self.spawn_args.get('subject_store_class', CONF.getValue('subject_store_class', default='ion.core.data.cassandra_bootstrap.CassandraStoreBootstrap'))
+        self.subject_store_class = pu.get_class(subject_store_class_name)
+
+        assert store.IStore.implementedBy(self.subject_store_class), \
+            'The back end class for the subject store passed to the identity registry does not implement the required IStore interface.'
+
+        self._username = self.spawn_args.get("username", CONF.getValue("username", None))
+        self._password = self.spawn_args.get("password", CONF.getValue("password",None))
+
+        # Get the configuration for cassandra - may or may not be used depending on the backend class
+        self._storage_conf = get_cassandra_configuration()
+
+        # Set once every identity which existed before the subject store is known to be in it
+        self._subject_index_complete = False
+
+    @defer.inlineCallbacks
     def slc_init(self):
         """
         """
         # Service life cycle state. Initialize service here. Can use yields.
 
-        # Can be called in __init__ or in slc_init... no yield required
         self.rc = ResourceClient(proc=self)
         self.asc = AssociationServiceClient(proc=self)
         self.ac = AssociationClient(proc=self)
         self.irc = IdentityRegistryClient(proc=self)
         #Response = yield self.mc.create_instance(RESOURCE_CFG_RESPONSE_TYPE, MessageName='IR response')
 
+        if issubclass(self.subject_store_class, cassandra.CassandraStore):
+            log.info("Instantiating Cassandra Subject Store")
+
+            storage_provider = self._storage_conf[STORAGE_PROVIDER]
+            keyspace = self._storage_conf[PERSISTENT_ARCHIVE]['name']
+
+            self.subject_store = self.subject_store_class(self._username, self._password, storage_provider, keyspace, IDENTITY_SUBJECT_CACHE)
+
+            yield self.register_life_cycle_object(self.subject_store)
+        else:
+            # A memory store is only for testing - it is not shared with other instances of the registry
+            self.subject_store = self.subject_store_class(self)
+            # Give this instance its own backend - the memory store is shared by default
+            self.subject_store.kvs = {}
+
     @defer.inlineCallbacks
     def slc_activate(self):
         # Setup broadcast channel (for policy reloading)
@@ -293,6 +332,8 @@ class IdentityRegistryService(ServiceProcess):
        
         yield self.rc.put_instance(identity, 'Adding identity %s' % identity.subject)
         log.debug('Commit completed, %s' % identity.ResourceIdentity)
+
+        yield self.subject_store.put(identity.subject, identity.ResourceIdentity)
         
         # Optionally map OOI ID to subject in admin role dictionary
         if subject_has_admin_role(identity.subject):
@@ -448,11 +489,11 @@ class IdentityRegistryService(ServiceProcess):
 
         identity, ooi_id = yield self._findUser(request.configuration.subject)
         if ooi_id != None:
-           log.debug('get_ooiid_for_user: ooi_id = '+ooi_id.key)
+           log.debug('get_ooiid_for_user: ooi_id = '+ooi_id)
            # Create the response object...
            Response = yield self.message_client.create_instance(RESOURCE_CFG_RESPONSE_TYPE, MessageName='IR response')
            Response.resource_reference = Response.CreateObject(USER_OOIID_TYPE)
-           Response.resource_reference.ooi_id = ooi_id.key
+           Response.resource_reference.ooi_id = ooi_id
            Response.result = "OK"
            defer.returnValue(Response)
         else:
@@ -631,10 +672,65 @@ class IdentityRegistryService(ServiceProcess):
     @defer.inlineCallbacks
     def _findUser(self, Subject):
         """
-        Implementation of User find that uses the registry and associations.
+        Find the identity with the given certificate subject using the subject store.
+        @retval a list of the identity resource and its ooi_id, or [None, None] if there is no such identity
         """
         log.debug('_findUser searching for "%s"' %Subject)
-        
+
+        if not self._subject_index_complete:
+            yield self._migrateSubjectIndex()
+
+        ooi_id = yield self.subject_store.get(Subject)
+
+        if ooi_id is None:
+            log.debug('subject %s not found'%Subject)
+            defer.returnValue([None, None])
+
+        Resource = yield self.rc.get_instance(ooi_id)
+        if Subject != getattr(Resource, 'subject'):
+            log.error('Subject store entry for "%s" refers to identity %s with subject "%s"' % (Subject, ooi_id, Resource.subject))
+            defer.returnValue([None, None])
+
+        log.debug('subject %s found'%Subject)
+        defer.returnValue([Resource, ooi_id])
+
+    @defer.inlineCallbacks
+    def _migrateSubjectIndex(self):
+        """
+        Identities which were created before the subject store existed, or which were preloaded, are not in it. The
+        first lookup after the registry starts checks whether the store has been indexed, and indexes it if not - with
+        a persistent store the scan runs only once.
+        """
+        complete = yield self.subject_store.get(SUBJECT_INDEX_COMPLETE)
+        if complete is None:
+            yield self._indexSubjects()
+        self._subject_index_complete = True
+
+    @defer.inlineCallbacks
+    def _indexSubjects(self):
+        """
+        Put the subject of every identity resource in the subject store - a scan of all the identities which is only
+        needed once for a new subject store.
+        """
+        log.info('Indexing the subjects of all identity resources')
+
+        ooi_id_list = yield self._findIdentities()
+
+        for ooi_id in ooi_id_list:
+            Resource = yield self.rc.get_instance(ooi_id)
+            # The first identity with a subject is the one which was always found
+            existing = yield self.subject_store.get(Resource.subject)
+            if existing is None:
+                yield self.subject_store.put(Resource.subject, ooi_id.key)
+
+        yield self.subject_store.put(SUBJECT_INDEX_COMPLETE, 'True')
+        log.info('Indexed the subjects of %d identity resources' % len(ooi_id_list))
+
+    @defer.inlineCallbacks
+    def _findIdentities(self):
+        """
+        @retval the list of references to all the identity resources
+        """
         # get all the identity resources out of the Association Service
         request = yield self.message_client.create_instance(PREDICATE_OBJECT_QUERY_TYPE)
         pair = request.pairs.add()
@@ -651,15 +747,7 @@ class IdentityRegistryService(ServiceProcess):
    
         ooi_id_list = yield self.asc.get_subjects(request)     
 
-        # Now we have a list of ooi_ids. Gotta pull and search them individually.
-        for ooi_id in ooi_id_list.idrefs:
-            Resource = yield self.rc.get_instance(ooi_id)
-            if Subject == getattr(Resource, 'subject'):
-                log.debug('subject %s found'%Subject)
-                defer.returnValue([Resource, ooi_id])
-
-        log.debug('subject %s not found'%Subject)
-        defer.returnValue([None, None])
+        defer.returnValue(ooi_id_list.idrefs)
 
 
     def _CheckRequest(self, request):
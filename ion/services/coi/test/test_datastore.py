@@ -7,6 +7,7 @@
 @author Matt Rodriguez
 """
 from twisted.trial import unittest
+import numpy
 from ion.core.exception import ReceivedContainerError, ReceivedApplicationError
 from ion.core.messaging.receiver import Receiver, WorkerReceiver
 from ion.core.process.process import Process
@@ -27,6 +28,7 @@ from ion.test.iontest import IonTestCase
 
 from ion.core.object import object_utils
 from ion.core.object import workbench
+from ion.core.object import gpb_wrapper
 
 from ion.core.data import cassandra_bootstrap
 from ion.core.data import storage_configuration_utility
@@ -37,6 +39,8 @@ from ion.core.data.storage_configuration_utility import BLOB_CACHE, COMMIT_CACHE
 from telephus.cassandra.ttypes import InvalidRequestException
 
 from ion.services.coi.datastore import ION_DATASETS_CFG, PRELOAD_CFG, ID_CFG, DataStoreClient, CDM_BOUNDED_ARRAY_TYPE
+from ion.services.coi.datastore import DataStoreWorkBenchError, ExtractCredits, EXTRACT_CHUNK_SIZE_HEADER, EXTRACT_CREDIT_TO_HEADER
+from ion.services.coi.datastore import DecodedArrayCache
 # Pick three to test existence
 from ion.services.coi.datastore_bootstrap.ion_preload_config import HAS_A_ID, DATASET_RESOURCE_TYPE_ID, ROOT_USER_ID, NAME_CFG, CONTENT_ARGS_CFG, PREDICATE_CFG, ION_RESOURCE_TYPES_CFG, ION_PREDICATES_CFG, ION_IDENTITIES_CFG, SAMPLE_PROFILE_DATA_SOURCE_ID
 
@@ -488,6 +492,67 @@ class DataStoreTest(IonTestCase):
 
         self.assertEqual(ab.title,'Datastore Addressbook')
 
+    @defer.inlineCallbacks
+    def test_child_links(self):
+
+        result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        # The child links of every blob are stored beside it - a leaf has none to store
+        wb_repo = self.wb1.workbench.get_repository(self.repo_key)
+        ab_key = wb_repo.root_object.MyId
+        link_store = self.ds1.workbench._link_store
+
+        for key, element in wb_repo.index_hash.iteritems():
+            if element.type == workbench.COMMIT_TYPE:
+                continue
+
+            record = yield link_store.get(key)
+            if element.isleaf:
+                self.assertEqual(record, None)
+            else:
+                self.assertNotEqual(record, None)
+                self.assertEqual(set([link[0] for link in gpb_wrapper.decode_child_links(record)]), element.ChildLinks)
+
+        self.ds1.workbench.clear()
+
+        # Walk the graph without loading any objects
+        load_repo = self.ds1.workbench.create_repository(addresslink_type)
+        def fail_load(element):
+            self.fail('_get_blobs should not load the blobs to find their children')
+        load_repo._load_element = fail_load
+
+        blobs = yield self.ds1.workbench._get_blobs(load_repo, [ab_key])
+
+        # The addressbook and two people - the phone numbers are part of the people
+        self.assertEqual(len(blobs), 3)
+
+        # The people are excluded along with their phone numbers
+        load_repo.index_hash.clear()
+        blobs = yield self.ds1.workbench._get_blobs(load_repo, [ab_key], [person_type])
+        self.assertEqual(blobs.keys(), [ab_key])
+        self.assertEqual(blobs[ab_key].child_links_known, True)
+
+    @defer.inlineCallbacks
+    def test_child_links_missing(self):
+
+        result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        ab_key = self.wb1.workbench.get_repository(self.repo_key).root_object.MyId
+
+        # Blobs written before the link store existed are decoded and their links are stored
+        self.ds1.workbench._link_store.kvs.clear()
+        self.ds1.workbench.clear()
+
+        load_repo = self.ds1.workbench.create_repository(addresslink_type)
+        blobs = yield self.ds1.workbench._get_blobs(load_repo, [ab_key])
+        self.assertEqual(len(blobs), 3)
+
+        for key, element in blobs.iteritems():
+            record = yield self.ds1.workbench._link_store.get(key)
+            self.assertEqual(record is None, element.isleaf)
+
     @defer.inlineCallbacks
     def test_push_clear_pull_again(self):
 
@@ -543,6 +608,61 @@ class DataStoreTest(IonTestCase):
         self.assertEqual(ab.title,'Datastore Addressbook')
 
 
+    @defer.inlineCallbacks
+    def test_push_update_clear_pull(self):
+
+        result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        repo = self.wb1.workbench.get_repository(self.repo_key)
+        self.assertEqual(repo.remote_commits.values(), [set([repo.commit_head.MyId])])
+
+        # The second push only offers the new commit and the changed blobs
+        repo.root_object.person[1].name = 'Johnny'
+        repo.commit('Changed a name')
+
+        result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        self.wb1.workbench.clear()
+        self.ds1.workbench.clear()
+
+        result = yield self.wb1.workbench.pull('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        repo = self.wb1.workbench.get_repository(self.repo_key)
+        ab = yield repo.checkout('master')
+
+        self.assertEqual(ab.title,'Datastore Addressbook')
+        self.assertEqual(ab.person[0].name,'David')
+        self.assertEqual(ab.person[1].name,'Johnny')
+
+    @defer.inlineCallbacks
+    def test_push_unknown_commits(self):
+
+        repo = self.wb1.workbench.get_repository(self.repo_key)
+
+        # A commit the datastore does not have - the push falls back to sending everything
+        targetname = self.wb1.get_scoped_name('system', 'datastore')
+        repo.remote_commits[targetname] = set([object_utils.sha1bin('not a commit')])
+
+        result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        self.assertEqual(repo.remote_commits[targetname], set([repo.commit_head.MyId]))
+
+        self.wb1.workbench.clear()
+        self.ds1.workbench.clear()
+
+        result = yield self.wb1.workbench.pull('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        repo = self.wb1.workbench.get_repository(self.repo_key)
+        ab = yield repo.checkout('master')
+
+        self.assertEqual(ab.title,'Datastore Addressbook')
+
+
     @defer.inlineCallbacks
     def test_push_clear_pull_branched(self):
 
@@ -1153,6 +1273,150 @@ class MulitDataStoreTest(IonTestCase):
 
 
 
+class ExtractCreditsTest(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def test_take_and_grant(self):
+        credits = ExtractCredits(2, timeout=5)
+
+        yield credits.take()
+        yield credits.take()
+        self.assertEqual(credits.credits, 0)
+
+        d = credits.take()
+        self.assertFalse(d.called)
+        self.assertEqual(credits.waits, 1)
+
+        credits.grant(2)
+        self.assertTrue(d.called)
+        self.assertEqual(credits.credits, 1)
+        self.assertEqual(credits.granted, 4)
+
+        # the timer is stopped once the credit arrives
+        self.assertEqual(credits._timer, None)
+        yield d
+
+    @defer.inlineCallbacks
+    def test_timeout(self):
+        credits = ExtractCredits(0, timeout=0.01)
+
+        try:
+            yield credits.take()
+        except DataStoreWorkBenchError:
+            pass
+        else:
+            self.fail('Taking a credit the consumer never granted should time out')
+
+    def test_cancel(self):
+        credits = ExtractCredits(0, timeout=5)
+        d = credits.take()
+        credits.cancel()
+        self.assertEqual(credits._timer, None)
+        self.assertFalse(d.called)
+
+
+class DecodedArrayCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loads = []
+        self.pending = {}
+
+    def load(self, key, size):
+        self.loads.append(key)
+        return defer.succeed(numpy.arange(size, dtype=numpy.float64))
+
+    def slow_load(self, key, size):
+        self.loads.append(key)
+        self.pending[key] = defer.Deferred()
+        self.pending[key].addCallback(lambda _: numpy.arange(size, dtype=numpy.float64))
+        return self.pending[key]
+
+    @defer.inlineCallbacks
+    def test_hit_and_miss(self):
+        cache = DecodedArrayCache(10**6)
+
+        a1 = yield cache.get_array('a', self.load, 'a', 100)
+        a2 = yield cache.get_array('a', self.load, 'a', 100)
+
+        self.assertIdentical(a1, a2)
+        self.assertEqual(self.loads, ['a'])
+        self.assertEqual(a1.flags.writeable, False)
+
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['arrays'], stats['bytes']), (1, 1, 1, 800))
+
+    @defer.inlineCallbacks
+    def test_evictions(self):
+        # room for two arrays of 100 float64
+        cache = DecodedArrayCache(1600)
+
+        for key in ['a', 'b', 'a', 'c', 'a', 'b']:
+            yield cache.get_array(key, self.load, key, 100)
+
+        # b is the least recently used when c arrives, then c when b comes back
+        self.assertEqual(self.loads, ['a', 'b', 'c', 'b'])
+
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 4, 2))
+        self.assertEqual(stats['bytes'], 1600)
+
+    @defer.inlineCallbacks
+    def test_shared_load(self):
+        cache = DecodedArrayCache(10**6)
+
+        d1 = cache.get_array('a', self.slow_load, 'a', 10)
+        d2 = cache.get_array('a', self.slow_load, 'a', 10)
+        self.assertFalse(d2.called)
+
+        self.pending['a'].callback(None)
+        a1 = yield d1
+        a2 = yield d2
+
+        self.assertIdentical(a1, a2)
+        self.assertEqual(self.loads, ['a'])
+        self.assertEqual(cache.get_stats()['shared'], 1)
+
+    @defer.inlineCallbacks
+    def test_failed_load(self):
+        cache = DecodedArrayCache(10**6)
+
+        d1 = cache.get_array('a', self.slow_load, 'a', 10)
+        d2 = cache.get_array('a', self.slow_load, 'a', 10)
+
+        self.pending['a'].errback(KeyError('a'))
+        yield self.failUnlessFailure(d1, KeyError)
+        yield self.failUnlessFailure(d2, KeyError)
+
+        # Nothing is cached - the next request loads again
+        yield cache.get_array('a', self.load, 'a', 10)
+        self.assertEqual(self.loads, ['a', 'a'])
+
+    @defer.inlineCallbacks
+    def test_oversized_array(self):
+        cache = DecodedArrayCache(1600)
+
+        yield cache.get_array('a', self.load, 'a', 100)
+        # 1600 bytes - as large as the whole cache, so it is not cached and a is not evicted
+        big = yield cache.get_array('b', self.load, 'b', 200)
+        yield cache.get_array('b', self.load, 'b', 200)
+        yield cache.get_array('a', self.load, 'a', 100)
+
+        self.assertEqual(big.flags.writeable, False)
+        self.assertEqual(self.loads, ['a', 'b', 'b'])
+
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 3, 0))
+        self.assertEqual((stats['arrays'], stats['bytes']), (1, 800))
+
+    @defer.inlineCallbacks
+    def test_no_cache(self):
+        cache = DecodedArrayCache(0)
+
+        yield cache.get_array('a', self.load, 'a', 10)
+        yield cache.get_array('a', self.load, 'a', 10)
+        self.assertEqual(self.loads, ['a', 'a'])
+
+
 class DataStoreExtractDataTest(IonTestCase):
     services = [
         {'name':'ds1','module':'ion.services.coi.datastore','class':'DataStoreService',
@@ -1296,11 +1560,12 @@ class DataStoreExtractDataTest(IonTestCase):
         self._def_done = defer.Deferred()   # this is called back in the handler when the "done" message comes through
 
         # patch up datastore's _send_data_chunk method
-        def fake_send_chunk(data_routing_key, chunkmsg):
+        def fake_send_chunk(data_routing_key, chunkmsg, headers=None):
             self._recv_data.append({'ndarray':      chunkmsg.ndarray.value[:],
                                     'start_index':  chunkmsg.start_index,
                                     'seq_number':   chunkmsg.seq_number,
-                                    'seq_max':      chunkmsg.seq_max})
+                                    'seq_max':      chunkmsg.seq_max,
+                                    'headers':      headers})
             if chunkmsg.done:
                 self._def_done.callback(True)
 
@@ -1377,6 +1642,189 @@ class DataStoreExtractDataTest(IonTestCase):
         # tear down datarec
         yield datarec.terminate()
 
+    @defer.inlineCallbacks
+    def test_flow_controlled_with_messaging(self):
+
+        self._granted = 3
+
+        # a slow consumer - it only grants a credit for the next chunk some time after receiving one
+        @defer.inlineCallbacks
+        def datahandler(data, msg):
+            content = data['content']
+
+            # the datastore must never send more chunks than have been granted
+            self.failUnless(len(self._recv_data) < self._granted)
+
+            self._recv_data.append({'ndarray': content.ndarray.value[:],
+                                    'start_index':content.start_index})
+            yield msg.ack()
+
+            if content.done:
+                self._def_done.callback(True)
+                return
+
+            yield pu.asleep(0.01)
+            self._granted += 1
+            # the stream headers are in the payload of the chunk message
+            yield self.dsc.grant_extract_credits(data)
+
+        consumer_config = { 'exchange' : 'magnet.topic',
+                'exchange_type' : 'topic',
+                'durable': False,
+                'auto_delete': True,
+                'mandatory': True,
+                'immediate': False,
+                'warn_if_exists': False,
+                'routing_key' : 'flow_data_listener',
+                'queue' : None,
+              }
+
+        datarec = WorkerReceiver('flow_data_listener', process=self.proc, scope=Receiver.SCOPE_GLOBAL, handler=datahandler, consumer_config=consumer_config)
+        yield datarec.attach()
+
+        self.ds1.workbench._send_data_chunk = self._old_send_chunk
+
+        msg = yield self.dsc.proc.message_client.create_instance(DATA_REQUEST_MESSAGE_TYPE)
+        msg.structure_array_ref = self.first_struct_as_key
+
+        for size in (15, 40, 200):
+            bounds = msg.request_bounds.add()
+            bounds.origin = 0
+            bounds.size = size
+
+        msg.data_routing_key = "flow_data_listener"
+
+        yield self.dsc.extract_data(msg, credits=3, chunk_size=2000)
+        yield self._def_done
+
+        # the consumer asked for smaller chunks
+        self.failUnlessEqual(len(self._recv_data), 200*40*15 / 2000)
+        for chunk in self._recv_data:
+            self.failUnless(len(chunk['ndarray']) <= 2000)
+
+        counter = 0
+        for ndarray in (x['ndarray'] for x in self._recv_data):
+            for data in ndarray:
+                self.failUnlessEqual(int(data), counter)
+                counter += 1
+        self.failUnlessEqual(counter, 200*40*15)
+
+        # the stream is gone once the extraction is done
+        self.failUnlessEqual(self.ds1.workbench._extract_streams, {})
+
+        yield datarec.terminate()
+
+    @defer.inlineCallbacks
+    def test_negotiated_chunk_size(self):
+
+        msg = yield self.dsc.proc.message_client.create_instance(DATA_REQUEST_MESSAGE_TYPE)
+        msg.structure_array_ref = self.first_struct_as_key
+
+        for size in (15, 40, 200):
+            bounds = msg.request_bounds.add()
+            bounds.origin = 0
+            bounds.size = size
+
+        msg.data_routing_key = "data_listener"
+
+        # a larger chunk than the datastore sends is capped
+        yield self.dsc.extract_data(msg, chunk_size=10**6)
+        yield self._def_done
+
+        for chunk in self._recv_data:
+            self.failUnlessEqual(chunk['headers'][EXTRACT_CHUNK_SIZE_HEADER], 8000)
+            self.failUnless(len(chunk['ndarray']) <= 8000)
+
+            # not flow controlled
+            self.failIf(EXTRACT_CREDIT_TO_HEADER in chunk['headers'])
+
+        totalelems = sum([len(x['ndarray']) for x in self._recv_data])
+        self.failUnlessEquals(totalelems, 200*40*15)
+
+    @defer.inlineCallbacks
+    def test_array_cache(self):
+
+        msg = yield self.dsc.proc.message_client.create_instance(DATA_REQUEST_MESSAGE_TYPE)
+        msg.structure_array_ref = self.second_struct_as_key
+
+        for size in (4, 20, 20, 20):
+            bounds = msg.request_bounds.add()
+            bounds.origin = 0
+            bounds.size = size
+
+        msg.data_routing_key = "data_listener"
+
+        yield self.dsc.extract_data(msg)
+        yield self._def_done
+
+        # Each of the four bounded arrays is decoded once
+        stats = self.ds1.workbench._array_cache.get_stats()
+        self.failUnlessEqual(stats['misses'], 4)
+        hits = stats['hits']
+        first = [x['ndarray'] for x in self._recv_data]
+
+        # The same extraction again is served from the decoded arrays
+        self._recv_data = []
+        self._def_done = defer.Deferred()
+
+        yield self.dsc.extract_data(msg)
+        yield self._def_done
+
+        stats = self.ds1.workbench._array_cache.get_stats()
+        self.failUnlessEqual(stats['misses'], 4)
+        self.failUnless(stats['hits'] >= hits + 4)
+        self.failUnlessEqual([x['ndarray'] for x in self._recv_data], first)
+
+    @defer.inlineCallbacks
+    def test_reduce_data(self):
+
+        msg = yield self.dsc.proc.message_client.create_instance(DATA_REQUEST_MESSAGE_TYPE)
+        msg.structure_array_ref = self.second_struct_as_key
+
+        # crosses three of the bounded arrays, strided in the inner dimensions
+        bounds = msg.request_bounds.add()
+        bounds.origin = 1
+        bounds.size = 3
+
+        for stride in (1, 2, 3):
+            bounds = msg.request_bounds.add()
+            bounds.origin = 2
+            bounds.size = 15
+            bounds.stride = stride
+
+        msg.data_routing_key = "data_listener"
+
+        # the full extracted array to check the reductions against
+        yield self.dsc.extract_data(msg)
+        yield self._def_done
+
+        full = []
+        for ndarray in (x['ndarray'] for x in self._recv_data):
+            full.extend(ndarray)
+        full = numpy.array(full)
+        self.failUnlessEqual(full.size, 3 * 15 * 8 * 5)
+        chunks = len(self._recv_data)
+
+        expected = {'min': full.min(),
+                    'max': full.max(),
+                    'sum': full.sum(),
+                    'mean': full.mean(),
+                    'count': full.size}
+
+        for kind, value in expected.items():
+            reply = yield self.dsc.reduce_data(msg, kind)
+            self.failUnless(reply.done)
+            self.failUnlessEqual(len(reply.ndarray.value), 1)
+            self.assertAlmostEqual(reply.ndarray.value[0], value)
+
+        reply = yield self.dsc.reduce_data(msg, 'decimate')
+        self.failUnlessEqual(reply.ndarray.value[:], full.tolist())
+
+        # the reductions are made next to the data - no chunks are sent
+        self.failUnlessEqual(len(self._recv_data), chunks)
+
+        yield self.failUnlessFailure(self.dsc.reduce_data(msg, 'median'), ReceivedApplicationError)
+
     @defer.inlineCallbacks
     def test_full_one_ba(self):
 
@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/coi/test/test_hyperslab.py
+@author David Stuebe
+@test ion.services.coi.hyperslab Check the numpy strip planning and gather against the element by element extraction
+it replaced in the datastore, on synthetic bounded array layouts
+"""
+
+import math
+import random
+
+import numpy
+from twisted.trial import unittest
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from ion.services.coi import hyperslab
+
+
+class Source(object):
+    """
+    Stands in for a bounded array - origins and sizes of its bounds and a flat array of values
+    """
+
+    def __init__(self, origins, shape, values):
+        self.origins = origins
+        self.shape = shape
+        self.values = values
+
+
+def intersections(sources, request):
+    """
+    Step 1 of extract_data - the target and source ranges of each source which intersects the request
+    @param request a list of (origin, size) tuples
+    """
+    includes = []
+    for source in sources:
+        target_range = []
+        src_range = []
+        for (rorigin, rsize), origin, size in zip(request, source.origins, source.shape):
+            isec_start = max(origin, rorigin)
+            isec_end = min(origin + size, rorigin + rsize)
+            if isec_start >= isec_end:
+                break
+            target_range.append((isec_start - rorigin, isec_end - rorigin))
+            src_range.append((isec_start - origin, isec_end - origin))
+        else:
+            includes.append((source, target_range, src_range))
+    return includes
+
+
+def scan_get_slices(targetdimextents, srcdimextents, targetranges, srcranges, strides):
+    """
+    The recursive slice generator the datastore used
+    """
+    targetidxextents = [None] * len(targetdimextents)
+    srcidxextents = [None] * len(srcdimextents)
+    targetidxextents[-1] = 1
+    srcidxextents[-1] = 1
+
+    striddentargetextents = [int(math.ceil(targetdimextents[i]/float(strides[i]))) for i in xrange(len(targetdimextents))]
+    for x in range(len(targetidxextents)-2, -1, -1):
+        targetidxextents[x] = reduce(lambda x,y: x*y, striddentargetextents[x+1:])
+    for x in range(len(srcidxextents)-2, -1, -1):
+        srcidxextents[x] = reduce(lambda x, y: x*y, srcdimextents[x+1:])
+
+    def recslice(trs, srs, ts, ss, tstrides, cts=0, css=0, rc=0):
+        if len(trs) == 0:
+            yield ((int(math.ceil(cts+ts[0]/float(tstrides[0]))), int(math.ceil(cts+ts[1]/float(tstrides[0])))),
+                   (css+ss[0], css+ss[1]),
+                   tstrides[0])
+        else:
+            ctr = trs[0]
+            csr = srs[0]
+            cstride = tstrides[0]
+            tv, sv = ctr[0], csr[0]
+            while tv < ctr[1] and sv < csr[1]:
+                if tv % cstride == 0:
+                    for xx in recslice(trs[1:], srs[1:], ts, ss, tstrides[1:],
+                                       cts+(tv * targetidxextents[rc]), css+(sv * srcidxextents[rc]), rc+1):
+                        yield xx
+                tv += 1
+                sv += 1
+
+    for x in recslice(targetranges[:-1], srcranges[:-1], targetranges[-1], srcranges[-1], strides[:]):
+        yield x
+
+
+def scan_remove_overlaps(strips):
+    """
+    The pairwise overlap pass the datastore used
+    """
+    non_overlap_striplist = []
+    for stripitem in strips:
+        ba, targetslice, srcslice, leng, laststridelen = stripitem
+        for existing_stripitem in non_overlap_striplist:
+            nba, ntargetslice, nsrcslice, nleng, nlaststridelen = existing_stripitem
+            if targetslice[0] >= ntargetslice[0] and targetslice[0] < ntargetslice[1]:
+                intlen = ntargetslice[1] - targetslice[0]
+                if targetslice[0] + intlen >= targetslice[1]:
+                    break
+                else:
+                    targetslice = (targetslice[0] + intlen, targetslice[1])
+                    srcslice = (srcslice[0] + intlen * laststridelen, srcslice[1])
+                    leng = targetslice[1] - targetslice[0]
+        else:
+            non_overlap_striplist.append((ba, targetslice, srcslice, leng, laststridelen))
+    return non_overlap_striplist
+
+
+def scan_split_strips(source, targetslice, srcslice, laststridelen, chunk_factor):
+    """
+    The splitting of strips longer than the chunk factor the datastore used
+    """
+    targetslicelen = targetslice[1] - targetslice[0]
+    srcslicelen = srcslice[1] - srcslice[0]
+    if targetslicelen <= chunk_factor:
+        return [(source, targetslice, srcslice, targetslicelen, laststridelen)]
+
+    strips = []
+    upperbound = targetslicelen / chunk_factor
+    src_chunk_factor = (srcslicelen * chunk_factor) / targetslicelen
+    for i in xrange(upperbound):
+        offset = i * chunk_factor
+        thislen = min(targetslicelen - offset, chunk_factor)
+        src_offset = i * src_chunk_factor
+        src_len = min(srcslicelen - src_offset, src_chunk_factor)
+        strips.append((source, (targetslice[0] + offset, targetslice[0] + offset + thislen),
+                       (srcslice[0] + src_offset, srcslice[0] + src_offset + src_len), thislen, laststridelen))
+
+    left = targetslicelen % chunk_factor
+    if left > 0:
+        src_left = srcslicelen % src_chunk_factor
+        strips.append((source, (targetslice[1] - left, targetslice[1]), (srcslice[1] - src_left, srcslice[1]), left, laststridelen))
+    return strips
+
+
+def scan_compress_strips(strips, chunk_factor):
+    """
+    The compression of contiguous strips the datastore used
+    """
+    compressed_striplist = []
+    accumstrip = None
+    for stripitem in strips:
+        ba, targetslice, srcslice, leng, laststridelen = stripitem
+        if accumstrip and ba != accumstrip[0]:
+            compressed_striplist.append(accumstrip)
+            accumstrip = None
+        if accumstrip is None:
+            accumstrip = stripitem[:]
+            continue
+        if srcslice[0] == accumstrip[2][1] and laststridelen == accumstrip[4] and accumstrip[3] + leng <= chunk_factor:
+            accumstrip = (accumstrip[0], (accumstrip[1][0], targetslice[1]), (accumstrip[2][0], srcslice[1]), srcslice[1] - accumstrip[2][0], accumstrip[4])
+        else:
+            compressed_striplist.append(accumstrip)
+            accumstrip = stripitem[:]
+    if accumstrip is not None:
+        compressed_striplist.append(accumstrip)
+    return compressed_striplist
+
+
+def scan_extract(sources, request, strides, chunk_factor):
+    """
+    Steps 3 to 7 of extract_data as the datastore used to run them - the old sort left the strips in the order they
+    were generated, and values were copied one element at a time into a list. The extraction plan did not change and
+    is shared.
+    @retval a list of (start index, values) for each chunk
+    """
+    targetshape = [size for origin, size in request]
+    striplist = []
+    for source, targetranges, srcranges in intersections(sources, request):
+        for targetslice, srcslice, laststridelen in scan_get_slices(targetshape, source.shape, targetranges, srcranges, strides):
+            striplist.extend(scan_split_strips(source, targetslice, srcslice, laststridelen, chunk_factor))
+
+    strips = scan_remove_overlaps(scan_compress_strips(striplist, chunk_factor))
+
+    # The values of an ndarray were a python list
+    lists = dict([(id(source), source.values.tolist()) for source in sources])
+
+    chunks = []
+    for step in hyperslab.plan_extraction(strips, chunk_factor):
+        elemcount = sum([strip[3] for strip in step])
+        targetndarray = [None] * elemcount
+        targetoffset = 0
+        for source, targetidxs, srcidxs, leng, stride in step:
+            srcslice = lists[id(source)][srcidxs[0]:srcidxs[1]]
+            targetndarray[targetoffset:targetoffset+leng] = [d for i, d in enumerate(srcslice) if i % stride == 0]
+            targetoffset += leng
+
+        if None in targetndarray:
+            raise ValueError('Nones found in targetndarray')
+        chunks.append((step[0][1][0], targetndarray))
+
+    return chunks
+
+
+def plan(sources, request, strides, chunk_factor):
+    """
+    Steps 3 to 6 of extract_data as the datastore runs them now
+    """
+    targetshape = [size for origin, size in request]
+    striplist = []
+    for source, targetranges, srcranges in intersections(sources, request):
+        slices = hyperslab.get_slices(targetshape, source.shape, targetranges, srcranges, strides)
+        striplist.extend(hyperslab.split_strips(source, slices, chunk_factor))
+
+    strips = hyperslab.sort_strips(striplist)
+    strips = hyperslab.remove_overlaps(hyperslab.compress_strips(strips, chunk_factor))
+
+    return hyperslab.plan_extraction(strips, chunk_factor)
+
+
+def extract(sources, request, strides, chunk_factor):
+    """
+    Steps 3 to 7 of extract_data as the datastore runs them now
+    """
+    chunks = []
+    for step in plan(sources, request, strides, chunk_factor):
+        values = hyperslab.gather(step, lambda source: source.values)
+        chunks.append((step[0][1][0], values.tolist()))
+
+    return chunks
+
+
+def reduce_extract(sources, request, strides, chunk_factor, kind, dtype):
+    """
+    The reduction of reduce_data - one step of the extraction plan at a time
+    """
+    reduction = hyperslab.Reduction(kind, dtype)
+    for step in plan(sources, request, strides, chunk_factor):
+        reduction.add(hyperslab.gather(step, lambda source: source.values))
+    return reduction.result()
+
+
+def split_layout(shape, dim, pieces, dtype=numpy.float64):
+    """
+    The full array of shape with values 0..n, split into bounded arrays along one dimension
+    @retval the full array and a list of sources in the order of dim
+    """
+    full = numpy.arange(numpy.prod(shape)).astype(dtype).reshape(shape)
+    cuts = sorted(random.sample(range(1, shape[dim]), pieces - 1)) if pieces > 1 else []
+    sources = []
+    for start, end in zip([0] + cuts, cuts + [shape[dim]]):
+        index = [slice(None)] * len(shape)
+        index[dim] = slice(start, end)
+        block = full[tuple(index)]
+        origins = [0] * len(shape)
+        origins[dim] = start
+        sources.append(Source(origins, list(block.shape), block.ravel().copy()))
+    return full, sources
+
+
+def random_request(shape, strided=False):
+    request = []
+    strides = []
+    for size in shape:
+        origin = random.randrange(size)
+        request.append((origin, random.randint(1, size - origin)))
+        if strided:
+            strides.append(random.choice([1, 1, 2, 3]))
+        else:
+            strides.append(1)
+    return request, strides
+
+
+def assemble(chunks, size):
+    """
+    Put the chunks at their start index, as a client of extract_data does
+    """
+    target = [None] * size
+    for start, values in chunks:
+        target[start:start + len(values)] = values
+    return target
+
+
+class HyperslabTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(2011)
+
+    def test_get_slices(self):
+        for i in range(200):
+            rank = random.randint(1, 4)
+            shape = [random.randint(1, 6) for x in range(rank)]
+            targetshape = [random.randint(1, 6) for x in range(rank)]
+            targetranges = []
+            srcranges = []
+            for size, tsize in zip(shape, targetshape):
+                length = random.randint(1, min(size, tsize))
+                tstart = random.randint(0, tsize - length)
+                sstart = random.randint(0, size - length)
+                targetranges.append((tstart, tstart + length))
+                srcranges.append((sstart, sstart + length))
+            strides = [1] * rank
+
+            expected = list(scan_get_slices(targetshape, shape, targetranges, srcranges, strides))
+            self.assertEqual(hyperslab.get_slices(targetshape, shape, targetranges, srcranges, strides), expected)
+
+    def test_remove_overlaps(self):
+        for i in range(200):
+            strips = []
+            for j in range(random.randint(1, 30)):
+                start = random.randint(0, 100)
+                end = start + random.randint(0, 20)
+                stride = random.randint(1, 3)
+                src = random.randint(0, 50)
+                strips.append((j, (start, end), (src, src + (end - start) * stride), end - start, stride))
+
+            strips = hyperslab.sort_strips(strips)
+            self.assertEqual(hyperslab.remove_overlaps(strips), scan_remove_overlaps(strips))
+
+            # Nothing in the target is covered twice, and nothing is lost
+            covered = set()
+            for strip in hyperslab.remove_overlaps(strips):
+                span = set(range(strip[1][0], strip[1][1]))
+                self.failIf(covered & span)
+                covered.update(span)
+            expected = set()
+            for strip in strips:
+                expected.update(range(strip[1][0], strip[1][1]))
+            self.assertEqual(covered, expected)
+
+    def test_gather(self):
+        a = Source([0], [10], numpy.arange(10, dtype=numpy.int32))
+        b = Source([10], [10], numpy.arange(10, 20, dtype=numpy.int32))
+        strips = [(a, (0, 2), (0, 4), 2, 2), (a, (2, 4), (5, 9), 2, 2), (b, (4, 5), (3, 4), 1, 1)]
+
+        values = hyperslab.gather(strips, lambda source: source.values)
+        self.assertEqual(values.dtype, numpy.int32)
+        self.assertEqual(values.tolist(), [0, 2, 5, 7, 13])
+
+        strings = Source([0], [3], numpy.array(['a', 'b', 'c'], dtype=object))
+        values = hyperslab.gather([(strings, (0, 2), (1, 3), 2, 1)], lambda source: source.values)
+        self.assertEqual(values.tolist(), ['b', 'c'])
+
+    def _compare(self, full, sources, request, strides, chunk_factor):
+        expected = scan_extract(sources, request, strides, chunk_factor)
+        result = extract(sources, request, strides, chunk_factor)
+
+        self.assertEqual(result, expected)
+        for (start, values), (expected_start, expected_values) in zip(result, expected):
+            self.assertEqual([type(v) for v in values], [type(v) for v in expected_values])
+
+        index = tuple([slice(origin, origin + size, stride) for (origin, size), stride in zip(request, strides)])
+        self.assertEqual(assemble(result, full[index].size), full[index].ravel().tolist())
+
+    def test_identical_one_array(self):
+        for i in range(50):
+            shape = [random.randint(1, 8) for x in range(random.randint(1, 4))]
+            full, sources = split_layout(shape, 0, 1)
+            request, strides = random_request(shape)
+            self._compare(full, sources, request, strides, random.choice([5, 20, 8000]))
+
+    def test_identical_split_arrays(self):
+        for i in range(100):
+            shape = [random.randint(2, 8) for x in range(random.randint(1, 4))]
+            full, sources = split_layout(shape, 0, random.randint(1, shape[0]), random.choice([numpy.float32, numpy.int64]))
+            request, strides = random_request(shape)
+            self._compare(full, sources, request, strides, random.choice([5, 20, 8000]))
+
+    def test_identical_dataset_layout(self):
+        # The layouts and strided requests of the datastore extract_data tests
+        full, sources = split_layout([15, 40, 200], 0, 1)
+        self._compare(full, sources, [(0, 1), (0, 10), (50, 100)], [1, 1, 10], 8000)
+        self._compare(full, sources, [(5, 10), (0, 40), (0, 200)], [1, 1, 1], 8000)
+
+        full, sources = split_layout([4, 20, 20, 20], 0, 4)
+        self._compare(full, sources, [(2, 1), (0, 20), (10, 10), (10, 10)], [1, 5, 1, 1], 8000)
+        self._compare(full, sources, [(0, 4), (0, 20), (0, 20), (0, 20)], [1, 1, 1, 1], 8000)
+
+    def test_strided(self):
+        for i in range(200):
+            shape = [random.randint(2, 8) for x in range(random.randint(1, 4))]
+            dim = random.randrange(len(shape))
+            full, sources = split_layout(shape, dim, random.randint(1, shape[dim]))
+            request, strides = random_request(shape, strided=True)
+
+            index = tuple([slice(origin, origin + size, stride) for (origin, size), stride in zip(request, strides)])
+            result = extract(sources, request, strides, random.choice([2, 5, 8000]))
+            self.assertEqual(assemble(result, full[index].size), full[index].ravel().tolist())
+
+    def test_unordered_arrays(self):
+        # Bounded arrays split along an inner dimension, or out of order, give strips out of target order
+        for i in range(50):
+            shape = [random.randint(2, 8) for x in range(random.randint(2, 3))]
+            dim = random.randrange(len(shape))
+            full, sources = split_layout(shape, dim, random.randint(1, shape[dim]))
+            random.shuffle(sources)
+            request, strides = random_request(shape, strided=True)
+
+            index = tuple([slice(origin, origin + size, stride) for (origin, size), stride in zip(request, strides)])
+            result = extract(sources, request, strides, random.choice([5, 8000]))
+            self.assertEqual(assemble(result, full[index].size), full[index].ravel().tolist())
+
+    def test_overlapping_arrays(self):
+        full = numpy.arange(60, dtype=numpy.float64).reshape((6, 10))
+        sources = [Source([0, 0], [4, 10], full[0:4].ravel().copy()),
+                   Source([2, 0], [4, 10], full[2:6].ravel().copy()),
+                   Source([1, 0], [2, 10], full[1:3].ravel().copy())]
+
+        self._compare(full, sources, [(0, 6), (2, 7)], [1, 1], 8000)
+        self._compare(full, sources, [(1, 4), (0, 10)], [1, 1], 8000)
+
+
+class ReductionTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(2011)
+
+    def _expected(self, values, kind):
+        """
+        The reduction computed by numpy on the whole extracted hyperslab
+        """
+        if kind == hyperslab.REDUCE_COUNT:
+            return [values.size]
+        if kind == hyperslab.REDUCE_DECIMATE:
+            return values.ravel().tolist()
+        return [getattr(values, kind)()]
+
+    def test_reductions(self):
+        for i in range(100):
+            shape = [random.randint(2, 8) for x in range(random.randint(1, 4))]
+            dim = random.randrange(len(shape))
+            dtype = random.choice([numpy.float64, numpy.float32, numpy.int32, numpy.uint64])
+            full, sources = split_layout(shape, dim, random.randint(1, shape[dim]), dtype)
+            random.shuffle(sources)
+            request, strides = random_request(shape, strided=True)
+            chunk_factor = random.choice([2, 5, 8000])
+
+            index = tuple([slice(origin, origin + size, stride) for (origin, size), stride in zip(request, strides)])
+            for kind in hyperslab.REDUCTIONS:
+                result = reduce_extract(sources, request, strides, chunk_factor, kind, dtype)
+                expected = self._expected(full[index], kind)
+
+                if kind in (hyperslab.REDUCE_MEAN, hyperslab.REDUCE_SUM) and full.dtype == numpy.float32:
+                    # the chunks are summed in float64, numpy sums float32 in float32
+                    self.failUnless(abs(result[0] - expected[0]) <= 1e-5 * abs(expected[0]))
+                elif kind == hyperslab.REDUCE_MEAN:
+                    self.assertAlmostEqual(result[0], expected[0])
+                else:
+                    self.assertEqual(result.tolist(), expected)
+
+    def test_result_dtypes(self):
+        values = numpy.arange(10, dtype=numpy.int32)
+        expected = {hyperslab.REDUCE_MIN: numpy.int32,
+                    hyperslab.REDUCE_MAX: numpy.int32,
+                    hyperslab.REDUCE_SUM: numpy.int64,
+                    hyperslab.REDUCE_MEAN: numpy.float64,
+                    hyperslab.REDUCE_COUNT: numpy.int64,
+                    hyperslab.REDUCE_DECIMATE: numpy.int32}
+
+        for kind, dtype in expected.items():
+            reduction = hyperslab.Reduction(kind, values.dtype)
+            reduction.add(values[:4])
+            reduction.add(values[4:])
+            self.assertEqual(reduction.result().dtype, numpy.dtype(dtype))
+
+        reduction = hyperslab.Reduction(hyperslab.REDUCE_SUM, numpy.uint32)
+        reduction.add(numpy.array([2 ** 32 - 1, 2 ** 32 - 1], dtype=numpy.uint32))
+        self.assertEqual(reduction.result().tolist(), [2 ** 33 - 2])
+
+    def test_nan(self):
+        for kind in (hyperslab.REDUCE_MIN, hyperslab.REDUCE_MAX, hyperslab.REDUCE_SUM, hyperslab.REDUCE_MEAN):
+            reduction = hyperslab.Reduction(kind, numpy.float64)
+            reduction.add(numpy.array([1.0, numpy.nan]))
+            reduction.add(numpy.array([2.0]))
+            self.failUnless(numpy.isnan(reduction.result()[0]))
+
+    def test_strings(self):
+        reduction = hyperslab.Reduction(hyperslab.REDUCE_MAX, object)
+        reduction.add(numpy.array(['b', 'a'], dtype=object))
+        reduction.add(numpy.array(['c'], dtype=object))
+        self.assertEqual(reduction.result().tolist(), ['c'])
+
+        self.assertRaises(ValueError, hyperslab.Reduction, hyperslab.REDUCE_SUM, object)
+        self.assertRaises(ValueError, hyperslab.Reduction, hyperslab.REDUCE_MEAN, object)
+
+    def test_no_values(self):
+        self.assertRaises(ValueError, hyperslab.Reduction, 'median', numpy.float64)
+
+        for kind, expected in ((hyperslab.REDUCE_COUNT, [0]), (hyperslab.REDUCE_SUM, [0.0]), (hyperslab.REDUCE_DECIMATE, [])):
+            reduction = hyperslab.Reduction(kind, numpy.float64)
+            reduction.add(numpy.empty(0))
+            self.assertEqual(reduction.result().tolist(), expected)
+
+        for kind in (hyperslab.REDUCE_MIN, hyperslab.REDUCE_MAX, hyperslab.REDUCE_MEAN):
+            reduction = hyperslab.Reduction(kind, numpy.float64)
+            self.assertRaises(ValueError, reduction.result)
@@ -118,7 +118,8 @@ class IdentityRegistryClientTest(IonTestCase):
             {'name':'dataset_controller', 'module':'ion.services.dm.inventory.dataset_controller', 'class':'DatasetControllerClient'},
             {'name':'resource_registry1','module':'ion.services.coi.resource_registry.resource_registry','class':'ResourceRegistryService',
              'spawnargs':{'datastore_service':'datastore'}},
-            {'name':'identity_registry','module':'ion.services.coi.identity_registry','class':'IdentityRegistryService'}
+            {'name':'identity_registry','module':'ion.services.coi.identity_registry','class':'IdentityRegistryService',
+             'spawnargs':{'subject_store_class':'ion.core.data.store.Store'}}
         ]
 
         sup = yield self._spawn_processes(services)
@@ -465,3 +466,40 @@ xN/XW/CKTL9f05RpuHULaoNHcOqi56m+Cs6jUaOuVwPxn5T0YoN/Tp24hbRfxFvMG34V
         yield self.irc.unset_role(user_id, role)
         self.failIf(user_has_role(user_id, 'EARLY_ADOPTER'))
         self.failIf(user_has_role(user_id, 'MARINE_OPERATOR'))
+
+    @defer.inlineCallbacks
+    def test_subject_store(self):
+        irs = self._get_service_by_name('identity_registry')
+
+        # The preloaded identities are indexed the first time a subject is looked up
+        identity, ooi_id = yield irs._findUser(self.user2_subject)
+        self.assertEqual(ooi_id, self.user2_ooi_id)
+        self.assertEqual(identity.subject, self.user2_subject)
+
+        # From now on a lookup never scans the identities - a subject which is not in the store is not there
+        def no_scan(*args, **kwargs):
+            self.fail('The identity registry scanned all the identities')
+        setattr(irs.asc, 'get_subjects', no_scan)
+
+        identity, ooi_id = yield irs._findUser(self.user2_subject)
+        self.assertEqual(ooi_id, self.user2_ooi_id)
+
+        identity, ooi_id = yield irs._findUser(self.user1_subject)
+        self.assertEqual(identity, None)
+        self.assertEqual(ooi_id, None)
+
+        # A registered user is found at once
+        IdentityRequest = yield self.mc.create_instance(RESOURCE_CFG_REQUEST_TYPE, MessageName='IR request')
+        IdentityRequest.configuration = IdentityRequest.CreateObject(IDENTITY_TYPE)
+        IdentityRequest.configuration.certificate = self.user1_certificate
+        IdentityRequest.configuration.rsa_private_key = self.user1_rsa_private_key
+        Response = yield self.irc.register_user(IdentityRequest)
+
+        identity, ooi_id = yield irs._findUser(self.user1_subject)
+        self.assertEqual(ooi_id, Response.resource_reference.ooi_id)
+
+        # A restarted registry finds the index already built in the store and does not scan again
+        irs._subject_index_complete = False
+
+        identity, ooi_id = yield irs._findUser(self.user1_subject)
+        self.assertEqual(ooi_id, Response.resource_reference.ooi_id)
@@ -8,18 +8,29 @@
 
 from ion.core.object import object_utils
 from ion.core.messaging.message_client import MessageClient
-from twisted.internet import defer
+from twisted.internet import defer, task
 from ion.core.process.service_process import ServiceProcess, ServiceClient
 from ion.core.process.process import ProcessFactory
 from ion.services.dm.distribution.publisher_subscriber import SubscriberFactory
 from ion.services.dm.distribution.events import EventSubscriber
 from uuid import uuid4
 import time
+from collections import deque
+from itertools import islice
 from ion.core.object.codec import ObjectCodecInterceptor
 
 import ion.util.ionlog
 log = ion.util.ionlog.getLogger(__name__)
 
+from ion.core import ioninit
+CONF = ioninit.config(__name__)
+
+# The number of events held for each event stream - a session which reads less often loses the oldest events
+BUFFER_SIZE = CONF.getValue('buffer_size', 1000)
+
+# Sessions which have not made a request for this many seconds are unsubscribed
+SESSION_TIMEOUT = CONF.getValue('session_timeout', 600.0)
+
 EVENTS_EXCHANGE_POINT="events.topic"
 
 EVENTMONITOR_SUBSCRIBE_MESSAGE_TYPE     = object_utils.create_type_identifier(object_id=2335, version=1)
@@ -29,6 +40,59 @@ EVENTMONITOR_GETDATA_MESSAGE_TYPE       = object_utils.create_type_identifier(ob
 EVENTMONITOR_DATA_MESSAGE_TYPE          = object_utils.create_type_identifier(object_id=2339, version=1)
 EVENTMONITOR_SUBDATA_TYPE               = object_utils.create_type_identifier(object_id=2340, version=1)
 
+
+class EventStream(object):
+    """
+    The events received by one subscription to an event id and origin, shared by every session subscribed to them.
+    The events are held encoded, once, in a ring of bounded size. Each session subscription keeps a cursor - the
+    sequence number of the last event it has read.
+    """
+
+    def __init__(self, key, max_size=BUFFER_SIZE):
+        self.key = key
+        self.subscriber = None
+
+        # (session_id, subscription_id) of the session subscriptions reading this stream
+        self.readers = set()
+
+        # (sequence number, datetime, encoded message)
+        self._events = deque(maxlen=max_size)
+        self.last_seq = 0
+
+    @property
+    def first_seq(self):
+        """
+        The sequence number of the oldest event held
+        """
+        return self.last_seq - len(self._events) + 1
+
+    def append(self, datetime, msg):
+        self.last_seq += 1
+        self._events.append((self.last_seq, datetime, msg))
+
+    def read(self, cursor, timestamp=None):
+        """
+        Get the events after the cursor
+        @param cursor the sequence number of the last event read
+        @param timestamp if not None only return events with a datetime at or after it
+        @retval a list of the encoded messages, and the number of events after the cursor which have been dropped from
+        the ring
+        """
+        first_seq = self.first_seq
+        start = max(cursor + 1, first_seq)
+        missed = start - (cursor + 1)
+
+        events = []
+        for seq, datetime, msg in islice(self._events, start - first_seq, None):
+            if timestamp is None or datetime >= timestamp:
+                events.append(msg)
+
+        return events, missed
+
+    def __len__(self):
+        return len(self._events)
+
+
 class EventMonitorService(ServiceProcess):
 
     # Declaration of service
@@ -45,24 +109,85 @@ class EventMonitorService(ServiceProcess):
 
     def slc_init(self, *args, **kwargs):
         self._subs = {}
+        # (event_id, origin) -> EventStream
+        self._streams = {}
         self._subfactory = SubscriberFactory(process=self) #, handler=self._handle_msg)
         self._mc = MessageClient(proc=self)
         self._codec = ObjectCodecInterceptor("fakecodec")
+
+        self._buffer_size = int(self.spawn_args.get('buffer_size', BUFFER_SIZE))
+        self._session_timeout = float(self.spawn_args.get('session_timeout', SESSION_TIMEOUT))
+        self._evict_loop = task.LoopingCall(self._evict_idle_sessions)
+
         ServiceProcess.slc_init(self, *args, **kwargs)
 
-    def _handle_msg(self, session_id, subid, msg):
-        log.debug("message for you sir %s %s %s" % (session_id, subid, str(msg['content'].datetime)))
-        assert self._subs.has_key(session_id) and self._subs[session_id]['subscribers'].has_key(subid)
+    def slc_activate(self, *args, **kwargs):
+        if self._session_timeout > 0 and not self._evict_loop.running:
+            self._evict_loop.start(self._session_timeout / 10.0, now=False)
+
+    def slc_terminate(self, *args, **kwargs):
+        if self._evict_loop.running:
+            self._evict_loop.stop()
+
+    def _handle_msg(self, key, msg):
+        log.debug("message for you sir %s %s" % (str(key), str(msg['content'].datetime)))
+
+        stream = self._streams.get(key, None)
+        if stream is None:
+            log.debug('No sessions for event stream %s' % str(key))
+            return
 
         # save off datetime so we can filter without having to unpack
         msg['_datetime'] = msg['content'].datetime
 
-        # pack it up as if we were messaging!
+        # pack it up as if we were messaging! Once for all the sessions reading the stream
         fo = self.FakeInvocation(msg)
         self._codec.after(fo)
         msg = fo.message
 
-        self._subs[session_id]['subscribers'][subid]['msgs'].append(msg)
+        stream.append(msg['_datetime'], msg)
+
+    def _release(self, session_id, subid):
+        """
+        Remove a session subscription from the stream it reads.
+        @retval the subscriber to terminate if no session reads the stream any more, else None
+        """
+        subdata = self._subs[session_id]['subscribers'].pop(subid)
+        stream = self._streams.get(subdata['stream'], None)
+        if stream is None:
+            return None
+
+        stream.readers.discard((session_id, subid))
+        if len(stream.readers) == 0:
+            del self._streams[stream.key]
+            return stream.subscriber
+
+        return None
+
+    def _evict_idle_sessions(self):
+        """
+        Unsubscribe sessions which have not made a request within the session timeout
+        @retval A deferred which fires when the released subscribers are terminated - failures are logged, so they do
+        not stop the eviction loop
+        """
+        expired = time.time() - self._session_timeout
+
+        def log_failure(failure, session_id):
+            log.error('Failed to terminate a subscriber of idle event monitor session %s: %s' % (session_id, failure.getErrorMessage()))
+
+        def_list = []
+        for session_id, session in self._subs.items():
+            if session['last_request_time'] < expired:
+                log.info('Evicting idle event monitor session %s' % session_id)
+                for subid in session['subscribers'].keys():
+                    sub = self._release(session_id, subid)
+                    if sub is not None:
+                        d = defer.maybeDeferred(sub.terminate)
+                        d.addErrback(log_failure, session_id)
+                        def_list.append(d)
+                del self._subs[session_id]
+
+        return defer.DeferredList(def_list)
 
     def _bump_timestamp(self, session_id):
         assert self._subs.has_key(session_id)
@@ -87,18 +212,31 @@ class EventMonitorService(ServiceProcess):
         # create new subscription id
         subid           = str(uuid4())[:6]
 
-        # create the subscriber
-        sub = yield self._subfactory.build(subscriber_type=EventSubscriber,
-                                           event_id=event_id,
-                                           origin=origin,
-                                           handler=lambda m: self._handle_msg(session_id, subid, m))
+        # create the subscriber, unless another session already reads this stream
+        key = (event_id, origin)
+        stream = self._streams.get(key, None)
+        if stream is None:
+            stream = EventStream(key, self._buffer_size)
+            self._streams[key] = stream
+            try:
+                stream.subscriber = yield self._subfactory.build(subscriber_type=EventSubscriber,
+                                                                 event_id=event_id,
+                                                                 origin=origin,
+                                                                 handler=lambda m: self._handle_msg(key, m))
+            except:
+                del self._streams[key]
+                raise
 
         # store this subscriber locally (TODO: for now)
         if not self._subs.has_key(session_id):
-            self._subs[session_id] = { 'last_request_time' : '',
+            self._subs[session_id] = { 'last_request_time' : 0.0,
                                        'subscribers' : {} }
 
-        self._subs[session_id]['subscribers'][subid] = { 'subscriber': sub, 'msgs': [] }
+        # Only events received from now on are for this subscription
+        stream.readers.add((session_id, subid))
+        self._subs[session_id]['subscribers'][subid] = { 'stream': key,
+                                                         'first': stream.last_seq,
+                                                         'cursor': stream.last_seq }
         self._bump_timestamp(session_id)
 
         # generate response
@@ -122,16 +260,16 @@ class EventMonitorService(ServiceProcess):
         # try to look it up
         termsubs = []
         if self._subs.has_key(session_id):
-            if subscription_id is None:
-                termsubs.extend([y['subscriber'] for y in [x for x in self._subs[session_id]['subscribers'].values()]])
+            if not subscription_id:
+                for subid in self._subs[session_id]['subscribers'].keys():
+                    termsubs.append(self._release(session_id, subid))
                 del(self._subs[session_id])
             else:
                 if self._subs[session_id]['subscribers'].has_key(subscription_id):
-                    termsubs.append(self._subs[session_id]['subscribers'][subscription_id]['subscriber'])
-                    del(self._subs[session_id]['subscribers'][subscription_id])
+                    termsubs.append(self._release(session_id, subscription_id))
 
-        # terminate collected active subscribers
-        for sub in termsubs:
+        # terminate collected active subscribers which no other session reads
+        for sub in filter(None, termsubs):
             log.debug("Unsubscribing from session_id: %s, subscription_id: %s", session_id, subscription_id)
             sub.terminate()
 
@@ -149,14 +287,16 @@ class EventMonitorService(ServiceProcess):
         response.session_id = session_id
 
         if self._subs.has_key(session_id):
-            if not timestamp or len(timestamp) == 0:
-                timestamp = self._subs[session_id]['last_request_time']
-                self._bump_timestamp(session_id)
+            self._bump_timestamp(session_id)
 
-            try:
-                timestamp = float(timestamp)
-            except:
-                timestamp = 0.0
+            if not timestamp or len(timestamp) == 0:
+                # Everything since the last read of each subscription
+                timestamp = None
+            else:
+                try:
+                    timestamp = float(timestamp)
+                except:
+                    timestamp = 0.0
 
             log.debug("get_data(): filtering against timestamp [%s]" % str(timestamp))
 
@@ -164,11 +304,21 @@ class EventMonitorService(ServiceProcess):
                 # skip if we have a list of sub ids to give back and this subid is not in the list
                 if len(subscriber_ids) > 0 and not subid in subscriber_ids:
                     continue
+
+                stream = self._streams[subdata['stream']]
+                if timestamp is None:
+                    events, missed = stream.read(subdata['cursor'])
+                    if missed > 0:
+                        log.warn('Event monitor session %s missed %d events on subscription %s' % (session_id, missed, subid))
+                else:
+                    events, missed = stream.read(subdata['first'], timestamp)
+                subdata['cursor'] = stream.last_seq
+
                 dataobj = response.data.add()
                 dataobj.subscription_id = subid
-                dataobj.subscription_desc = subdata['subscriber']._binding_key #"none for now"
+                dataobj.subscription_desc = getattr(stream.subscriber, '_binding_key', '') #"none for now"
 
-                for idx, event in enumerate([ev for ev in subdata['msgs'] if ev['_datetime'] >= timestamp]):
+                for event in events:
 
                     # unpack it up as if we were messaging!
                     fo = self.FakeInvocation(event.copy())
@@ -0,0 +1,105 @@
+"""
+@file ion/services/dm/distribution/eventmonitor_performance_testing.py
+@author David Stuebe
+@brief Compare the event monitor holding an unbounded list of events encoded once per session with the shared event
+stream, which encodes each event once into a bounded ring read by every session through its own cursor.
+
+Run as a script:
+python ion/services/dm/distribution/eventmonitor_performance_testing.py -s 1,10,100 -e 2000 -b 1000
+"""
+
+import time
+from optparse import OptionParser
+
+from ion.core.object import workbench
+from ion.core.object import object_utils
+from ion.core.object.codec import ObjectCodecInterceptor
+from ion.services.dm.distribution.eventmonitor import EventStream, EventMonitorService
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+PERSON_TYPE = object_utils.create_type_identifier(object_id=20001, version=1)
+
+
+class EventMonitorPerformanceTester:
+
+    def __init__(self, session_counts, num_events, buffer_size):
+
+        self.session_counts = session_counts
+        self.num_events = num_events
+        self.buffer_size = buffer_size
+
+        self.codec = ObjectCodecInterceptor('fakecodec')
+        self.wb = workbench.WorkBench('No Process Performance Test')
+
+    def make_event(self, i):
+        repo = self.wb.create_repository(PERSON_TYPE)
+        repo.root_object.name = 'Event number %d' % i
+        repo.root_object.id = i
+        repo.commit('event')
+        return repo.root_object
+
+    def encode(self, event):
+        fo = EventMonitorService.FakeInvocation({'content':event})
+        self.codec.after(fo)
+        return fo.message
+
+    def run_per_session(self, num_sessions, events):
+        """
+        Every session holds its own copy of every event, encoded for it
+        """
+        msgs = dict([(session, []) for session in range(num_sessions)])
+        for i, event in enumerate(events):
+            for session in range(num_sessions):
+                msg = self.encode(event)
+                msg['_datetime'] = float(i)
+                msgs[session].append(msg)
+
+        stored = sum([len(x) for x in msgs.values()])
+        size = sum([len(msg['content']) for x in msgs.values() for msg in x])
+        return stored, size
+
+    def run_shared(self, num_sessions, events):
+        """
+        One bounded stream for all the sessions, each reading from its own cursor
+        """
+        stream = EventStream(('1001', 'origin'), self.buffer_size)
+        cursors = dict([(session, 0) for session in range(num_sessions)])
+        for i, event in enumerate(events):
+            stream.append(float(i), self.encode(event))
+
+        for session in cursors:
+            msgs, missed = stream.read(cursors[session])
+            cursors[session] = stream.last_seq
+
+        size = sum([len(msg['content']) for seq, datetime, msg in stream._events])
+        return len(stream), size
+
+    def runBenchMarks(self):
+        events = [self.make_event(i) for i in xrange(self.num_events)]
+
+        for num_sessions in self.session_counts:
+            print "%d sessions subscribed to one stream, %d events" % (num_sessions, self.num_events)
+
+            for name, method in [('Encoded per session', self.run_per_session), ('Shared stream', self.run_shared)]:
+                t1 = time.time()
+                stored, size = method(num_sessions, events)
+                t2 = time.time()
+                print "%s: %f seconds (%f events per second) - %d events held, %d bytes" % \
+                    (name, t2 - t1, self.num_events / (t2 - t1), stored, size)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-s", "--sessions", dest="sessions", default="1,10,100", help="Comma separated list of the number of sessions")
+    parser.add_option("-e", "--events", dest="events", default=2000, help="The number of events published")
+    parser.add_option("-b", "--buffer", dest="buffer", default=1000, help="The number of events held by the shared stream")
+    opts, args = parser.parse_args()
+
+    session_counts = [int(x) for x in opts.sessions.split(',')]
+    tester = EventMonitorPerformanceTester(session_counts, int(opts.events), int(opts.buffer))
+    tester.runBenchMarks()
+
+if __name__ == "__main__":
+    main()
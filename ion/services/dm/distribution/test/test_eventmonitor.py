@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/dm/distribution/test/test_eventmonitor.py
+@author David Stuebe
+@test ion.services.dm.distribution.eventmonitor Exercise the bounded event streams shared by event monitor sessions
+"""
+
+from twisted.trial import unittest
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from ion.services.dm.distribution.eventmonitor import EventStream
+
+
+class EventStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = EventStream(('1001', 'origin'), max_size=5)
+
+    def fill(self, num):
+        for i in range(num):
+            self.stream.append(float(i), 'event %d' % i)
+
+    def test_bounded(self):
+        self.fill(12)
+
+        self.assertEqual(len(self.stream), 5)
+        self.assertEqual(self.stream.last_seq, 12)
+        self.assertEqual(self.stream.first_seq, 8)
+
+        events, missed = self.stream.read(0)
+        self.assertEqual(events, ['event 7', 'event 8', 'event 9', 'event 10', 'event 11'])
+        self.assertEqual(missed, 7)
+
+    def test_cursors(self):
+        """
+        Sessions reading the same stream at different rates each see every event after their own cursor
+        """
+        self.fill(3)
+        fast = slow = 0
+
+        events, missed = self.stream.read(fast)
+        self.assertEqual(events, ['event 0', 'event 1', 'event 2'])
+        fast = self.stream.last_seq
+
+        self.stream.append(3.0, 'event 3')
+
+        events, missed = self.stream.read(fast)
+        self.assertEqual((events, missed), (['event 3'], 0))
+        fast = self.stream.last_seq
+
+        events, missed = self.stream.read(slow)
+        self.assertEqual((events, missed), (['event 0', 'event 1', 'event 2', 'event 3'], 0))
+
+        events, missed = self.stream.read(self.stream.last_seq)
+        self.assertEqual((events, missed), ([], 0))
+
+    def test_timestamp(self):
+        self.fill(5)
+
+        events, missed = self.stream.read(0, timestamp=2.0)
+        self.assertEqual(events, ['event 2', 'event 3', 'event 4'])
+
+        # Events from before the subscription are never returned
+        events, missed = self.stream.read(4, timestamp=0.0)
+        self.assertEqual(events, ['event 4'])
+
+    def test_empty(self):
+        self.assertEqual(len(self.stream), 0)
+        self.assertEqual(self.stream.read(0), ([], 0))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/dm/ingestion/blob_upload.py
+@author David Stuebe
+@brief A windowed pipeline for putting the ndarray blobs of received chunks to the datastore. Small chunks are coalesced
+into one put_blobs message up to a size limit and several messages may be in flight at once, so receiving the next
+chunk does not wait for the round trip of the last one.
+"""
+
+from twisted.internet import defer
+from twisted.python import failure
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class BlobUploadPipeline(object):
+    """
+    Collects blob elements and sends them in batches. A batch is sent when its size reaches batch_bytes; at most
+    window batches are in flight at once. The first failed batch fails the pipeline - every later add and the drain
+    fail with the same error.
+
+    Each blob is linked into the blobs message of the current batch as it is added, which copies it into the message.
+    The caller's object may be invalidated as soon as add returns - the message a received chunk arrived in is cleared
+    from the workbench once its op completes.
+
+    @param create_message a callable returning a deferred blobs message to fill
+    @param put_blobs a callable which sends a blobs message and returns a deferred
+    @param window the most batches in flight at once
+    @param batch_bytes the size at which a batch is sent
+    """
+
+    def __init__(self, create_message, put_blobs, window=4, batch_bytes=1048576):
+
+        self._create_message = create_message
+        self._put_blobs = put_blobs
+
+        self.window = max(int(window), 1)
+        self.batch_bytes = int(batch_bytes)
+
+        # The blobs message of the batch being filled, and the number and size of the blobs linked into it
+        self._message = None
+        self._pending = 0
+        self._pending_bytes = 0
+
+        self._in_flight = set()
+        # Deferreds waiting for a free slot in the window
+        self._waiting = []
+        # Deferreds waiting for the pipeline to empty
+        self._draining = []
+
+        self._failure = None
+
+        # Statistics
+        self.blobs_sent = 0
+        self.batches_sent = 0
+
+    @defer.inlineCallbacks
+    def add(self, obj, size):
+        """
+        Add a blob element to the pipeline
+        @param obj the wrapped blob element, linked into the blobs message before the returned deferred fires
+        @param size the size of the element in bytes
+        @retval a deferred which fires when the pipeline can take another blob
+        """
+        if self._failure is not None:
+            self._failure.raiseException()
+
+        if self._message is None:
+            blobs_msg = yield self._create_message()
+            # Another add may have started the batch while the message was created
+            if self._message is None:
+                self._message = blobs_msg
+
+        link = self._message.blob_elements.add()
+        link.SetLink(obj)
+
+        self._pending += 1
+        self._pending_bytes += size
+
+        if self._pending_bytes >= self.batch_bytes:
+            self._send_pending()
+
+        yield self._wait_for_window()
+
+    def drain(self):
+        """
+        Send anything pending
+        @retval a deferred which fires when every blob added is in the datastore, or fails with the first error
+        """
+        if self._failure is None and self._message is not None:
+            self._send_pending()
+
+        if self._failure is not None:
+            return defer.fail(self._failure)
+
+        if not self._in_flight:
+            return defer.succeed(None)
+
+        d = defer.Deferred()
+        self._draining.append(d)
+        return d
+
+    def __len__(self):
+        """
+        The number of blobs added but not yet sent
+        """
+        return self._pending
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def _wait_for_window(self):
+        if len(self._in_flight) < self.window:
+            return defer.succeed(None)
+
+        d = defer.Deferred()
+        self._waiting.append(d)
+        return d
+
+    def _send_pending(self):
+        blobs_msg = self._message
+        num_blobs = self._pending
+        self._message = None
+        self._pending = 0
+        self._pending_bytes = 0
+
+        d = defer.maybeDeferred(self._put_blobs, blobs_msg)
+        self._in_flight.add(d)
+        d.addBoth(self._sent, d, num_blobs)
+
+    def _sent(self, result, d, num_blobs):
+        self._in_flight.discard(d)
+
+        if isinstance(result, failure.Failure):
+            if self._failure is None:
+                log.error('Put blobs failed: %s' % result.getErrorMessage())
+                self._failure = result
+        else:
+            self.blobs_sent += num_blobs
+            self.batches_sent += 1
+
+        if self._failure is not None:
+            waiting = self._waiting + self._draining
+            self._waiting = []
+            self._draining = []
+            for waiter in waiting:
+                waiter.errback(self._failure)
+            return None
+
+        while self._waiting and len(self._in_flight) < self.window:
+            self._waiting.pop(0).callback(None)
+
+        if not self._in_flight:
+            draining = self._draining
+            self._draining = []
+            for waiter in draining:
+                waiter.callback(None)
+
+        return None
@@ -28,6 +28,8 @@ import ion.util.procutils as pu
 from ion.core.messaging.message_client import MessageClient
 from ion.services.coi.resource_registry.resource_client import ResourceClient, ResourceClientError
 from ion.services.dm.distribution.publisher_subscriber import Subscriber, PublisherFactory
+from ion.services.dm.ingestion.blob_upload import BlobUploadPipeline
+from ion.services.dm.ingestion import time_axis
 
 from ion.core.object.cdm_methods import attribute_merge, variables
 
@@ -48,6 +50,11 @@ import logging
 CONF = ioninit.config(__name__)
 log = ion.util.ionlog.getLogger(__name__)
 
+# The number of put_blobs messages in flight at once while receiving chunks, and the size at which received blobs
+# are sent in one message
+BLOB_UPLOAD_WINDOW = CONF.getValue('blob_upload_window', 4)
+BLOB_BATCH_BYTES = CONF.getValue('blob_batch_bytes', 1048576)
+
 
 CDM_DATASET_TYPE = object_utils.create_type_identifier(object_id=10001, version=1)
 
@@ -141,6 +148,9 @@ class IngestionService(ServiceProcess):
         self.dataset = None
         self.data_source = None
 
+        # The ndarrays of received chunks on their way to the datastore - one pipeline per ingest
+        self._blob_uploads = None
+
         self._ingestion_terminating = False
 
         self._ingestion_processing_publisher = IngestionProcessingEventPublisher(process=self)
@@ -234,6 +244,11 @@ class IngestionService(ServiceProcess):
 
         log.debug('_prepare_ingest - Start')
 
+        self._blob_uploads = BlobUploadPipeline(lambda: self.mc.create_instance(BLOBS_MESSAGE_TYPE),
+                                                self._put_blobs,
+                                                window=self.spawn_args.get('blob_upload_window', BLOB_UPLOAD_WINDOW),
+                                                batch_bytes=self.spawn_args.get('blob_batch_bytes', BLOB_BATCH_BYTES))
+
         # Get the current state of the dataset:
         try:
             self.dataset = yield self.rc.get_instance(content.dataset_id, excluded_types=[CDM_BOUNDED_ARRAY_TYPE])
@@ -669,20 +684,14 @@ class IngestionService(ServiceProcess):
         ba = content.bounded_array
 
 
-        # Create a blobs message to send to the datastore with the ndarray
-        blobs_msg = yield self.mc.create_instance(BLOBS_MESSAGE_TYPE)
+        # Queue the ndarray to be put to the datastore - waits only while the upload window is full. The pipeline
+        # copies it into a blobs message before add returns, so it outlives this message's repository, which the
+        # receiver clears once this op completes. The blobs are all in the datastore before recv_done merges the
+        # supplement.
         ndarray_element = content.Repository.index_hash.get(ba.ndarray.MyId)
         obj = content.Repository._wrap_message_object(ndarray_element._element)
 
-        link = blobs_msg.blob_elements.add()
-        link.SetLink(obj)
-
-        # Put it to the datastore
-        try:
-            yield self.dsc.put_blobs(blobs_msg)
-        except ReceivedError, re:
-            log.error(re)
-            raise IngestionError('Could not put blob in received chunk to the datastore.')
+        yield self._blob_uploads.add(obj, ndarray_element.__sizeof__())
 
         # Now add the bounded array, but not the ndarray to the dataset in the ingestion service
         log.debug('Adding content to variable name: %s' % content.variable_name)
@@ -696,10 +705,24 @@ class IngestionService(ServiceProcess):
         my_ba = ba_link.Repository.copy_object(ba, deep_copy=False)
         ba_link.SetLink(my_ba)
 
+        # The chunk is acked once its blob is queued, before the put completes. This is deliberate - waiting for the
+        # put would bring back one datastore round trip per chunk. If a put fails, the next chunk and recv_done fail
+        # with its error and the ingest ends without merging the supplement, so the data source must send it again.
         yield msg.ack()
 
         log.info('_ingest_op_recv_chunk - Complete')
 
+    @defer.inlineCallbacks
+    def _put_blobs(self, blobs_msg):
+        """
+        Put a batch of blobs from received chunks to the datastore
+        """
+        try:
+            yield self.dsc.put_blobs(blobs_msg)
+        except ReceivedError, re:
+            log.error(re)
+            raise IngestionError('Could not put blob in received chunk to the datastore.')
+
 
     @defer.inlineCallbacks
     def _ingest_op_recv_done(self, content, headers, msg, convid="unknown"):
@@ -733,6 +756,11 @@ class IngestionService(ServiceProcess):
             raise IngestionError('Expected message type Data Acquasition Complete Message Type, received %s'
                                  % str(content), content.ResponseCodes.BAD_REQUEST)
 
+        # Wait for the blobs of every chunk received to reach the datastore
+        if self._blob_uploads is not None:
+            yield self._blob_uploads.drain()
+            log.info('Put %d blobs to the datastore in %d messages' % (self._blob_uploads.blobs_sent, self._blob_uploads.batches_sent))
+
 
 
         if content.status != content.StatusCode.OK:
@@ -1248,14 +1276,9 @@ class IngestionService(ServiceProcess):
 
                     # Step 1c: Now, grab all the array values from the ndarrays..
                     log.debug('Grabbing all the array values from the ndarrays...')
-                    values = IngestionService._get_ndarray_vals(sup_agg_var)
+                    sup_indices, sup_values = IngestionService._get_ndarray_vals(sup_agg_var)
                     if log.getEffectiveLevel() <= logging.DEBUG:
-                        log.debug('>>  ndarray values = %s' % str(values))
-
-                    # need to compare in the same units - to hard to convert the variable using the units string...
-                    sup_var_start = values[0][1]
-                    sup_var_end = values[-1][1]
-                    search_times = [sup_var_start,sup_var_end]
+                        log.debug('>>  ndarray values = %s' % str(sup_values))
 
                     log.debug('Gathering a list of keys for blobs which need to be fetched for the cur_agg_var (time)...')
                     need_keys = IngestionService._get_ndarray_keys(cur_agg_var)
@@ -1268,39 +1291,15 @@ class IngestionService(ServiceProcess):
 
                     # Step 1c: Now, grab all the array values from the ndarrays..
                     log.debug('Grabbing all the array values from the ndarrays...')
-                    values = IngestionService._get_ndarray_vals(cur_agg_var)
+                    cur_indices, cur_values = IngestionService._get_ndarray_vals(cur_agg_var)
                     if log.getEffectiveLevel() <= logging.DEBUG:
-                        log.debug('>>  ndarray values = %s' % str(values))
+                        log.debug('>>  ndarray values = %s' % str(cur_values))
 
-                    #cur_var_end = values[-1][1]
-                    cur_eindex = values[-1][0]
-
-                    time_indices = self._find_time_index(values, search_times)
-                    log.debug('time_indices = %s' % str(time_indices))
-                    
-                    sup_sindex = time_indices[sup_var_start]
-                    sup_eindex = time_indices[sup_var_end]
-
-                    # Adjust indices when the supplement times lay between indices in the current dataset
-                    if sup_sindex < 0:
-                        sup_sindex = -sup_sindex - 1
-                    #if sup_eindex < 0:
-                    #    sup_eindex = -sup_eindex - 2
-
-
-                    if sup_eindex is None:
-                        sup_eindex = sup_sindex + sup_agg_dim_length - 1
-
-                        
-                    # Calculate the insertion offset -- how bounded_arrays ordered after the overwritten section must be offset
-                    #supplement_impact = (sup_eindex + 1) - sup_sindex  #(number of values displaced by inserting this supplement into the dataset)
-                    #insertion_offset  = sup_agg_dim_length - supplement_impact
-
-                    if sup_eindex >= cur_eindex:
-                        insertion_offset  = sup_eindex - cur_eindex
-
-                    else:
-                        insertion_offset  = 0
+                    # need to compare in the same units - to hard to convert the variable using the units string...
+                    # Find where the supplement start and end times lay in the current dataset and how the indices
+                    # after the overwritten section must be offset
+                    sup_sindex, sup_eindex, insertion_offset = time_axis.overwrite_offsets(cur_indices, cur_values, sup_values, sup_agg_dim_length)
+                    log.debug('sup_sindex = %s, sup_eindex = %s, insertion_offset = %s' % (sup_sindex, sup_eindex, insertion_offset))
 
             else:
     
@@ -1329,10 +1328,10 @@ class IngestionService(ServiceProcess):
                     log.debug('Grabbing all the array values from the ndarrays...')
                     values = IngestionService._get_ndarray_vals(sup_agg_var)
                     if log.getEffectiveLevel() <= logging.DEBUG:
-                        log.debug('>>  ndarray values = %s' % str(values))
+                        log.debug('>>  ndarray values = %s' % str(values[1]))
 
 
-                    time_indices = yield self._find_time_index(values, [cur_etime - runtime_offset_seconds])
+                    time_indices = self._find_time_index(values, [cur_etime - runtime_offset_seconds])
                     time_index   = time_indices[cur_etime - runtime_offset_seconds]
 
                     log.debug('Time Indicies: %s, %s' % (str(time_indices), time_index))
@@ -1856,31 +1855,26 @@ class IngestionService(ServiceProcess):
     def _get_ndarray_vals(cls, time_variable):
         """
         @Brief: Retrieves all the values of all the bounded arrays in the given time_variable
-        @return: A sorted list of tuples containing the values index followed by the value at that index.
-                 Since a variable's bounded array's may contain duplicate data, this array may contain
-                 tuples which specify the same first value.  When this is the case, it is useful to
-                 ensure that the two values specified at the same index match, otherwise the variable
-                 is corrupt.  NOTE: This validation is NOT accomplished by this method.
-                 
+        @return: A numpy array of indices and a numpy array of the values at those indices, ordered by index then value.
+                 Since a variable's bounded array's may contain duplicate data, an index may appear more than once.
+                 When this is the case, it is useful to ensure that the two values specified at the same index match,
+                 otherwise the variable is corrupt.  NOTE: This validation is NOT accomplished by this method.
+
         @note: This method will not yet work on multidimensional variables (more than one item in the
                bounded array's list of bounds).  This is because iteration over such a structure is
                quite complicated and currently unnessary since this method is only used for time
                variables (true time coordinate variables will only ever have one dimension -- time)
-               
+
         @note: This method assumes all blobs for the components of the given time_variable (bounded_arrays,
                ndarrays, etc) have been fetched.  If they have not it will fail with a KeyError.
         """
-        results = []
+        chunks = []
         for ba in time_variable.content.bounded_arrays:
             if len(ba.bounds) > 1:
-                raise IngestionException('_get_ndarray_vals does not support enflating bounded arrays with more than one dimension -- yet')
-            origin = ba.bounds[0].origin
-            for i in range(len(ba.ndarray.value)):
-                val = ba.ndarray.value[i]
-                idx = origin + i
-                results.append((idx, val))
-        results.sort()
-        return results
+                raise IngestionError('_get_ndarray_vals does not support enflating bounded arrays with more than one dimension -- yet')
+            chunks.append((ba.bounds[0].origin, ba.ndarray.value[:]))
+
+        return time_axis.time_axis(chunks)
 
 
     @defer.inlineCallbacks
@@ -1935,54 +1929,16 @@ class IngestionService(ServiceProcess):
 
     def _find_time_index(self, values, search_times, THRESHOLD = 0.001):
         """
-        @todo: Add documentation about what negative value returns mean
+        Find where each of the search_times lay in the time values
+        @param values the (indices, values) arrays returned by _get_ndarray_vals
+        @retval a dict of search time to the index of the time value within THRESHOLD of it. If there is no such value
+        the index is negative: -(index + 1) where index is that of the first later time value; None if there is no later
+        time value either.
         """
+        indices, values = values
+        log.debug('Searching for values "%s"' % str(search_times))
 
-        search_times_cpy = search_times[:]  # copy the search_times list so we can remove values
-
-
-        # Step 2: Perform a linear search in the values array for each time in search_times
-        #         a) Binary search will most likely be performed nearer worse case (logN time) - since the
-        #            overlapping region should (on average) be fairly small
-        #            * Linear search may be optimal for average case
-        #            ** Linear search is "required" when indexing into the current data (rather than the
-        #               supplement) because we must traverse multiple bounded arrays
-        
-        
-        # Step 2a: Perform the linear search to see where in the set of values our search_times lay
-        log.debug('Searching for values "%s"' % str(search_times_cpy))
-        log.debug('Got Time values "%s" in ndarray list' % str(values))
-        results_dict = {}
-        for i, tup in enumerate(values):
-            #log.debug('i - %s,tup - %s' % (i,tup))
-            idx, val = tup
-            # @note: this is a good place to check if two entries in the time variables bounded_arrays
-            #        contain mismatched values for the same index -- this shouldn't happen however
-            for search_time in search_times_cpy:
-                if val is search_time or abs(val - search_time) < THRESHOLD: # TODO: should change this to using some sort of near-match function
-                    results_dict[search_time] = idx
-                    search_times_cpy.remove(search_time)
-                elif search_time < val:
-                    results_dict[search_time] = -(idx + 1)  # used to be -(i + 1) ????
-                    search_times_cpy.remove(search_time)
-                # else search_time > val: continue
-            if len(search_times_cpy) == 0:
-                break; 
-
-
-        # Don't get it - what is the error? ValueError: need more than 2 values to unpack
-        if len(search_times_cpy) > 0:
-            not_in_list_val = None
-
-            for search_time in search_times_cpy:
-                results_dict[search_time] = not_in_list_val
-        # don't use the copy of the list after this point -- structure is indeterminant
-        search_times_cpy = None
-
-        # Step 2b: @todo: Make sure that we aren't experiencing a roundoff issue by checking how close
-        #           our search_start is to the values before and after it in the list (floats only)
-         
-        return(results_dict)
+        return time_axis.find_time_index(indices, values, search_times, THRESHOLD)
 
 
     @defer.inlineCallbacks
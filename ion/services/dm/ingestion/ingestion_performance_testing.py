@@ -0,0 +1,116 @@
+"""
+@file ion/services/dm/ingestion/ingestion_performance_testing.py
+@author David Stuebe
+@brief Measure the time to put the blobs of received chunks to the datastore - one put_blobs round trip per chunk, as
+recv_chunk used to work, against the windowed upload pipeline which coalesces small chunks.
+
+The datastore is an in memory stand in; each put_blobs costs a fixed round trip plus a transfer time per byte.
+
+Run as a script:
+python ion/services/dm/ingestion/ingestion_performance_testing.py -c 10,100,1000 -s 4096 -t 0.005 -w 4
+"""
+
+import time
+from optparse import OptionParser
+
+from twisted.internet import defer, reactor
+
+from ion.services.dm.ingestion.blob_upload import BlobUploadPipeline
+from ion.services.dm.ingestion.test.test_blob_upload import FakeDataStore
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class InMemoryDataStore(FakeDataStore):
+    """
+    The fake datastore of the pipeline tests, completing each put_blobs after the round trip and transfer time
+    """
+
+    def __init__(self, round_trip, bytes_per_second):
+        FakeDataStore.__init__(self)
+        self.round_trip = round_trip
+        self.bytes_per_second = bytes_per_second
+
+    def put_blobs(self, blobs_msg):
+        d = FakeDataStore.put_blobs(self, blobs_msg)
+        size = sum([len(blob) for blob in blobs_msg.blob_elements])
+        reactor.callLater(self.round_trip + float(size) / self.bytes_per_second, self._complete, blobs_msg)
+        return d
+
+    def _complete(self, blobs_msg):
+        index = [msg for msg, d in self.calls].index(blobs_msg)
+        self.complete(index)
+
+
+class IngestionPerformanceTester:
+
+    def __init__(self, chunk_counts, chunk_size, round_trip, window, batch_bytes, bytes_per_second):
+
+        self.chunk_counts = chunk_counts
+        self.chunk_size = chunk_size
+        self.round_trip = round_trip
+        self.window = window
+        self.batch_bytes = batch_bytes
+        self.bytes_per_second = bytes_per_second
+
+    def make_chunks(self, num_chunks):
+        return ['%08d' % i + 'x' * (self.chunk_size - 8) for i in xrange(num_chunks)]
+
+    @defer.inlineCallbacks
+    def run_serial(self, chunks):
+        ds = InMemoryDataStore(self.round_trip, self.bytes_per_second)
+        for chunk in chunks:
+            blobs_msg = yield ds.create_message()
+            link = blobs_msg.blob_elements.add()
+            link.SetLink(chunk)
+            yield ds.put_blobs(blobs_msg)
+
+        defer.returnValue(ds)
+
+    @defer.inlineCallbacks
+    def run_pipeline(self, chunks):
+        ds = InMemoryDataStore(self.round_trip, self.bytes_per_second)
+        pipeline = BlobUploadPipeline(ds.create_message, ds.put_blobs, window=self.window, batch_bytes=self.batch_bytes)
+        for chunk in chunks:
+            yield pipeline.add(chunk, len(chunk))
+        yield pipeline.drain()
+
+        defer.returnValue(ds)
+
+    @defer.inlineCallbacks
+    def runBenchMarks(self):
+        for num_chunks in self.chunk_counts:
+            chunks = self.make_chunks(num_chunks)
+
+            for name, method in [('put_blobs per chunk', self.run_serial), ('Upload pipeline', self.run_pipeline)]:
+                t1 = time.time()
+                ds = yield method(chunks)
+                t2 = time.time()
+                assert len(ds.blobs) == num_chunks
+
+                print "%s: %d chunks of %d bytes - %f seconds (%f chunks per second), %d put_blobs calls" % \
+                    (name, num_chunks, self.chunk_size, t2 - t1, num_chunks / (t2 - t1), len(ds.batches))
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-c", "--chunks", dest="chunks", default="10,100,1000", help="Comma separated list of the number of chunks to ingest")
+    parser.add_option("-s", "--size", dest="size", default=4096, help="The size of each chunk in bytes")
+    parser.add_option("-t", "--round_trip", dest="round_trip", default=0.005, help="Simulated round trip time of a put_blobs call in seconds")
+    parser.add_option("-b", "--bandwidth", dest="bandwidth", default=50000000, help="Simulated datastore bandwidth in bytes per second")
+    parser.add_option("-w", "--window", dest="window", default=4, help="The number of put_blobs calls in flight at once")
+    parser.add_option("-m", "--batch", dest="batch", default=1048576, help="The size in bytes at which blobs are sent in one put_blobs call")
+    opts, args = parser.parse_args()
+
+    chunk_counts = [int(x) for x in opts.chunks.split(',')]
+    tester = IngestionPerformanceTester(chunk_counts, int(opts.size), float(opts.round_trip), int(opts.window),
+                                        int(opts.batch), float(opts.bandwidth))
+
+    d = tester.runBenchMarks()
+    d.addErrback(log.error)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+if __name__ == "__main__":
+    main()
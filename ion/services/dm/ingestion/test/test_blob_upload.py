@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/dm/ingestion/test/test_blob_upload.py
+@author David Stuebe
+@test ion.services.dm.ingestion.blob_upload Exercise the windowed blob upload pipeline against an in memory datastore
+"""
+
+from twisted.trial import unittest
+from twisted.internet import defer
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from ion.services.dm.ingestion.blob_upload import BlobUploadPipeline
+
+
+class FakeLink(object):
+
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def SetLink(self, obj):
+        self.blobs.append(obj)
+
+
+class FakeBlobElements(list):
+
+    def add(self):
+        return FakeLink(self)
+
+
+class FakeBlobsMessage(object):
+
+    def __init__(self):
+        self.blob_elements = FakeBlobElements()
+
+
+class FakeDataStore(object):
+    """
+    Holds the blobs put to it - each put_blobs completes when the test fires it
+    """
+
+    def __init__(self):
+        self.blobs = []
+        self.batches = []
+        self.calls = []
+
+    def create_message(self):
+        return defer.succeed(FakeBlobsMessage())
+
+    def put_blobs(self, blobs_msg):
+        d = defer.Deferred()
+        self.calls.append((blobs_msg, d))
+        return d
+
+    def complete(self, index=0):
+        blobs_msg, d = self.calls.pop(index)
+        self.batches.append(list(blobs_msg.blob_elements))
+        self.blobs.extend(blobs_msg.blob_elements)
+        d.callback(None)
+
+    def fail(self, index=0):
+        blobs_msg, d = self.calls.pop(index)
+        d.errback(RuntimeError('Put blobs failed'))
+
+
+class BlobUploadPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ds = FakeDataStore()
+        self.pipeline = BlobUploadPipeline(self.ds.create_message, self.ds.put_blobs, window=2, batch_bytes=100)
+
+    def test_coalesce(self):
+        for i in range(5):
+            d = self.pipeline.add('blob %d' % i, 30)
+            self.assertTrue(d.called)
+
+        # The first four blobs reach the batch size, the fifth waits for more
+        self.assertEqual(len(self.ds.calls), 1)
+        self.assertEqual(len(self.pipeline), 1)
+
+        d = self.pipeline.drain()
+        self.assertEqual(len(self.ds.calls), 2)
+        self.assertFalse(d.called)
+
+        self.ds.complete()
+        self.ds.complete()
+        self.assertTrue(d.called)
+
+        self.assertEqual(self.ds.batches, [['blob 0', 'blob 1', 'blob 2', 'blob 3'], ['blob 4']])
+        self.assertEqual((self.pipeline.blobs_sent, self.pipeline.batches_sent), (5, 2))
+
+    def test_linked_on_add(self):
+        """
+        A blob is linked into the blobs message before add returns, so the caller may invalidate its object right away
+        """
+        messages = []
+        def create_message():
+            messages.append(FakeBlobsMessage())
+            return defer.succeed(messages[-1])
+
+        pipeline = BlobUploadPipeline(create_message, self.ds.put_blobs, window=2, batch_bytes=100)
+
+        self.assertTrue(pipeline.add('a', 30).called)
+        self.assertTrue(pipeline.add('b', 30).called)
+        self.assertEqual(messages[0].blob_elements, ['a', 'b'])
+        self.assertEqual(self.ds.calls, [])
+
+        # The batch is full - the next blob starts a new message
+        pipeline.add('c', 40)
+        pipeline.add('d', 10)
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(messages[1].blob_elements, ['d'])
+
+    def test_window(self):
+        """
+        Adding waits while the window is full, and continues as soon as a slot frees
+        """
+        self.assertTrue(self.pipeline.add('a', 100).called)
+
+        d = self.pipeline.add('b', 100)
+        self.assertFalse(d.called)
+        self.assertEqual(self.pipeline.in_flight, 2)
+
+        # Batches may complete out of order
+        self.ds.complete(1)
+        self.assertTrue(d.called)
+
+        d = self.pipeline.add('c', 100)
+        self.assertFalse(d.called)
+
+        self.ds.complete()
+        self.assertTrue(d.called)
+        self.ds.complete()
+
+        done = self.pipeline.drain()
+        self.assertTrue(done.called)
+        self.assertEqual(self.ds.blobs, ['b', 'a', 'c'])
+
+    def test_empty_drain(self):
+        d = self.pipeline.drain()
+        self.assertTrue(d.called)
+        self.assertEqual(self.ds.calls, [])
+
+    @defer.inlineCallbacks
+    def test_failure(self):
+        self.pipeline.add('a', 100)
+        waiting = self.pipeline.add('b', 100)
+
+        self.ds.fail()
+
+        # The chunk waiting for the window, later chunks and the drain all fail with the put error
+        yield self.failUnlessFailure(waiting, RuntimeError)
+        yield self.failUnlessFailure(self.pipeline.add('c', 100), RuntimeError)
+        yield self.failUnlessFailure(self.pipeline.drain(), RuntimeError)
+
+        self.ds.complete()
+        self.assertEqual(self.ds.blobs, ['b'])
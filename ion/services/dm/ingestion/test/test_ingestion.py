@@ -387,8 +387,10 @@ class IngestionTest(IonTestCase):
         self.assertIn(supplement_msg.bounded_array.MyId, self.ingest.dataset.Repository.index_hash)
         self.assertNotIn(supplement_msg.bounded_array.ndarray.MyId, self.ingest.dataset.Repository.index_hash)
 
-        # The datastore should now have this ndarray
-        self.failUnless(self.datastore.b_store.has_key(supplement_msg.bounded_array.ndarray.MyId))
+        # The datastore has this ndarray once the upload pipeline is drained
+        yield self.ingest._blob_uploads.drain()
+        has_key = yield self.datastore.b_store.has_key(supplement_msg.bounded_array.ndarray.MyId)
+        self.failUnless(has_key)
 
 
     def create_chunk(self, supplement_msg):
@@ -1217,6 +1219,99 @@ class IngestionTest(IonTestCase):
         self.failUnless("Expected message type" in ingestdef.result.msg_content.MessageResponseBody)
         self.failUnless(ingestdef.result.msg_content.MessageResponseCode, msg.ResponseCodes.BAD_REQUEST)
 
+    @defer.inlineCallbacks
+    def test_recv_chunks_via_subscriber(self):
+        """
+        Sends chunks through the ingestion subscriber rather than calling the op, so the receiver clears each chunk
+        message from the workbench as soon as its op completes - before the blob upload pipeline sends its blob.
+        """
+        new_dataset_id = 'C37A2796-E44C-47BF-BBFB-637339CE81D0'
+        new_datasource_id = '0B1B4D49-6C64-452F-989A-2CDB02561BBE'
+        yield self._create_datasource_and_set(new_dataset_id, new_datasource_id)
+
+        dataset = yield self.rc.get_instance(new_dataset_id)
+
+        var_name = "depth"
+        float_type = dataset.root_group.DataType.FLOAT
+        ddim = dataset.root_group.AddDimension(var_name, 100, False)
+        var = dataset.root_group.AddVariable(var_name, float_type, [ddim])
+        var.content = dataset.CreateObject(ARRAY_STRUCTURE_TYPE)
+
+        yield self.rc.put_instance(dataset, "Added depth variable")
+
+        msg = yield self.proc.message_client.create_instance(PERFORM_INGEST_MSG_TYPE)
+        msg.dataset_id = new_dataset_id
+        msg.reply_to = "fake.respond"
+        msg.ingest_service_timeout = 45
+        msg.datasource_id = new_datasource_id
+
+        def_ready = defer.Deferred()
+        def readyrecv(data):
+            def_ready.callback(True)
+
+        readysub = Subscriber(xp_name="magnet.topic",
+                              binding_key="fake.respond",
+                              process=self.proc)
+        readysub.ondata = readyrecv
+        yield readysub.initialize()
+        yield readysub.activate()
+
+        ingestdef = self._ic.ingest(msg)
+        yield def_ready
+
+        pub = Publisher(process=self.proc,
+                        xp_name=get_events_exchange_point(),
+                        routing_key="%s.%s" % (str(DATASET_STREAMING_EVENT_ID), new_dataset_id))
+
+        yield pub.initialize()
+        yield pub.activate()
+
+        @defer.inlineCallbacks
+        def send(operation, content):
+            kwargs = { 'recipient' : pub._routing_key,
+                       'content'   : content,
+                       'headers'   : {'sender-name' : self.proc.proc_name },
+                       'operation' : operation,
+                       'sender'    : self.proc.id.full }
+            yield pub._recv.send(**kwargs)
+
+        # The chunks are far smaller than the blob batch size, so none is sent before recv_done drains the pipeline
+        ndarray_keys = []
+        for x in xrange(10):
+            supplement_msg = yield self.proc.message_client.create_instance(SUPPLEMENT_MSG_TYPE)
+            supplement_msg.dataset_id = new_dataset_id
+            supplement_msg.variable_name = var_name
+
+            supplement_msg.bounded_array = supplement_msg.CreateObject(BOUNDED_ARRAY_TYPE)
+            supplement_msg.bounded_array.ndarray = supplement_msg.CreateObject(FLOAT32ARRAY_TYPE)
+
+            supplement_msg.bounded_array.bounds.add()
+            supplement_msg.bounded_array.bounds[0].origin = x * 10
+            supplement_msg.bounded_array.bounds[0].size = 10
+
+            supplement_msg.bounded_array.ndarray.value.extend([y/10.0 for y in range(x*10, x*10+10)])
+
+            supplement_msg.Repository.commit("committing round %d" % x)
+            ndarray_keys.append(supplement_msg.bounded_array.ndarray.MyId)
+
+            yield send('recv_chunk', supplement_msg)
+
+        complete_msg = yield self.proc.message_client.create_instance(DAQ_COMPLETE_MSG_TYPE)
+        complete_msg.status = complete_msg.StatusCode.OK
+        yield send('recv_done', complete_msg)
+
+        yield ingestdef
+
+        for key in ndarray_keys:
+            has_key = yield self.datastore.b_store.has_key(key)
+            self.failUnless(has_key)
+
+        dataset = yield self.rc.get_instance(new_dataset_id)
+        var = dataset.root_group.FindVariableByName(var_name)
+        self.failUnlessEqual(len(var.content.bounded_arrays), 10)
+        for x in xrange(0, 100, 7):
+            self.failUnlessApproximates(x/10.0, var.GetValue(x), 0.01)
+
     @defer.inlineCallbacks
     def test_recv_random_order(self):
         """
@@ -1284,6 +1379,8 @@ class IngestionTest(IonTestCase):
             # Call the op of the ingest process directly
             yield self.ingest._ingest_op_recv_chunk(supplement_msg, '', self.fake_msg())
 
+        yield self.ingest._blob_uploads.drain()
+
         updated_bounded_arrays = var.content.bounded_arrays[:]
 
         # should add 10 bounded arrays
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/dm/ingestion/test/test_time_axis.py
+@author David Stuebe
+@test ion.services.dm.ingestion.time_axis Check the numpy time axis merge math against the list scan it replaced, on
+synthetic datasets with long time series
+"""
+
+import random
+
+import numpy
+from twisted.trial import unittest
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from ion.services.dm.ingestion import time_axis
+
+
+def scan_ndarray_vals(chunks):
+    """
+    The list of (index, value) tuples the ingestion service used to build
+    """
+    results = []
+    for origin, vals in chunks:
+        for i in range(len(vals)):
+            results.append((origin + i, vals[i]))
+    results.sort()
+    return results
+
+
+def scan_find_time_index(values, search_times, THRESHOLD=0.001):
+    """
+    The linear scan the ingestion service used to search the time values
+    """
+    search_times_cpy = search_times[:]
+    results_dict = {}
+    for i, tup in enumerate(values):
+        idx, val = tup
+        for search_time in search_times_cpy:
+            if val is search_time or abs(val - search_time) < THRESHOLD:
+                results_dict[search_time] = idx
+                search_times_cpy.remove(search_time)
+            elif search_time < val:
+                results_dict[search_time] = -(idx + 1)
+                search_times_cpy.remove(search_time)
+        if len(search_times_cpy) == 0:
+            break
+
+    for search_time in search_times_cpy:
+        results_dict[search_time] = None
+
+    return results_dict
+
+
+def scan_overwrite_offsets(cur_values, sup_values, sup_agg_dim_length):
+    """
+    The overwrite offsets as the ingestion service used to calculate them
+    """
+    sup_var_start = sup_values[0][1]
+    sup_var_end = sup_values[-1][1]
+    cur_eindex = cur_values[-1][0]
+
+    time_indices = scan_find_time_index(cur_values, [sup_var_start, sup_var_end])
+
+    sup_sindex = time_indices[sup_var_start]
+    sup_eindex = time_indices[sup_var_end]
+
+    if sup_sindex < 0:
+        sup_sindex = -sup_sindex - 1
+
+    if sup_eindex is None:
+        sup_eindex = sup_sindex + sup_agg_dim_length - 1
+
+    if sup_eindex >= cur_eindex:
+        insertion_offset = sup_eindex - cur_eindex
+    else:
+        insertion_offset = 0
+
+    return sup_sindex, sup_eindex, insertion_offset
+
+
+def make_chunks(times, chunk_size, origin=0):
+    """
+    Split a time series into bounded arrays
+    """
+    return [(origin + i, times[i:i + chunk_size]) for i in range(0, len(times), chunk_size)]
+
+
+class TimeAxisTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rand = random.Random(1234)
+
+    def assert_time_axis(self, chunks):
+        indices, values = time_axis.time_axis(chunks)
+        expected = scan_ndarray_vals(chunks)
+
+        self.assertEqual(zip(indices.tolist(), values.tolist()), expected)
+        return indices, values, expected
+
+    def assert_search(self, chunks, search_times):
+        indices, values, expected = self.assert_time_axis(chunks)
+        self.assertEqual(time_axis.find_time_index(indices, values, search_times),
+                         scan_find_time_index(expected, search_times))
+
+    def test_search(self):
+        times = [3600.0 * i for i in range(1000)]
+        chunks = make_chunks(times, 100)
+
+        # Exact times, times between steps, before the start and after the end
+        for search_time in [0.0, 3600.0, 1800.0, 3599.9995, -5.0, times[-1], times[-1] + 1.0]:
+            self.assert_search(chunks, [search_time])
+
+        # Pairs of times resolved at the same and at neighbouring positions
+        for pair in [[7200.0, 7200.0], [7200.0, 7300.0], [7200.0, 10800.0], [10800.0, 7200.0],
+                     [1800.0, 1900.0], [times[-1], times[-1]], [-1.0, -2.0], [0.0, times[-1] + 1.0]]:
+            self.assert_search(chunks, pair)
+
+        # Random times
+        for i in range(50):
+            search_times = [self.rand.uniform(-3600.0, 3600000.0) for j in range(self.rand.randint(1, 4))]
+            self.assert_search(chunks, search_times)
+
+    def test_duplicate_and_disordered(self):
+        """
+        Bounded arrays which repeat indices, and a time axis which is not ordered by value
+        """
+        times = [10.0 * i for i in range(200)]
+        chunks = make_chunks(times, 50) + [(40, times[40:60])]
+        self.assert_search(chunks, [400.0, 405.0, 590.0])
+
+        disordered = times[:]
+        disordered[100], disordered[120] = disordered[120], disordered[100]
+        chunks = make_chunks(disordered, 50)
+        for search_time in [995.0, 1200.0, 1195.0, 2500.0]:
+            self.assert_search(chunks, [search_time])
+        self.assert_search(chunks, [995.0, 1195.0])
+
+    def test_integer_times(self):
+        times = range(1280106120, 1280106120 + 3600 * 500, 3600)
+        self.assert_search(make_chunks(times, 64), [times[10], times[10] + 1800, times[-1] + 3600])
+
+    def assert_overwrite(self, cur_times, sup_times, chunk_size):
+        cur_chunks = make_chunks(cur_times, chunk_size)
+        sup_chunks = make_chunks(sup_times, chunk_size)
+
+        cur_indices, cur_values, cur_expected = self.assert_time_axis(cur_chunks)
+        sup_indices, sup_values, sup_expected = self.assert_time_axis(sup_chunks)
+
+        result = time_axis.overwrite_offsets(cur_indices, cur_values, sup_values, len(sup_times))
+        expected = scan_overwrite_offsets(cur_expected, sup_expected, len(sup_times))
+        self.assertEqual(result, expected)
+        return result
+
+    def test_overwrite_offsets(self):
+        """
+        Supplements overwriting a long time series, on a dataset of 10^5 time steps
+        """
+        num_steps = 100000
+        cur_times = [60.0 * i for i in range(num_steps)]
+
+        # Overlapping the end of the dataset
+        sindex, eindex, offset = self.assert_overwrite(cur_times, [60.0 * i for i in range(num_steps - 10, num_steps + 90)], 1000)
+        self.assertEqual((sindex, eindex, offset), (num_steps - 10, num_steps - 10 + 99, 90))
+
+        # Inside the dataset, on and between the time steps
+        self.assert_overwrite(cur_times, [60.0 * i for i in range(5000, 6000)], 1000)
+        self.assert_overwrite(cur_times, [60.0 * i + 30.0 for i in range(5000, 6000)], 1000)
+
+        # Starting before the dataset
+        self.assert_overwrite(cur_times, [60.0 * i - 600.0 for i in range(100)], 1000)
+
+        # Random supplements
+        for i in range(10):
+            start = self.rand.randint(0, num_steps + 100)
+            length = self.rand.randint(1, 5000)
+            shift = self.rand.choice([0.0, 0.0002, 15.0])
+            self.assert_overwrite(cur_times, [60.0 * j + shift for j in range(start, start + length)], 997)
+
+    def test_long_overlap(self):
+        """
+        The overlap search on a supplement of 10^6 time steps
+        """
+        num_steps = 1000000
+        sup_times = numpy.arange(num_steps, dtype=numpy.float64) * 10.0
+        chunks = make_chunks(sup_times.tolist(), 50000)
+
+        indices, values = time_axis.time_axis(chunks)
+        expected = scan_ndarray_vals(chunks)
+
+        for cur_etime in [0.0, 5.0, sup_times[123456], sup_times[-1], sup_times[-1] + 10.0]:
+            self.assertEqual(time_axis.find_time_index(indices, values, [cur_etime]),
+                             scan_find_time_index(expected, [cur_etime]))
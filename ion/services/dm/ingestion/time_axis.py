@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/dm/ingestion/time_axis.py
+@author David Stuebe
+@brief The index math used to merge a supplement into a dataset along its time axis, on numpy arrays. The time values
+of a variable are gathered into one index array and one value array and searched with a binary search rather than a
+scan for each search time.
+"""
+
+import numpy
+
+
+def time_axis(chunks):
+    """
+    Gather the values of the bounded arrays of a one dimensional variable
+    @param chunks an iterable of (origin, values) for each bounded array
+    @retval an array of indices and an array of values ordered by index then value. Bounded arrays may repeat an index,
+    in which case it appears more than once.
+    """
+    indices = []
+    values = []
+    for origin, vals in chunks:
+        vals = numpy.asarray(vals)
+        indices.append(numpy.arange(origin, origin + len(vals), dtype=numpy.int64))
+        values.append(vals)
+
+    if not indices:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0)
+
+    indices = numpy.concatenate(indices)
+    values = numpy.concatenate(values)
+
+    order = numpy.lexsort((values, indices))
+    return indices[order], values[order]
+
+
+class _TimeSearch(object):
+    """
+    Finds the first position at or after a start position where the time value is greater than a bound. A time axis
+    is normally ordered by value as well as by index, in which case this is a binary search.
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.ordered = len(values) < 2 or bool(numpy.all(values[1:] >= values[:-1]))
+
+    def first_above(self, bound, start):
+        values = self.values
+        if start >= len(values):
+            return len(values)
+
+        if self.ordered:
+            return max(start, int(numpy.searchsorted(values, bound, side='right')))
+
+        # A disordered axis - still one pass in numpy rather than in python
+        above = numpy.flatnonzero(values[start:] > bound)
+        if len(above) == 0:
+            return len(values)
+        return start + int(above[0])
+
+
+def find_time_index(indices, values, search_times, threshold=0.001):
+    """
+    Find where each search time lies in a time axis.
+
+    For each search time the result is the index of the first time value within threshold of it, or -(index + 1) where
+    index is that of the first time value after it, or None if every time value is before it. The search times are
+    resolved in order while walking the time axis; once a search time is found, the next one in the list is not
+    considered until the following time value - so a later search time is never found at the same position as an
+    earlier one.
+
+    @param indices the index of each time value, as returned by time_axis
+    @param values the time values, as returned by time_axis
+    @param search_times a list of times to find
+    @retval a dict of search time to index
+    """
+    search = _TimeSearch(values)
+    num_values = len(values)
+
+    # The position at which each search time is found - its first time value above search_time - threshold
+    remaining = list(search_times)
+    results = {}
+
+    position = 0
+    while remaining:
+        position = min([search.first_above(search_time - threshold, position) for search_time in remaining])
+        if position >= num_values:
+            break
+
+        value = values[position]
+        idx = int(indices[position])
+
+        # Visit the search times as a loop over the list which removes the found ones would
+        k = 0
+        while k < len(remaining):
+            search_time = remaining[k]
+            if value > search_time - threshold:
+                if abs(value - search_time) < threshold:
+                    results[search_time] = idx
+                else:
+                    results[search_time] = -(idx + 1)
+                remaining.remove(search_time)
+            k += 1
+
+        position += 1
+
+    for search_time in remaining:
+        results[search_time] = None
+
+    return results
+
+
+def overwrite_offsets(cur_indices, cur_values, sup_values, sup_agg_dim_length, threshold=0.001):
+    """
+    Calculate where an overwriting supplement lies in the current dataset
+    @param cur_indices, cur_values the time axis of the current dataset
+    @param sup_values the time values of the supplement, ordered as returned by time_axis
+    @param sup_agg_dim_length the length of the supplement along the time axis
+    @retval (sup_sindex, sup_eindex, insertion_offset)
+    """
+    sup_var_start = sup_values[0].item()
+    sup_var_end = sup_values[-1].item()
+
+    cur_eindex = int(cur_indices[-1])
+
+    time_indices = find_time_index(cur_indices, cur_values, [sup_var_start, sup_var_end], threshold)
+
+    sup_sindex = time_indices[sup_var_start]
+    sup_eindex = time_indices[sup_var_end]
+
+    # Adjust indices when the supplement times lay between indices in the current dataset
+    if sup_sindex < 0:
+        sup_sindex = -sup_sindex - 1
+
+    if sup_eindex is None:
+        sup_eindex = sup_sindex + sup_agg_dim_length - 1
+
+    # Calculate the insertion offset -- how bounded_arrays ordered after the overwritten section must be offset
+    if sup_eindex >= cur_eindex:
+        insertion_offset = sup_eindex - cur_eindex
+    else:
+        insertion_offset = 0
+
+    return sup_sindex, sup_eindex, insertion_offset
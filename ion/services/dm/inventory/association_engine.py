@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/dm/inventory/association_engine.py
+@author David Stuebe
+@brief A set based query engine for the association service. Triples are evaluated as set operations over a fixed
+number of index store queries - one query per association pair and one query for the head commits of all the
+candidates - rather than one query per candidate row.
+"""
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from twisted.internet import defer
+
+from ion.core.exception import ApplicationError
+
+from ion.core.data import store
+from ion.core.data.storage_configuration_utility import PREDICATE_KEY, OBJECT_KEY, BRANCH_NAME, SUBJECT_KEY
+from ion.core.data.storage_configuration_utility import SUBJECT_BRANCH, OBJECT_BRANCH, REPOSITORY_KEY
+from ion.core.data.storage_configuration_utility import RESOURCE_OBJECT_TYPE, RESOURCE_LIFE_CYCLE_STATE
+
+from ion.services.coi.datastore_bootstrap.ion_preload_config import HAS_LIFE_CYCLE_STATE_ID, TYPE_OF_ID
+
+from ion.core.object import object_utils
+
+from net.ooici.core.message.ion_message_pb2 import BAD_REQUEST
+
+PREDICATE_REFERENCE_TYPE = object_utils.create_type_identifier(object_id=25, version=1)
+
+LifeCycleStateObject = object_utils.create_type_identifier(object_id=26, version=1)
+
+
+class AssociationServiceError(ApplicationError):
+    """
+    An exception class for the Association Service
+    """
+
+
+# The two ends of an association - the column holding the key and the column holding the branch
+SUBJECT_END = (SUBJECT_KEY, SUBJECT_BRANCH)
+OBJECT_END = (OBJECT_KEY, OBJECT_BRANCH)
+
+
+class AssociationQueryEngine(object):
+    """
+    Evaluate association queries against an index store of commits.
+
+    The candidates for a query are collected from the association rows as a map of repository key to the set of
+    branches named in the associations. Candidates from several pairs are intersected in memory. Only the candidates
+    which survive the intersection are checked against the head commits of their repository, using a single query
+    with an IN predicate on the repository key. The type and life cycle state of a resource are denormalized in to
+    its head commits, so filtering by type or state is applied to the same rows.
+
+    Queries are read only - divergent heads are reported but not merged.
+    """
+
+    def __init__(self, index_store, page_size=store.DEFAULT_QUERY_PAGE_SIZE):
+        """
+        @param index_store the index store of commits
+        @param page_size the number of rows to read at a time
+        """
+        self.index_store = index_store
+        self.page_size = page_size
+
+        # The number of queries made against the index store
+        self.store_queries = 0
+
+    @defer.inlineCallbacks
+    def _read_query(self, q):
+        """
+        Read the results of a query a page at a time
+        @retval a list of rows
+        """
+        self.store_queries += 1
+        cursor = self.index_store.query_cursor(q, page_size=self.page_size)
+
+        result = []
+        while not cursor.exhausted:
+            rows = yield cursor.next_page()
+            result.extend(rows.itervalues())
+
+        defer.returnValue(result)
+
+    def _split_pairs(self, pairs, far_end_name, allow_type_and_state):
+        """
+        Separate the search by type and life cycle state from the search by association
+        @retval (association pairs, type_of_pair, life_cycle_pair)
+        """
+        association_pairs = []
+        type_of_pair = None
+        life_cycle_pair = None
+
+        for pair in pairs:
+
+            if pair.predicate.ObjectType != PREDICATE_REFERENCE_TYPE:
+                raise AssociationServiceError('Invalid predicate type in association query.', BAD_REQUEST)
+
+            if allow_type_and_state and pair.predicate.key == HAS_LIFE_CYCLE_STATE_ID:
+
+                if getattr(pair, far_end_name).ObjectType != LifeCycleStateObject:
+                    raise AssociationServiceError('Invalid object type in association query.', BAD_REQUEST)
+
+                if life_cycle_pair is not None:
+                    raise AssociationServiceError('Invalid search by life cycle state - two predicate object pairs in the query specify life cycle. There can be only One!', BAD_REQUEST)
+                life_cycle_pair = pair
+
+            elif allow_type_and_state and pair.predicate.key == TYPE_OF_ID:
+
+                if type_of_pair is not None:
+                    raise AssociationServiceError('Invalid search by type - two predicate object pairs in the query specify type_of. There can be only One!', BAD_REQUEST)
+                type_of_pair = pair
+
+            else:
+                association_pairs.append(pair)
+
+        return association_pairs, type_of_pair, life_cycle_pair
+
+    @defer.inlineCallbacks
+    def _association_candidates(self, association_pairs, far_end_name, far_column, near_end):
+        """
+        Find the repositories at the near end of the current associations matching all the pairs.
+        @param far_end_name the attribute of the pair which holds the reference to the far end ('object' or 'subject')
+        @param far_column the commit column holding the key of the far end
+        @param near_end SUBJECT_END or OBJECT_END - the end of the association we are looking for
+        @retval a dictionary mapping repository key to a set of branch names
+        """
+        near_key_column, near_branch_column = near_end
+
+        candidates = None
+
+        for pair in association_pairs:
+
+            q = store.Query()
+            # Get only the latest version of the association!
+            q.add_predicate_gt(BRANCH_NAME,'')
+            q.add_predicate_eq(PREDICATE_KEY, pair.predicate.key)
+            q.add_predicate_eq(far_column, getattr(pair, far_end_name).key)
+
+            rows = yield self._read_query(q)
+
+            pair_candidates = {}
+            for row in rows:
+                pair_candidates.setdefault(row[near_key_column], set()).add(row[near_branch_column])
+
+            candidates = _intersect_candidates(candidates, pair_candidates)
+
+            if not candidates:
+                # Nothing can match - no need to look at the rest of the pairs
+                break
+
+        defer.returnValue(candidates or {})
+
+    @defer.inlineCallbacks
+    def _filter_heads(self, candidates, type_of_pair=None, life_cycle_pair=None):
+        """
+        Keep the candidates whose repository has a head commit on the associated branch, and which meet the type and
+        life cycle state criteria if given. A divergent repository is kept if any one of its heads meets the criteria -
+        merging the heads is a write which is left to the next resource client which reads it.
+        @param candidates a dictionary mapping repository key to a set of branch names
+        @retval a set of (repository key, branch name) tuples
+        """
+        result = set()
+        if not candidates:
+            defer.returnValue(result)
+
+        q = store.Query()
+        q.add_predicate_gt(BRANCH_NAME,'')
+        q.add_predicate_in(REPOSITORY_KEY, sorted(candidates.keys()))
+
+        rows = yield self._read_query(q)
+
+        heads = {}
+        for row in rows:
+            heads.setdefault(row[REPOSITORY_KEY], []).append(row)
+
+        for repo_key, branches in candidates.iteritems():
+
+            head_rows = heads.get(repo_key)
+            if not head_rows:
+                # The repository is not in the store
+                continue
+
+            seen = set()
+            for row in head_rows:
+
+                if row[BRANCH_NAME] not in branches:
+                    raise NotImplementedError('Dealing with associations to a resource with multiple branches is not yet supported')
+
+                if row[BRANCH_NAME] in seen:
+                    log.warn("Association query found a divergent resource: %s" % str(repo_key))
+
+                seen.add(row[BRANCH_NAME])
+
+                if _meets_criteria(row, type_of_pair, life_cycle_pair):
+                    result.add((repo_key, row[BRANCH_NAME]))
+
+        defer.returnValue(result)
+
+    @defer.inlineCallbacks
+    def _search_by_type(self, type_of_pair, life_cycle_pair):
+        """
+        Go straight to the denormalized rows for the resource commits
+        """
+        if not type_of_pair:
+            raise AssociationServiceError('Illegal request to association service. Can not return all subjects by life cycle - there are too many!')
+
+        q = store.Query()
+        q.add_predicate_gt(BRANCH_NAME,'')
+
+        # This is by definition a search for a Resource
+        q.add_predicate_eq(RESOURCE_OBJECT_TYPE, type_of_pair.object.key)
+
+        if life_cycle_pair:
+            q.add_predicate_eq(RESOURCE_LIFE_CYCLE_STATE, str(life_cycle_pair.object.lcs))
+
+        rows = yield self._read_query(q)
+
+        defer.returnValue(set([(row[REPOSITORY_KEY], row[BRANCH_NAME]) for row in rows]))
+
+    @defer.inlineCallbacks
+    def get_subjects(self, predicate_object_pairs):
+        """
+        @param predicate_object_pairs the pairs of a predicate object query message
+        @retval a set of (repository key, branch name) tuples for the subjects
+        """
+        association_pairs, type_of_pair, life_cycle_pair = self._split_pairs(predicate_object_pairs, 'object', True)
+
+        if not association_pairs:
+            subjects = yield self._search_by_type(type_of_pair, life_cycle_pair)
+
+        else:
+            candidates = yield self._association_candidates(association_pairs, 'object', OBJECT_KEY, SUBJECT_END)
+            subjects = yield self._filter_heads(candidates, type_of_pair, life_cycle_pair)
+
+        log.info('Found %s subjects!' % len(subjects))
+        defer.returnValue(subjects)
+
+    @defer.inlineCallbacks
+    def get_objects(self, subject_predicate_pairs):
+        """
+        @param subject_predicate_pairs the pairs of a subject predicate query message
+        @retval a set of (repository key, branch name) tuples for the objects
+        """
+        association_pairs, type_of_pair, life_cycle_pair = self._split_pairs(subject_predicate_pairs, 'subject', False)
+
+        candidates = yield self._association_candidates(association_pairs, 'subject', SUBJECT_KEY, OBJECT_END)
+        objects = yield self._filter_heads(candidates)
+
+        log.info('Found %s objects!' % len(objects))
+        defer.returnValue(objects)
+
+    @defer.inlineCallbacks
+    def get_star(self, subject_pairs, object_pairs):
+        """
+        The intersection of the objects of the subject pairs and the subjects of the object pairs. The candidates from
+        both searches are intersected before the head commits are checked, so only one head query is needed.
+        @retval a set of (repository key, branch name) tuples
+        """
+        association_pairs, type_of_pair, life_cycle_pair = self._split_pairs(object_pairs, 'object', True)
+        object_association_pairs, unused_type, unused_lcs = self._split_pairs(subject_pairs, 'subject', False)
+
+        if not association_pairs:
+            subjects = yield self._search_by_type(type_of_pair, life_cycle_pair)
+            objects = yield self.get_objects(subject_pairs)
+            stars = subjects.intersection(objects)
+
+        else:
+            subject_candidates = yield self._association_candidates(association_pairs, 'object', OBJECT_KEY, SUBJECT_END)
+
+            object_candidates = {}
+            if subject_candidates:
+                object_candidates = yield self._association_candidates(object_association_pairs, 'subject', SUBJECT_KEY, OBJECT_END)
+
+            candidates = _intersect_candidates(subject_candidates, object_candidates)
+            stars = yield self._filter_heads(candidates, type_of_pair, life_cycle_pair)
+
+        log.info("Intersection: %d items" % len(stars))
+        defer.returnValue(stars)
+
+    @defer.inlineCallbacks
+    def get_association(self, subject_key, predicate_key, object_key):
+        """
+        @retval a list of the current association rows between the subject, predicate and object
+        """
+        q = store.Query()
+        # Get only the latest version of the association!
+        q.add_predicate_gt(BRANCH_NAME,'')
+        q.add_predicate_eq(SUBJECT_KEY, subject_key)
+        q.add_predicate_eq(PREDICATE_KEY, predicate_key)
+        q.add_predicate_eq(OBJECT_KEY, object_key)
+
+        rows = yield self._read_query(q)
+        defer.returnValue(rows)
+
+
+def _intersect_candidates(candidates, new_candidates):
+    """
+    Intersect two maps of repository key to branch names. None is the universal set.
+    """
+    if candidates is None:
+        return new_candidates
+
+    result = {}
+    for key, branches in new_candidates.iteritems():
+        if key in candidates:
+            common = candidates[key].intersection(branches)
+            if common:
+                result[key] = common
+
+    return result
+
+
+def _meets_criteria(row, type_of_pair, life_cycle_pair):
+    """
+    Check the denormalized type and life cycle state of a resource head commit
+    """
+    if type_of_pair is not None and row.get(RESOURCE_OBJECT_TYPE) != type_of_pair.object.key:
+        return False
+
+    if life_cycle_pair is not None and row.get(RESOURCE_LIFE_CYCLE_STATE) != str(life_cycle_pair.object.lcs):
+        return False
+
+    return True
@@ -6,7 +6,6 @@
 @author Matt Rodriguez
 @brief A service to provide indexing and search capability of objects in the datastore
 """
-from ion.services.coi.resource_registry.resource_client import ResourceClient
 
 import ion.util.ionlog
 from net.ooici.core.message.ion_message_pb2 import BAD_REQUEST
@@ -21,6 +20,7 @@ from ion.core.process.process import ProcessFactory
 from ion.core.process.service_process import ServiceProcess, ServiceClient
 
 from ion.core.data import cassandra
+from ion.core.data import sqlite_store
 from ion.core.data.storage_configuration_utility import COMMIT_INDEXED_COLUMNS, PREDICATE_KEY, OBJECT_KEY, COMMIT_CACHE
 from ion.core.data.storage_configuration_utility import  BRANCH_NAME, SUBJECT_KEY,  SUBJECT_BRANCH, RESOURCE_OBJECT_TYPE 
 from ion.core.data.storage_configuration_utility import  RESOURCE_LIFE_CYCLE_STATE, REPOSITORY_KEY, OBJECT_BRANCH
@@ -30,6 +30,8 @@ from ion.services.coi.datastore_bootstrap.ion_preload_config import HAS_LIFE_CYC
 
 from ion.core.data import store
 
+from ion.services.dm.inventory.association_engine import AssociationQueryEngine, AssociationServiceError
+
 from ion.core.object import object_utils
 
 from ion.core import ioninit
@@ -52,10 +54,6 @@ PREDICATE_REFERENCE_TYPE = object_utils.create_type_identifier(object_id=25, ver
 
 LifeCycleStateObject = object_utils.create_type_identifier(object_id=26, version=1)
 
-class AssociationServiceError(ApplicationError):
-    """
-    An exception class for the Association Service
-    """
 
 
 class AssociationService(ServiceProcess):
@@ -86,7 +84,9 @@ class AssociationService(ServiceProcess):
 
         # Get the configuration for cassandra - may or may not be used depending on the backend class
         self._storage_conf = get_cassandra_configuration()
-        self._rc = ResourceClient(proc=self)
+
+        # The number of rows to read at a time from the index store for queries which may return many rows
+        self._query_page_size = int(self.spawn_args.get('query_page_size', CONF.getValue('query_page_size', store.DEFAULT_QUERY_PAGE_SIZE)))
 
 
 
@@ -103,202 +103,17 @@ class AssociationService(ServiceProcess):
             self.index_store = self.index_store_class(self._username, self._password, storage_provider, keyspace, COMMIT_CACHE)
 
             yield self.register_life_cycle_object(self.index_store)
+        elif issubclass(self.index_store_class, sqlite_store.SqliteIndexStore):
+            log.info("Instantiating Sqlite Index Store")
+
+            keyspace = self._storage_conf[PERSISTENT_ARCHIVE]['name']
+            self.index_store = self.index_store_class(keyspace, COMMIT_CACHE, indices=COMMIT_INDEXED_COLUMNS)
         else:
             self.index_store = self.index_store_class(self, indices=COMMIT_INDEXED_COLUMNS )
 
-        log.info('SLC_INIT Association Service: index store class - %s' % self.index_store_class)
-
-    @defer.inlineCallbacks
-    def _get_subjects(self, predicate_pairs):
-        life_cycle_pair = None
-        type_of_pair = None
-
-        subjects = set()
-
-        # subject_keys is the set of keys for the associated subjects - to reject quickly any that are not present
-        subject_keys = set()
-
-        first_pair = True
-
-        for pair in predicate_pairs:
-
-
-            q = store.Query()
-            # Get only the latest version of the association!
-            q.add_predicate_gt(BRANCH_NAME,'')
-
-            # Build a query for the predicate of the search
-            if pair.predicate.ObjectType != PREDICATE_REFERENCE_TYPE:
-                raise AssociationServiceError('Invalid predicate type in _get_subjects.', BAD_REQUEST)
-
-
-            # if the predicate is for life cycle state or type - do not use associations to find it.
-            if pair.predicate.key == HAS_LIFE_CYCLE_STATE_ID:
-                if pair.object.ObjectType != LifeCycleStateObject:
-                    raise AssociationServiceError('Invalid object type in _get_subjects.', BAD_REQUEST)
-
-                if not life_cycle_pair:
-                    life_cycle_pair = pair
-                else:
-                    # two life cycle pairs in one request is an error!
-                    raise AssociationServiceError('Invalid search by life cycle state - two predicate object pairs in the query specify life cycle. There can be only One!', BAD_REQUEST)  # Highlander!
-
-                continue
-
-            elif pair.predicate.key == TYPE_OF_ID:
-
-                if not type_of_pair:
-                    type_of_pair = pair
-
-                else:
-                    # two life cycle pairs in one request is an error!
-                    raise AssociationServiceError('Invalid search by type - two predicate object pairs in the query specify type_of. There can be only One!', BAD_REQUEST)
-                continue
-
-            q.add_predicate_eq(PREDICATE_KEY, pair.predicate.key)
-
-            q.add_predicate_eq(OBJECT_KEY, pair.object.key)
-
-            rows = yield self.index_store.query(q)
-
-            # subject_pointers is the resulting set of pointers to the current state of the association subject
-            subjects_pointers = set()
-
-            current_keys = set()
-            for key, row in rows.items():
-
-
-                #@TODO - check for divergence and branches in the association and in the object - not just the subject
-
-                if not first_pair and row[SUBJECT_KEY] not in subject_keys:
-                    # The result we are looking for is an intersection operation. If this key is not here escape!
-                    continue
-                current_keys.add(row[SUBJECT_KEY])
-
-                # Get the latest commits for the Subject_Key
-                subject_query = store.Query()
-                # Get only the head or get all? Hmmm not sure...
-                subject_query.add_predicate_gt(BRANCH_NAME,'')
-                subject_query.add_predicate_eq(REPOSITORY_KEY,row[SUBJECT_KEY])
-                subject_heads = yield self.index_store.query(subject_query)
-
-                subj_candidates = {}     # map branch -> object_key
-                resolve_objs = []       # list of object keys we need to resolve due to multiple branches
-
-                for commit_key, commit_row in subject_heads.items():
-
-                    if commit_row[BRANCH_NAME] != row[SUBJECT_BRANCH]:
-                        raise NotImplementedError('Dealing with associations to a subject with multiple branches is not yet supported')
-
-                    # have we already seen this branch name? if so, we have divergence, add it to list of things to resolve
-                    if commit_row[BRANCH_NAME] in subj_candidates:
-                        # remove it
-                        del subj_candidates[commit_row[BRANCH_NAME]]
-
-                        # push it to resolve objs
-                        resolve_objs.append(row[SUBJECT_KEY])
-
-                        log.warn("_get_subjects found a divergent subject: %s" % str(row[SUBJECT_KEY]))
-                    else:
-                        subj_candidates[commit_row[BRANCH_NAME]] = row[SUBJECT_KEY]
-
-                # do we have to resolve anything
-                for rkey in resolve_objs:
-                    r = yield self._rc.get_instance(rkey)
-
-                    # make sure we are a merge commit
-                    if len(r.Repository._current_branch.commitrefs[0].parentrefs) != 2:
-                        raise AssociationServiceError("_get_subjects attempted to resolve a divergent associated subjects but rc did not give us a merge commit")
-
-                    # put it back
-                    yield self._rc.put_instance(r)
-
-                    # add our key/branch pair to the candidates
-                    subj_candidates[r.Repository._current_branch.branchkey] = rkey
-
-                # candidates are now final, add them to objects_pointers
-                for branch, key in subj_candidates.iteritems():
-                    total_key = (key, branch)
-                    subjects_pointers.add(total_key)
-
-            # Now - at the end of the loop over the pairs - take the intersection with the current search results!
-            if first_pair:
-                subjects = subjects_pointers
-                subject_keys.update(current_keys)
-                first_pair = False
-            else:
-                subject_keys.intersection_update(current_keys)
-                subjects.intersection_update(subjects_pointers)
-
-
-        # Now apply any search by type or lcs!
-        if first_pair:
-            # If there was no search by association - only by type and state - type must be true!
-
-            if not type_of_pair:
-                raise AssociationServiceError('Illegal request to association service. Can not return all subjects by life cycle - there are too many!')
-
-            # Now we are not searching for associations - we are taking a shortcut - straight to the denormalized row for a resource commit!
-            q = store.Query()
-            q.add_predicate_gt(BRANCH_NAME,'')
-
-
-            # This is by definition a search for a Resource
-            q.add_predicate_eq(RESOURCE_OBJECT_TYPE, type_of_pair.object.key)
-
-
-            if life_cycle_pair:
-                q.add_predicate_eq(RESOURCE_LIFE_CYCLE_STATE, str(life_cycle_pair.object.lcs))
-
-
-            # Get all the results that meet the type / state query
-            rows = yield self.index_store.query(q)
-
-            # This is a simple search - just add the results!
-            for key, row in rows.items():
-
-                totalkey = (row[REPOSITORY_KEY] , row[BRANCH_NAME])
-
-                subjects.add(totalkey)
+        self.engine = AssociationQueryEngine(self.index_store, page_size=self._query_page_size)
 
-        elif len(subjects) > 0 and life_cycle_pair or type_of_pair:
-            # Now apply search by type and state... if needed.
-
-            new_set=set()
-
-            # Assumption - the number of rows returned by the association search is much smaller than what will come from search by type or state!
-            for subject in subjects:
-
-                # There for, for each result - check and see if it meets the criteria by type and state...
-                q = store.Query()
-
-                # Test this repository key
-                q.add_predicate_eq(REPOSITORY_KEY, subject[0])
-
-                # Latest state
-                q.add_predicate_gt(BRANCH_NAME,'')
-
-                if life_cycle_pair:
-                    q.add_predicate_eq(RESOURCE_LIFE_CYCLE_STATE, str(life_cycle_pair.object.lcs))
-
-                if type_of_pair:
-                    q.add_predicate_eq(RESOURCE_OBJECT_TYPE, type_of_pair.object.key)
-
-                # Get all the results that meet the type / state query
-                rows = yield self.index_store.query(q)
-
-                for key, row in rows.items():
-
-                    totalkey = (row[REPOSITORY_KEY] , row[BRANCH_NAME])
-
-                    new_set.add(totalkey)
-
-            # Keep the results from our narrowed search
-            subjects = new_set
-
-
-        log.info('Found %s subjects!' % len(subjects))
-        defer.returnValue(subjects)
+        log.info('SLC_INIT Association Service: index store class - %s' % self.index_store_class)
 
     @defer.inlineCallbacks
     def op_get_subjects(self, predicate_object_query, headers, msg):
@@ -313,7 +128,7 @@ class AssociationService(ServiceProcess):
         if len(predicate_object_query.pairs) == 0:
             raise AssociationServiceError('Invalid Predicate Object Query received - zero length pairs!', predicate_object_query.ResponseCodes.BAD_REQUEST)
 
-        subjects = yield self._get_subjects(predicate_object_query.pairs)
+        subjects = yield self.engine.get_subjects(predicate_object_query.pairs)
         list_of_subjects = yield self.message_client.create_instance(QUERY_RESULT_TYPE)
 
         for subject in subjects:
@@ -329,103 +144,6 @@ class AssociationService(ServiceProcess):
 
         yield self.reply_ok(msg, list_of_subjects)
 
-    @defer.inlineCallbacks
-    def _get_objects(self, subject_pairs):
-        # The resulting set of Objects
-        objects = set()
-
-        first_pair = True
-
-        # subject_keys is the set of keys for the associated subjects - to reject quickly any that are not present
-        object_keys = set()
-
-        for pair in subject_pairs:
-
-
-            q = store.Query()
-            # Get only the latest version of the association!
-            q.add_predicate_gt(BRANCH_NAME,'')
-
-            # Build a query for the predicate of the search
-            if pair.predicate.ObjectType != PREDICATE_REFERENCE_TYPE:
-                raise AssociationServiceError('Invalid predicate type in _get_objects.', BAD_REQUEST)
-
-            q.add_predicate_eq(PREDICATE_KEY, pair.predicate.key)
-
-            q.add_predicate_eq(SUBJECT_KEY, pair.subject.key)
-
-            rows = yield self.index_store.query(q)
-
-            # subject_pointers is the resulting set of pointers to the current state of the association subject
-            objects_pointers = set()
-
-            current_keys=set()
-            for key, row in rows.items():
-
-                if not first_pair and row[OBJECT_KEY] not in object_keys:
-                    # The result we are looking for is an intersection operation. If this key is not her escape!
-                    continue
-
-                current_keys.add(row[OBJECT_KEY])
-
-                # Get the latest commits for the Subject_Key
-                object_query = store.Query()
-                # Get only the head or get all? Hmmm not sure...
-                object_query.add_predicate_gt(BRANCH_NAME,'')
-                object_query.add_predicate_eq(REPOSITORY_KEY,row[OBJECT_KEY])
-                object_heads = yield self.index_store.query(object_query)
-
-                obj_candidates = {}     # map branch -> object_key
-                resolve_objs = []       # list of object keys we need to resolve due to multiple branches
-
-                for commit_key, commit_row in object_heads.items():
-
-                    if commit_row[BRANCH_NAME] != row[OBJECT_BRANCH]:
-                        raise NotImplementedError('Dealing with associations to a Object with multiple branches is not yet supported')
-
-                    # have we already seen this branch name? if so, we have divergence, add it to list of things to resolve
-                    if commit_row[BRANCH_NAME] in obj_candidates:
-                        # remove it
-                        del obj_candidates[commit_row[BRANCH_NAME]]
-
-                        # push it to resolve objs
-                        resolve_objs.append(row[OBJECT_KEY])
-
-                        log.warn("_get_objects found a divergent object: %s" % str(row[OBJECT_KEY]))
-                    else:
-                        obj_candidates[commit_row[BRANCH_NAME]] = row[OBJECT_KEY]
-
-                # do we have to resolve anything
-                for rkey in resolve_objs:
-                    r = yield self._rc.get_instance(rkey)
-
-                    # make sure we are a merge commit
-                    if len(r.Repository._current_branch.commitrefs[0].parentrefs) != 2:
-                        raise AssociationServiceError("_get_objects attempted to resolve a divergent associated object but rc did not give us a merge commit")
-
-                    # put it back
-                    yield self._rc.put_instance(r)
-
-                    # add our key/branch pair to the candidates
-                    obj_candidates[r.Repository._current_branch.branchkey] = rkey
-
-                # candidates are now final, add them to objects_pointers
-                for branch, key in obj_candidates.iteritems():
-                    total_key = (key, branch)
-                    objects_pointers.add(total_key)
-
-            # Now - at the end of the loop over the pairs - take the intersection with the current search results!
-            if first_pair:
-                objects = objects_pointers
-                object_keys.update(current_keys)
-                first_pair = False
-            else:
-                object_keys.intersection_update(current_keys)
-                objects.intersection_update(objects_pointers)
-
-        log.info('Found %s objects!' % len(objects))
-        defer.returnValue(objects)
-
     @defer.inlineCallbacks
     def op_get_objects(self, subject_predicate_query, headers, msg):
         """
@@ -440,7 +158,7 @@ class AssociationService(ServiceProcess):
         if len(subject_predicate_query.pairs) is 0:
             raise AssociationServiceError('Invalid Subject Predicate Query received - zero length pairs!', subject_predicate_query.ResponseCodes.BAD_REQUEST)
 
-        objects = yield self._get_objects(subject_predicate_query.pairs)
+        objects = yield self.engine.get_objects(subject_predicate_query.pairs)
         list_of_objects = yield self.message_client.create_instance(QUERY_RESULT_TYPE)
 
         for obj in objects:
@@ -468,13 +186,7 @@ class AssociationService(ServiceProcess):
         if len(content.subject_pairs) == 0 or len(content.object_pairs) == 0:
            raise AssociationServiceError('Invalid getstar query received - zero length pairs!', content.ResponseCodes.BAD_REQUEST)
 
-        subjects = yield self._get_subjects(content.object_pairs)
-        objects = yield self._get_objects(content.subject_pairs)
-
-        stars = set(subjects)
-        stars.intersection_update(objects)
-
-        log.info("Intersection: %d items" % len(stars))
+        stars = yield self.engine.get_star(content.subject_pairs, content.object_pairs)
 
         list_of_star = yield self.message_client.create_instance(QUERY_RESULT_TYPE)
         for obj in stars:
@@ -614,7 +326,7 @@ class AssociationService(ServiceProcess):
 
         if len(rows) == 1:
 
-            key, row = rows.popitem()
+            row = rows[0]
             response = yield self.message_client.create_instance(IDREF_TYPE)
             response.key = row[REPOSITORY_KEY]
             response.branch = row[BRANCH_NAME]
@@ -660,17 +372,7 @@ class AssociationService(ServiceProcess):
         if association_query.MessageType != ASSOCIATION_QUERY_MSG_TYPE:
             raise AssociationServiceError('Unexpected type received \n %s' % str(association_query), association_query.ResponseCodes.BAD_REQUEST)
 
-        q = store.Query()
-        # Get only the latest version of the association!
-        q.add_predicate_gt(BRANCH_NAME,'')
-
-        q.add_predicate_eq(SUBJECT_KEY, association_query.subject.key)
-
-        q.add_predicate_eq(PREDICATE_KEY, association_query.predicate.key)
-
-        q.add_predicate_eq(OBJECT_KEY, association_query.object.key)
-
-        return self.index_store.query(q)
+        return self.engine.get_association(association_query.subject.key, association_query.predicate.key, association_query.object.key)
 
 
     @defer.inlineCallbacks
@@ -713,13 +415,22 @@ class AssociationService(ServiceProcess):
         yield self.reply_ok(msg, response)
 
     def association_query_from_request(self, asc_query):
+        """
+        The value for each of subject, predicate and object may be a key or a list of keys - only one may be a list.
+        """
         q = store.Query()
         # Get only the latest version of the association!
         q.add_predicate_gt(BRANCH_NAME,'')
 
-        if 'subject' in asc_query:      q.add_predicate_eq(SUBJECT_KEY, asc_query['subject'])
-        if 'predicate' in asc_query:    q.add_predicate_eq(PREDICATE_KEY, asc_query['predicate'])
-        if 'object' in asc_query:       q.add_predicate_eq(OBJECT_KEY, asc_query['object'])
+        for name, column in (('subject', SUBJECT_KEY), ('predicate', PREDICATE_KEY), ('object', OBJECT_KEY)):
+            if name not in asc_query:
+                continue
+
+            value = asc_query[name]
+            if isinstance(value, (list, tuple)):
+                q.add_predicate_in(column, value)
+            else:
+                q.add_predicate_eq(column, value)
 
         return self.index_store.query(q)
 
@@ -856,7 +567,7 @@ class AssociationServiceClient(ServiceClient):
     def get_associations_map(self, msg):
         """
         @brief Get the associations between any of subject, predicate and object. Becareful - you can ask very big questions with this method!
-        @param params msg, a dictionary with keys for each of the subject, predicate and object
+        @param params msg, a dictionary with keys for each of the subject, predicate and object - one of them may be a list of keys
         @retval Query Results as a dict
         """
         yield self._check_init()
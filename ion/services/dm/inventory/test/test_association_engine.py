@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/dm/inventory/test/test_association_engine.py
+@author David Stuebe
+@brief Test the set based association query engine against the in memory index store
+"""
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from ion.core.data import store
+from ion.core.data.storage_configuration_utility import COMMIT_INDEXED_COLUMNS, REPOSITORY_KEY, BRANCH_NAME
+from ion.core.data.storage_configuration_utility import SUBJECT_KEY, SUBJECT_BRANCH, PREDICATE_KEY, OBJECT_KEY, OBJECT_BRANCH
+from ion.core.data.storage_configuration_utility import RESOURCE_OBJECT_TYPE, RESOURCE_LIFE_CYCLE_STATE
+
+from ion.services.coi.datastore_bootstrap.ion_preload_config import TYPE_OF_ID, HAS_LIFE_CYCLE_STATE_ID, OWNED_BY_ID, HAS_A_ID
+
+from ion.services.dm.inventory.association_engine import AssociationQueryEngine, AssociationServiceError
+from ion.services.dm.inventory.association_engine import PREDICATE_REFERENCE_TYPE, LifeCycleStateObject
+
+from ion.core.object import object_utils
+
+IDREF_TYPE = object_utils.create_type_identifier(object_id=4, version=1)
+
+
+class Ref(object):
+    """
+    Stand in for the references in the pairs of a query message
+    """
+    def __init__(self, object_type, key=None, lcs=None):
+        self.ObjectType = object_type
+        self.key = key
+        self.lcs = lcs
+
+
+class Pair(object):
+    def __init__(self, predicate, object=None, subject=None):
+        self.predicate = Ref(PREDICATE_REFERENCE_TYPE, predicate)
+        self.object = object
+        self.subject = subject
+
+
+class ExpandingIndexStore(store.IndexStore):
+    """
+    Expands a query with an IN predicate in to one cursor per value - the way the cassandra index store does
+    """
+
+    def query_cursor(self, query_predicates, page_size=store.DEFAULT_QUERY_PAGE_SIZE):
+        queries = query_predicates.expand_in()
+        if queries != [query_predicates]:
+            return store.ChainedQueryCursor([self.query_cursor(q, page_size) for q in queries], page_size, max_concurrent=4)
+
+        return store.IndexStore.query_cursor(self, query_predicates, page_size)
+
+
+class AssociationEngineTest(unittest.TestCase):
+
+    NUM_RESOURCES = 50
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        store.IndexStore.kvs.clear()
+        store.IndexStore.indices.clear()
+        self.index_store = store.IndexStore(indices=COMMIT_INDEXED_COLUMNS)
+
+        self.engine = AssociationQueryEngine(self.index_store, page_size=7)
+
+        # Resources - the even ones are datasets, every third one is active
+        for i in range(self.NUM_RESOURCES):
+            yield self._put_resource('resource_%d' % i, 'dataset' if i % 2 == 0 else 'source', '1' if i % 3 == 0 else '0')
+
+        yield self._put_resource('user_a', 'identity', '1')
+        yield self._put_resource('user_b', 'identity', '1')
+
+        # Ownership associations - user_a owns all of them, user_b owns the first ten
+        for i in range(self.NUM_RESOURCES):
+            yield self._put_association('owned_a_%d' % i, 'resource_%d' % i, OWNED_BY_ID, 'user_a')
+            if i < 10:
+                yield self._put_association('owned_b_%d' % i, 'resource_%d' % i, OWNED_BY_ID, 'user_b')
+
+        # A has_a association with an old version which points elsewhere
+        yield self._put_association('has_a_1', 'resource_0', HAS_A_ID, 'resource_1')
+        yield self._put_association('has_a_1', 'resource_0', HAS_A_ID, 'resource_3', commit='old', branch='')
+
+        # An association to a resource which is not in the store
+        yield self._put_association('owned_a_missing', 'missing', OWNED_BY_ID, 'user_a')
+
+    def tearDown(self):
+        store.IndexStore.kvs.clear()
+        store.IndexStore.indices.clear()
+
+    def _put_resource(self, key, resource_type, lcs, commit='head'):
+        attributes = {REPOSITORY_KEY:key, BRANCH_NAME:'master', RESOURCE_OBJECT_TYPE:resource_type, RESOURCE_LIFE_CYCLE_STATE:lcs}
+        return self.index_store.put('%s_%s' % (key, commit), 'commit blob', attributes)
+
+    def _put_association(self, key, subject, predicate, object, commit='head', branch='master'):
+        attributes = {REPOSITORY_KEY:key, BRANCH_NAME:branch,
+                      SUBJECT_KEY:subject, SUBJECT_BRANCH:'master',
+                      PREDICATE_KEY:predicate,
+                      OBJECT_KEY:object, OBJECT_BRANCH:'master'}
+        return self.index_store.put('%s_%s' % (key, commit), 'commit blob', attributes)
+
+    def _owned_by(self, user):
+        return Pair(OWNED_BY_ID, object=Ref(IDREF_TYPE, user))
+
+    def _type_of(self, resource_type):
+        return Pair(TYPE_OF_ID, object=Ref(IDREF_TYPE, resource_type))
+
+    def _state(self, lcs):
+        return Pair(HAS_LIFE_CYCLE_STATE_ID, object=Ref(LifeCycleStateObject, lcs=lcs))
+
+    @defer.inlineCallbacks
+    def test_get_subjects(self):
+
+        subjects = yield self.engine.get_subjects([self._owned_by('user_a')])
+
+        self.assertEqual(subjects, set([('resource_%d' % i, 'master') for i in range(self.NUM_RESOURCES)]))
+
+        # One query for the association and one for the heads - not one per subject
+        self.assertEqual(self.engine.store_queries, 2)
+
+    @defer.inlineCallbacks
+    def test_get_subjects_expanded_in(self):
+
+        expected = yield self.engine.get_subjects([self._owned_by('user_a'), self._state('1')])
+
+        engine = AssociationQueryEngine(ExpandingIndexStore(indices=COMMIT_INDEXED_COLUMNS), page_size=7)
+        subjects = yield engine.get_subjects([self._owned_by('user_a'), self._state('1')])
+        self.assertEqual(subjects, expected)
+
+    @defer.inlineCallbacks
+    def test_get_subjects_intersection(self):
+
+        subjects = yield self.engine.get_subjects([self._owned_by('user_a'), self._owned_by('user_b')])
+
+        self.assertEqual(subjects, set([('resource_%d' % i, 'master') for i in range(10)]))
+        self.assertEqual(self.engine.store_queries, 3)
+
+    @defer.inlineCallbacks
+    def test_get_subjects_type_and_state(self):
+
+        pairs = [self._owned_by('user_b'), self._type_of('dataset'), self._state(1)]
+        subjects = yield self.engine.get_subjects(pairs)
+
+        self.assertEqual(subjects, set([('resource_0', 'master'), ('resource_6', 'master')]))
+
+        # The type and state are checked on the head commits - no extra queries
+        self.assertEqual(self.engine.store_queries, 2)
+
+    @defer.inlineCallbacks
+    def test_get_subjects_by_type_only(self):
+
+        subjects = yield self.engine.get_subjects([self._type_of('identity')])
+        self.assertEqual(subjects, set([('user_a', 'master'), ('user_b', 'master')]))
+        self.assertEqual(self.engine.store_queries, 1)
+
+        try:
+            yield self.engine.get_subjects([self._state(1)])
+        except AssociationServiceError:
+            pass
+        else:
+            self.fail('Search by state only must fail!')
+
+    @defer.inlineCallbacks
+    def test_get_subjects_none(self):
+
+        subjects = yield self.engine.get_subjects([self._owned_by('user_c'), self._owned_by('user_a')])
+        self.assertEqual(subjects, set())
+
+        # Stop as soon as the intersection is empty
+        self.assertEqual(self.engine.store_queries, 1)
+
+    @defer.inlineCallbacks
+    def test_get_objects(self):
+
+        objects = yield self.engine.get_objects([Pair(HAS_A_ID, subject=Ref(IDREF_TYPE, 'resource_0'))])
+        self.assertEqual(objects, set([('resource_1', 'master')]))
+
+        objects = yield self.engine.get_objects([Pair(OWNED_BY_ID, subject=Ref(IDREF_TYPE, 'resource_3'))])
+        self.assertEqual(objects, set([('user_a', 'master'), ('user_b', 'master')]))
+
+    @defer.inlineCallbacks
+    def test_get_star(self):
+
+        # Things owned by user_b which are owned by user_a... and datasets
+        stars = yield self.engine.get_star([Pair(OWNED_BY_ID, subject=Ref(IDREF_TYPE, 'resource_3'))],
+                                           [self._owned_by('user_a')])
+        self.assertEqual(stars, set())
+
+        stars = yield self.engine.get_star([Pair(HAS_A_ID, subject=Ref(IDREF_TYPE, 'resource_0'))],
+                                           [self._owned_by('user_a'), self._type_of('source')])
+        self.assertEqual(stars, set([('resource_1', 'master')]))
+
+    @defer.inlineCallbacks
+    def test_get_association(self):
+
+        rows = yield self.engine.get_association('resource_0', HAS_A_ID, 'resource_1')
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][REPOSITORY_KEY], 'has_a_1')
+
+        # The old version is not current
+        rows = yield self.engine.get_association('resource_0', HAS_A_ID, 'resource_3')
+        self.assertEqual(rows, [])
+
+    @defer.inlineCallbacks
+    def test_divergent_subject(self):
+
+        # A second head for resource_0 in a different state - the query does not merge them
+        yield self._put_resource('resource_0', 'dataset', '0', commit='divergent')
+        nrows = len(self.index_store.kvs)
+
+        subjects = yield self.engine.get_subjects([self._owned_by('user_b')])
+        self.assertIn(('resource_0', 'master'), subjects)
+        self.assertEqual(len(subjects), 10)
+
+        # Kept if any of its heads meets the criteria
+        subjects = yield self.engine.get_subjects([self._owned_by('user_b'), self._state('0')])
+        self.assertIn(('resource_0', 'master'), subjects)
+
+        # Nothing was written
+        self.assertEqual(len(self.index_store.kvs), nrows)
@@ -734,6 +734,15 @@ class AssociationServiceTest(IonTestCase):
         result = yield self.asc.association_exists(request)
         self.assertEqual(result.result, True)
 
+    @defer.inlineCallbacks
+    def test_get_associations_map_subject_list(self):
+
+        owner_map = yield self.asc.get_associations_map({'subject': [SAMPLE_PROFILE_DATASET_ID, 'not_a_resource'],
+                                                         'predicate': OWNED_BY_ID,
+                                                         'object': ANONYMOUS_USER_ID})
+
+        self.assertEqual(owner_map, {SAMPLE_PROFILE_DATASET_ID: ANONYMOUS_USER_ID})
+
     @defer.inlineCallbacks
     def test_get_star(self):
 
@@ -826,23 +835,14 @@ class AssociationServiceTest(IonTestCase):
 
         self.failUnlessIn(SAMPLE_PROFILE_DATASET_ID, key_list)
 
-        # we should be able to pull here without resolving anything - it's already been resolved and pushed
+        # The query does not merge and push the divergent heads - the next resource client to read it merges them
         p4 = Process()
         yield p4.spawn()
         rc4 = ResourceClient(proc=p4)
 
         ds4 = yield rc4.get_instance(SAMPLE_PROFILE_DATASET_ID)
         self.failUnlessEqual(ds4.ResourceLifeCycleState, ds4.DECOMMISSIONED)
-
-        # grab the datastore process
-        datastore_id = yield self.sup.get_child_id('ds1')
-        datastore  = self._get_procinstance(datastore_id)
-
-        # grab this repo
-        repo = datastore.workbench.get_repository(SAMPLE_PROFILE_DATASET_ID)
-        repo.checkout('master')
-
-        self.failUnlessEquals(repo._current_branch.commitrefs[0].MyId, ds4.Repository._current_branch.commitrefs[0].MyId)
+        self.failUnlessEquals(len(ds4.Repository._current_branch.commitrefs[0].parentrefs), 2)
 
 
 
@@ -914,21 +914,12 @@ class AssociationServiceTest(IonTestCase):
 
         self.failUnlessIn(SAMPLE_PROFILE_DATA_SOURCE_ID, key_list)
 
-        # we should be able to pull here without resolving anything - it's already been resolved and pushed
+        # The query does not merge and push the divergent heads - the next resource client to read it merges them
         p4 = Process()
         yield p4.spawn()
         rc4 = ResourceClient(proc=p4)
 
         dset4 = yield rc4.get_instance(SAMPLE_PROFILE_DATA_SOURCE_ID)
         self.failUnlessEqual(dset4.ResourceLifeCycleState, dset4.DECOMMISSIONED)
-
-        # grab the datastore process
-        datastore_id = yield self.sup.get_child_id('ds1')
-        datastore  = self._get_procinstance(datastore_id)
-
-        # grab this repo
-        repo = datastore.workbench.get_repository(SAMPLE_PROFILE_DATA_SOURCE_ID)
-        repo.checkout('master')
-
-        self.failUnlessEquals(repo._current_branch.commitrefs[0].MyId, dset4.Repository._current_branch.commitrefs[0].MyId)
+        self.failUnlessEquals(len(dset4.Repository._current_branch.commitrefs[0].parentrefs), 2)
 
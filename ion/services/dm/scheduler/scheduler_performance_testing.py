@@ -0,0 +1,177 @@
+"""
+@file ion/services/dm/scheduler/scheduler_performance_testing.py
+@author David Stuebe
+@brief Measure how late scheduler timers fire with many periodic tasks - one reactor.callLater per task with a store
+query and a payload parse on every tick, as the scheduler used to work, against the timer queue with the task
+definitions and parsed payloads held in memory.
+
+Run as a script:
+python ion/services/dm/scheduler/scheduler_performance_testing.py -n 1000,10000,20000 -d 20 -i 5
+"""
+
+import time
+import random
+from optparse import OptionParser
+
+from twisted.internet import defer, reactor, task
+
+from ion.core.data.store import IndexStore, Query
+from ion.core.object import workbench
+from ion.core.object import object_utils
+from ion.core.object.gpb_wrapper import StructureElement
+from ion.services.dm.scheduler.timer_queue import TimerQueue
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+PERSON_TYPE = object_utils.create_type_identifier(object_id=20001, version=1)
+
+INDICES = ['task_id', 'interval_seconds', 'payload', 'constant']
+
+
+class BenchmarkIndexStore(IndexStore):
+    """
+    An index store with its own storage
+    """
+    def __init__(self, *args, **kwargs):
+        self.kvs = {}
+        self.indices = {}
+
+        IndexStore.__init__(self, *args, **kwargs)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class SchedulerPerformanceTester:
+
+    def __init__(self, num_tasks, duration, max_interval):
+
+        self.num_tasks = num_tasks
+        self.duration = duration
+        self.max_interval = max_interval
+
+        wb = workbench.WorkBench('No Process Performance Test')
+        repo = wb.create_repository(PERSON_TYPE)
+        repo.root_object.name = 'Scheduler payload'
+        repo.root_object.id = 1
+        repo.commit('payload')
+        self.payload = repo.index_hash[repo.root_object.MyId].serialize()
+
+    def make_tasks(self, num_tasks):
+        rand = random.Random(1234)
+        tasks = {}
+        for i in xrange(num_tasks):
+            task_id = 'task_%d' % i
+            tasks[task_id] = {'task_id':task_id,
+                              'constant':'1',
+                              'interval_seconds':str(rand.randint(1, self.max_interval)),
+                              'payload':self.payload}
+        return tasks
+
+    @defer.inlineCallbacks
+    def run_call_later(self, tasks):
+        """
+        One delayed call per task; each tick queries the store and parses the payload
+        """
+        store = BenchmarkIndexStore(indices=INDICES)
+        for task_id, tdef in tasks.iteritems():
+            yield store.put(task_id, task_id, index_attributes=tdef)
+
+        lateness = []
+        calls = {}
+        stop_time = time.time() + self.duration
+
+        @defer.inlineCallbacks
+        def fire(task_id, due):
+            lateness.append(time.time() - due)
+
+            q = Query()
+            q.add_predicate_eq('task_id', task_id)
+            tdefs = yield store.query(q)
+            tdef = tdefs.values()[0]
+            StructureElement.parse_structure_element(tdef['payload'])
+
+            interval = int(tdef['interval_seconds'])
+            if time.time() + interval < stop_time:
+                calls[task_id] = reactor.callLater(interval, fire, task_id, time.time() + interval)
+
+        now = time.time()
+        for task_id, tdef in tasks.iteritems():
+            interval = int(tdef['interval_seconds'])
+            calls[task_id] = reactor.callLater(interval, fire, task_id, now + interval)
+
+        yield task.deferLater(reactor, self.duration + 1, lambda: None)
+
+        for call in calls.itervalues():
+            if call.active():
+                call.cancel()
+
+        defer.returnValue(lateness)
+
+    @defer.inlineCallbacks
+    def run_timer_queue(self, tasks):
+        """
+        One delayed call for all the tasks; each tick uses the cached definition and payload
+        """
+        cache = {}
+        for task_id, tdef in tasks.iteritems():
+            cache[task_id] = (int(tdef['interval_seconds']), StructureElement.parse_structure_element(tdef['payload']))
+
+        lateness = []
+        stop_time = reactor.seconds() + self.duration
+
+        def fire(task_id, fire_time):
+            lateness.append(reactor.seconds() - fire_time)
+            interval, se = cache[task_id]
+            if fire_time + interval < stop_time:
+                queue.schedule_at(task_id, fire_time + interval)
+
+        queue = TimerQueue(fire)
+        for task_id, (interval, se) in cache.iteritems():
+            queue.schedule(task_id, interval)
+
+        yield task.deferLater(reactor, self.duration + 1, lambda: None)
+        queue.stop()
+
+        defer.returnValue(lateness)
+
+    def report(self, name, num_tasks, lateness, elapsed):
+        lateness.sort()
+        print "%s: %d tasks, %d events (%f events per second) - lateness ms p50 %f, p95 %f, p99 %f, max %f" % \
+            (name, num_tasks, len(lateness), len(lateness) / elapsed,
+             percentile(lateness, 0.5) * 1000.0, percentile(lateness, 0.95) * 1000.0,
+             percentile(lateness, 0.99) * 1000.0, percentile(lateness, 1.0) * 1000.0)
+
+    @defer.inlineCallbacks
+    def runBenchMarks(self):
+        for num_tasks in self.num_tasks:
+            tasks = self.make_tasks(num_tasks)
+
+            lateness = yield self.run_call_later(tasks)
+            self.report('callLater per task', num_tasks, lateness, self.duration)
+
+            lateness = yield self.run_timer_queue(tasks)
+            self.report('Timer queue', num_tasks, lateness, self.duration)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-n", "--tasks", dest="tasks", default="1000,10000,20000", help="Comma separated list of the number of periodic tasks")
+    parser.add_option("-d", "--duration", dest="duration", default=20, help="The number of seconds to run each test")
+    parser.add_option("-i", "--interval", dest="interval", default=5, help="The largest task interval in seconds")
+    opts, args = parser.parse_args()
+
+    num_tasks = [int(x) for x in opts.tasks.split(',')]
+    tester = SchedulerPerformanceTester(num_tasks, int(opts.duration), int(opts.interval))
+
+    d = tester.runBenchMarks()
+    d.addErrback(log.error)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+if __name__ == "__main__":
+    main()
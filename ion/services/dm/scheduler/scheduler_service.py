@@ -14,7 +14,7 @@ from ion.core.object.gpb_wrapper import StructureElement
 
 import ion.util.ionlog
 log = ion.util.ionlog.getLogger(__name__)
-from twisted.internet import defer, reactor
+from twisted.internet import defer
 from uuid import uuid4
 
 from ion.core.data import cassandra, store
@@ -23,11 +23,10 @@ from ion.core.process.service_process import ServiceProcess, ServiceClient
 from ion.core.messaging.message_client import MessageClient
 from ion.core.object import object_utils
 from ion.services.dm.distribution.events import ScheduleEventPublisher
+from ion.services.dm.scheduler.timer_queue import TimerQueue
 
 from ion.core.data.storage_configuration_utility import STORAGE_PROVIDER, PERSISTENT_ARCHIVE, get_cassandra_configuration
 
-from ion.util.iontime import IonTime
-
 import ion.util.procutils as pu
 
 # get configuration
@@ -190,8 +189,11 @@ class SchedulerService(ServiceProcess):
 
         self.mc = MessageClient(proc=self)
 
-        # maps task_ids to IDelayedCall objects, popped off when callback is called, used to cancel tasks
-        self._callback_tasks = {}
+        # maps task_ids to the task definition and the parsed payload element - the store is only read on activate
+        self._tasks = {}
+
+        # One delayed call in the reactor for all the tasks
+        self.timers = TimerQueue(self._send_and_reschedule)
 
         # will move pub through the lifecycle states with the service
         self.pub = ScheduleEventPublisher(process=self)
@@ -228,6 +230,8 @@ class SchedulerService(ServiceProcess):
         for task_id, tdef in rows.iteritems():
             log.debug("slc_activate: scheduling %s" % task_id)
 
+            self._cache_task(task_id, tdef)
+
             # could be None
             try:
                 start_time = int(tdef['start_time'])
@@ -235,8 +239,8 @@ class SchedulerService(ServiceProcess):
                 start_time = None
 
             self._schedule_event(start_time, int(tdef['interval_seconds']), task_id)
-        
-        
+
+        log.info('Scheduled %d tasks from the store' % len(rows))
         
     def slc_terminate(self):
         """
@@ -245,11 +249,21 @@ class SchedulerService(ServiceProcess):
         foreach task in op_query:
           rm_task(task)
         """
-        for k, v in self._callback_tasks.iteritems():
-            if v.active():
-                v.cancel()
+        self.timers.stop()
 
-    def _schedule_event(self, starttime, interval, task_id, query_result=None):
+    def _cache_task(self, task_id, tdef):
+        """
+        Hold the task definition in memory with its payload parsed once, so that sending an event needs neither a
+        store query nor a parse.
+        """
+        try:
+            se = StructureElement.parse_structure_element(tdef['payload'])
+        except:
+            se = None
+
+        self._tasks[task_id] = (dict(tdef), se)
+
+    def _schedule_event(self, starttime, interval, task_id):
         """
         Helper method to schedule and record a callback in the service.
         Used by op_add_task and on startup.
@@ -262,11 +276,9 @@ class SchedulerService(ServiceProcess):
                                 use the IonTime utility class.
         @param  interval        The interval to trigger scheduler events, in seconds.
         @param  task_id         The task_id to trigger.
-        @param  query_result    Internal param passed on from service activation which contains the query result already
-                                instead of making _send_and_reschedule go get it again.
         """
         assert interval and task_id and interval > 0
-        curtime = IonTime().time_ms
+        curtime = int(self.timers.clock.seconds() * 1000)
         starttime = starttime or curtime
 
         # determine first callback time
@@ -281,8 +293,7 @@ class SchedulerService(ServiceProcess):
 
         log.debug("_schedule_event: calculated next callback time of %d" % calctime)
 
-        ccl = reactor.callLater(calctime, self._send_and_reschedule, task_id, query_result=query_result)
-        self._callback_tasks[task_id] = ccl
+        self.timers.schedule(task_id, calctime)
 
     @defer.inlineCallbacks
     def op_add_task(self, content, headers, msg):
@@ -338,9 +349,8 @@ class SchedulerService(ServiceProcess):
 
         resp = yield self.mc.create_instance(ADDTASK_RSP_TYPE)
 
-        # check to see if the task_id already exists in the store
-        existing_task = yield self.scheduled_events.get(task_id)
-        if existing_task is not None:
+        # check to see if the task_id is already scheduled
+        if task_id in self._tasks:
             log.info("Already have task with id %s scheduled." % task_id)
             resp.duplicate = True
             resp.task_id = task_id
@@ -352,16 +362,20 @@ class SchedulerService(ServiceProcess):
         resp.origin     = desired_origin
 
         # extract content of message
+        tdef = {'task_id': task_id,
+                'constant': '1',    # used for being able to pull all tasks
+                'user_id': user_id,
+                'start_time': str(starttime),
+                'end_time': str(endtime),
+                'interval_seconds': str(msg_interval),
+                'desired_origin': desired_origin,
+                'payload': str(payload)}
+
         yield self.scheduled_events.put(task_id,
                                         task_id,  # ok to use for value? seems kind of silly
-                                        index_attributes={'task_id': task_id,
-                                                          'constant': '1',    # used for being able to pull all tasks
-                                                          'user_id': user_id,
-                                                          'start_time': str(starttime),
-                                                          'end_time': str(endtime),
-                                                          'interval_seconds': str(msg_interval),
-                                                          'desired_origin': desired_origin,
-                                                          'payload': str(payload)})
+                                        index_attributes=tdef)
+
+        self._cache_task(task_id, tdef)
 
         # Now that task is stored into registry, add to messaging callback
         log.debug('Adding task to scheduler')
@@ -375,8 +389,7 @@ class SchedulerService(ServiceProcess):
     @defer.inlineCallbacks
     def op_rm_task(self, content, headers, msg):
         """
-        Remove a task from the list/store. Will be dropped from the reactor
-        when the timer fires and _send_and_reschedule checks the registry.
+        Remove a task from the list/store and cancel its timer.
         """
         task_id = content.task_id
 
@@ -387,9 +400,8 @@ class SchedulerService(ServiceProcess):
             return
 
         # if the task is active, remove it
-        if self._callback_tasks.has_key(task_id):
-            self._callback_tasks[task_id].cancel()
-            del self._callback_tasks[task_id]
+        self.timers.cancel(task_id)
+        self._tasks.pop(task_id, None)
 
         log.debug('Removing task_id %s from store...' % task_id)
         yield self.scheduled_events.remove(task_id)
@@ -403,55 +415,58 @@ class SchedulerService(ServiceProcess):
     ##################################################
     # Internal methods
 
-    @defer.inlineCallbacks
-    def _send_and_reschedule(self, task_id, query_result=None):
+    def _send_and_reschedule(self, task_id, fire_time):
         """
-        Check to see if we're still in the store - if not, we've been removed
-        and should abort the run.
+        Called by the timer queue when the timer for a task expires. The next timer is set from the time this one was
+        due rather than from now, so that the time taken to send does not accumulate, then the event is sent.
 
-        @param  query_result    Internal param - passed in from Scheduler activation, which has already done a query.
-                                Allows us to skip making another query for the info we already have.
+        @param  fire_time   The time, in seconds of the timer clock, at which the timer was due.
         """
         log.debug('Worker activated for task %s' % task_id)
 
-        if query_result is None:
-            q = Query()
-            q.add_predicate_eq('task_id', task_id)
+        if not self._tasks.has_key(task_id):
+            log.warn("task_id %s no longer in list of tasks, aborting" % task_id)
+            return
+        tdef, se = self._tasks[task_id]
 
-            tdefs = yield self.scheduled_events.query(q)
-            if len(tdefs) != 1:
-                log.error("Query did not find task_id: %s, expected 1, got %d" % (task_id, len(tdefs)))
-                defer.returnValue(False)
+        interval = int(tdef['interval_seconds'])
+        now = self.timers.clock.seconds()
+        missed = int((now - fire_time) / interval) + 1
+        if missed > 1:
+            log.warn('Task %s missed %d intervals' % (task_id, missed - 1))
+        self.timers.schedule_at(task_id, fire_time + missed * interval)
 
-            tdef = tdefs.values()[0]
-        else:
-            tdef = query_result
+        d = self._send_event(task_id, tdef, se)
+        d.addErrback(lambda reason: log.error('Failed to send the event for task %s: %s' % (task_id, reason)))
 
-        # pop callback object off of scheduled items
-        if not self._callback_tasks.has_key(task_id):
-            log.warn("task_id %s no longer in list of callbacks, aborting" % task_id)
-            defer.returnValue(False)
-        del self._callback_tasks[task_id]
+        log.debug('Task %s rescheduled for %s seconds OK' % (task_id, tdef['interval_seconds']))
 
-        # deserialize and objectify payload
+    @defer.inlineCallbacks
+    def _send_event(self, task_id, tdef, se):
+        """
+        Publish the scheduler event for a task
+        @param  se  The parsed payload element of the task, or None if it has no payload
+        """
         log.debug('Time to send to "%s", id "%s"' % (tdef['desired_origin'], task_id))
 
         msg = yield self.pub.create_event(origin=tdef['desired_origin'],
                                           task_id=tdef['task_id'],
                                           user_id=tdef['user_id'])
 
-        try:
-            se = StructureElement.parse_structure_element(tdef['payload'])
-            payload = msg.Repository._load_element(se)
-            msg.Repository.index_hash[payload.MyId]=se
+        if se is not None:
+            try:
+                payload = msg.Repository._load_element(se)
+                msg.Repository.index_hash[payload.MyId]=se
 
-            msg.additional_data.payload = payload
-        except:
+                msg.additional_data.payload = payload
+            except:
+                log.info('No payload found or payload in incorrect format')
+        else:
             log.info('No payload found or payload in incorrect format')
 
         yield self.pub.publish_event(msg, origin=tdef['desired_origin'])
 
-        log.debug('Send completed, rescheduling %s' % task_id)
+        log.debug('Send completed for %s' % task_id)
 
         #################################################
         ## BANDAID FIX FOR 262 RE-OPEN
@@ -470,11 +485,6 @@ class SchedulerService(ServiceProcess):
             log.error("Could not clear repository: %s" % str(ex))
             pass
 
-        # start time of None is fine, we just happened so we can be sure interval_seconds is just about right
-        self._schedule_event(None, int(tdef['interval_seconds']), task_id)
-
-        log.debug('Task %s rescheduled for %s seconds OK' % (task_id, tdef['interval_seconds']))
-
 class SchedulerServiceClient(ServiceClient):
     """
     Client class for the SchedulerService, simple muster/send/reply.
@@ -9,6 +9,7 @@
 import time
 
 from twisted.internet import defer
+from twisted.internet.task import Clock
 from ion.core.exception import ReceivedApplicationError
 
 from ion.core.process.process import Process
@@ -218,6 +219,53 @@ class SchedulerTest(IonTestCase):
         self.failUnlessEqual(rc.value, 'OK')
         yield asleep(0.5)
 
+    @defer.inlineCallbacks
+    def test_deterministic_clock(self):
+        """
+        Drive the scheduler with a clock under test control and make sure events need no store reads.
+        """
+        sched = self._get_service_by_name('scheduler')
+        clock = Clock()
+        clock.advance(time.time())
+        sched.timers.clock = clock
+
+        reads = []
+        def no_query(*args, **kwargs):
+            reads.append(args)
+            return defer.succeed({})
+        sched.scheduled_events.query = no_query
+
+        sc = SchedulerServiceClient(proc=self.proc)
+        mc = self.proc.message_client
+
+        msg_a = yield mc.create_instance(ADDTASK_REQ_TYPE)
+        msg_a.desired_origin    = SCHEDULE_TYPE_PERFORM_INGESTION_UPDATE
+        msg_a.interval_seconds  = 10
+        msg_a.payload           = msg_a.CreateObject(SCHEDULE_TYPE_PERFORM_INGESTION_UPDATE_PAYLOAD_TYPE)
+        msg_a.payload.dataset_id = "TESTER"
+        msg_a.payload.datasource_id = "TWO"
+
+        resp_msg = yield sc.add_task(msg_a)
+
+        clock.advance(9)
+        yield asleep(0.5)
+        self.failUnlessEquals(len(self._notices), 0)
+
+        for i in range(3):
+            clock.advance(10)
+            yield asleep(0.5)
+
+        self.failUnlessEquals(self._notices, ["TESTER"] * 3)
+        self.failUnlessEquals(reads, [])
+
+        msg_r = yield mc.create_instance(RMTASK_REQ_TYPE)
+        msg_r.task_id = resp_msg.task_id
+        yield sc.rm_task(msg_r)
+
+        clock.advance(100)
+        yield asleep(0.5)
+        self.failUnlessEquals(len(self._notices), 3)
+
     @defer.inlineCallbacks
     def test_rm(self):
         # Create clients
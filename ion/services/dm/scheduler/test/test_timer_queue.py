@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/dm/scheduler/test/test_timer_queue.py
+@author David Stuebe
+@test ion.services.dm.scheduler.timer_queue Exercise the timer queue with a deterministic clock
+"""
+
+from twisted.trial import unittest
+from twisted.internet.task import Clock
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+from ion.services.dm.scheduler.timer_queue import TimerQueue, TimerQueueError
+
+
+class TimerQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.fired = []
+        self.queue = TimerQueue(self._fire, clock=self.clock)
+
+    def _fire(self, key, fire_time):
+        self.fired.append((key, fire_time, self.clock.seconds()))
+
+    def test_order(self):
+        self.queue.schedule('c', 3)
+        self.queue.schedule('a', 1)
+        self.queue.schedule('b', 2)
+
+        # Only one delayed call however many timers
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+
+        self.clock.advance(0.5)
+        self.assertEqual(self.fired, [])
+
+        self.clock.pump([0.5, 1, 1])
+        self.assertEqual([key for key, fire_time, now in self.fired], ['a', 'b', 'c'])
+        self.assertEqual([fire_time for key, fire_time, now in self.fired], [1, 2, 3])
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 0)
+
+    def test_same_time(self):
+        for key in ['a', 'b', 'c']:
+            self.queue.schedule(key, 5)
+
+        self.clock.advance(5)
+        self.assertEqual([key for key, fire_time, now in self.fired], ['a', 'b', 'c'])
+
+    def test_cancel_and_replace(self):
+        self.queue.schedule('a', 1)
+        self.queue.schedule('b', 2)
+        self.queue.schedule('c', 3)
+
+        self.assertTrue(self.queue.cancel('a'))
+        self.assertFalse(self.queue.cancel('a'))
+        self.assertFalse('a' in self.queue)
+
+        # Move b after c
+        self.queue.schedule('b', 4)
+        self.assertEqual(self.queue.fire_time('b'), 4)
+
+        self.clock.advance(10)
+        self.assertEqual([key for key, fire_time, now in self.fired], ['c', 'b'])
+
+        self.queue.schedule('d', 1)
+        self.queue.cancel('d')
+        self.assertEqual(len(self.clock.getDelayedCalls()), 0)
+
+    def test_earlier_timer_rearms(self):
+        self.queue.schedule('late', 100)
+        self.queue.schedule('early', 1)
+
+        self.clock.advance(1)
+        self.assertEqual([key for key, fire_time, now in self.fired], ['early'])
+
+        self.clock.advance(99)
+        self.assertEqual([key for key, fire_time, now in self.fired], ['early', 'late'])
+
+    def test_periodic_without_drift(self):
+        """
+        A callback which schedules the next run from the time the timer was due does not drift even when the clock is
+        late.
+        """
+        def periodic(key, fire_time):
+            self._fire(key, fire_time)
+            self.queue.schedule_at(key, fire_time + 10)
+        self.queue.callback = periodic
+
+        self.queue.schedule('p', 10)
+
+        # The clock is always a little late
+        for i in range(100):
+            self.clock.advance(10.25)
+
+        # Every timer due in the 1025 seconds has fired, at the time it was due
+        self.assertEqual([fire_time for key, fire_time, now in self.fired], [10 * (i + 1) for i in range(102)])
+        for key, fire_time, now in self.fired:
+            self.assertTrue(now - fire_time < 10.25)
+
+    def test_callback_error(self):
+        def broken(key, fire_time):
+            self._fire(key, fire_time)
+            raise RuntimeError('broken callback')
+        self.queue.callback = broken
+
+        self.queue.schedule('a', 1)
+        self.queue.schedule('b', 1)
+        self.clock.advance(1)
+
+        self.assertEqual(len(self.fired), 2)
+        self.flushLoggedErrors(RuntimeError)
+
+    def test_stop(self):
+        self.queue.schedule('a', 1)
+        self.queue.stop()
+
+        self.assertEqual(len(self.clock.getDelayedCalls()), 0)
+        self.assertRaises(TimerQueueError, self.queue.schedule, 'a', 1)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""
+@file ion/services/dm/scheduler/timer_queue.py
+@author David Stuebe
+@brief A priority queue of keyed timers driven by a single delayed call. Scheduling, moving and cancelling a timer
+cost O(log n) and only the earliest timer is ever armed in the reactor, however many timers there are.
+"""
+
+import heapq
+
+from twisted.internet import reactor
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class TimerQueueError(Exception):
+    """
+    An exception class for the timer queue
+    """
+
+
+class TimerQueue(object):
+    """
+    Calls callback(key, fire_time) when the timer for a key expires. Each key has at most one timer; scheduling a key
+    again replaces its timer. Cancelled or replaced entries stay in the heap until they reach the top, where they are
+    dropped.
+
+    @param callback the function called for each timer which expires
+    @param clock an IReactorTime provider - the reactor, or a twisted.internet.task.Clock in tests
+    """
+
+    def __init__(self, callback, clock=None):
+
+        self.callback = callback
+        self.clock = clock or reactor
+
+        # entries of [fire_time, sequence, key]
+        self._heap = []
+        # key -> the live entry for the key
+        self._entries = {}
+
+        self._sequence = 0
+        self._delayed_call = None
+        self._armed_time = None
+        self._stopped = False
+
+    def schedule(self, key, delay):
+        """
+        Set the timer for key to expire delay seconds from now
+        @retval the time at which the timer will expire
+        """
+        return self.schedule_at(key, self.clock.seconds() + max(delay, 0))
+
+    def schedule_at(self, key, fire_time):
+        """
+        Set the timer for key to expire at fire_time, in the seconds of the clock
+        """
+        if self._stopped:
+            raise TimerQueueError('Can not schedule a timer in a stopped queue')
+
+        self._discard(key)
+
+        self._sequence += 1
+        entry = [fire_time, self._sequence, key]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+        if self._armed_time is None or fire_time < self._armed_time:
+            self._arm()
+
+        return fire_time
+
+    def cancel(self, key):
+        """
+        Cancel the timer for key
+        @retval True if there was a timer to cancel
+        """
+        return self._discard(key)
+
+    def fire_time(self, key):
+        """
+        @retval the time at which the timer for key expires, or None
+        """
+        entry = self._entries.get(key, None)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def stop(self):
+        """
+        Cancel all the timers
+        """
+        self._stopped = True
+        self._entries.clear()
+        del self._heap[:]
+        self._disarm()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+
+        # Leave the entry in the heap - it is dropped when it reaches the top
+        entry[2] = None
+
+        if len(self._entries) == 0:
+            del self._heap[:]
+            self._disarm()
+
+        return True
+
+    def _disarm(self):
+        if self._delayed_call is not None and self._delayed_call.active():
+            self._delayed_call.cancel()
+        self._delayed_call = None
+        self._armed_time = None
+
+    def _arm(self):
+        """
+        Arm the single delayed call for the earliest live timer
+        """
+        heap = self._heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+
+        if not heap:
+            self._disarm()
+            return
+
+        fire_time = heap[0][0]
+        if fire_time == self._armed_time and self._delayed_call is not None and self._delayed_call.active():
+            return
+
+        self._disarm()
+        self._armed_time = fire_time
+        self._delayed_call = self.clock.callLater(max(fire_time - self.clock.seconds(), 0), self._expire)
+
+    def _expire(self):
+        self._delayed_call = None
+        self._armed_time = None
+
+        now = self.clock.seconds()
+        heap = self._heap
+
+        expired = []
+        while heap and heap[0][0] <= now:
+            fire_time, sequence, key = heapq.heappop(heap)
+            if key is None:
+                continue
+            del self._entries[key]
+            expired.append((key, fire_time))
+
+        for key, fire_time in expired:
+            try:
+                self.callback(key, fire_time)
+            except Exception, ex:
+                log.exception('Timer callback for %s failed: %s' % (key, ex))
+
+        if not self._stopped:
+            self._arm()
@@ -41,6 +41,14 @@ CONF = ioninit.config(__name__)
 from ion.core.object import object_utils
 
 from ion.core.cc.shell import control
+
+from twisted.internet import reactor
+
+from ion.core.data import store
+from ion.core.data.storage_configuration_utility import COMMIT_INDEXED_COLUMNS, REPOSITORY_KEY, BRANCH_NAME
+from ion.core.data.storage_configuration_utility import SUBJECT_KEY, SUBJECT_BRANCH, PREDICATE_KEY, OBJECT_KEY, OBJECT_BRANCH
+from ion.core.data.storage_configuration_utility import RESOURCE_OBJECT_TYPE, RESOURCE_LIFE_CYCLE_STATE
+from ion.services.dm.inventory.association_engine import AssociationQueryEngine
 #-- CC Application interface
 
 # Functions required
@@ -184,6 +192,147 @@ def find_by_predicate():
 
     defer.returnValue(key_list)
          
+class BenchmarkIndexStore(store.IndexStore):
+    """
+    An in memory index store with its own rows - so that it does not share them with the datastore in this container.
+    Each query and each page of a query cursor is delayed to simulate a round trip to the backend.
+    """
+    kvs = {}
+    indices = {}
+
+    latency = 0.001
+
+    queries = 0
+
+    def _delay(self, result):
+        self.queries += 1
+        d = defer.Deferred()
+        reactor.callLater(self.latency, d.callback, result)
+        return d
+
+    def query(self, query_predicates):
+        d = store.IndexStore.query(self, query_predicates)
+        d.addCallback(self._delay)
+        return d
+
+    def query_cursor(self, query_predicates, page_size=store.DEFAULT_QUERY_PAGE_SIZE):
+        cursor = store.IndexStore.query_cursor(self, query_predicates, page_size)
+        next_page = cursor.next_page
+
+        def delayed_next_page():
+            d = next_page()
+            d.addCallback(self._delay)
+            return d
+
+        cursor.next_page = delayed_next_page
+        return cursor
+
+
+class ExpandingBenchmarkIndexStore(BenchmarkIndexStore):
+    """
+    A benchmark index store which can not search for a set of values - a query with an IN predicate is expanded in to
+    one cursor per value, read several at a time, the way the cassandra index store does.
+    """
+
+    def query_cursor(self, query_predicates, page_size=store.DEFAULT_QUERY_PAGE_SIZE):
+        queries = query_predicates.expand_in()
+        if queries != [query_predicates]:
+            return store.ChainedQueryCursor([self.query_cursor(q, page_size) for q in queries], page_size)
+
+        return BenchmarkIndexStore.query_cursor(self, query_predicates, page_size)
+
+
+class _Ref(object):
+    def __init__(self, object_type, key):
+        self.ObjectType = object_type
+        self.key = key
+
+
+class _Pair(object):
+    def __init__(self, predicate, obj):
+        self.predicate = _Ref(PREDICATE_REFERENCE_TYPE, predicate)
+        self.object = _Ref(IDREF_TYPE, obj)
+
+
+def _load_benchmark_store(index_store, num_resources):
+    """
+    Put a head commit for each resource, and an owned by association for each resource with the anonymous user
+    """
+    for i in range(num_resources):
+        resource_key = 'benchmark_resource_%d' % i
+        index_store.put(resource_key + '_head', 'commit', {REPOSITORY_KEY:resource_key, BRANCH_NAME:'master',
+                                                           RESOURCE_OBJECT_TYPE:'dataset', RESOURCE_LIFE_CYCLE_STATE:'1'})
+
+        index_store.put('benchmark_association_%d_head' % i, 'commit', {REPOSITORY_KEY:'benchmark_association_%d' % i,
+                                                                        BRANCH_NAME:'master',
+                                                                        SUBJECT_KEY:resource_key, SUBJECT_BRANCH:'master',
+                                                                        PREDICATE_KEY:OWNED_BY_ID,
+                                                                        OBJECT_KEY:ANONYMOUS_USER_ID, OBJECT_BRANCH:'master'})
+
+
+@defer.inlineCallbacks
+def _row_by_row_get_subjects(index_store, predicate_key, object_key):
+    """
+    The previous implementation of get_subjects - one head query for each association row.
+    """
+    q = store.Query()
+    q.add_predicate_gt(BRANCH_NAME,'')
+    q.add_predicate_eq(PREDICATE_KEY, predicate_key)
+    q.add_predicate_eq(OBJECT_KEY, object_key)
+
+    rows = yield index_store.query(q)
+
+    subjects = set()
+    for key, row in rows.items():
+        subject_query = store.Query()
+        subject_query.add_predicate_gt(BRANCH_NAME,'')
+        subject_query.add_predicate_eq(REPOSITORY_KEY,row[SUBJECT_KEY])
+        subject_heads = yield index_store.query(subject_query)
+
+        for commit_key, commit_row in subject_heads.items():
+            subjects.add((row[SUBJECT_KEY], commit_row[BRANCH_NAME]))
+
+    defer.returnValue(subjects)
+
+
+@defer.inlineCallbacks
+def compare_query_engines(num_resources=1000, latency=0.001):
+    """
+    Compare the number of index store queries and the time to find the resources owned by a user with the previous
+    row by row implementation and with the set based query engine, on a store which supports IN natively and on one
+    which expands it in to a query per value like cassandra.
+    """
+    BenchmarkIndexStore.kvs.clear()
+    BenchmarkIndexStore.indices.clear()
+    index_store = BenchmarkIndexStore(indices=COMMIT_INDEXED_COLUMNS)
+    index_store.latency = latency
+
+    _load_benchmark_store(index_store, num_resources)
+
+    t1 = time.time()
+    index_store.queries = 0
+    old_result = yield _row_by_row_get_subjects(index_store, OWNED_BY_ID, ANONYMOUS_USER_ID)
+    t2 = time.time()
+    print "Row by row: found %d subjects with %d store round trips in %f seconds" % (len(old_result), index_store.queries, t2 - t1)
+
+    # A store which searches for a set of values natively, and one which expands the IN like cassandra
+    expanding_store = ExpandingBenchmarkIndexStore(indices=COMMIT_INDEXED_COLUMNS)
+    expanding_store.latency = latency
+
+    for name, engine_store in (('native IN', index_store), ('expanded IN', expanding_store)):
+        engine = AssociationQueryEngine(engine_store)
+        t1 = time.time()
+        engine_store.queries = 0
+        new_result = yield engine.get_subjects([_Pair(OWNED_BY_ID, ANONYMOUS_USER_ID)])
+        t2 = time.time()
+        print "Query engine (%s): found %d subjects with %d store round trips in %f seconds" % (name, len(new_result), engine_store.queries, t2 - t1)
+
+        assert old_result == new_result, 'The query engine result does not match the row by row result!'
+
+    BenchmarkIndexStore.kvs.clear()
+    BenchmarkIndexStore.indices.clear()
+
+
 @defer.inlineCallbacks
 def start(container, starttype, app_definition, *args, **kwargs):
 
@@ -260,6 +409,7 @@ def start(container, starttype, app_definition, *args, **kwargs):
     control.add_term_name('find_by_owner',find_by_owner)
     control.add_term_name('find_by_lcs',find_by_lcs)
     control.add_term_name('find_by_predicate',find_by_predicate)
+    control.add_term_name('compare_query_engines',compare_query_engines)
     defer.returnValue(res)
 
 @defer.inlineCallbacks
@@ -60,6 +60,7 @@ setup( name = 'ioncore',
            'hoover==0.5.2',
            'setproctitle==1.1.2',
            'ionproto>=1.1.0',
+           'numpy>=1.6.0',
                           ],
        entry_points = {
                         'console_scripts': [